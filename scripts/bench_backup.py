@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк резервного копирования базы под нагрузкой обработчиков.
+
+Заполняет базу индексом заметок на ~N МБ и запускает «обработчики»: через
+пул SQLite они читают конфигурацию пользователя и изредка пишут состояние
+рассылки. Задержки их операций p50/p99/макс. сравниваются без копирования,
+во время снимка за один шаг (вся база под блокировкой) и во время снимка
+по шагам — в обычном режиме журнала и в WAL. Печатает длительность снимков
+и восстановления.
+
+Запуск: python scripts/bench_backup.py [размер_МБ] [страниц_за_шаг]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.backup import backup_database, restore_database  # noqa: E402
+from src.database import Database  # noqa: E402
+from src.executors import run_db, shutdown_executors  # noqa: E402
+
+HANDLERS = 8
+USERS = 1000
+
+
+def fill(db: Database, megabytes: int):
+    """Заполнить базу пользователями и заметками примерно на megabytes МБ."""
+    for user_id in range(USERS):
+        db.save_notion_token(user_id, f"token-{user_id}")
+    rng = random.Random(1)
+    rows_per_page = 500
+    for page in range(megabytes * 1024 * 1024 // (rows_per_page * 200)):
+        rows = [
+            (f"p{page}-b{i}", " ".join(f"слово{rng.randrange(5000)}" for _ in range(12)), False)
+            for i in range(rows_per_page)
+        ]
+        db.index_notes(f"page-{page}", rows, time.time())
+
+
+async def handlers_during(db: Database, action) -> tuple:
+    """Задержки операций обработчиков, пока выполняется action (в отдельном потоке)."""
+    latencies = []
+    done = asyncio.Event()
+
+    async def handler(seed: int):
+        rng = random.Random(seed)
+        while not done.is_set():
+            user_id = rng.randrange(USERS)
+            started = time.perf_counter()
+            if rng.random() < 0.8:
+                await run_db(db.get_user_config, user_id)
+            else:
+                await run_db(db.save_digest_state, user_id, "page", None, "hash", 1, "text", "now")
+            latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(0.002)
+
+    tasks = [asyncio.ensure_future(handler(seed)) for seed in range(HANDLERS)]
+    started = time.perf_counter()
+    result = await asyncio.to_thread(action)
+    elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*tasks)
+    return result, elapsed, latencies
+
+
+def report(name: str, elapsed: float, latencies: list, extra: str = ""):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:<18} {elapsed:6.2f} с   обработчики p50 {statistics.median(latencies):6.2f} мс   "
+        f"p99 {p99:7.2f} мс   макс. {latencies[-1]:7.2f} мс {extra}"
+    )
+
+
+async def main_async(megabytes: int, pages: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bot.db"))
+        db.init_database()
+        fill(db, megabytes)
+        print(f"База {os.path.getsize(db.db_path) / 1024 / 1024:.1f} МБ, обработчиков {HANDLERS}")
+        backups = os.path.join(tmp, "backups")
+
+        _, elapsed, latencies = await handlers_during(db, lambda: time.sleep(1.0))
+        report("без копирования", elapsed, latencies)
+
+        snapshot, elapsed, latencies = await handlers_during(db, lambda: backup_database(db.db_path, backups, pages=-1))
+        report("снимок за шаг", elapsed, latencies)
+
+        for mode in ('delete', 'wal'):
+            if mode == 'wal':
+                db.enable_wal()
+            snapshot, elapsed, latencies = await handlers_during(
+                db, lambda: backup_database(db.db_path, backups, pages=pages)
+            )
+            report(
+                f"по {pages} стр., {mode}", elapsed, latencies,
+                f"(шагов {snapshot.steps}, перезапусков {snapshot.restarts})"
+            )
+
+        db.close()
+        duration = restore_database(snapshot.path, db.db_path)
+        print(f"Восстановление: {duration:.2f} с")
+    shutdown_executors()
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    asyncio.run(main_async(megabytes, pages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк декодирования блоков: сырые словари против BlockRecord.
+
+Генерирует страницу из 10 000 блоков (ответы по 100 блоков, как у Notion)
+и сравнивает время разбора и пиковую память:
+  * dicts   — json.loads и удержание полных словарей блоков (старый путь);
+  * records — decode_block_list в BlockRecord (orjson, если установлен).
+
+Запуск: python scripts/bench_blocks.py [число_блоков]
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.blocks import decode_block_list, extract_text  # noqa: E402
+
+PAGE_SIZE = 100
+
+
+def make_block(i: int) -> dict:
+    """Блок to_do в формате ответа Notion."""
+    return {
+        "object": "block",
+        "id": f"{i:08x}-0000-0000-0000-000000000000",
+        "parent": {"type": "page_id", "page_id": "11111111-2222-3333-4444-555555555555"},
+        "created_time": "2026-01-01T10:00:00.000Z",
+        "last_edited_time": "2026-01-02T10:00:00.000Z",
+        "created_by": {"object": "user", "id": "99999999-8888-7777-6666-555555555555"},
+        "last_edited_by": {"object": "user", "id": "99999999-8888-7777-6666-555555555555"},
+        "has_children": False,
+        "archived": False,
+        "in_trash": False,
+        "type": "to_do",
+        "to_do": {
+            "rich_text": [{
+                "type": "text",
+                "text": {"content": f"Заметка номер {i}: купить молоко и хлеб", "link": None},
+                "annotations": {
+                    "bold": False, "italic": False, "strikethrough": False,
+                    "underline": False, "code": False, "color": "default",
+                },
+                "plain_text": f"Заметка номер {i}: купить молоко и хлеб",
+                "href": None,
+            }],
+            "checked": i % 3 == 0,
+            "color": "default",
+        },
+    }
+
+
+def make_pages(total: int) -> list:
+    """Сырые ответы blocks.children.list."""
+    pages = []
+    for start in range(0, total, PAGE_SIZE):
+        end = min(start + PAGE_SIZE, total)
+        pages.append(json.dumps({
+            "object": "list",
+            "results": [make_block(i) for i in range(start, end)],
+            "next_cursor": "cursor" if end < total else None,
+            "has_more": end < total,
+        }).encode())
+    return pages
+
+
+def run_dicts(pages: list) -> list:
+    """Старый путь: полные словари блоков живут до конца обработки."""
+    blocks = []
+    for raw in pages:
+        blocks.extend(json.loads(raw)["results"])
+    notes = [
+        (extract_text(b["to_do"]["rich_text"]), b["to_do"]["checked"])
+        for b in blocks if b.get("type") == "to_do"
+    ]
+    assert len(notes) == len(blocks)
+    return blocks
+
+
+def run_records(pages: list) -> list:
+    """Новый путь: сразу компактные записи."""
+    records = []
+    for raw in pages:
+        page, _ = decode_block_list(raw)
+        records.extend(page)
+    return records
+
+
+def measure(name: str, fn, pages: list):
+    """Замерить время (лучшее из 5) и пиковую память одного прогона."""
+    best = min(_timed(fn, pages) for _ in range(5))
+    tracemalloc.start()
+    result = fn(pages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:8s} {len(result):6d} блоков  {best * 1000:8.1f} мс  пик {peak / 1024 / 1024:7.2f} МБ")
+
+
+def _timed(fn, pages: list) -> float:
+    started = time.perf_counter()
+    fn(pages)
+    return time.perf_counter() - started
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    pages = make_pages(total)
+    print(f"Страница из {total} блоков, {len(pages)} ответов по {PAGE_SIZE}")
+    measure("dicts", run_dicts, pages)
+    measure("records", run_records, pages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк справедливой очереди пользователей.
+
+Тяжёлый пользователь ставит N задач Notion разом (пересылка пачки
+сообщений), лёгкие пользователи в это время присылают по одной заметке раз
+в несколько миллисекунд. Каждая задача — sleep, имитирующий запрос к Notion.
+Сравниваются задержки лёгких пользователей p50/p99 при общей FIFO-очереди
+(asyncio.Semaphore) и при FairScheduler.
+
+Запуск: python scripts/bench_fair_queue.py [задач_тяжёлого] [слотов]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fair_queue import FairScheduler  # noqa: E402
+
+NOTION_LATENCY = 0.02
+LIGHT_USERS = 20
+LIGHT_INTERVAL = 0.01
+
+
+class FifoSlots:
+    """Общая очередь без учёта пользователей — поведение до планировщика."""
+
+    def __init__(self, capacity: int):
+        self._semaphore = asyncio.Semaphore(capacity)
+
+    def slot(self, key):
+        return self._semaphore
+
+
+async def scenario(slots, heavy_jobs: int) -> list:
+    """Задержки лёгких пользователей в миллисекундах."""
+    latencies = []
+
+    async def job(key, light: bool):
+        started = time.perf_counter()
+        async with slots.slot(key):
+            await asyncio.sleep(NOTION_LATENCY)
+        if light:
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    heavy = [asyncio.ensure_future(job('heavy', False)) for _ in range(heavy_jobs)]
+    light = []
+    for i in range(LIGHT_USERS):
+        await asyncio.sleep(LIGHT_INTERVAL)
+        light.append(asyncio.ensure_future(job(f'light-{i}', True)))
+    await asyncio.gather(*heavy, *light)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    latencies.sort()
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    print(f"{name:<6} p50 {statistics.median(latencies):8.1f} мс   p99 {p99:8.1f} мс")
+
+
+def main():
+    heavy_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    capacity = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    print(f"Тяжёлый пользователь: {heavy_jobs} задач, слотов {capacity}, лёгких пользователей {LIGHT_USERS}")
+
+    report("FIFO", asyncio.run(scenario(FifoSlots(capacity), heavy_jobs)))
+    fair = FairScheduler('bench', capacity, weights={})
+    report("DRR", asyncio.run(scenario(fair, heavy_jobs)))
+    print(fair.format_stats(top=3))
+
+
+if __name__ == '__main__':
+    main()
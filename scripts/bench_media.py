@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк потоковой загрузки файлов: память и пропускная способность.
+
+Локальный HTTP-сервер отдаёт файл заданного размера (генерируется на лету,
+как файл Bot API), MediaCapture скачивает его кусками и отправляет части в
+заглушку Notion, которая только считает байты. Печатает пропускную
+способность и пиковую память Python (tracemalloc) — она должна быть порядка
+двух частей (буфер и копия) и не расти с размером файла.
+
+Запуск: python scripts/bench_media.py [размер_МБ ...]
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.media import MB, MediaCapture, MediaItem  # noqa: E402
+
+BLOCK = b"\0" * (256 * 1024)
+
+
+class FileServer(BaseHTTPRequestHandler):
+    """Отдаёт GET /<байт> как поток нулей."""
+
+    def do_GET(self):
+        size = int(self.path.strip('/'))
+        self.send_response(200)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        sent = 0
+        while sent < size:
+            step = min(len(BLOCK), size - sent)
+            self.wfile.write(BLOCK[:step])
+            sent += step
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CountingNotion:
+    """Заглушка Notion: принимает части и только считает байты."""
+
+    def __init__(self):
+        self.received = 0
+
+    def create_file_upload(self, filename, content_type, parts):
+        return "upload"
+
+    def send_file_part(self, upload_id, data, filename, content_type, part_number=None):
+        self.received += len(data)
+
+    def complete_file_upload(self, upload_id):
+        pass
+
+
+async def run(url: str, size: int):
+    media = MediaCapture(db=None, max_file_size=size)
+    notion = CountingNotion()
+    item = MediaItem("bench", size, "bench.bin", 'application/octet-stream', 'file', "bench")
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await media.upload(notion, media.iter_file(url), item, size)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await media.stop()
+
+    assert notion.received == size
+    print(
+        f"{size / MB:7.0f} МБ  {size / MB / elapsed:7.1f} МБ/с  "
+        f"пик памяти {peak / MB:6.1f} МБ  буфер {media.peak_buffer / MB:5.1f} МБ"
+    )
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [20, 100, 500]
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for size_mb in sizes:
+            size = size_mb * MB
+            asyncio.run(run(f"{base}/{size}", size))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк локального поиска заметок (/find).
+
+Заполняет индекс N заметками на P страницах и измеряет задержки
+search_notes p50/p99 для запросов из одного и двух слов (с префиксом),
+с фильтром по отметке и без, — с FTS5 и на запасном поиске по подстроке.
+
+Запуск: python scripts/bench_search.py [число_заметок] [число_страниц]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Database  # noqa: E402
+from src.search import search_terms  # noqa: E402
+
+WORDS = (
+    "купить молоко хлеб позвонить маме написать отчёт встреча проект бюджет "
+    "прочитать книгу записаться врач оплатить счёт починить велосипед подарок "
+    "идея статья презентация отпуск билеты налог ремонт кухня сад собака"
+).split()
+QUERIES = ["молок", "отчёт", "купить хлеб", "позв мам", "бюдж проект", "велосипед"]
+ROUNDS = 200
+
+
+def fill(db: Database, notes: int, pages: int, rng: random.Random):
+    """Заполнить индекс случайными заметками."""
+    started = time.perf_counter()
+    for page in range(pages):
+        rows = [
+            (f"p{page}-b{i}", " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12))),
+             rng.random() < 0.6)
+            for i in range(notes // pages)
+        ]
+        db.sync_page_index(f"page-{page}", rows, time.time())
+    return time.perf_counter() - started
+
+
+def measure(db: Database, pages: int, rng: random.Random) -> list:
+    """Задержки поиска в миллисекундах."""
+    latencies = []
+    for _ in range(ROUNDS):
+        page_id = f"page-{rng.randrange(pages)}"
+        terms = search_terms(rng.choice(QUERIES))
+        checked = rng.choice((None, False))
+        started = time.perf_counter()
+        db.search_notes(page_id, terms, checked, 10)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<10} p50 {statistics.median(latencies):7.2f} мс   p99 {p99:7.2f} мс")
+
+
+def main():
+    notes = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        db.init_database()
+        elapsed = fill(db, notes, pages, rng)
+        print(f"Проиндексировано {notes} заметок на {pages} страницах за {elapsed:.1f} с")
+
+        if db.fts_enabled:
+            report("FTS5", measure(db, pages, rng))
+        db.fts_enabled = False
+        report("подстрока", measure(db, pages, rng))
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта бота.
+
+Измеряет время от запуска процесса `python -m src.bot` до первого запроса
+getUpdates. Вместо api.telegram.org используется локальная заглушка Bot API
+(через TELEGRAM_API_BASE_URL), база создаётся во временной директории.
+
+Дополнительно проверяет бюджет времени импорта модулей проекта
+(python -X importtime) и то, что отложенные модули не загружаются при старте.
+
+Запуск: python scripts/bench_startup.py [число_запусков] [бюджет_старта_мс]
+Код возврата 1, если какой-либо бюджет превышен.
+"""
+
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOT_TOKEN = '123456:bench'
+
+# Бюджет кумулятивного времени импорта, мс
+IMPORT_BUDGET_MS = {
+    'src.bot': 600,
+    'src.handlers': 40,
+    'src.capture': 25,
+    'src.notion_api': 20,
+    'src.database': 10,
+    'src.app_globals': 5,
+}
+
+# Модули, которые не должны загружаться при `import src.bot`: обработчики и клиент
+# Notion подключает main(), рассылки — фоновая задача после начала опроса
+DEFERRED_MODULES = (
+    'src.notifications', 'src.handlers', 'src.executors', 'src.fair_queue',
+    'src.http_pool', 'src.log_pipeline', 'src.notion_api', 'notion_client',
+)
+
+# Что импортирует main() до первого getUpdates — на этом проверяется бюджет
+STARTUP_IMPORTS = 'import src.bot, src.handlers, src.log_pipeline'
+
+
+class StubBotAPI(BaseHTTPRequestHandler):
+    """Минимальная заглушка Bot API: getMe, deleteWebhook, getUpdates."""
+
+    first_get_updates = None
+    event = threading.Event()
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+
+        if method == 'getUpdates':
+            if StubBotAPI.first_get_updates is None:
+                StubBotAPI.first_get_updates = time.perf_counter()
+                StubBotAPI.event.set()
+            result = []
+        elif method == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        else:
+            result = True
+
+        body = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure_startup(port: int, data_dir: str) -> float:
+    """Один холодный старт: секунды от exec до первого getUpdates."""
+    StubBotAPI.first_get_updates = None
+    StubBotAPI.event.clear()
+
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=BOT_TOKEN,
+        TELEGRAM_API_BASE_URL=f'http://127.0.0.1:{port}/bot',
+        DATA_DIR=data_dir,
+        PYTHONPATH=ROOT,
+    )
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'src.bot'], cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not StubBotAPI.event.wait(30):
+            raise RuntimeError("Бот не вызвал getUpdates за 30 секунд")
+        return StubBotAPI.first_get_updates - started
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def measure_imports(statement: str = 'import src.bot') -> dict:
+    """Кумулятивное время импорта модулей при выполнении statement, мс."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT),
+        capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, _self, cumulative, name = (part.strip() for part in line.replace('import time:', '|', 1).split('|'))
+        timings[name] = int(cumulative) / 1000
+    return timings
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    startup_budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1500
+    ok = True
+
+    # Прогрев: компиляция .pyc не должна попасть в измерения
+    measure_imports(STARTUP_IMPORTS)
+    timings = measure_imports(STARTUP_IMPORTS)
+
+    print("Импорт модулей (кумулятивно):")
+    for module, budget in IMPORT_BUDGET_MS.items():
+        spent = timings.get(module)
+        if spent is None:
+            print(f"  {module:<20} не импортирован")
+            continue
+        status = 'OK' if spent <= budget else 'ПРЕВЫШЕН'
+        ok = ok and spent <= budget
+        print(f"  {module:<20} {spent:8.1f} мс (бюджет {budget} мс) {status}")
+
+    bot_timings = measure_imports()
+    print(f"  {'import src.bot':<20} {bot_timings.get('src.bot', 0):8.1f} мс")
+    for module in DEFERRED_MODULES:
+        if module in bot_timings:
+            ok = False
+            print(f"  {module:<20} загружен при старте, хотя должен быть отложен")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubBotAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            samples = [measure_startup(server.server_address[1], data_dir) * 1000 for _ in range(runs)]
+    finally:
+        server.shutdown()
+
+    median = statistics.median(samples)
+    print(f"\nСтарт до первого getUpdates ({runs} запусков):")
+    print(f"  медиана {median:.0f} мс, мин {min(samples):.0f} мс, макс {max(samples):.0f} мс "
+          f"(бюджет {startup_budget_ms:.0f} мс)")
+    ok = ok and median <= startup_budget_ms
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
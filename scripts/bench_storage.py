@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк хранилищ пользователей под конкурентной нагрузкой.
+
+Запускает N одновременных «обработчиков», каждый выполняет смесь операций,
+похожую на работу бота: в основном get_user_config (каждое сообщение),
+изредка чтение настроек уведомлений и запись версии. Печатает пропускную
+способность и задержки p50/p99 для каждого хранилища.
+
+PostgreSQL проверяется, если задан DATABASE_URL и установлен asyncpg.
+
+Запуск: python scripts/bench_storage.py [число_операций] [параллельность]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import Database  # noqa: E402
+from src.storage import ASYNCPG_AVAILABLE, MemoryUserStore, PostgresUserStore, SQLiteUserStore  # noqa: E402
+
+USERS = 1000
+
+
+async def one_operation(store, rng: random.Random):
+    """Одна операция из смеси: 90% конфиг, 8% уведомления, 2% запись."""
+    user_id = rng.randrange(USERS)
+    roll = rng.random()
+    if roll < 0.90:
+        await store.get_user_config(user_id)
+    elif roll < 0.98:
+        await store.get_notification_settings(user_id)
+    else:
+        await store.set_user_version(user_id, f"1.{rng.randrange(100)}.0")
+
+
+async def run(name: str, store, operations: int, concurrency: int):
+    await store.init()
+    for user_id in range(USERS):
+        await store.save_notion_token(user_id, f"token-{user_id}")
+        await store.save_page_config(user_id, f"page-{user_id}", "Inbox")
+
+    latencies = []
+
+    async def worker(seed: int, count: int):
+        rng = random.Random(seed)
+        for _ in range(count):
+            started = time.perf_counter()
+            await one_operation(store, rng)
+            latencies.append(time.perf_counter() - started)
+
+    per_worker = operations // concurrency
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(seed, per_worker) for seed in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await store.close()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:9s} {len(latencies) / elapsed:9.0f} оп/с  p50 {p50:7.2f} мс  p99 {p99:7.2f} мс")
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print(f"{operations} операций, {concurrency} параллельных обработчиков, {USERS} пользователей")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        db.init_database()
+        asyncio.run(run("sqlite", SQLiteUserStore(db), operations, concurrency))
+    asyncio.run(run("memory", MemoryUserStore(), operations, concurrency))
+
+    dsn = os.getenv('DATABASE_URL')
+    if dsn and ASYNCPG_AVAILABLE:
+        asyncio.run(run("postgres", PostgresUserStore(dsn), operations, concurrency))
+    else:
+        print("postgres  пропущен: задайте DATABASE_URL и установите asyncpg")
+
+
+if __name__ == "__main__":
+    main()
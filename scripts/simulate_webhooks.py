@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Симулятор вебхуков Notion для локальной проверки приёмника.
+
+Отправляет подписанное событие запущенному боту (NOTION_WEBHOOK_PORT),
+как это сделал бы Notion. Секрет берётся из NOTION_WEBHOOK_SECRET.
+
+Примеры:
+  # На странице-инбоксе добавили или изменили блоки
+  python scripts/simulate_webhooks.py page.content_updated <page_id>
+  # В базе данных-инбоксе создали запись
+  python scripts/simulate_webhooks.py page.created <record_id> --parent <database_id> --parent-type database
+  # Подтверждение подписки (без подписи)
+  python scripts/simulate_webhooks.py --verification secret_test
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.webhooks import NOTION_WEBHOOK_PATH, NOTION_WEBHOOK_SECRET, build_event, send_event  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправить событие Notion приёмнику вебхуков")
+    parser.add_argument('type', nargs='?', default='page.content_updated', help="тип события")
+    parser.add_argument('entity_id', nargs='?', help="ID страницы, записи или источника данных")
+    parser.add_argument('--entity-type', default='page')
+    parser.add_argument('--parent', help="ID родителя (база данных, источник данных, страница)")
+    parser.add_argument('--parent-type', default='page')
+    parser.add_argument('--url', default=f"http://127.0.0.1:{os.getenv('NOTION_WEBHOOK_PORT', '8081')}"
+                                         f"{NOTION_WEBHOOK_PATH}")
+    parser.add_argument('--secret', default=NOTION_WEBHOOK_SECRET)
+    parser.add_argument('--verification', help="отправить токен проверки подписки вместо события")
+    args = parser.parse_args()
+
+    if args.verification:
+        event, secret = {"verification_token": args.verification}, None
+    else:
+        if not args.entity_id:
+            parser.error("укажите entity_id")
+        event = build_event(args.type, args.entity_id, args.entity_type, args.parent, args.parent_type)
+        secret = args.secret
+
+    status = asyncio.run(send_event(args.url, event, secret))
+    print(f"{args.url}: HTTP {status}")
+    sys.exit(0 if status == 200 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Контроль допуска запросов к Notion.
+
+Ограничивает число одновременно выполняющихся операций с Notion — в целом
+и на одного пользователя. Когда лимит исчерпан, обработчики не ждут в
+очереди без ограничений, а деградируют: запись заметки ставится в
+фоновую очередь, /list отвечает из кэша.
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+NOTION_INFLIGHT_GLOBAL = int(os.getenv('NOTION_INFLIGHT_GLOBAL', '32'))
+NOTION_INFLIGHT_PER_USER = int(os.getenv('NOTION_INFLIGHT_PER_USER', '2'))
+
+
+class AdmissionController:
+    """Счётчики операций с Notion в полёте с глобальным и пользовательским лимитом.
+
+    Используется только из цикла событий, поэтому блокировки не нужны.
+    """
+
+    def __init__(self, global_limit: int = NOTION_INFLIGHT_GLOBAL,
+                 per_user_limit: int = NOTION_INFLIGHT_PER_USER):
+        """Инициализация контроллера."""
+        self.global_limit = global_limit
+        self.per_user_limit = per_user_limit
+        self.in_flight = 0
+        self._per_user: Dict[int, int] = defaultdict(int)
+        self._released: Optional[asyncio.Condition] = None
+        self.admitted = 0
+        self.denied = 0
+
+    def _can_admit(self, user_id: int) -> bool:
+        return self.in_flight < self.global_limit and self._per_user[user_id] < self.per_user_limit
+
+    def try_acquire(self, user_id: int) -> bool:
+        """Занять слот без ожидания.
+
+        Returns:
+            bool: False, если лимит исчерпан — вызывающий должен деградировать
+        """
+        if not self._can_admit(user_id):
+            self.denied += 1
+            return False
+        self._take(user_id)
+        return True
+
+    async def acquire(self, user_id: int):
+        """Дождаться свободного слота (для фоновых задач)."""
+        if self._released is None:
+            self._released = asyncio.Condition()
+        async with self._released:
+            await self._released.wait_for(lambda: self._can_admit(user_id))
+            self._take(user_id)
+
+    def _take(self, user_id: int):
+        self.in_flight += 1
+        self._per_user[user_id] += 1
+        self.admitted += 1
+
+    def release(self, user_id: int):
+        """Освободить слот."""
+        self.in_flight -= 1
+        self._per_user[user_id] -= 1
+        if self._per_user[user_id] <= 0:
+            del self._per_user[user_id]
+        if self._released is not None:
+            asyncio.get_running_loop().create_task(self._notify())
+
+    async def _notify(self):
+        async with self._released:
+            self._released.notify_all()
+
+    def stats(self) -> dict:
+        """Снимок счётчиков."""
+        return {
+            'in_flight': self.in_flight,
+            'users_in_flight': len(self._per_user),
+            'admitted': self.admitted,
+            'denied': self.denied,
+        }
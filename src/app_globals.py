@@ -1,16 +1,85 @@
 """Global application objects.
 
 This module contains global instances that are shared across the application.
+They are constructed by init_globals() from main(), not at import time, so
+importing the bot does not touch the filesystem or build unused objects.
+Handlers must read them as attributes of this module at call time.
 """
 
-from src.database import Database
-from src.notion_api import NotionClient
+from typing import TYPE_CHECKING, Optional
 
-# Global database instance
-db = Database()
+if TYPE_CHECKING:
+    from src.admission import AdmissionController
+    from src.capture import CaptureQueue
+    from src.database import Database
+    from src.inbox_cache import ChangeTracker, InboxCache
+    from src.list_view import ListCursorCache
+    from src.mark_done import MarkDoneBatcher, RateBudget
+    from src.media import MediaCapture
+    from src.page_index import PageIndex
+    from src.search import NoteSearch
+    from src.storage import UserStore
 
-# Global Notion API client
-notion_client = NotionClient()
+# Global database instance (local SQLite)
+db: Optional['Database'] = None
 
-# Global notification manager (initialized in main())
-notification_manager = None
+# Global user store: config, notification settings, versions (see src/storage.py)
+storage: Optional['UserStore'] = None
+
+# Global workspace page-title index (per Notion token)
+page_index: Optional['PageIndex'] = None
+
+# Global admission control for Notion work and the overflow capture queue
+admission: Optional['AdmissionController'] = None
+capture_queue: Optional['CaptureQueue'] = None
+
+# Global cache of the last /list result per user
+inbox_cache: Optional['InboxCache'] = None
+
+# Global per-user inbox change times from Notion webhooks (see src/webhooks.py)
+inbox_changes: Optional['ChangeTracker'] = None
+
+# Global Notion cursors of the paginated /list per user
+list_cursors: Optional['ListCursorCache'] = None
+
+# Global per-token pacing of background Notion writes
+notion_budget: Optional['RateBudget'] = None
+
+# Global batcher of "mark done" taps from /list and digests
+mark_done: Optional['MarkDoneBatcher'] = None
+
+# Global streaming uploader of photos, documents and voice notes
+media: Optional['MediaCapture'] = None
+
+# Global local full-text search over captured notes (see src/search.py)
+search: Optional['NoteSearch'] = None
+
+
+def init_globals():
+    """Create the global instances (called once from main())."""
+    global db, storage, page_index, admission, capture_queue, inbox_cache, inbox_changes, list_cursors
+    global notion_budget, mark_done, media, search
+
+    from src.admission import AdmissionController
+    from src.capture import CaptureQueue
+    from src.database import Database
+    from src.inbox_cache import ChangeTracker, InboxCache
+    from src.list_view import ListCursorCache
+    from src.mark_done import MarkDoneBatcher, RateBudget
+    from src.media import MediaCapture
+    from src.page_index import PageIndex
+    from src.search import NoteSearch
+    from src.storage import create_user_store
+
+    db = Database()
+    storage = create_user_store(db)
+    page_index = PageIndex()
+    admission = AdmissionController()
+    inbox_changes = ChangeTracker()
+    capture_queue = CaptureQueue(db, admission, changes=inbox_changes)
+    inbox_cache = InboxCache()
+    list_cursors = ListCursorCache()
+    notion_budget = RateBudget()
+    mark_done = MarkDoneBatcher(budget=notion_budget)
+    media = MediaCapture(db)
+    search = NoteSearch(db)
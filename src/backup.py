@@ -0,0 +1,319 @@
+"""
+Резервные копии базы бота без остановки.
+
+bot.db — единственная копия токенов, настроек страниц и расписаний.
+Копировать файл работающего бота нельзя (копия может оказаться
+несогласованной), а останавливать бота ради копии — простой.
+
+Снимок делается через backup API SQLite из отдельного соединения только для
+чтения и отдельного потока, по BACKUP_PAGES_PER_STEP страниц за шаг.
+В режиме WAL всё копирование идёт в одной транзакции чтения: снимок
+согласован на её начало, а запись бота не ждёт вовсе. Поэтому плановое
+копирование переводит базу в WAL. Без WAL блокировка отпускается между
+шагами, и запись ждёт не дольше одного шага, но каждая запись бота
+заставляет SQLite начать копирование заново; после BACKUP_MAX_RESTARTS
+перезапусков остаток копируется за один шаг. Готовый снимок проверяется
+(PRAGMA quick_check), сбрасывается на диск и атомарно переименовывается —
+недописанных снимков в каталоге не бывает.
+
+Снимки делаются раз в BACKUP_INTERVAL_HOURS (0 — выключено), хранятся
+последние BACKUP_KEEP. Пока идёт копирование, задержка операций с базой
+измеряется пробными запросами и попадает в отчёт.
+
+Восстановление — копия файла снимка на место базы при остановленном боте:
+
+    python -m src.backup create
+    python -m src.backup list
+    python -m src.backup restore [снимок]   # по умолчанию последний
+
+Прежняя база сохраняется рядом с суффиксом .before-restore.
+"""
+
+import asyncio
+import glob
+import logging
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from src.database import Database
+from src.executors import run_db
+from src.log_pipeline import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Каталог снимков (по умолчанию backups рядом с базой)
+BACKUP_DIR = os.getenv('BACKUP_DIR')
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '24'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+# Страниц базы за один шаг копирования и пауза между шагами
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '128'))
+BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', '0.005'))
+BACKUP_MAX_RESTARTS = int(os.getenv('BACKUP_MAX_RESTARTS', '5'))
+# Интервал пробных запросов к базе во время копирования
+BACKUP_PROBE_INTERVAL = 0.05
+
+PARTIAL_SUFFIX = '.partial'
+PREVIOUS_SUFFIX = '.before-restore'
+
+
+class BackupError(Exception):
+    """Снимок не создан или не прошёл проверку."""
+
+
+class _TooManyRestarts(Exception):
+    """База меняется быстрее, чем копируется по шагам."""
+
+
+class BackupReport:
+    """Итог создания снимка."""
+
+    __slots__ = ('path', 'size', 'steps', 'restarts', 'duration', 'probe_p50', 'probe_p99', 'probe_max')
+
+    def __init__(self, path: str, size: int, steps: int, restarts: int, duration: float):
+        self.path = path
+        self.size = size
+        self.steps = steps
+        self.restarts = restarts
+        self.duration = duration
+        # Задержки пробных запросов к базе во время копирования, секунды
+        self.probe_p50: Optional[float] = None
+        self.probe_p99: Optional[float] = None
+        self.probe_max: Optional[float] = None
+
+    def format(self) -> str:
+        """Строка для логов."""
+        text = (
+            f"Снимок базы {os.path.basename(self.path)}: {self.size / 1024 / 1024:.1f} МБ "
+            f"за {self.duration:.2f} с, шагов {self.steps}, перезапусков {self.restarts}"
+        )
+        if self.probe_p50 is not None:
+            text += (
+                f"; задержка операций с базой p50 {self.probe_p50 * 1000:.1f} мс, "
+                f"p99 {self.probe_p99 * 1000:.1f} мс, макс. {self.probe_max * 1000:.1f} мс"
+            )
+        return text
+
+
+def default_backup_dir(db_path: str) -> str:
+    """Каталог снимков: BACKUP_DIR или backups рядом с базой."""
+    return BACKUP_DIR or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups')
+
+
+def _stem(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _quick_check(connection: sqlite3.Connection, path: str):
+    result = connection.execute('PRAGMA quick_check').fetchone()[0]
+    if result != 'ok':
+        raise BackupError(f"Снимок {path} повреждён: {result}")
+
+
+def backup_database(db_path: str, backup_dir: str, pages: int = BACKUP_PAGES_PER_STEP,
+                    sleep: float = BACKUP_STEP_SLEEP, max_restarts: int = BACKUP_MAX_RESTARTS) -> BackupReport:
+    """
+    Создать снимок базы по шагам (блокирующий вызов).
+
+    Raises:
+        BackupError: снимок не прошёл проверку
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(backup_dir, f"{_stem(db_path)}-{stamp}.db")
+    partial = path + PARTIAL_SUFFIX
+    steps = restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        if last_remaining is not None and remaining > last_remaining:
+            # Бот изменил базу — SQLite копирует заново
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+
+    started = time.perf_counter()
+    source = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    target = sqlite3.connect(partial)
+    try:
+        if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            # Транзакция чтения фиксирует снимок: запись бота его не меняет и не ждёт
+            source.execute('BEGIN')
+            source.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except _TooManyRestarts:
+            logger.warning("База меняется во время копирования, остаток копируется за один шаг")
+            source.backup(target)
+            steps += 1
+        _quick_check(target, path)
+        target.close()
+        _fsync(partial)
+        os.replace(partial, path)
+        _fsync(backup_dir)
+    except BaseException:
+        target.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        source.close()
+
+    return BackupReport(path, os.path.getsize(path), steps, restarts, time.perf_counter() - started)
+
+
+def list_backups(db_path: str, backup_dir: str) -> List[str]:
+    """Снимки базы, новые первыми."""
+    return sorted(glob.glob(os.path.join(backup_dir, f"{glob.escape(_stem(db_path))}-*.db")), reverse=True)
+
+
+def prune_backups(db_path: str, backup_dir: str, keep: int = BACKUP_KEEP) -> List[str]:
+    """Удалить снимки сверх последних keep. Возвращает удалённые пути."""
+    removed = list_backups(db_path, backup_dir)[max(keep, 1):]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def restore_database(backup_path: str, db_path: str) -> float:
+    """
+    Восстановить базу из снимка (бот должен быть остановлен).
+
+    Снимок проверяется, копируется рядом с базой и атомарно встаёт на её
+    место. Прежняя база вместе с журналом WAL переименовывается в
+    *.before-restore: журнал старой базы нельзя оставлять рядом с новой.
+
+    Returns:
+        float: длительность восстановления в секундах
+
+    Raises:
+        BackupError: снимок повреждён
+    """
+    started = time.perf_counter()
+    check = sqlite3.connect(f"file:{os.path.abspath(backup_path)}?mode=ro", uri=True)
+    try:
+        _quick_check(check, backup_path)
+    finally:
+        check.close()
+
+    staged = db_path + '.restore'
+    shutil.copyfile(backup_path, staged)
+    _fsync(staged)
+    for suffix in ('-wal', '-shm'):
+        # Журнал от прошлого восстановления не должен прилипнуть к новой прежней базе
+        if os.path.exists(db_path + PREVIOUS_SUFFIX + suffix):
+            os.remove(db_path + PREVIOUS_SUFFIX + suffix)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.replace(db_path + suffix, db_path + PREVIOUS_SUFFIX + suffix)
+    os.replace(staged, db_path)
+    _fsync(os.path.dirname(os.path.abspath(db_path)))
+    return time.perf_counter() - started
+
+
+class DatabaseBackup:
+    """Плановые снимки базы бота с хранением последних BACKUP_KEEP."""
+
+    def __init__(self, db: Database, backup_dir: Optional[str] = None, keep: int = BACKUP_KEEP,
+                 pages: int = BACKUP_PAGES_PER_STEP, sleep: float = BACKUP_STEP_SLEEP):
+        """Инициализация резервного копирования."""
+        self.db = db
+        self.backup_dir = backup_dir or default_backup_dir(db.db_path)
+        self.keep = keep
+        self.pages = pages
+        self.sleep = sleep
+        self.last: Optional[BackupReport] = None
+
+    def schedule(self, scheduler, hours: float = BACKUP_INTERVAL_HOURS):
+        """Добавить периодические снимки в планировщик."""
+        if hours <= 0:
+            return
+        scheduler.add_job(
+            self.run_scheduled, 'interval', hours=hours,
+            id='db_backup', replace_existing=True
+        )
+        logger.info(f"Снимки базы запланированы раз в {hours:g} ч, хранится {self.keep}")
+
+    async def run_scheduled(self):
+        """Плановый снимок: ошибки только логируются."""
+        try:
+            await self.run()
+        except Exception as e:
+            logger.error(f"Не удалось создать снимок базы: {e}")
+
+    async def run(self) -> BackupReport:
+        """Создать снимок в отдельном потоке, удалить старые и измерить влияние на запросы к базе."""
+        await run_db(self.db.enable_wal)
+        copying = asyncio.get_running_loop().create_task(asyncio.to_thread(
+            backup_database, self.db.db_path, self.backup_dir, self.pages, self.sleep
+        ))
+        latencies = await self._probe_until(copying)
+        report = await copying
+        if latencies:
+            latencies.sort()
+            report.probe_p50 = statistics.median(latencies)
+            report.probe_p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+            report.probe_max = latencies[-1]
+
+        removed = await asyncio.to_thread(prune_backups, self.db.db_path, self.backup_dir, self.keep)
+        self.last = report
+        logger.info(report.format() + (f", удалено старых снимков {len(removed)}" if removed else ""))
+        return report
+
+    async def _probe_until(self, task: asyncio.Task) -> List[float]:
+        """Задержки пробных запросов через пул SQLite, пока идёт копирование."""
+        latencies = []
+        while not task.done():
+            started = time.perf_counter()
+            await run_db(self.db.ping)
+            latencies.append(time.perf_counter() - started)
+            await asyncio.wait([task], timeout=BACKUP_PROBE_INTERVAL)
+        return latencies
+
+
+def main():
+    """Снимки из командной строки: create, list, restore [снимок]."""
+    setup_logging()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'create'
+    db_path = Database().db_path
+    backup_dir = default_backup_dir(db_path)
+
+    if command == 'create':
+        report = backup_database(db_path, backup_dir)
+        prune_backups(db_path, backup_dir)
+        print(report.format())
+    elif command == 'list':
+        for path in list_backups(db_path, backup_dir):
+            print(f"{path}\t{os.path.getsize(path) / 1024 / 1024:.1f} МБ")
+    elif command == 'restore':
+        backups = list_backups(db_path, backup_dir)
+        source = sys.argv[2] if len(sys.argv) > 2 else (backups[0] if backups else None)
+        if source is None:
+            print(f"В {backup_dir} нет снимков")
+            sys.exit(1)
+        duration = restore_database(source, db_path)
+        print(f"База {db_path} восстановлена из {source} за {duration:.2f} с "
+              f"(прежняя — {db_path + PREVIOUS_SUFFIX})")
+    else:
+        print("Использование: python -m src.backup [create|list|restore [снимок]]")
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Декодирование блоков Notion в компактные записи.
+
+Ответы Notion разбираются сразу в объекты BlockRecord со `__slots__`:
+из каждого блока сохраняются только id, тип, текст, отметка чекбокса, время
+изменения и два признака — есть ли вложенные блоки и простой ли это текст
+без оформления. Остальные поля ответа не удерживаются в памяти. Для разбора JSON
+используется orjson, если он установлен.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+
+    def loads(data: bytes):
+        """Разобрать JSON."""
+        return orjson.loads(data)
+except ImportError:
+    import json
+
+    def loads(data: bytes):
+        """Разобрать JSON."""
+        return json.loads(data)
+
+
+# Типы блоков, из которых извлекается текст
+TEXT_BLOCK_TYPES = ('to_do', 'paragraph')
+
+# Оформление rich_text по умолчанию
+_PLAIN_ANNOTATIONS = {
+    'bold': False, 'italic': False, 'strikethrough': False, 'underline': False, 'code': False, 'color': 'default',
+}
+
+
+class BlockRecord:
+    """Компактное представление блока Notion."""
+
+    __slots__ = ('id', 'type', 'text', 'checked', 'last_edited_time', 'has_children', 'plain')
+
+    def __init__(self, id: str, type: str, text: str, checked: Optional[bool], last_edited_time: Optional[str],
+                 has_children: bool = False, plain: bool = True):
+        self.id = id
+        self.type = type
+        self.text = text
+        # True/False для to_do, None для остальных типов
+        self.checked = checked
+        self.last_edited_time = last_edited_time
+        self.has_children = has_children
+        # False, если в тексте есть оформление, ссылки или упоминания — text передаёт его не полностью
+        self.plain = plain
+
+    def __repr__(self):
+        return f"BlockRecord({self.id!r}, {self.type!r}, {self.text!r}, {self.checked!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, BlockRecord):
+            return NotImplemented
+        return (
+            self.id == other.id and self.type == other.type and self.text == other.text
+            and self.checked == other.checked and self.last_edited_time == other.last_edited_time
+        )
+
+
+def extract_text(rich_text: list) -> str:
+    """Извлечь текст из rich_text массива."""
+    return ''.join(
+        (item.get('text') or {}).get('content', '')
+        for item in rich_text
+        if item.get('type') == 'text'
+    )
+
+
+def is_plain_rich_text(rich_text: list) -> bool:
+    """Состоит ли rich_text только из простого текста без оформления и ссылок."""
+    for item in rich_text:
+        if item.get('type') != 'text' or (item.get('text') or {}).get('link'):
+            return False
+        annotations = item.get('annotations')
+        if annotations and any(annotations.get(key, value) != value for key, value in _PLAIN_ANNOTATIONS.items()):
+            return False
+    return True
+
+
+def decode_block(block: dict) -> Optional[BlockRecord]:
+    """Преобразовать блок из ответа Notion в BlockRecord.
+
+    Returns:
+        BlockRecord или None для блоков без текста (изображения, разделители и т.п.)
+    """
+    block_type = block.get('type')
+    if block_type not in TEXT_BLOCK_TYPES:
+        return None
+
+    data = block.get(block_type) or {}
+    rich_text = data.get('rich_text', ())
+    return BlockRecord(
+        block.get('id', ''),
+        block_type,
+        extract_text(rich_text),
+        bool(data.get('checked', False)) if block_type == 'to_do' else None,
+        block.get('last_edited_time'),
+        bool(block.get('has_children', False)),
+        is_plain_rich_text(rich_text),
+    )
+
+
+def decode_database_item(page: dict, title_property: str, checkbox_property: str) -> BlockRecord:
+    """Преобразовать страницу базы данных в BlockRecord типа to_do."""
+    properties = page.get('properties') or {}
+    title = properties.get(title_property) or {}
+    checkbox = properties.get(checkbox_property) or {}
+    return BlockRecord(
+        page.get('id', ''),
+        'to_do',
+        extract_text(title.get('title', ())),
+        bool(checkbox.get('checkbox', False)),
+        page.get('last_edited_time'),
+    )
+
+
+def decode_blocks(blocks: Iterable[dict]) -> List[BlockRecord]:
+    """Преобразовать список блоков, пропуская блоки без текста."""
+    records = []
+    for block in blocks:
+        record = decode_block(block)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def decode_block_list(raw: bytes) -> Tuple[List[BlockRecord], Optional[str]]:
+    """
+    Разобрать сырой ответ `blocks.children.list`.
+
+    Returns:
+        tuple: (записи блоков, курсор следующей страницы или None)
+    """
+    response = loads(raw)
+    records = decode_blocks(response.get('results', ()))
+    next_cursor = response.get('next_cursor') if response.get('has_more') else None
+    return records, next_cursor
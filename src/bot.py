@@ -5,6 +5,7 @@ Telegram бот для записи сообщений в Notion Inbox стра
 Entry point for the bot. Initializes all components and starts polling.
 """
 
+import asyncio
 import logging
 import os
 from telegram import Update
@@ -17,39 +18,107 @@ from telegram.ext import (
     filters,
 )
 
-from src.app_globals import db, notification_manager
-from src.notifications import NotificationManager
-from src.notion_api import NotionClient
-from src.handlers import (
-    start,
-    handle_notion_token,
-    handle_page_input,
-    handle_message,
-    reset,
-    list_notes,
-    cancel,
-    help_command,
-    version_command,
-    notifications_command,
-    handle_notification_callback,
-    WAITING_FOR_NOTION_TOKEN,
-    WAITING_FOR_PAGE,
-    SETTING_NOTIFICATIONS,
-    WAITING_FOR_NOTIFICATION_TIME,
-    WAITING_FOR_NOTIFICATION_DAYS,
-    WAITING_FOR_TIMEZONE,
-)
+from src import app_globals
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# Адрес Bot API (например, локальный telegram-bot-api или заглушка бенчмарка)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
+# Порт приёмника вебхуков Notion (не задан — вебхуки выключены)
+NOTION_WEBHOOK_PORT = os.getenv('NOTION_WEBHOOK_PORT')
+
+
+async def post_init(application: Application):
+    """Открыть хранилище и отложить запуск рассылок, чтобы не задерживать первый getUpdates."""
+    await app_globals.storage.init()
+    # Заметки, принятые в очередь до прошлой остановки
+    await app_globals.capture_queue.start(application.bot, app_globals.storage)
+    if NOTION_WEBHOOK_PORT:
+        # Приёмник вебхуков Notion (см. src/webhooks.py)
+        from src.webhooks import WebhookReceiver
+
+        receiver = WebhookReceiver(app_globals.storage, app_globals.inbox_changes)
+        await receiver.start()
+        application.bot_data['webhook_receiver'] = receiver
+    application.bot_data['notifications_startup'] = asyncio.get_running_loop().create_task(
+        start_notifications(application)
+    )
+
+
+async def post_stop(application: Application):
+    """Дописать очередь заметок, пока бот ещё может отредактировать ответы «в очереди»."""
+    left = await app_globals.capture_queue.drain()
+    if left:
+        logger.warning(f"В очереди осталось заметок: {left}, они будут записаны после запуска")
+
+
+async def post_shutdown(application: Application):
+    """Остановить приёмник вебхуков, хранилище пользователей, загрузчик файлов, поиск и процессы рассылки."""
+    receiver = application.bot_data.get('webhook_receiver')
+    if receiver is not None:
+        await receiver.stop()
+    await app_globals.storage.close()
+    await app_globals.media.stop()
+    logger.info(app_globals.media.format_stats())
+    await app_globals.search.stop()
+    logger.info(app_globals.search.format_stats())
+    pool = application.bot_data.get('digest_workers')
+    if pool is not None:
+        await asyncio.get_running_loop().run_in_executor(None, pool.stop)
+
+
+async def start_notifications(application: Application):
+    """Запустить менеджер уведомлений после начала опроса Telegram."""
+    while not application.running:
+        await asyncio.sleep(0.05)
+
+    try:
+        # APScheduler и модуль рассылок загружаются только здесь
+        from src.notifications import NotificationManager
+
+        notif_manager = NotificationManager(
+            app_globals.db, application.bot, app_globals.storage, app_globals.inbox_changes
+        )
+        await notif_manager.start()
+        # Сохраняем в bot_data для доступа из обработчиков
+        application.bot_data['notification_manager'] = notif_manager
+
+        if notif_manager.queue_mode:
+            # Рассылки формируют отдельные процессы (см. src/digest_worker.py)
+            from src.digest_worker import DIGEST_WORKERS, POOL_CHECK_INTERVAL, WorkerPool
+            from src.executors import run_db
+
+            await run_db(app_globals.db.enable_wal)
+            if DIGEST_WORKERS > 0:
+                pool = WorkerPool(DIGEST_WORKERS)
+                pool.start()
+                application.bot_data['digest_workers'] = pool
+                notif_manager.scheduler.add_job(pool.check, 'interval', seconds=POOL_CHECK_INTERVAL)
+
+        # Архивация выполненных задач использует тот же планировщик
+        from src.compactor import Compactor
+
+        compactor = Compactor(
+            app_globals.db, application.bot, app_globals.notion_budget, app_globals.storage
+        )
+        compactor.schedule(notif_manager.scheduler)
+
+        # Снимки базы тем же планировщиком (см. src/backup.py)
+        from src.backup import DatabaseBackup
+
+        DatabaseBackup(app_globals.db).schedule(notif_manager.scheduler)
+    except Exception as e:
+        logger.error(f"Не удалось запустить менеджер уведомлений: {e}")
+
 
 def main():
     """Главная функция запуска бота."""
+    # Модули проекта (и notion-client с httpx/h2) загружаются при запуске, а не при импорте src.bot
+    from src.log_pipeline import setup_logging, shutdown_logging
+
+    # Логи пишет фоновый поток (см. src/log_pipeline.py)
+    setup_logging()
+
     # Получаем токен бота из переменной окружения
     bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
     
@@ -58,20 +127,61 @@ def main():
         print("Ошибка: Установите переменную окружения TELEGRAM_BOT_TOKEN")
         return
     
-    # Создаем приложение
-    application = Application.builder().token(bot_token).build()
-    
+    from src.executors import format_executor_stats, shutdown_executors
+    from src.fair_queue import FairUpdateProcessor
+    from src.http_pool import format_pool_stats, shutdown_shared_transport
+    from src.notion_api import NotionClient
+    from src.handlers import (
+        start,
+        handle_notion_token,
+        handle_page_input,
+        handle_page_selection,
+        handle_message,
+        handle_media,
+        handle_edited_message,
+        reset,
+        list_notes,
+        find_command,
+        handle_list_page,
+        handle_mark_done,
+        archive_command,
+        split_command,
+        cancel,
+        help_command,
+        version_command,
+        notifications_command,
+        handle_notification_callback,
+        WAITING_FOR_NOTION_TOKEN,
+        WAITING_FOR_PAGE,
+        SETTING_NOTIFICATIONS,
+        WAITING_FOR_NOTIFICATION_TIME,
+        WAITING_FOR_NOTIFICATION_DAYS,
+        WAITING_FOR_TIMEZONE,
+    )
+
+    # Глобальные объекты создаются здесь, а не при импорте модулей
+    app_globals.init_globals()
+
     # Инициализируем базу данных сначала (с миграциями)
-    db.init_database()
-    
-    # Инициализируем менеджер уведомлений
-    notion_client = NotionClient()
-    notif_manager = NotificationManager(db, notion_client, application.bot)
-    notif_manager.start()
-    
-    # Сохраняем в bot_data для доступа из обработчиков
-    application.bot_data['notification_manager'] = notif_manager
-    
+    app_globals.db.init_database()
+
+    # Создаем приложение
+    # Диалоги и user_data переживают перезапуск (см. src/persistence.py)
+    from src.persistence import CONVERSATION_TTL, SQLitePersistence
+
+    persistence = SQLitePersistence(app_globals.db)
+    # Обновления разных пользователей обрабатываются параллельно и по очереди,
+    # обновления одного пользователя — последовательно (см. src/fair_queue.py)
+    update_processor = FairUpdateProcessor()
+    builder = (
+        Application.builder().token(bot_token)
+        .post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown).persistence(persistence)
+        .concurrent_updates(update_processor)
+    )
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    application = builder.build()
+
     # Создаем ConversationHandler для настройки
     setup_handler = ConversationHandler(
         entry_points=[CommandHandler('start', start)],
@@ -80,10 +190,14 @@ def main():
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_notion_token)
             ],
             WAITING_FOR_PAGE: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_page_input)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_page_input),
+                CallbackQueryHandler(handle_page_selection, pattern='^page_select_')
             ],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
+        name='setup',
+        persistent=True,
+        conversation_timeout=CONVERSATION_TTL,
     )
     
     # Создаем ConversationHandler для настройки уведомлений
@@ -104,23 +218,51 @@ def main():
             ],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
+        name='notifications',
+        persistent=True,
+        conversation_timeout=CONVERSATION_TTL,
     )
     
     # Регистрируем обработчики
     application.add_handler(setup_handler)
     application.add_handler(notifications_handler)
     application.add_handler(CommandHandler('list', list_notes))
+    application.add_handler(CommandHandler('find', find_command))
+    application.add_handler(CallbackQueryHandler(handle_list_page, pattern=r'^list_page_\d+$'))
+    application.add_handler(CallbackQueryHandler(handle_mark_done, pattern='^done_'))
     application.add_handler(CommandHandler('reset', reset))
+    application.add_handler(CommandHandler('archive', archive_command))
+    application.add_handler(CommandHandler('split', split_command))
     application.add_handler(CommandHandler('help', help_command))
     application.add_handler(CommandHandler('version', version_command))
     application.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
+        MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND, handle_message)
+    )
+    application.add_handler(
+        MessageHandler(
+            filters.UpdateType.MESSAGE & (filters.PHOTO | filters.Document.ALL | filters.VOICE | filters.AUDIO),
+            handle_media
+        )
+    )
+    application.add_handler(
+        MessageHandler(filters.UpdateType.EDITED_MESSAGE & filters.TEXT & ~filters.COMMAND, handle_edited_message)
     )
     
     # Запускаем бота
     logger.info("Бот запущен...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
+    logger.info(format_pool_stats())
+    logger.info(NotionClient.reads.format_stats())
+    logger.info(NotionClient.policy.format_stats())
+    logger.info(update_processor.scheduler.format_stats())
+    logger.info(app_globals.capture_queue.scheduler.format_stats())
+    logger.info(format_executor_stats())
+    shutdown_executors()
+    NotionClient.policy.shutdown()
+    shutdown_shared_transport()
+    shutdown_logging()
+
 
 if __name__ == '__main__':
     main()
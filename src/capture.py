@@ -0,0 +1,357 @@
+"""
+Запись заметок из сообщений Telegram в Notion.
+
+Каждое сообщение привязывается к созданному блоку Notion по
+(chat_id, message_id). Привязка делает запись идемпотентной: повторная
+обработка того же сообщения не создаёт дубль, даже если предыдущая попытка
+оборвалась по таймауту уже после того, как Notion создал блок.
+"""
+
+import asyncio
+import logging
+import os
+from typing import List, Optional, Set
+
+from src.admission import AdmissionController
+from src.database import Database
+from src.encoder import note_texts
+from src.executors import ExecutorSaturated, run_db, run_notion
+from src.fair_queue import FairScheduler, current_user
+from src.inbox_cache import ChangeTracker
+from src.notion_api import InboxTarget, NotionClient
+from src.notion_errors import NotionError
+from src.search import forget_notes, index_note_texts
+
+logger = logging.getLogger(__name__)
+
+# Максимум заметок, ожидающих записи при перегрузке Notion
+CAPTURE_QUEUE_SIZE = int(os.getenv('CAPTURE_QUEUE_SIZE', '500'))
+CAPTURE_QUEUE_WORKERS = int(os.getenv('CAPTURE_QUEUE_WORKERS', '4'))
+# Попыток записи заметки из очереди при временных ошибках Notion
+CAPTURE_MAX_ATTEMPTS = int(os.getenv('CAPTURE_MAX_ATTEMPTS', '5'))
+CAPTURE_RETRY_DELAY = float(os.getenv('CAPTURE_RETRY_DELAY', '10'))
+# Сколько секунд дописывать очередь при остановке бота
+CAPTURE_DRAIN_TIMEOUT = float(os.getenv('CAPTURE_DRAIN_TIMEOUT', '20'))
+
+
+async def capture_note(db: Database, notion: NotionClient, chat_id: int, message_id: int,
+                 target: InboxTarget, text: str, per_line: bool = False) -> str:
+    """
+    Записать сообщение в инбокс ровно один раз.
+
+    В режиме per_line каждая строка сообщения становится отдельной задачей;
+    все блоки заметки привязываются к сообщению.
+
+    Returns:
+        str: ID первого блока (или страницы базы данных) Notion с заметкой
+    """
+    # В базе данных заметка всегда одна запись
+    per_line = per_line and not target.is_database
+    mapping = await run_db(db.get_message_block, chat_id, message_id)
+
+    if mapping.get('block_id'):
+        # Сообщение уже записано
+        return mapping['block_id']
+
+    if mapping:
+        # Прошлая попытка оборвалась: проверяем, не созданы ли блоки на самом деле
+        block_ids = await _recover_note(db, notion, chat_id, message_id, target, mapping)
+        if block_ids:
+            return block_ids[0]
+        await run_db(db.delete_message_block, chat_id, message_id)
+
+    await run_db(db.reserve_message_block, chat_id, message_id, target.id, text, per_line)
+    try:
+        block_ids = await run_notion(notion.add_note, target, text, per_line)
+    except NotionClient.UNKNOWN_OUTCOME_ERRORS:
+        # Блок мог быть создан — оставляем резерв для проверки при повторе
+        raise
+    except Exception:
+        await run_db(db.delete_message_block, chat_id, message_id)
+        raise
+
+    await run_db(db.save_message_block, chat_id, message_id, block_ids[0], text, block_ids[1:])
+    await index_note_texts(db, target.id, block_ids, _indexed_texts(target, text, per_line))
+    return block_ids[0]
+
+
+async def _recover_note(db: Database, notion: NotionClient, chat_id: int, message_id: int,
+                        target: InboxTarget, mapping: dict) -> List[str]:
+    """
+    Найти в Notion блоки заметки, запись которой оборвалась с неизвестным исходом.
+
+    Найденная заметка дописывается (если оборвалась между пачками блоков) и
+    привязывается к сообщению.
+
+    Returns:
+        list: ID блоков заметки или пустой список, если заметка не создана
+    """
+    if mapping['page_id'] != target.id:
+        return []
+    exclude = await run_db(db.get_mapped_block_ids, mapping['page_id'])
+    # Тексты блоков — в режиме /split, в котором начиналась запись
+    texts = _indexed_texts(target, mapping['content'], mapping['per_line'])
+    block_ids = await run_notion(notion.find_note_blocks, target, texts, exclude)
+    if not block_ids:
+        return []
+
+    logger.info(f"Найдена ранее записанная заметка для сообщения {chat_id}/{message_id}")
+    if len(block_ids) < len(texts):
+        # Запись оборвалась между пачками блоков: дописываем остальные строки
+        block_ids += await run_notion(
+            notion.append_note_blocks, target.id, texts[len(block_ids):], block_ids[-1]
+        )
+    await run_db(db.save_message_block, chat_id, message_id, block_ids[0], mapping['content'], block_ids[1:])
+    await index_note_texts(db, target.id, block_ids, texts)
+    return block_ids
+
+
+async def update_note(db: Database, notion: NotionClient, chat_id: int, message_id: int,
+                target: InboxTarget, text: str) -> bool:
+    """
+    Обновить заметку после редактирования сообщения.
+
+    Заметка остаётся в том режиме /split, в котором была записана, даже
+    если пользователь с тех пор переключил его. Если запись заметки
+    оборвалась с неизвестным исходом, её блоки сначала ищутся в Notion.
+
+    Returns:
+        bool: False, если сообщение не привязано к блоку
+    """
+    mapping = await run_db(db.get_message_block, chat_id, message_id)
+    if mapping and not mapping.get('block_id'):
+        if not await _recover_note(db, notion, chat_id, message_id, target, mapping):
+            return False
+        mapping = await run_db(db.get_message_block, chat_id, message_id)
+    if not mapping.get('block_id') or mapping['page_id'] != target.id:
+        return False
+    per_line = mapping['per_line'] and not target.is_database
+
+    if mapping.get('content') != text:
+        block_ids = await run_notion(notion.update_note, target, mapping['block_ids'], text, per_line)
+        await run_db(db.save_message_block, chat_id, message_id, block_ids[0], text, block_ids[1:])
+        await forget_notes(db, [block_id for block_id in mapping['block_ids'] if block_id not in block_ids])
+        await index_note_texts(
+            db, target.id, block_ids, _indexed_texts(target, text, per_line), keep_checked=True
+        )
+    return True
+
+
+def _indexed_texts(target: InboxTarget, text: str, per_line: bool) -> List[str]:
+    """Тексты блоков заметки в том же порядке, что и их ID."""
+    if target.is_database:
+        return [text]
+    return note_texts(text, per_line)
+
+
+class QueuedCapture:
+    """Заметка, отложенная до освобождения слота Notion."""
+
+    __slots__ = ('user_id', 'chat_id', 'message_id', 'token', 'target', 'text', 'ack_message_id', 'per_line',
+                 'attempts')
+
+    def __init__(self, user_id: int, chat_id: int, message_id: int, token: str,
+                 target: InboxTarget, text: str, ack_message_id: Optional[int] = None,
+                 per_line: bool = False, attempts: int = 0):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.token = token
+        self.target = target
+        self.text = text
+        # Сообщение бота «в очереди», которое будет отредактировано по итогу
+        self.ack_message_id = ack_message_id
+        self.per_line = per_line
+        self.attempts = attempts
+
+
+def is_transient(error: BaseException) -> bool:
+    """Стоит ли повторить запись: Notion или пул потоков временно перегружены."""
+    if isinstance(error, NotionError):
+        return error.transient
+    return isinstance(error, ExecutorSaturated)
+
+
+class CaptureQueue:
+    """Ограниченная фоновая очередь записи заметок.
+
+    Заметки пишутся по очередям пользователей (src/fair_queue.py), поэтому
+    заметка лёгкого пользователя не ждёт, пока разберутся сотни пересланных
+    сообщений другого.
+
+    Пользователь получает ответ «в очереди», поэтому заметка хранится в
+    таблице queued_captures до записи в Notion: при остановке бот дописывает
+    очередь (drain), а недописанное загружается при следующем запуске
+    (start). Повтор записи безопасен — его защищает привязка message_blocks.
+    Временные ошибки Notion повторяются с нарастающей задержкой.
+    """
+
+    def __init__(self, db: Database, admission: AdmissionController,
+                 maxsize: int = CAPTURE_QUEUE_SIZE, workers: int = CAPTURE_QUEUE_WORKERS,
+                 changes: Optional[ChangeTracker] = None, max_attempts: int = CAPTURE_MAX_ATTEMPTS,
+                 retry_delay: float = CAPTURE_RETRY_DELAY):
+        """Инициализация очереди."""
+        self.db = db
+        self.admission = admission
+        self.changes = changes
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay = retry_delay
+        self.scheduler = FairScheduler('capture', workers)
+        # Бот для редактирования ответов «в очереди» (задаётся в start)
+        self.bot = None
+        self._waiting = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping: Optional[asyncio.Event] = None
+
+    @property
+    def size(self) -> int:
+        """Число заметок в очереди (включая ожидающие повтора)."""
+        return self._waiting
+
+    async def start(self, bot, storage) -> int:
+        """
+        Загрузить заметки, не записанные до прошлой остановки.
+
+        Returns:
+            int: число загруженных заметок
+        """
+        self.bot = bot
+        rows = await run_db(self.db.get_queued_captures)
+        restored = 0
+        for row in rows:
+            config = await storage.get_user_config(row['user_id'])
+            if not config.get('notion_token') or not config.get('page_id'):
+                await run_db(self.db.delete_queued_capture, row['chat_id'], row['message_id'])
+                await self._edit_ack(
+                    row['chat_id'], row['ack_message_id'], "❌ Бот больше не настроен, заметка не записана."
+                )
+                continue
+            self._start(QueuedCapture(
+                row['user_id'], row['chat_id'], row['message_id'], config['notion_token'],
+                InboxTarget.from_config(config), row['content'], row['ack_message_id'],
+                row['per_line'], row['attempts']
+            ))
+            restored += 1
+        if restored:
+            logger.info(f"Загружено заметок из очереди: {restored}")
+        return restored
+
+    async def submit(self, item: QueuedCapture) -> bool:
+        """
+        Сохранить заметку в очередь и запустить её запись.
+
+        Returns:
+            bool: False, если очередь переполнена
+        """
+        if self._waiting >= self.maxsize:
+            return False
+        # Место занимается до сохранения, чтобы параллельные вызовы не превысили лимит
+        self._waiting += 1
+        try:
+            saved = await run_db(
+                self.db.save_queued_capture, item.user_id, item.chat_id, item.message_id,
+                item.text, item.per_line, item.ack_message_id
+            )
+        finally:
+            self._waiting -= 1
+        if saved:
+            self._start(item)
+        return True
+
+    def _start(self, item: QueuedCapture):
+        self._waiting += 1
+        task = asyncio.get_running_loop().create_task(self._write(item))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, item: QueuedCapture):
+        """Записать заметку, когда подойдёт очередь её автора; временные ошибки повторить."""
+        current_user.set(item.user_id)
+        try:
+            while True:
+                try:
+                    await self._capture(item)
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+                    item.attempts += 1
+                    if not is_transient(e) or item.attempts >= self.max_attempts:
+                        break
+                logger.warning(
+                    f"Заметка из очереди {item.chat_id}/{item.message_id} не записана "
+                    f"(попытка {item.attempts}): {error}, повтор"
+                )
+                await run_db(self.db.set_queued_capture_attempts, item.chat_id, item.message_id, item.attempts)
+                if await self._wait_stopping(self.retry_delay * item.attempts):
+                    # Бот останавливается — заметка остаётся в базе до следующего запуска
+                    return
+
+            await run_db(self.db.delete_queued_capture, item.chat_id, item.message_id)
+            if error is None:
+                if self.changes is not None:
+                    self.changes.touch(item.user_id)
+                await self._edit_ack(item.chat_id, item.ack_message_id, "✅ Заметка записана")
+            else:
+                logger.error(f"Ошибка при записи заметки из очереди: {error}")
+                await self._edit_ack(item.chat_id, item.ack_message_id, f"❌ Не удалось записать заметку: {error}")
+        finally:
+            self._waiting -= 1
+
+    async def _capture(self, item: QueuedCapture):
+        await self.scheduler.acquire(item.user_id)
+        try:
+            await self.admission.acquire(item.user_id)
+            try:
+                await capture_note(
+                    self.db, NotionClient.for_token(item.token), item.chat_id,
+                    item.message_id, item.target, item.text, item.per_line
+                )
+            finally:
+                self.admission.release(item.user_id)
+        finally:
+            self.scheduler.release(item.user_id)
+
+    async def _wait_stopping(self, delay: float) -> bool:
+        """Подождать delay секунд. Returns: True, если за это время началась остановка."""
+        if self._stopping is None:
+            self._stopping = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _edit_ack(self, chat_id: int, ack_message_id: Optional[int], text: str):
+        if self.bot is None or ack_message_id is None:
+            return
+        try:
+            await self.bot.edit_message_text(text, chat_id=chat_id, message_id=ack_message_id)
+        except Exception as e:
+            logger.error(f"Не удалось обновить сообщение об очереди: {e}")
+
+    async def drain(self, timeout: float = CAPTURE_DRAIN_TIMEOUT) -> int:
+        """
+        Дописать очередь при остановке бота.
+
+        Заметки, ожидающие повтора или не успевшие за timeout секунд,
+        остаются в базе и будут записаны после следующего запуска.
+
+        Returns:
+            int: число недописанных заметок
+        """
+        if self._stopping is None:
+            self._stopping = asyncio.Event()
+        self._stopping.set()
+        tasks = list(self._tasks)
+        if not tasks:
+            return 0
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        left = await run_db(self.db.get_queued_captures)
+        return len(left)
@@ -0,0 +1,106 @@
+"""
+Автоматические выключатели для токенов, страниц и чатов.
+
+Повторяющиеся постоянные ошибки (NotionAuthError, NotionPermissionError,
+NotionNotFoundError, Forbidden от Telegram) размыкают выключатель соответствующего ключа. Пользователи,
+затронутые разомкнутым выключателем, приостанавливаются и исключаются из
+расписания рассылок до повторной настройки через /start.
+
+Доступ к странице выдаётся интеграции, поэтому выключатель страницы
+относится к паре (токен, страница): потерявший доступ токен одного
+пользователя не приостанавливает других пользователей той же страницы.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+from telegram.error import Forbidden
+
+from src.notion_errors import NotionAuthError, NotionNotFoundError, NotionPermissionError, translate_error
+
+logger = logging.getLogger(__name__)
+
+# Сколько постоянных ошибок подряд размыкают выключатель
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '3'))
+
+KIND_TOKEN = 'token'
+KIND_PAGE = 'page'
+KIND_CHAT = 'chat'
+
+BreakerKey = Tuple[str, str]
+
+
+def _token_hash(token: str) -> str:
+    # Хэш, чтобы не хранить сам токен
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def token_key(token: str) -> BreakerKey:
+    """Ключ выключателя токена."""
+    return KIND_TOKEN, _token_hash(token)
+
+
+def page_key(token: str, page_id: str) -> BreakerKey:
+    """Ключ выключателя страницы или базы данных, доступной по токену."""
+    return KIND_PAGE, f"{_token_hash(token)}:{page_id}"
+
+
+def chat_key(chat_id: int) -> BreakerKey:
+    """Ключ выключателя чата Telegram."""
+    return KIND_CHAT, str(chat_id)
+
+
+def classify_permanent_error(error: Exception) -> Optional[Tuple[str, str]]:
+    """
+    Определить, является ли ошибка постоянной.
+
+    Returns:
+        tuple: (вид ключа, причина) или None для временных ошибок
+    """
+    if isinstance(error, Forbidden):
+        return KIND_CHAT, "Пользователь заблокировал бота"
+
+    # Временные ошибки (429, 5xx, таймауты) выключатель не размыкают
+    error = translate_error(error)
+    if isinstance(error, NotionAuthError):
+        return KIND_TOKEN, "Токен Notion недействителен"
+    if isinstance(error, (NotionPermissionError, NotionNotFoundError)):
+        return KIND_PAGE, "Страница недоступна или удалена"
+    return None
+
+
+class CircuitBreakerRegistry:
+    """Счётчики постоянных ошибок по ключам."""
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD):
+        """Инициализация реестра."""
+        self.threshold = threshold
+        self._failures: Dict[BreakerKey, int] = {}
+
+    def record_failure(self, key: BreakerKey) -> bool:
+        """
+        Учесть постоянную ошибку.
+
+        Returns:
+            bool: True, если выключатель разомкнулся
+        """
+        failures = self._failures.get(key, 0) + 1
+        self._failures[key] = failures
+        if failures >= self.threshold:
+            logger.warning(f"Выключатель {key[0]} разомкнут после {failures} ошибок")
+            return True
+        return False
+
+    def record_success(self, key: BreakerKey):
+        """Сбросить счётчик после успешной операции."""
+        self._failures.pop(key, None)
+
+    def is_open(self, key: BreakerKey) -> bool:
+        """Разомкнут ли выключатель."""
+        return self._failures.get(key, 0) >= self.threshold
+
+    def reset(self, key: BreakerKey):
+        """Замкнуть выключатель (например, после перенастройки)."""
+        self._failures.pop(key, None)
@@ -0,0 +1,220 @@
+"""
+Перенос выполненных задач из инбокса в архив.
+
+Выполненные to_do никогда не удаляются со страницы инбокса, поэтому каждый
+листинг страницы (в /list, рассылке, поиске заметки) со временем становится
+дороже. Пользователь может включить архивацию командой /archive: раз в
+COMPACTOR_INTERVAL_HOURS отмеченные задачи старше порога копируются в
+архивную страницу или базу данных и удаляются из инбокса пачками, не
+превышая бюджет запросов к Notion.
+
+Сначала заметки копируются, потом удаляются: при сбое посередине задача
+может задвоиться в архиве, но не потеряется. Простые заметки копируются
+пачкой по тексту. Заметки с оформлением, ссылками, упоминаниями или
+вложенными блоками копируются целиком, по одной. Если в заметке есть
+блок, который нельзя воссоздать (вложенная страница, файл Notion), она
+остаётся в инбоксе.
+"""
+
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from telegram import Bot
+
+from src.blocks import BlockRecord
+from src.database import Database
+from src.executors import run_db, run_notion
+from src.fair_queue import current_user
+from src.mark_done import RateBudget
+from src.notion_api import InboxTarget, NotionClient, count_tree_writes
+from src.search import forget_notes, sync_records
+from src.storage import SQLiteUserStore, UserStore
+
+logger = logging.getLogger(__name__)
+
+# Переносить отмеченные задачи, которые не менялись дольше этого срока
+COMPACTOR_MIN_AGE_DAYS = int(os.getenv('COMPACTOR_MIN_AGE_DAYS', '7'))
+# Заметок в одной пачке копирования (не больше 100 — лимит Notion на добавление)
+COMPACTOR_BATCH_SIZE = min(int(os.getenv('COMPACTOR_BATCH_SIZE', '50')), 100)
+COMPACTOR_INTERVAL_HOURS = int(os.getenv('COMPACTOR_INTERVAL_HOURS', '24'))
+
+# Блоков в одном ответе Notion при листинге страницы
+LISTING_PAGE_SIZE = 100
+
+
+def listing_requests(block_count: int) -> int:
+    """Число запросов к Notion, нужное для полного листинга страницы."""
+    return max(1, math.ceil(block_count / LISTING_PAGE_SIZE))
+
+
+def select_compactable(records: List[BlockRecord], min_age_days: int,
+                       now: Optional[datetime] = None) -> List[BlockRecord]:
+    """Отмеченные to_do, которые не менялись дольше min_age_days."""
+    now = now or datetime.now(timezone.utc)
+    threshold = now - timedelta(days=min_age_days)
+    selected = []
+    for record in records:
+        if record.type != 'to_do' or not record.checked or not record.text or not record.last_edited_time:
+            continue
+        edited = datetime.fromisoformat(record.last_edited_time.replace('Z', '+00:00'))
+        if edited < threshold:
+            selected.append(record)
+    return selected
+
+
+class CompactionReport:
+    """Итог архивации одного инбокса."""
+
+    __slots__ = ('moved', 'failed', 'blocks_before', 'blocks_after', 'skipped')
+
+    def __init__(self, moved: int, failed: int, blocks_before: int, blocks_after: int, skipped: int = 0):
+        self.moved = moved
+        self.failed = failed
+        self.blocks_before = blocks_before
+        self.blocks_after = blocks_after
+        # Заметки, которые нельзя скопировать без потерь
+        self.skipped = skipped
+
+    def format(self) -> str:
+        """Сообщение пользователю об итогах."""
+        text = (
+            f"🗄 Перенесено в архив выполненных задач: {self.moved}.\n"
+            f"На странице инбокса осталось блоков: {self.blocks_after} — список теперь загружается "
+            f"за {listing_requests(self.blocks_after)} запрос(а) к Notion "
+            f"вместо {listing_requests(self.blocks_before)}."
+        )
+        if self.failed:
+            text += f"\n⚠️ Не удалось удалить из инбокса: {self.failed} (они уже скопированы в архив)."
+        if self.skipped:
+            text += (
+                f"\nℹ️ Оставлено в инбоксе: {self.skipped} — в них есть вложенные страницы или файлы, "
+                "которые нельзя перенести без потерь."
+            )
+        return text
+
+
+class Compactor:
+    """Плановая архивация выполненных задач у пользователей, включивших её."""
+
+    def __init__(self, db: Database, bot: Bot, budget: Optional[RateBudget] = None,
+                 storage: Optional[UserStore] = None):
+        """Инициализация архиватора."""
+        self.db = db
+        self.storage = storage or SQLiteUserStore(db)
+        self.bot = bot
+        self.budget = budget or RateBudget()
+
+    def schedule(self, scheduler):
+        """Добавить периодический прогон в планировщик."""
+        scheduler.add_job(
+            self.run_all, 'interval', hours=COMPACTOR_INTERVAL_HOURS,
+            id='compactor', replace_existing=True
+        )
+        logger.info(f"Архивация инбоксов запланирована раз в {COMPACTOR_INTERVAL_HOURS} ч")
+
+    async def run_all(self):
+        """Архивировать инбоксы всех пользователей по очереди."""
+        user_ids = await run_db(self.db.get_users_with_compaction)
+        moved = 0
+        for user_id in user_ids:
+            try:
+                report = await self.compact_user(user_id)
+            except Exception as e:
+                logger.error(f"Ошибка архивации инбокса пользователя {user_id}: {e}")
+                continue
+            if report is None or not report.moved:
+                continue
+            moved += report.moved
+            try:
+                await self.bot.send_message(chat_id=user_id, text=report.format())
+            except Exception as e:
+                logger.error(f"Не удалось отправить итог архивации пользователю {user_id}: {e}")
+        logger.info(f"Архивация завершена: пользователей {len(user_ids)}, перенесено задач {moved}")
+
+    async def compact_user(self, user_id: int) -> Optional[CompactionReport]:
+        """
+        Перенести выполненные задачи пользователя в архив.
+
+        Returns:
+            CompactionReport или None, если архивация не настроена
+        """
+        # Запросы архивации идут в очереди пользователя (src/fair_queue.py)
+        current_user.set(user_id)
+        config = await self.storage.get_user_config(user_id)
+        settings = await run_db(self.db.get_compaction_settings, user_id)
+        if not settings.get('enabled') or not config.get('notion_token') or not config.get('page_id'):
+            return None
+        if config.get('suspended_reason'):
+            return None
+
+        target = InboxTarget.from_config(config)
+        if target.is_database:
+            # База данных фильтруется на стороне Notion — архивировать незачем
+            return None
+
+        token = config['notion_token']
+        notion = NotionClient.for_token(token)
+        archive = InboxTarget(
+            settings['archive_type'], settings['archive_id'], settings['archive_data_source_id'],
+            settings['archive_title_property'], settings['archive_checkbox_property']
+        )
+
+        await self.budget.acquire(token)
+        fetched_at = time.time()
+        records = await run_notion(notion.list_all_block_records, target.id)
+        # Полный список блоков заодно обновляет индекс поиска
+        await sync_records(self.db, target.id, records, fetched_at)
+        candidates = select_compactable(records, settings['min_age_days'])
+
+        moved = failed = skipped = 0
+        for start in range(0, len(candidates), COMPACTOR_BATCH_SIZE):
+            batch = candidates[start:start + COMPACTOR_BATCH_SIZE]
+            simple = [record for record in batch if record.plain and not record.has_children]
+
+            # Копирование простых заметок: один запрос для страницы, по запросу на заметку для базы
+            if simple:
+                for _ in range(len(simple) if archive.is_database else 1):
+                    await self.budget.acquire(token)
+                await run_notion(notion.archive_notes, archive, [record.text for record in simple])
+            copied = list(simple)
+
+            # Остальные копируются целиком вместе с вложенными блоками
+            for record in batch:
+                if record.plain and not record.has_children:
+                    continue
+                await self.budget.acquire(token)
+                tree = await run_notion(notion.get_block_tree, record.id)
+                if tree is None:
+                    skipped += 1
+                    continue
+                for _ in range(count_tree_writes(tree)):
+                    await self.budget.acquire(token)
+                await run_notion(notion.archive_block_tree, archive, tree)
+                copied.append(record)
+
+            deleted = []
+            for record in copied:
+                await self.budget.acquire(token)
+                try:
+                    await run_notion(notion.delete_block, record.id)
+                    deleted.append(record.id)
+                except Exception as e:
+                    logger.error(f"Не удалось удалить блок {record.id} из инбокса: {e}")
+                    failed += 1
+            moved += len(deleted)
+            await run_db(self.db.delete_message_blocks_by_block_ids, deleted)
+            await forget_notes(self.db, deleted)
+
+        report = CompactionReport(moved, failed, len(records), len(records) - moved, skipped)
+        await run_db(
+            self.db.save_compaction_result,
+            user_id, moved, report.blocks_after, datetime.now(timezone.utc).isoformat()
+        )
+        logger.info(
+            f"Архивация пользователя {user_id}: перенесено {moved}, осталось блоков {report.blocks_after}"
+        )
+        return report
@@ -9,6 +9,11 @@ import os
 logger = logging.getLogger(__name__)
 
 
+def _page_key(page_id: str) -> str:
+    """ID страницы в индексе поиска: без дефисов, чтобы FTS5 считал его одним словом."""
+    return page_id.replace('-', '')
+
+
 class Database:
     """Класс для работы с SQLite базой данных."""
     
@@ -30,6 +35,8 @@ class Database:
             # Иначе используем текущую директорию
             self.db_path = db_path
         self.conn = None
+        # Доступен ли полнотекстовый поиск FTS5 (проверяется миграцией)
+        self.fts_enabled = False
     
     def get_connection(self):
         """Получить соединение с базой данных."""
@@ -65,6 +72,17 @@ class Database:
         self.migrate_add_version_field()
         self.migrate_from_intro_shown()
         self.migrate_add_timezone_field()
+        self.migrate_add_message_blocks_table()
+        self.migrate_add_target_fields()
+        self.migrate_add_digest_state_table()
+        self.migrate_add_suspension_fields()
+        self.migrate_add_compaction_table()
+        self.migrate_add_persistence_tables()
+        self.migrate_add_extra_block_ids()
+        self.migrate_add_note_index()
+        self.migrate_add_digest_jobs_table()
+        self.migrate_add_queued_captures_table()
+        self.migrate_add_message_split_mode()
 
         logger.info("База данных инициализирована")
     
@@ -74,7 +92,9 @@ class Database:
         cursor = conn.cursor()
         
         cursor.execute(
-            'SELECT notion_token, page_id, page_name FROM users WHERE user_id = ?',
+            '''SELECT notion_token, page_id, page_name, target_type, data_source_id,
+                      title_property, checkbox_property, suspended_reason
+               FROM users WHERE user_id = ?''',
             (user_id,)
         )
         
@@ -83,7 +103,12 @@ class Database:
             return {
                 'notion_token': row['notion_token'],
                 'page_id': row['page_id'],
-                'page_name': row['page_name']
+                'page_name': row['page_name'],
+                'target_type': row['target_type'] or 'page',
+                'data_source_id': row['data_source_id'],
+                'title_property': row['title_property'],
+                'checkbox_property': row['checkbox_property'],
+                'suspended_reason': row['suspended_reason']
             }
         return {}
     
@@ -97,25 +122,34 @@ class Database:
             VALUES (?, ?, CURRENT_TIMESTAMP)
             ON CONFLICT(user_id) DO UPDATE SET
                 notion_token = ?,
+                suspended_at = NULL,
+                suspended_reason = NULL,
                 updated_at = CURRENT_TIMESTAMP
         ''', (user_id, token, token))
         
         conn.commit()
-        logger.info(f"Токен сохранен для пользователя {user_id}")
+        logger.info("Токен сохранен для пользователя %s", user_id, extra={'event': 'db.write', 'user_id': user_id})
     
-    def save_page_config(self, user_id: int, page_id: str, page_name: str):
-        """Сохранить конфигурацию страницы для пользователя."""
+    def save_page_config(self, user_id: int, page_id: str, page_name: str, target_type: str = 'page',
+                         data_source_id: str = None, title_property: str = None,
+                         checkbox_property: str = None):
+        """Сохранить конфигурацию страницы (или базы данных) для пользователя."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
             UPDATE users
-            SET page_id = ?, page_name = ?, updated_at = CURRENT_TIMESTAMP
+            SET page_id = ?, page_name = ?, target_type = ?, data_source_id = ?,
+                title_property = ?, checkbox_property = ?, suspended_at = NULL, suspended_reason = NULL,
+                updated_at = CURRENT_TIMESTAMP
             WHERE user_id = ?
-        ''', (page_id, page_name, user_id))
+        ''', (page_id, page_name, target_type, data_source_id, title_property, checkbox_property, user_id))
         
         conn.commit()
-        logger.info(f"Конфигурация страницы сохранена для пользователя {user_id}")
+        logger.info(
+            "Конфигурация страницы сохранена для пользователя %s", user_id,
+            extra={'event': 'db.write', 'user_id': user_id}
+        )
     
     def reset_user_config(self, user_id: int):
         """Сбросить конфигурацию пользователя."""
@@ -123,10 +157,15 @@ class Database:
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+        cursor.execute('DELETE FROM compaction_settings WHERE user_id = ?', (user_id,))
         
         conn.commit()
-        logger.info(f"Конфигурация сброшена для пользователя {user_id}")
+        logger.info("Конфигурация сброшена для пользователя %s", user_id, extra={'event': 'db.write', 'user_id': user_id})
     
+    def ping(self):
+        """Простейший запрос к базе (пробы задержки во время резервного копирования)."""
+        self.get_connection().execute('SELECT 1').fetchone()
+
     def close(self):
         """Закрыть соединение с базой данных."""
         if self.conn:
@@ -145,7 +184,10 @@ class Database:
         ''', (int(enabled), time, days, timezone_offset, user_id))
         
         conn.commit()
-        logger.info(f"Настройки уведомлений сохранены для пользователя {user_id}")
+        logger.info(
+            "Настройки уведомлений сохранены для пользователя %s", user_id,
+            extra={'event': 'db.write', 'user_id': user_id}
+        )
 
     def get_notification_settings(self, user_id: int) -> dict:
         """Получить настройки уведомлений пользователя."""
@@ -195,7 +237,10 @@ class Database:
         ''', (version, user_id))
         
         conn.commit()
-        logger.info(f"Версия {version} установлена для пользователя {user_id}")
+        logger.info(
+            "Версия %s установлена для пользователя %s", version, user_id,
+            extra={'event': 'db.write', 'user_id': user_id}
+        )
 
     def get_users_with_notifications(self) -> list:
         """Получить всех пользователей с включенными уведомлениями."""
@@ -206,6 +251,7 @@ class Database:
             SELECT user_id, notification_time, notification_days, timezone_offset
             FROM users 
             WHERE notification_enabled = 1 AND notification_time IS NOT NULL
+                AND suspended_at IS NULL
         ''')
         
         return [
@@ -218,6 +264,22 @@ class Database:
             for row in cursor.fetchall()
         ]
 
+    def get_users_by_notion_ids(self, notion_keys: list) -> list:
+        """Получить пользователей, чья страница или источник данных среди notion_keys (без дефисов)."""
+        if not notion_keys:
+            return []
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        placeholders = ','.join('?' * len(notion_keys))
+        cursor.execute(f'''
+            SELECT user_id FROM users
+            WHERE REPLACE(LOWER(page_id), '-', '') IN ({placeholders})
+               OR REPLACE(LOWER(data_source_id), '-', '') IN ({placeholders})
+        ''', list(notion_keys) * 2)
+
+        return [row['user_id'] for row in cursor.fetchall()]
+
     def migrate_add_version_field(self):
         """Миграция: добавить поле last_seen_version."""
         conn = self.get_connection()
@@ -320,4 +382,959 @@ class Database:
         if 'timezone_offset' not in columns:
             cursor.execute("ALTER TABLE users ADD COLUMN timezone_offset INTEGER")
             conn.commit()
-            logger.info("Добавлено поле timezone_offset")
\ No newline at end of file
+            logger.info("Добавлено поле timezone_offset")
+
+    def migrate_add_message_blocks_table(self):
+        """Миграция: таблица соответствия сообщений Telegram блокам Notion."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # block_id = NULL означает, что запись в Notion начата, но не подтверждена
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS message_blocks (
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                page_id TEXT NOT NULL,
+                block_id TEXT,
+                content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, message_id)
+            )
+        ''')
+        conn.commit()
+
+    def get_message_block(self, chat_id: int, message_id: int) -> dict:
+        """Получить блок Notion, созданный для сообщения Telegram."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'SELECT page_id, block_id, content, extra_block_ids, per_line FROM message_blocks '
+            'WHERE chat_id = ? AND message_id = ?',
+            (chat_id, message_id)
+        )
+
+        row = cursor.fetchone()
+        if row:
+            block_ids = [row['block_id']] if row['block_id'] else []
+            if row['extra_block_ids']:
+                block_ids.extend(row['extra_block_ids'].split(','))
+            # Записи до появления поля: построчными были заметки из нескольких блоков
+            per_line = row['per_line']
+            return {
+                'page_id': row['page_id'],
+                'block_id': row['block_id'],
+                'block_ids': block_ids,
+                'content': row['content'],
+                'per_line': bool(per_line) if per_line is not None else len(block_ids) > 1
+            }
+        return {}
+
+    def reserve_message_block(self, chat_id: int, message_id: int, page_id: str, content: str,
+                              per_line: bool = False):
+        """Отметить, что для сообщения начата запись блока в Notion (per_line — режим /split)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO message_blocks (chat_id, message_id, page_id, content, per_line)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, message_id) DO NOTHING
+        ''', (chat_id, message_id, page_id, content, per_line))
+
+        conn.commit()
+
+    def save_message_block(self, chat_id: int, message_id: int, block_id: str, content: str,
+                           extra_block_ids: list = ()):
+        """Сохранить ID блоков Notion, созданных для сообщения (первый и остальные)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE message_blocks
+            SET block_id = ?, content = ?, extra_block_ids = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE chat_id = ? AND message_id = ?
+        ''', (block_id, content, ','.join(extra_block_ids) or None, chat_id, message_id))
+
+        conn.commit()
+
+    def delete_message_block(self, chat_id: int, message_id: int):
+        """Удалить соответствие сообщения и блока."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'DELETE FROM message_blocks WHERE chat_id = ? AND message_id = ?',
+            (chat_id, message_id)
+        )
+
+        conn.commit()
+
+    def delete_message_blocks_by_block_ids(self, block_ids: list):
+        """Удалить соответствия сообщений блокам, перенесённым в архив."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            'DELETE FROM message_blocks WHERE block_id = ?',
+            [(block_id,) for block_id in block_ids]
+        )
+
+        conn.commit()
+
+    def get_mapped_block_ids(self, page_id: str) -> set:
+        """Получить ID блоков страницы, уже привязанных к сообщениям."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'SELECT block_id, extra_block_ids FROM message_blocks WHERE page_id = ? AND block_id IS NOT NULL',
+            (page_id,)
+        )
+
+        block_ids = set()
+        for row in cursor.fetchall():
+            block_ids.add(row['block_id'])
+            if row['extra_block_ids']:
+                block_ids.update(row['extra_block_ids'].split(','))
+        return block_ids
+
+    def migrate_add_extra_block_ids(self):
+        """Миграция: остальные блоки заметок, записанных несколькими блоками."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("PRAGMA table_info(message_blocks)")
+        columns = [row['name'] for row in cursor.fetchall()]
+
+        if 'extra_block_ids' not in columns:
+            cursor.execute("ALTER TABLE message_blocks ADD COLUMN extra_block_ids TEXT")
+            conn.commit()
+            logger.info("Добавлено поле extra_block_ids")
+
+    def migrate_add_message_split_mode(self):
+        """Миграция: режим /split, в котором записана заметка (правки сообщения сохраняют его)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("PRAGMA table_info(message_blocks)")
+        columns = [row['name'] for row in cursor.fetchall()]
+
+        if 'per_line' not in columns:
+            cursor.execute("ALTER TABLE message_blocks ADD COLUMN per_line BOOLEAN")
+            conn.commit()
+            logger.info("Добавлено поле per_line")
+
+    def migrate_add_queued_captures_table(self):
+        """Миграция: заметки, отложенные до освобождения Notion (переживают перезапуск)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS queued_captures (
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                per_line BOOLEAN DEFAULT 0,
+                ack_message_id INTEGER,
+                attempts INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, message_id)
+            )
+        ''')
+        conn.commit()
+
+    def save_queued_capture(self, user_id: int, chat_id: int, message_id: int, content: str,
+                            per_line: bool, ack_message_id: int = None) -> bool:
+        """
+        Сохранить заметку, поставленную в очередь.
+
+        Returns:
+            bool: False, если сообщение уже в очереди
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO queued_captures (chat_id, message_id, user_id, content, per_line, ack_message_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, message_id) DO NOTHING
+        ''', (chat_id, message_id, user_id, content, per_line, ack_message_id))
+
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def get_queued_captures(self) -> list:
+        """Получить заметки из очереди в порядке постановки."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT chat_id, message_id, user_id, content, per_line, ack_message_id, attempts
+            FROM queued_captures ORDER BY created_at, rowid
+        ''')
+
+        return [
+            {
+                'chat_id': row['chat_id'],
+                'message_id': row['message_id'],
+                'user_id': row['user_id'],
+                'content': row['content'],
+                'per_line': bool(row['per_line']),
+                'ack_message_id': row['ack_message_id'],
+                'attempts': row['attempts']
+            }
+            for row in cursor.fetchall()
+        ]
+
+    def set_queued_capture_attempts(self, chat_id: int, message_id: int, attempts: int):
+        """Сохранить число неудачных попыток записи заметки из очереди."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'UPDATE queued_captures SET attempts = ? WHERE chat_id = ? AND message_id = ?',
+            (attempts, chat_id, message_id)
+        )
+
+        conn.commit()
+
+    def delete_queued_capture(self, chat_id: int, message_id: int):
+        """Удалить заметку из очереди (записана или окончательно не удалась)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'DELETE FROM queued_captures WHERE chat_id = ? AND message_id = ?',
+            (chat_id, message_id)
+        )
+
+        conn.commit()
+
+    def migrate_add_target_fields(self):
+        """Миграция: поля для базы данных Notion в качестве инбокса."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("PRAGMA table_info(users)")
+        columns = [row['name'] for row in cursor.fetchall()]
+
+        if 'target_type' not in columns:
+            cursor.execute("ALTER TABLE users ADD COLUMN target_type TEXT DEFAULT 'page'")
+            conn.commit()
+            logger.info("Добавлено поле target_type")
+
+        for column in ('data_source_id', 'title_property', 'checkbox_property'):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE users ADD COLUMN {column} TEXT")
+                conn.commit()
+                logger.info(f"Добавлено поле {column}")
+
+    def migrate_add_digest_state_table(self):
+        """Миграция: состояние последней рассылки для пропуска неизменившихся."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS digest_state (
+                user_id INTEGER PRIMARY KEY,
+                page_id TEXT,
+                last_edited_time TEXT,
+                items_hash TEXT,
+                item_count INTEGER DEFAULT 0,
+                message TEXT,
+                checked_at TEXT
+            )
+        ''')
+        conn.commit()
+
+    def get_digest_state(self, user_id: int) -> dict:
+        """Получить состояние последней рассылки пользователя."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            '''SELECT page_id, last_edited_time, items_hash, item_count, message, checked_at
+               FROM digest_state WHERE user_id = ?''',
+            (user_id,)
+        )
+
+        row = cursor.fetchone()
+        if row:
+            return {
+                'page_id': row['page_id'],
+                'last_edited_time': row['last_edited_time'],
+                'items_hash': row['items_hash'],
+                'item_count': row['item_count'],
+                'message': row['message'],
+                'checked_at': row['checked_at']
+            }
+        return {}
+
+    def save_digest_state(self, user_id: int, page_id: str, last_edited_time: str, items_hash: str,
+                          item_count: int, message: str, checked_at: str):
+        """Сохранить состояние рассылки пользователя."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO digest_state (user_id, page_id, last_edited_time, items_hash, item_count, message, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                page_id = excluded.page_id,
+                last_edited_time = excluded.last_edited_time,
+                items_hash = excluded.items_hash,
+                item_count = excluded.item_count,
+                message = excluded.message,
+                checked_at = excluded.checked_at
+        ''', (user_id, page_id, last_edited_time, items_hash, item_count, message, checked_at))
+
+        conn.commit()
+
+    def migrate_add_suspension_fields(self):
+        """Миграция: поля приостановки пользователей с постоянными ошибками."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("PRAGMA table_info(users)")
+        columns = [row['name'] for row in cursor.fetchall()]
+
+        if 'suspended_at' not in columns:
+            cursor.execute("ALTER TABLE users ADD COLUMN suspended_at TIMESTAMP")
+            conn.commit()
+            logger.info("Добавлено поле suspended_at")
+
+        if 'suspended_reason' not in columns:
+            cursor.execute("ALTER TABLE users ADD COLUMN suspended_reason TEXT")
+            conn.commit()
+            logger.info("Добавлено поле suspended_reason")
+
+    def suspend_users(self, reason: str, user_id: int = None, notion_token: str = None,
+                      page_id: str = None) -> list:
+        """
+        Приостановить пользователей по ID, токену и (или) странице.
+
+        Заданные условия объединяются через И.
+
+        Returns:
+            list: ID приостановленных пользователей
+        """
+        filters = [
+            (field, value) for field, value in
+            (('user_id', user_id), ('notion_token', notion_token), ('page_id', page_id))
+            if value is not None
+        ]
+        if not filters:
+            raise ValueError("Не указано, кого приостановить")
+        condition = ' AND '.join(f'{field} = ?' for field, _ in filters)
+        values = tuple(value for _, value in filters)
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            f'SELECT user_id FROM users WHERE {condition} AND suspended_at IS NULL',
+            values
+        )
+        user_ids = [row['user_id'] for row in cursor.fetchall()]
+
+        cursor.execute(f'''
+            UPDATE users
+            SET suspended_at = CURRENT_TIMESTAMP, suspended_reason = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE {condition} AND suspended_at IS NULL
+        ''', (reason, *values))
+
+        conn.commit()
+        logger.info(f"Приостановлены пользователи {user_ids}: {reason}")
+        return user_ids
+
+    def migrate_add_compaction_table(self):
+        """Миграция: настройки и итоги переноса выполненных задач в архив."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS compaction_settings (
+                user_id INTEGER PRIMARY KEY,
+                enabled BOOLEAN DEFAULT 1,
+                archive_type TEXT DEFAULT 'page',
+                archive_id TEXT,
+                archive_name TEXT,
+                archive_data_source_id TEXT,
+                archive_title_property TEXT,
+                archive_checkbox_property TEXT,
+                min_age_days INTEGER DEFAULT 7,
+                last_run_at TEXT,
+                last_moved INTEGER DEFAULT 0,
+                last_block_count INTEGER
+            )
+        ''')
+        conn.commit()
+
+    def get_compaction_settings(self, user_id: int) -> dict:
+        """Получить настройки архивации пользователя."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT * FROM compaction_settings WHERE user_id = ?', (user_id,))
+
+        row = cursor.fetchone()
+        if row:
+            return {
+                'enabled': bool(row['enabled']),
+                'archive_type': row['archive_type'],
+                'archive_id': row['archive_id'],
+                'archive_name': row['archive_name'],
+                'archive_data_source_id': row['archive_data_source_id'],
+                'archive_title_property': row['archive_title_property'],
+                'archive_checkbox_property': row['archive_checkbox_property'],
+                'min_age_days': row['min_age_days'],
+                'last_run_at': row['last_run_at'],
+                'last_moved': row['last_moved'],
+                'last_block_count': row['last_block_count']
+            }
+        return {}
+
+    def save_compaction_settings(self, user_id: int, archive_type: str, archive_id: str, archive_name: str,
+                                 min_age_days: int, data_source_id: str = None, title_property: str = None,
+                                 checkbox_property: str = None):
+        """Включить архивацию в указанную страницу или базу данных."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT INTO compaction_settings (user_id, enabled, archive_type, archive_id, archive_name,
+                                             archive_data_source_id, archive_title_property,
+                                             archive_checkbox_property, min_age_days)
+            VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                enabled = 1,
+                archive_type = excluded.archive_type,
+                archive_id = excluded.archive_id,
+                archive_name = excluded.archive_name,
+                archive_data_source_id = excluded.archive_data_source_id,
+                archive_title_property = excluded.archive_title_property,
+                archive_checkbox_property = excluded.archive_checkbox_property,
+                min_age_days = excluded.min_age_days
+        ''', (user_id, archive_type, archive_id, archive_name, data_source_id, title_property,
+              checkbox_property, min_age_days))
+
+        conn.commit()
+
+    def disable_compaction(self, user_id: int):
+        """Выключить архивацию пользователя."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('UPDATE compaction_settings SET enabled = 0 WHERE user_id = ?', (user_id,))
+
+        conn.commit()
+
+    def get_users_with_compaction(self) -> list:
+        """Получить ID пользователей с включённой архивацией."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT user_id FROM compaction_settings WHERE enabled = 1')
+
+        return [row['user_id'] for row in cursor.fetchall()]
+
+    def save_compaction_result(self, user_id: int, moved: int, block_count: int, run_at: str):
+        """Сохранить итог последнего прогона архивации."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE compaction_settings
+            SET last_run_at = ?, last_moved = ?, last_block_count = ?
+            WHERE user_id = ?
+        ''', (run_at, moved, block_count, user_id))
+
+        conn.commit()
+
+    def migrate_add_persistence_tables(self):
+        """Миграция: таблицы состояния диалогов и user_data бота."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS persisted_user_data (
+                user_id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                PRIMARY KEY (user_id, key)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS persisted_conversations (
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                state TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (name, key)
+            )
+        ''')
+        conn.commit()
+
+    def load_persisted_user_data(self) -> dict:
+        """
+        Загрузить сохранённые user_data.
+
+        Returns:
+            dict: user_id -> {ключ: значение в JSON}
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT user_id, key, value FROM persisted_user_data')
+
+        result = {}
+        for row in cursor.fetchall():
+            result.setdefault(row['user_id'], {})[row['key']] = row['value']
+        return result
+
+    def load_persisted_conversations(self, name: str, updated_after: float) -> dict:
+        """
+        Загрузить состояния диалога, менявшиеся после updated_after.
+
+        Returns:
+            dict: ключ диалога в JSON -> состояние в JSON
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            'SELECT key, state FROM persisted_conversations WHERE name = ? AND updated_at > ?',
+            (name, updated_after)
+        )
+
+        return {row['key']: row['state'] for row in cursor.fetchall()}
+
+    def write_persistence_batch(self, user_upserts: list, user_deletes: list, dropped_users: list,
+                                conversation_upserts: list, conversation_deletes: list):
+        """Применить накопленные изменения состояния бота одной транзакцией."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            'DELETE FROM persisted_user_data WHERE user_id = ?', [(user_id,) for user_id in dropped_users]
+        )
+        cursor.executemany('''
+            INSERT INTO persisted_user_data (user_id, key, value) VALUES (?, ?, ?)
+            ON CONFLICT(user_id, key) DO UPDATE SET value = excluded.value
+        ''', user_upserts)
+        cursor.executemany(
+            'DELETE FROM persisted_user_data WHERE user_id = ? AND key = ?', user_deletes
+        )
+        cursor.executemany('''
+            INSERT INTO persisted_conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(name, key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+        ''', conversation_upserts)
+        cursor.executemany(
+            'DELETE FROM persisted_conversations WHERE name = ? AND key = ?', conversation_deletes
+        )
+
+        conn.commit()
+
+    def purge_expired_conversations(self, updated_before: float) -> int:
+        """Удалить зависшие диалоги, не менявшиеся с updated_before."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('DELETE FROM persisted_conversations WHERE updated_at <= ?', (updated_before,))
+
+        conn.commit()
+        return cursor.rowcount
+
+    def migrate_add_note_index(self):
+        """Миграция: локальный полнотекстовый индекс заметок для /find."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # checked = NULL для блоков без флажка (paragraph)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS note_index (
+                rowid INTEGER PRIMARY KEY,
+                block_id TEXT NOT NULL UNIQUE,
+                page_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                checked INTEGER,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_note_index_page ON note_index (page_id, checked)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS note_index_state (
+                page_id TEXT PRIMARY KEY,
+                synced_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+
+        try:
+            # Индекс с внешним содержимым: текст хранится только в note_index.
+            # page_id индексируется одним токеном (без дефисов), чтобы поиск
+            # сразу ограничивался страницей, а не ранжировал заметки всех пользователей
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS note_search USING fts5(
+                    text, page_id, content='note_index', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 недоступен, /find будет искать по подстроке: {e}")
+            self.fts_enabled = False
+            return
+
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS note_index_ai AFTER INSERT ON note_index BEGIN
+                INSERT INTO note_search (rowid, text, page_id) VALUES (new.rowid, new.text, new.page_id);
+            END;
+            CREATE TRIGGER IF NOT EXISTS note_index_ad AFTER DELETE ON note_index BEGIN
+                INSERT INTO note_search (note_search, rowid, text, page_id)
+                VALUES ('delete', old.rowid, old.text, old.page_id);
+            END;
+            CREATE TRIGGER IF NOT EXISTS note_index_au AFTER UPDATE OF text, page_id ON note_index BEGIN
+                INSERT INTO note_search (note_search, rowid, text, page_id)
+                VALUES ('delete', old.rowid, old.text, old.page_id);
+                INSERT INTO note_search (rowid, text, page_id) VALUES (new.rowid, new.text, new.page_id);
+            END;
+        ''')
+        conn.commit()
+        self.fts_enabled = True
+
+    def _upsert_notes(self, cursor, page_id: str, rows: list, updated_at: float, keep_checked: bool = False):
+        # Неизменившиеся заметки не трогаем, чтобы не перестраивать их в FTS
+        page_id = _page_key(page_id)
+        checked = 'note_index.checked' if keep_checked else 'excluded.checked'
+        cursor.executemany(f'''
+            INSERT INTO note_index (block_id, page_id, text, checked, updated_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(block_id) DO UPDATE SET
+                page_id = excluded.page_id, text = excluded.text,
+                checked = {checked}, updated_at = excluded.updated_at
+            WHERE note_index.text IS NOT excluded.text
+                OR note_index.checked IS NOT {checked}
+                OR note_index.page_id IS NOT excluded.page_id
+        ''', [
+            (block_id, page_id, text, None if is_checked is None else int(is_checked), updated_at)
+            for block_id, text, is_checked in rows
+        ])
+
+    def index_notes(self, page_id: str, rows: list, updated_at: float, keep_checked: bool = False):
+        """
+        Добавить или обновить заметки в индексе поиска.
+
+        Args:
+            rows: список (ID блока, текст, отмечена ли: True/False/None)
+            keep_checked: не менять отметку уже проиндексированных заметок
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        self._upsert_notes(cursor, page_id, rows, updated_at, keep_checked)
+
+        conn.commit()
+
+    def sync_page_index(self, page_id: str, rows: list, synced_at: float):
+        """Заменить индекс страницы полным списком её заметок и запомнить время синхронизации."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        self._upsert_notes(cursor, page_id, rows, synced_at)
+        page_id = _page_key(page_id)
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS synced_blocks (block_id TEXT PRIMARY KEY)')
+        cursor.execute('DELETE FROM synced_blocks')
+        cursor.executemany(
+            'INSERT OR IGNORE INTO synced_blocks (block_id) VALUES (?)', [(row[0],) for row in rows]
+        )
+        # Заметки, добавленные во время чтения, не удаляем
+        cursor.execute('''
+            DELETE FROM note_index
+            WHERE page_id = ? AND updated_at < ? AND block_id NOT IN (SELECT block_id FROM synced_blocks)
+        ''', (page_id, synced_at))
+        cursor.execute('DELETE FROM synced_blocks')
+        cursor.execute('''
+            INSERT INTO note_index_state (page_id, synced_at) VALUES (?, ?)
+            ON CONFLICT(page_id) DO UPDATE SET synced_at = excluded.synced_at
+        ''', (page_id, synced_at))
+
+        conn.commit()
+
+    def set_notes_checked(self, block_ids: list, checked: bool):
+        """Обновить отметку заметок в индексе поиска."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            'UPDATE note_index SET checked = ? WHERE block_id = ?',
+            [(int(checked), block_id) for block_id in block_ids]
+        )
+
+        conn.commit()
+
+    def delete_indexed_notes(self, block_ids: list):
+        """Удалить заметки из индекса поиска (перенесены в архив или удалены)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            'DELETE FROM note_index WHERE block_id = ?', [(block_id,) for block_id in block_ids]
+        )
+
+        conn.commit()
+
+    def get_index_synced_at(self, page_id: str):
+        """Время последней полной синхронизации индекса страницы или None."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT synced_at FROM note_index_state WHERE page_id = ?', (_page_key(page_id),))
+
+        row = cursor.fetchone()
+        return row['synced_at'] if row else None
+
+    def search_notes(self, page_id: str, terms: list, checked: bool = None, limit: int = 10) -> list:
+        """
+        Найти заметки страницы, содержащие все слова (по префиксу).
+
+        С FTS5 результаты упорядочены по релевантности (bm25), без него —
+        поиск по подстроке, сначала новые.
+
+        Returns:
+            list: словари с ключами block_id, text, checked
+        """
+        if not terms:
+            return []
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        page_id = _page_key(page_id)
+        checked_filter = '' if checked is None else ' AND n.checked = ?'
+        checked_params = () if checked is None else (int(checked),)
+        if self.fts_enabled:
+            # Каждое слово — строка в кавычках с префиксным поиском; релевантность — только по тексту
+            words = ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+            query = f'page_id : "{page_id}" AND text : ({words})'
+            cursor.execute(f'''
+                SELECT n.block_id, n.text, n.checked
+                FROM note_search JOIN note_index n ON n.rowid = note_search.rowid
+                WHERE note_search MATCH ?{checked_filter}
+                ORDER BY bm25(note_search, 1.0, 0.0) LIMIT ?
+            ''', (query, *checked_params, limit))
+        else:
+            # Встроенный lower() SQLite понимает только ASCII
+            conn.create_function('py_lower', 1, lambda text: text.lower() if text else text, deterministic=True)
+            like_filter = ' AND instr(py_lower(n.text), ?) > 0' * len(terms)
+            cursor.execute(f'''
+                SELECT n.block_id, n.text, n.checked FROM note_index n
+                WHERE n.page_id = ?{like_filter}{checked_filter}
+                ORDER BY n.updated_at DESC LIMIT ?
+            ''', (page_id, *terms, *checked_params, limit))
+
+        return [
+            {
+                'block_id': row['block_id'],
+                'text': row['text'],
+                'checked': None if row['checked'] is None else bool(row['checked'])
+            }
+            for row in cursor.fetchall()
+        ]
+
+    def enable_wal(self) -> str:
+        """Включить журнал WAL, чтобы процессы рассылки не блокировали бота.
+
+        Returns:
+            str: установленный режим журнала
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('PRAGMA journal_mode=WAL')
+        return cursor.fetchone()[0]
+
+    def migrate_add_digest_jobs_table(self):
+        """Миграция: очередь заданий рассылки для процессов-обработчиков."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # available_at — когда задание можно взять: для pending это время
+        # (повторной) попытки, для leased — окончание аренды
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS digest_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                due_at TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                UNIQUE (user_id, due_at)
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_digest_jobs_ready ON digest_jobs (status, available_at)'
+        )
+        conn.commit()
+
+    def enqueue_digest_job(self, user_id: int, due_at: str, now: float) -> bool:
+        """
+        Поставить рассылку пользователя в очередь.
+
+        Returns:
+            bool: False, если рассылка на это время уже в очереди
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT OR IGNORE INTO digest_jobs (user_id, due_at, available_at, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, due_at, now, now))
+
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def claim_digest_jobs(self, owner: str, lease_seconds: float, limit: int, max_attempts: int,
+                          now: float, max_lateness: float = None) -> list:
+        """
+        Взять готовые задания в аренду.
+
+        Задание с истёкшей арендой (процесс упал или завис) берётся заново;
+        если попытки исчерпаны, оно помечается failed. Задания, поставленные
+        в очередь больше max_lateness секунд назад, не отправляются, а
+        помечаются skipped: утренняя рассылка не должна прийти вечером.
+
+        Returns:
+            list: словари с ключами id, user_id, due_at, attempts (с учётом этой попытки)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # IMMEDIATE: выбор и захват заданий атомарны между процессами
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('''
+                UPDATE digest_jobs SET status = 'failed', error = 'аренда истекла', finished_at = ?
+                WHERE status = 'leased' AND available_at <= ? AND attempts >= ?
+            ''', (now, now, max_attempts))
+            if max_lateness is not None:
+                cursor.execute('''
+                    UPDATE digest_jobs SET status = 'skipped', error = 'рассылка опоздала', finished_at = ?
+                    WHERE status IN ('pending', 'leased') AND available_at <= ? AND created_at < ?
+                ''', (now, now, now - max_lateness))
+                if cursor.rowcount:
+                    logger.warning(
+                        f"Пропущено опоздавших рассылок: {cursor.rowcount}", extra={'event': 'digest.late'}
+                    )
+            cursor.execute('''
+                SELECT id, user_id, due_at, attempts FROM digest_jobs
+                WHERE status IN ('pending', 'leased') AND available_at <= ?
+                ORDER BY available_at LIMIT ?
+            ''', (now, limit))
+            jobs = [
+                {
+                    'id': row['id'],
+                    'user_id': row['user_id'],
+                    'due_at': row['due_at'],
+                    'attempts': row['attempts'] + 1
+                }
+                for row in cursor.fetchall()
+            ]
+            cursor.executemany('''
+                UPDATE digest_jobs SET status = 'leased', lease_owner = ?, available_at = ?,
+                    attempts = attempts + 1
+                WHERE id = ?
+            ''', [(owner, now + lease_seconds, job['id']) for job in jobs])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return jobs
+
+    def extend_digest_lease(self, job_id: int, owner: str, until: float) -> bool:
+        """
+        Продлить аренду задания.
+
+        Returns:
+            bool: False, если задание уже не принадлежит этому обработчику
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE digest_jobs SET available_at = ?
+            WHERE id = ? AND status = 'leased' AND lease_owner = ?
+        ''', (until, job_id, owner))
+
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def finish_digest_job(self, job_id: int, owner: str, now: float, error: str = None) -> bool:
+        """
+        Завершить задание: done без ошибки, failed с ошибкой.
+
+        Returns:
+            bool: False, если аренда была потеряна
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE digest_jobs SET status = ?, error = ?, finished_at = ?
+            WHERE id = ? AND status = 'leased' AND lease_owner = ?
+        ''', ('done' if error is None else 'failed', error, now, job_id, owner))
+
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def retry_digest_job(self, job_id: int, owner: str, available_at: float, error: str) -> bool:
+        """
+        Вернуть задание в очередь для повторной попытки.
+
+        Returns:
+            bool: False, если аренда была потеряна
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE digest_jobs SET status = 'pending', lease_owner = NULL, available_at = ?, error = ?
+            WHERE id = ? AND status = 'leased' AND lease_owner = ?
+        ''', (available_at, error, job_id, owner))
+
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def purge_digest_jobs(self, before: float) -> int:
+        """Удалить завершённые задания старше before. Возвращает число удалённых."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "DELETE FROM digest_jobs WHERE status IN ('done', 'failed', 'skipped') AND finished_at < ?", (before,)
+        )
+
+        conn.commit()
+        return cursor.rowcount
+
+    def get_digest_queue_stats(self, now: float) -> dict:
+        """Число заданий по статусам и возраст самого старого готового задания в секундах."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT status, COUNT(*) AS count FROM digest_jobs GROUP BY status')
+        stats = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0, 'skipped': 0}
+        stats.update({row['status']: row['count'] for row in cursor.fetchall()})
+
+        cursor.execute(
+            "SELECT MIN(available_at) AS oldest FROM digest_jobs WHERE status = 'pending' AND available_at <= ?",
+            (now,)
+        )
+        oldest = cursor.fetchone()['oldest']
+        stats['oldest_ready_age'] = now - oldest if oldest is not None else 0.0
+        return stats
@@ -0,0 +1,305 @@
+"""
+Процессы-обработчики рассылок (DIGEST_MODE=queue).
+
+В режиме очереди планировщик бота только ставит задания в таблицу
+digest_jobs, а рассылку формируют и отправляют отдельные процессы: большой
+слот в 09:00 больше не отнимает цикл событий и потоки Notion у записи
+заметок. Обработчик берёт задания в аренду на DIGEST_LEASE_SECONDS и
+продлевает её, пока рассылка формируется. Если процесс упал, аренда истекает
+и задание берёт другой обработчик; после DIGEST_MAX_ATTEMPTS попыток
+задание помечается failed. Задание, не отправленное за DIGEST_MAX_LATENESS
+секунд после своего времени (обработчики стояли, повторы затянулись),
+помечается skipped: пропущенные слоты не приходят пачкой после простоя.
+
+Временные ошибки Notion повторяются через DIGEST_RETRY_DELAY. Ошибки
+Telegram (кроме RetryAfter) не повторяются — сообщение могло уйти.
+
+Бот сам запускает DIGEST_WORKERS процессов. При DIGEST_WORKERS=0 их
+запускают отдельно, например в своём контейнере:
+
+    python -m src.digest_worker [число_процессов]
+
+События вебхуков Notion хранятся в памяти бота, поэтому обработчики всегда
+проверяют время изменения страницы в самом Notion.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from typing import List, Optional, Set
+
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from src.database import Database
+from src.executors import ExecutorSaturated, run_db, shutdown_executors
+from src.log_pipeline import setup_logging, shutdown_logging
+from src.notion_errors import NotionError
+from src.notifications import NotificationManager
+from src.storage import create_user_store
+
+logger = logging.getLogger(__name__)
+
+# Процессов, которые запускает бот (0 — обработчики запускаются отдельно)
+DIGEST_WORKERS = int(os.getenv('DIGEST_WORKERS', '2'))
+# Рассылок, формируемых одним процессом одновременно
+DIGEST_WORKER_CONCURRENCY = int(os.getenv('DIGEST_WORKER_CONCURRENCY', '8'))
+DIGEST_LEASE_SECONDS = float(os.getenv('DIGEST_LEASE_SECONDS', '120'))
+DIGEST_MAX_ATTEMPTS = int(os.getenv('DIGEST_MAX_ATTEMPTS', '3'))
+DIGEST_RETRY_DELAY = float(os.getenv('DIGEST_RETRY_DELAY', '60'))
+DIGEST_POLL_INTERVAL = float(os.getenv('DIGEST_POLL_INTERVAL', '2'))
+# Через сколько секунд после своего времени рассылка уже не отправляется (0 — без ограничения)
+DIGEST_MAX_LATENESS = float(os.getenv('DIGEST_MAX_LATENESS', '3600'))
+# Сколько дней хранить завершённые задания
+DIGEST_JOBS_RETENTION_DAYS = float(os.getenv('DIGEST_JOBS_RETENTION_DAYS', '7'))
+# Сколько ждать завершения процессов при остановке, затем SIGKILL
+DIGEST_STOP_TIMEOUT = float(os.getenv('DIGEST_STOP_TIMEOUT', '10'))
+
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
+
+PURGE_INTERVAL = 3600
+POOL_CHECK_INTERVAL = 5
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Можно ли повторить рассылку: Notion временно недоступен, сообщение точно не ушло."""
+    if isinstance(error, NotionError):
+        return error.transient
+    return isinstance(error, (ExecutorSaturated, RetryAfter))
+
+
+class DigestWorker:
+    """Обработчик заданий рассылки из очереди SQLite."""
+
+    def __init__(self, db: Database, manager: NotificationManager, owner: Optional[str] = None,
+                 concurrency: int = DIGEST_WORKER_CONCURRENCY, lease_seconds: float = DIGEST_LEASE_SECONDS,
+                 max_attempts: int = DIGEST_MAX_ATTEMPTS, retry_delay: float = DIGEST_RETRY_DELAY,
+                 poll_interval: float = DIGEST_POLL_INTERVAL, max_lateness: float = DIGEST_MAX_LATENESS):
+        """Инициализация обработчика."""
+        self.db = db
+        self.manager = manager
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = max(concurrency, 1)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.max_lateness = max_lateness or None
+        self._running: Set[asyncio.Task] = set()
+        self._next_purge = 0.0
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+        self.lost = 0
+
+    async def run(self, stop: asyncio.Event):
+        """Брать задания, пока не выставлен stop; затем дождаться начатых."""
+        stopping = asyncio.get_running_loop().create_task(stop.wait())
+        try:
+            while not stop.is_set():
+                await self.claim()
+                await self._purge_if_due()
+                # Проснуться по освобождению слота, остановке или через интервал опроса
+                await asyncio.wait(
+                    {stopping, *self._running}, timeout=self.poll_interval,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            stopping.cancel()
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def claim(self) -> int:
+        """Взять задания на свободные слоты. Возвращает число взятых."""
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return 0
+        jobs = await run_db(
+            self.db.claim_digest_jobs, self.owner, self.lease_seconds, free, self.max_attempts, time.time(),
+            self.max_lateness
+        )
+        loop = asyncio.get_running_loop()
+        for job in jobs:
+            task = loop.create_task(self.process(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        return len(jobs)
+
+    async def process(self, job: dict):
+        """Сформировать и отправить рассылку задания, отметить результат."""
+        user_id = job['user_id']
+        heartbeat = asyncio.get_running_loop().create_task(self._heartbeat(job['id']))
+        config = {}
+        error = None
+        try:
+            config = await self.manager.storage.get_user_config(user_id)
+            if config.get('suspended_reason'):
+                logger.info(
+                    f"Рассылка пользователю {user_id} пропущена: пользователь приостановлен",
+                    extra={'event': 'digest.skipped', 'user_id': user_id}
+                )
+            else:
+                await self.manager.deliver_digest(user_id, config)
+        except Exception as e:
+            error = e
+        finally:
+            heartbeat.cancel()
+
+        now = time.time()
+        if error is None:
+            kept = await run_db(self.db.finish_digest_job, job['id'], self.owner, now)
+            self.done += 1
+        else:
+            logger.error(f"Ошибка рассылки пользователю {user_id} (попытка {job['attempts']}): {error}")
+            await self.manager.handle_failure(user_id, config, error)
+            if is_retryable(error) and job['attempts'] < self.max_attempts:
+                retry_at = now + max(self.retry_delay * job['attempts'], getattr(error, 'retry_after', 0) or 0)
+                kept = await run_db(self.db.retry_digest_job, job['id'], self.owner, retry_at, str(error))
+                self.retried += 1
+            else:
+                kept = await run_db(self.db.finish_digest_job, job['id'], self.owner, now, str(error))
+                self.failed += 1
+        if not kept:
+            self.lost += 1
+            logger.warning(f"Аренда задания рассылки {job['id']} потеряна до завершения")
+
+    async def _heartbeat(self, job_id: int):
+        """Продлевать аренду, пока рассылка формируется."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await run_db(self.db.extend_digest_lease, job_id, self.owner, time.time() + self.lease_seconds):
+                logger.warning(f"Задание рассылки {job_id} перешло другому обработчику")
+                return
+
+    async def _purge_if_due(self):
+        now = time.time()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + PURGE_INTERVAL
+        purged = await run_db(self.db.purge_digest_jobs, now - DIGEST_JOBS_RETENTION_DAYS * 86400)
+        if purged:
+            logger.info(f"Удалено завершённых заданий рассылки: {purged}")
+
+    def format_stats(self) -> str:
+        """Статистика обработчика для логов."""
+        return (
+            f"Обработчик рассылок {self.owner}: отправлено {self.done}, отложено {self.retried}, "
+            f"ошибок {self.failed}, потеряно аренд {self.lost}"
+        )
+
+
+async def serve():
+    """Работа одного процесса-обработчика до SIGTERM/SIGINT."""
+    db = Database()
+    db.init_database()
+    db.enable_wal()
+    storage = create_user_store(db)
+    await storage.init()
+
+    bot_kwargs = {'base_url': TELEGRAM_API_BASE_URL} if TELEGRAM_API_BASE_URL else {}
+    bot = Bot(os.environ['TELEGRAM_BOT_TOKEN'], **bot_kwargs)
+    worker = DigestWorker(db, NotificationManager(db, bot, storage))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    logger.info(f"Обработчик рассылок {worker.owner} запущен")
+    try:
+        async with bot:
+            await worker.run(stop)
+    finally:
+        await storage.close()
+        logger.info(worker.format_stats())
+        shutdown_executors()
+        db.close()
+
+
+def worker_main():
+    """Точка входа дочернего процесса."""
+    setup_logging()
+    try:
+        asyncio.run(serve())
+    finally:
+        shutdown_logging()
+
+
+class WorkerPool:
+    """Процессы-обработчики рассылок с перезапуском упавших."""
+
+    def __init__(self, processes: int = DIGEST_WORKERS):
+        """Инициализация пула."""
+        self.processes = processes
+        # spawn: дочерний процесс не наследует потоки и цикл событий бота
+        self._context = multiprocessing.get_context('spawn')
+        self._workers: List[Optional[multiprocessing.Process]] = [None] * processes
+        self.restarts = 0
+
+    def start(self):
+        """Запустить процессы."""
+        for index in range(self.processes):
+            self._start(index)
+        logger.info(f"Запущено процессов рассылки: {self.processes}")
+
+    def _start(self, index: int):
+        process = self._context.Process(target=worker_main, name=f"digest-worker-{index}", daemon=True)
+        process.start()
+        self._workers[index] = process
+
+    def check(self):
+        """Перезапустить завершившиеся процессы."""
+        for index, process in enumerate(self._workers):
+            if process is not None and process.exitcode is not None:
+                logger.warning(f"Процесс рассылки {process.name} завершился с кодом {process.exitcode}, перезапуск")
+                self.restarts += 1
+                self._start(index)
+
+    def stop(self, timeout: float = DIGEST_STOP_TIMEOUT):
+        """Остановить процессы: SIGTERM, затем SIGKILL по таймауту."""
+        workers = [process for process in self._workers if process is not None]
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in workers:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self._workers = [None] * self.processes
+        logger.info(f"Процессы рассылки остановлены (перезапусков: {self.restarts})")
+
+
+def main():
+    """Запуск обработчиков отдельно от бота: python -m src.digest_worker [число_процессов]."""
+    setup_logging()
+    if not os.getenv('TELEGRAM_BOT_TOKEN'):
+        logger.error("TELEGRAM_BOT_TOKEN не установлен!")
+        sys.exit(1)
+
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else max(DIGEST_WORKERS, 1)
+    pool = WorkerPool(processes)
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    pool.start()
+    while not stopping:
+        time.sleep(POOL_CHECK_INTERVAL)
+        if not stopping:
+            pool.check()
+    pool.stop()
+    shutdown_logging()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Кодирование текста заметок в блоки Notion.
+
+Notion принимает в одном элементе rich_text не больше 2000 символов
+(считаются единицы UTF-16, как в JavaScript), в одном блоке — не больше
+100 элементов rich_text, в одном запросе blocks.children.append — не
+больше 100 блоков. Длинный текст делится на сегменты, по возможности на
+границе строки или слова; сегменты склеиваются обратно в исходный текст.
+
+В режиме построчной записи (/split) каждая непустая строка или пункт
+списка становится отдельной задачей to_do; все блоки заметки
+отправляются одним запросом.
+"""
+
+import re
+from typing import List
+
+# Лимит Notion на длину текста одного элемента rich_text
+RICH_TEXT_LIMIT = 2000
+# Лимит Notion на число элементов rich_text в блоке
+MAX_RICH_TEXT_ITEMS = 100
+# Лимит Notion на число блоков в одном запросе добавления
+MAX_CHILDREN_PER_REQUEST = 100
+
+# Маркер пункта списка в начале строки: «- », «* », «• », «1. », «2) », «[ ] »
+_BULLET_RE = re.compile(r'^\s*(?:[-*•–—]\s+|\d+[.)]\s+|\[[ xX]?\]\s+)')
+
+
+def text_length(text: str) -> int:
+    """Длина текста в единицах UTF-16 — так её считает Notion."""
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+def split_text(text: str, limit: int = RICH_TEXT_LIMIT) -> List[str]:
+    """
+    Разделить текст на сегменты не длиннее limit единиц UTF-16.
+
+    Разрез делается после последнего перевода строки или пробела во второй
+    половине сегмента, иначе — ровно по лимиту. ''.join(сегменты) == text.
+    """
+    segments = []
+    rest = text
+    while text_length(rest) > limit:
+        # Самый длинный префикс, помещающийся в лимит
+        cut = 0
+        length = 0
+        for char in rest:
+            length += 2 if ord(char) > 0xFFFF else 1
+            if length > limit:
+                break
+            cut += 1
+
+        boundary = max(rest.rfind('\n', 0, cut), rest.rfind(' ', 0, cut))
+        if boundary >= cut // 2:
+            cut = boundary + 1
+        segments.append(rest[:cut])
+        rest = rest[cut:]
+    if rest or not segments:
+        segments.append(rest)
+    return segments
+
+
+def rich_text(text: str) -> list:
+    """Собрать rich_text из простого текста с учётом лимитов Notion."""
+    segments = split_text(text)
+    if len(segments) > MAX_RICH_TEXT_ITEMS:
+        raise ValueError(
+            f"Заметка слишком длинная: Notion принимает до {RICH_TEXT_LIMIT * MAX_RICH_TEXT_ITEMS} символов"
+        )
+    return [{"type": "text", "text": {"content": segment}} for segment in segments]
+
+
+def split_lines(text: str) -> List[str]:
+    """Непустые строки текста без маркеров списка."""
+    lines = []
+    for line in text.splitlines():
+        line = _BULLET_RE.sub('', line, count=1).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def note_texts(text: str, per_line: bool = False) -> List[str]:
+    """Тексты блоков, из которых будет состоять заметка."""
+    if per_line:
+        lines = split_lines(text)
+        if lines:
+            return lines
+    return [text]
+
+
+def todo_block(text: str, checked: bool = False) -> dict:
+    """Блок to_do с текстом."""
+    return {
+        "object": "block",
+        "type": "to_do",
+        "to_do": {"rich_text": rich_text(text), "checked": checked},
+    }
+
+
+def encode_note(text: str, per_line: bool = False) -> List[dict]:
+    """Блоки to_do заметки: один на всё сообщение или по одному на строку."""
+    return [todo_block(line) for line in note_texts(text, per_line)]
@@ -0,0 +1,242 @@
+"""
+Ограниченные пулы потоков для блокирующего ввода-вывода.
+
+Блокирующие вызовы выполняются в отдельных пулах: один для запросов к Notion,
+другой для SQLite. Поэтому зависание Notion не мешает доступу к базе.
+Очередь каждого пула ограничена. При переполнении действует политика:
+  * reject — новая задача отклоняется с ExecutorSaturated;
+  * shed   — из очереди вытесняется самая старая ожидающая задача;
+  * wait   — вызывающий ждёт освобождения места (обратное давление).
+
+Перед пулом Notion стоит справедливая очередь (src/fair_queue.py): потоки
+выдаются пользователям по очереди, а при переполнении вытесняется задача
+пользователя с самой длинной очередью, а не самая старая задача вообще.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Optional
+
+from src.fair_queue import FairScheduler, QueueOverflow, current_user
+
+logger = logging.getLogger(__name__)
+
+POLICY_REJECT = 'reject'
+POLICY_SHED = 'shed'
+POLICY_WAIT = 'wait'
+
+NOTION_EXECUTOR_WORKERS = int(os.getenv('NOTION_EXECUTOR_WORKERS', '16'))
+NOTION_EXECUTOR_QUEUE = int(os.getenv('NOTION_EXECUTOR_QUEUE', '64'))
+NOTION_EXECUTOR_POLICY = os.getenv('NOTION_EXECUTOR_POLICY', POLICY_REJECT)
+# Справедливая очередь пользователей перед пулом Notion
+NOTION_FAIR_QUEUE = os.getenv('NOTION_FAIR_QUEUE', 'true').lower() in ('true', '1', 'yes')
+
+# Соединение SQLite одно на процесс, поэтому по умолчанию один поток
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', '1'))
+DB_EXECUTOR_QUEUE = int(os.getenv('DB_EXECUTOR_QUEUE', '256'))
+DB_EXECUTOR_POLICY = os.getenv('DB_EXECUTOR_POLICY', POLICY_WAIT)
+
+
+class ExecutorSaturated(Exception):
+    """Пул перегружен, задача не принята или вытеснена."""
+
+
+class BoundedExecutor:
+    """Пул потоков с ограниченной очередью и счётчиками нагрузки."""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, policy: str = POLICY_REJECT):
+        """Инициализация пула."""
+        if policy not in (POLICY_REJECT, POLICY_SHED, POLICY_WAIT):
+            raise ValueError(f"Неизвестная политика пула: {policy}")
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.policy = policy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queue: Deque[Future] = deque()
+        self._active = 0
+        self._space: Optional[asyncio.Condition] = None
+        self.completed = 0
+        self.rejected = 0
+        self.shed = 0
+
+    @property
+    def active(self) -> int:
+        """Число выполняющихся задач."""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """Число задач, ожидающих свободного потока."""
+        return len(self._queue)
+
+    def stats(self) -> dict:
+        """Снимок счётчиков пула."""
+        with self._lock:
+            return {
+                'name': self.name,
+                'active': self._active,
+                'queued': len(self._queue),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'shed': self.shed,
+            }
+
+    def _has_space(self) -> bool:
+        return self._active + len(self._queue) < self.max_workers + self.max_queue
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Выполнить блокирующую функцию в пуле и дождаться результата."""
+        if self.policy == POLICY_WAIT:
+            await self._wait_for_space()
+
+        future: Future = Future()
+        with self._lock:
+            if not self._has_space():
+                if self.policy == POLICY_SHED and self._queue:
+                    victim = self._queue.popleft()
+                    self.shed += 1
+                    if not victim.cancelled():
+                        victim.set_exception(ExecutorSaturated(
+                            "Сервис перегружен, задача вытеснена. Попробуйте через минуту."
+                        ))
+                elif self.policy != POLICY_WAIT:
+                    self.rejected += 1
+                    raise ExecutorSaturated("Сервис перегружен. Попробуйте через минуту.")
+            self._queue.append(future)
+
+        self._executor.submit(self._call, future, fn, args, kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            self._notify_space()
+
+    def _call(self, future: Future, fn: Callable, args: tuple, kwargs: dict):
+        """Выполнить задачу в потоке пула, если она не была вытеснена."""
+        with self._lock:
+            try:
+                self._queue.remove(future)
+            except ValueError:
+                # Задача вытеснена из очереди до старта
+                return
+            if not future.set_running_or_notify_cancel():
+                # Вызывающий перестал ждать результат
+                return
+            self._active += 1
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self.completed += 1
+
+    async def _wait_for_space(self):
+        """Дождаться места в очереди (политика wait)."""
+        if self._space is None:
+            self._space = asyncio.Condition()
+        async with self._space:
+            await self._space.wait_for(self._has_space)
+
+    def _notify_space(self):
+        if self._space is None:
+            return
+
+        async def notify():
+            async with self._space:
+                self._space.notify_all()
+
+        asyncio.get_running_loop().create_task(notify())
+
+    def shutdown(self, wait: bool = True):
+        """Остановить пул."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_notion_executor: Optional[BoundedExecutor] = None
+_db_executor: Optional[BoundedExecutor] = None
+_notion_scheduler: Optional[FairScheduler] = None
+_executors_lock = threading.Lock()
+
+
+def get_notion_executor() -> BoundedExecutor:
+    """Пул для запросов к Notion (создаётся при первом обращении)."""
+    global _notion_executor
+    with _executors_lock:
+        if _notion_executor is None:
+            _notion_executor = BoundedExecutor(
+                'notion', NOTION_EXECUTOR_WORKERS, NOTION_EXECUTOR_QUEUE, NOTION_EXECUTOR_POLICY
+            )
+        return _notion_executor
+
+
+def get_db_executor() -> BoundedExecutor:
+    """Пул для работы с SQLite (создаётся при первом обращении)."""
+    global _db_executor
+    with _executors_lock:
+        if _db_executor is None:
+            _db_executor = BoundedExecutor(
+                'sqlite', DB_EXECUTOR_WORKERS, DB_EXECUTOR_QUEUE, DB_EXECUTOR_POLICY
+            )
+        return _db_executor
+
+
+def get_notion_scheduler() -> FairScheduler:
+    """Справедливая очередь перед пулом Notion (создаётся при первом обращении)."""
+    global _notion_scheduler
+    with _executors_lock:
+        if _notion_scheduler is None:
+            # Политика wait — обратное давление без вытеснения
+            max_pending = None if NOTION_EXECUTOR_POLICY == POLICY_WAIT else NOTION_EXECUTOR_QUEUE
+            _notion_scheduler = FairScheduler('notion', NOTION_EXECUTOR_WORKERS, max_pending=max_pending)
+        return _notion_scheduler
+
+
+async def run_notion(fn: Callable, *args, **kwargs):
+    """Выполнить запрос к Notion в пуле Notion в очереди текущего пользователя."""
+    if not NOTION_FAIR_QUEUE:
+        return await get_notion_executor().run(fn, *args, **kwargs)
+    try:
+        async with get_notion_scheduler().slot(current_user.get()):
+            return await get_notion_executor().run(fn, *args, **kwargs)
+    except QueueOverflow as e:
+        raise ExecutorSaturated(str(e)) from e
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """Выполнить операцию с базой в пуле SQLite."""
+    return await get_db_executor().run(fn, *args, **kwargs)
+
+
+def format_executor_stats() -> str:
+    """Статистика пулов в виде строки для логов."""
+    parts = []
+    for executor in (get_notion_executor(), get_db_executor()):
+        stats = executor.stats()
+        parts.append(
+            f"{stats['name']}: активно {stats['active']}, в очереди {stats['queued']}, "
+            f"выполнено {stats['completed']}, отклонено {stats['rejected']}, вытеснено {stats['shed']}"
+        )
+    if _notion_scheduler is not None:
+        parts.append(_notion_scheduler.format_stats())
+    return "Пулы: " + "; ".join(parts)
+
+
+def shutdown_executors():
+    """Остановить пулы при завершении процесса."""
+    global _notion_executor, _db_executor, _notion_scheduler
+    with _executors_lock:
+        for executor in (_notion_executor, _db_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        _notion_executor = None
+        _db_executor = None
+        _notion_scheduler = None
@@ -0,0 +1,362 @@
+"""
+Справедливое распределение работы с Notion между пользователями.
+
+Один пользователь, пересылающий сотни сообщений подряд или без конца
+нажимающий /list, не должен занимать все потоки Notion и цикл событий.
+FairScheduler держит отдельную очередь на каждого пользователя и выдаёт
+слоты по deficit round-robin: за один обход очередь пользователя получает
+квант, пропорциональный его весу, и тратит его на задачи своей стоимости.
+Лёгкий пользователь ждёт не дольше одного обхода, даже если у тяжёлого
+в очереди сотни задач.
+
+Планировщик стоит в трёх местах:
+  * обновления Telegram (FairUpdateProcessor): по одному обновлению на
+    пользователя одновременно, пользователи чередуются;
+  * фоновая очередь записи заметок (src/capture.py);
+  * запросы к пулу Notion (run_notion в src/executors.py).
+
+Пользователь, от имени которого идёт работа, берётся из current_user —
+его выставляют обработка обновления и фоновые задачи.
+
+Веса задаются в FAIR_WEIGHTS: «123456:4,777:0.5» (Telegram ID: вес).
+По каждому пользователю доступны глубина очереди и время ожидания слота.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Deque, Dict, Hashable, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+FAIR_WEIGHTS = os.getenv('FAIR_WEIGHTS', '')
+FAIR_DEFAULT_WEIGHT = float(os.getenv('FAIR_DEFAULT_WEIGHT', '1'))
+# Стоимость, на которую очередь пользователя может потратить за обход при весе 1
+FAIR_QUANTUM = float(os.getenv('FAIR_QUANTUM', '1'))
+# Сколько обновлений Telegram обрабатывается одновременно (разных пользователей)
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
+# Предел обновлений, ожидающих своей очереди, для семафора PTB
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '10000'))
+# Сколько пользователей помнить в статистике
+FAIR_STATS_KEYS = int(os.getenv('FAIR_STATS_KEYS', '1000'))
+
+# Пользователь, от имени которого выполняется текущая задача
+current_user: ContextVar[Optional[int]] = ContextVar('current_user', default=None)
+
+
+class QueueOverflow(Exception):
+    """Задача не принята или вытеснена из переполненной очереди."""
+
+
+def parse_weights(value: str) -> Dict[int, float]:
+    """Разобрать FAIR_WEIGHTS: «ID:вес,ID:вес»; некорректные пары пропускаются."""
+    weights = {}
+    for pair in value.split(','):
+        key, _, weight = pair.strip().partition(':')
+        if not key:
+            continue
+        try:
+            parsed = float(weight)
+            if parsed <= 0:
+                raise ValueError(weight)
+            weights[int(key)] = parsed
+        except ValueError:
+            logger.warning(f"FAIR_WEIGHTS: пропущен некорректный вес «{pair.strip()}»")
+    return weights
+
+
+class _Waiter:
+    """Задача, ожидающая слота."""
+
+    __slots__ = ('future', 'cost', 'enqueued_at')
+
+    def __init__(self, future: asyncio.Future, cost: float):
+        self.future = future
+        self.cost = cost
+        self.enqueued_at = time.monotonic()
+
+
+class KeyStats:
+    """Счётчики ожидания одного пользователя."""
+
+    __slots__ = ('served', 'wait_total', 'wait_max', 'dropped')
+
+    def __init__(self):
+        """Инициализация счётчиков."""
+        self.served = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.dropped = 0
+
+    def record(self, waited: float):
+        """Учесть выданный слот."""
+        self.served += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    @property
+    def wait_avg(self) -> float:
+        """Среднее время ожидания слота в секундах."""
+        return self.wait_total / self.served if self.served else 0.0
+
+
+class FairScheduler:
+    """Слоты на выполнение с очередями по пользователям и deficit round-robin.
+
+    Используется только из цикла событий, поэтому блокировки не нужны.
+    """
+
+    def __init__(self, name: str, capacity: int, per_key_limit: Optional[int] = None,
+                 quantum: float = FAIR_QUANTUM, weights: Optional[Dict[Hashable, float]] = None,
+                 default_weight: float = FAIR_DEFAULT_WEIGHT, max_pending: Optional[int] = None,
+                 stats_keys: int = FAIR_STATS_KEYS):
+        """Инициализация планировщика.
+
+        Args:
+            capacity: сколько задач выполняется одновременно
+            per_key_limit: сколько задач одного пользователя выполняется одновременно
+            max_pending: предел ожидающих задач; при переполнении вытесняется
+                последняя задача самой длинной очереди
+        """
+        self.name = name
+        self.capacity = max(capacity, 1)
+        self.per_key_limit = per_key_limit
+        self.quantum = quantum
+        self.weights = dict(weights if weights is not None else parse_weights(FAIR_WEIGHTS))
+        self.default_weight = default_weight
+        self.max_pending = max_pending
+        self.stats_keys = stats_keys
+        # Непустые очереди в порядке обхода
+        self._queues: 'OrderedDict[Hashable, Deque[_Waiter]]' = OrderedDict()
+        self._deficit: Dict[Hashable, float] = {}
+        # Очередь, которой уже выдан квант на текущий визит
+        self._visiting: Optional[Hashable] = None
+        self._running: Dict[Hashable, int] = {}
+        self._stats: 'OrderedDict[Hashable, KeyStats]' = OrderedDict()
+        self.active = 0
+        self.pending = 0
+        self.dropped = 0
+
+    def weight(self, key: Hashable) -> float:
+        """Вес пользователя."""
+        return self.weights.get(key, self.default_weight)
+
+    def depth(self, key: Hashable) -> int:
+        """Число задач пользователя, ожидающих слота."""
+        queue = self._queues.get(key)
+        return len(queue) if queue is not None else 0
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable, cost: float = 1.0):
+        """Занять слот на время блока."""
+        await self.acquire(key, cost)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    async def acquire(self, key: Hashable, cost: float = 1.0):
+        """Дождаться слота в очереди пользователя.
+
+        Raises:
+            QueueOverflow: очередь переполнена, задача не принята или вытеснена
+        """
+        if not self._queues and self._can_run(key):
+            # Никто не ждёт — очередь не нужна
+            self._start(key, 0.0)
+            return
+
+        if self.max_pending is not None and self.pending >= self.max_pending:
+            self._drop_for(key)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), cost)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+        queue.append(waiter)
+        self.pending += 1
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            future = waiter.future
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Слот выдан одновременно с отменой — вернуть его
+                self.release(key)
+            else:
+                self._remove(key, waiter)
+            raise
+
+    def release(self, key: Hashable):
+        """Освободить слот и выдать его следующей задаче."""
+        self.active -= 1
+        running = self._running.get(key, 0) - 1
+        if running > 0:
+            self._running[key] = running
+        else:
+            self._running.pop(key, None)
+        self._dispatch()
+
+    def _can_run(self, key: Hashable) -> bool:
+        if self.active >= self.capacity:
+            return False
+        return self.per_key_limit is None or self._running.get(key, 0) < self.per_key_limit
+
+    def _start(self, key: Hashable, waited: float):
+        self.active += 1
+        self._running[key] = self._running.get(key, 0) + 1
+        self._key_stats(key).record(waited)
+
+    def _key_stats(self, key: Hashable) -> KeyStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = KeyStats()
+            while len(self._stats) > self.stats_keys:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(key)
+        return stats
+
+    def _dispatch(self):
+        """Раздать свободные слоты по кругу очередей (deficit round-robin)."""
+        blocked = 0
+        while self.active < self.capacity and self._queues:
+            key = next(iter(self._queues))
+            queue = self._queues[key]
+            if not self._can_run(key):
+                # У пользователя уже занято максимум слотов — очередь ждёт своего круга
+                self._next_queue(key)
+                blocked += 1
+                if blocked >= len(self._queues):
+                    return
+                continue
+
+            if self._visiting != key:
+                self._visiting = key
+                self._deficit[key] = self._deficit.get(key, 0.0) + self.quantum * self.weight(key)
+            waiter = queue[0]
+            if waiter.cost > self._deficit[key]:
+                # Квант не покрывает задачу — дефицит копится до следующего обхода
+                self._next_queue(key)
+                continue
+
+            queue.popleft()
+            self.pending -= 1
+            self._deficit[key] -= waiter.cost
+            blocked = 0
+            if not queue:
+                # Опустевшая очередь не копит дефицит
+                del self._queues[key]
+                self._deficit.pop(key, None)
+                self._visiting = None
+            self._start(key, time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def _next_queue(self, key: Hashable):
+        self._queues.move_to_end(key)
+        self._visiting = None
+
+    def _remove(self, key: Hashable, waiter: _Waiter):
+        queue = self._queues.get(key)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self.pending -= 1
+        if not queue:
+            del self._queues[key]
+            self._deficit.pop(key, None)
+            if self._visiting == key:
+                self._visiting = None
+
+    def _drop_for(self, key: Hashable):
+        """Освободить место для задачи key за счёт самой длинной очереди."""
+        longest = max(self._queues, key=lambda k: len(self._queues[k]), default=None)
+        if longest is None or len(self._queues[longest]) <= self.depth(key):
+            # Пользователь сам занимает больше всех — отказываем ему
+            self.dropped += 1
+            self._key_stats(key).dropped += 1
+            raise QueueOverflow("Сервис перегружен. Попробуйте через минуту.")
+
+        waiter = self._queues[longest][-1]
+        self._remove(longest, waiter)
+        self.dropped += 1
+        self._key_stats(longest).dropped += 1
+        waiter.future.set_exception(QueueOverflow(
+            "Сервис перегружен, задача вытеснена. Попробуйте через минуту."
+        ))
+
+    def stats(self) -> Dict[Hashable, dict]:
+        """Снимок по пользователям: глубина очереди, занятые слоты и время ожидания."""
+        keys = list(self._stats) + [key for key in self._queues if key not in self._stats]
+        snapshot = {}
+        for key in keys:
+            stats = self._stats.get(key) or KeyStats()
+            snapshot[key] = {
+                'depth': self.depth(key),
+                'running': self._running.get(key, 0),
+                'weight': self.weight(key),
+                'served': stats.served,
+                'dropped': stats.dropped,
+                'wait_avg': stats.wait_avg,
+                'wait_max': stats.wait_max,
+            }
+        return snapshot
+
+    def format_stats(self, top: int = 5) -> str:
+        """Статистика для логов: пользователи с самым долгим ожиданием."""
+        snapshot = self.stats()
+        worst = sorted(snapshot.items(), key=lambda item: item[1]['wait_max'], reverse=True)[:top]
+        parts = [
+            f"{key}: очередь {s['depth']}, выдано {s['served']}, ожидание ср. {s['wait_avg'] * 1000:.0f} мс "
+            f"/ макс. {s['wait_max'] * 1000:.0f} мс"
+            for key, s in worst
+        ]
+        summary = (
+            f"Очередь {self.name}: активно {self.active}, ожидают {self.pending}, "
+            f"пользователей {len(snapshot)}, вытеснено {self.dropped}"
+        )
+        return summary + (" — " + "; ".join(parts) if parts else "")
+
+
+class FairUpdateProcessor(BaseUpdateProcessor):
+    """Обработка обновлений Telegram: по одному на пользователя, пользователи по очереди.
+
+    Обновления одного пользователя выполняются строго последовательно, поэтому
+    диалоги (ConversationHandler) и user_data видят их в исходном порядке.
+    """
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_MAX_PENDING,
+                 weights: Optional[Dict[Hashable, float]] = None):
+        """Инициализация обработчика."""
+        # Семафор PTB только ограничивает число ожидающих, очерёдность задаёт планировщик
+        super().__init__(max_concurrent_updates=max(max_pending, concurrency))
+        self.scheduler = FairScheduler('updates', concurrency, per_key_limit=1, weights=weights)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        """Дождаться очереди пользователя и обработать обновление от его имени."""
+        user = getattr(update, 'effective_user', None)
+        key = user.id if user is not None else None
+        try:
+            await self.scheduler.acquire(key)
+        except BaseException:
+            coroutine.close()
+            raise
+        token = current_user.set(key)
+        try:
+            await coroutine
+        finally:
+            current_user.reset(token)
+            self.scheduler.release(key)
+
+    async def initialize(self):
+        """Ресурсов для инициализации нет."""
+
+    async def shutdown(self):
+        """Ресурсов для освобождения нет."""
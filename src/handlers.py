@@ -5,11 +5,22 @@ message processing, and callback queries.
 """
 
 import logging
+import time
+from typing import Optional, Union
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, ConversationHandler
 
-from src.app_globals import db, notion_client, notification_manager
-from src.notion_api import NotionClient
+from src import app_globals
+from src.capture import QueuedCapture, capture_note, update_note
+from src.compactor import COMPACTOR_MIN_AGE_DAYS
+from src.executors import ExecutorSaturated, run_db, run_notion
+from src.list_view import LIST_PAGE_SIZE, ListCursorCache, format_notes
+from src.media import MediaError, media_from_message
+from src.notion_api import InboxTarget, NotionClient, TailCursor, TARGET_PAGE
+from src.notion_errors import NotionAuthError, NotionError, NotionNotFoundError, NotionPermissionError
+from src.page_index import has_close_match, normalize_title, rank_titles
+from src.search import index_records, parse_find_args, set_checked
 from src.utils import (
     get_time_keyboard,
     get_days_keyboard,
@@ -17,6 +28,11 @@ from src.utils import (
     format_days,
     get_notifications_actions_keyboard,
     get_timezone_keyboard,
+    get_page_candidates_keyboard,
+    get_list_navigation_keyboard,
+    dashed_id,
+    get_mark_done_keyboard,
+    set_mark_done_button,
     gmt_to_offset_seconds,
     offset_seconds_to_gmt,
     local_time_to_utc,
@@ -36,9 +52,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
 
     # Проверяем есть ли уже сохраненная конфигурация
-    config = db.get_user_config(user_id)
+    config = await app_globals.storage.get_user_config(user_id)
 
-    if config and config.get('notion_token') and config.get('page_id'):
+    suspended_reason = config.get('suspended_reason') if config else None
+
+    if config and config.get('notion_token') and config.get('page_id') and not suspended_reason:
         # Пользователь уже настроен - проверяем версию
         result = await check_and_show_changelog(update, context)
         if result is not None:
@@ -53,8 +71,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
         return ConversationHandler.END
 
-    # Новый пользователь - устанавливаем текущую версию
-    db.set_user_version(user_id, VERSION)
+    if suspended_reason:
+        # Рассылка приостановлена из-за постоянных ошибок - предлагаем перенастроить
+        await update.message.reply_text(
+            f"⚠️ Рассылка приостановлена: {suspended_reason}.\n\n"
+            "Давайте заново подключим Notion — после настройки уведомления возобновятся."
+        )
+    else:
+        # Новый пользователь - устанавливаем текущую версию
+        await app_globals.storage.set_user_version(user_id, VERSION)
 
     await update.message.reply_text(
         "👋 Привет! Я помогу вам записывать заметки в ваш Notion Inbox.\n\n"
@@ -87,19 +112,21 @@ async def handle_notion_token(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     # Проверяем токен через Notion API
     try:
-        test_client = NotionClient()
-        test_client.set_token(token)
+        test_client = NotionClient.for_token(token)
         # Пробуем получить информацию о пользователе
-        test_client.test_connection()
+        await run_notion(test_client.test_connection)
         
         # Сохраняем токен
-        db.save_notion_token(user_id, token)
+        await app_globals.storage.save_notion_token(user_id, token)
+
+        # Пока пользователь выбирает страницу, строим индекс названий в фоне
+        _schedule_page_index_build(context, token)
         
         await update.message.reply_text(
             "✅ Токен успешно сохранен!\n\n"
             "Теперь укажите страницу для записи заметок.\n\n"
             "Вы можете отправить:\n"
-            "• Ссылку на страницу (URL)\n"
+            "• Ссылку на страницу или базу данных (URL)\n"
             "• Или название страницы (если она находится в вашей рабочей области)\n\n"
             "Или отправьте /cancel для отмены."
         )
@@ -123,7 +150,7 @@ async def handle_page_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = update.effective_user.id
     page_input = update.message.text.strip()
     
-    config = db.get_user_config(user_id)
+    config = await app_globals.storage.get_user_config(user_id)
     if not config or not config.get('notion_token'):
         await update.message.reply_text(
             "❌ Токен не найден. Пожалуйста, начните с команды /start."
@@ -131,34 +158,51 @@ async def handle_page_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ConversationHandler.END
     
     try:
-        notion_client.set_token(config['notion_token'])
+        notion_client = NotionClient.for_token(config['notion_token'])
         
         # Определяем, это URL или название страницы
         page_id = None
         page_name = None
+        target = InboxTarget(TARGET_PAGE, None)
         
         if page_input.startswith('http'):
-            # Это URL, извлекаем page_id
+            # Это URL, извлекаем page_id (страницы или базы данных)
             page_id = notion_client.extract_page_id_from_url(page_input)
             if not page_id:
                 raise ValueError("Не удалось извлечь ID страницы из URL")
+            target, page_name = await run_notion(notion_client.resolve_target, page_id)
         else:
-            # Это название страницы, ищем её
-            page_id, page_name = notion_client.find_page_by_name(page_input)
-            if not page_id:
+            # Это название страницы, ищем её в индексе или живым поиском
+            candidates = await _find_page_candidates(context, config['notion_token'], page_input)
+            if not candidates:
                 raise ValueError(f"Страница '{page_input}' не найдена")
+
+            if _is_unambiguous(page_input, candidates):
+                page_id, page_name = candidates[0]
+            else:
+                await update.message.reply_text(
+                    "🔎 Найдено несколько страниц. Выберите нужную:",
+                    reply_markup=get_page_candidates_keyboard(candidates)
+                )
+                return WAITING_FOR_PAGE
         
         # Проверяем доступ к странице и получаем её название
         if not page_name:
-            page_info = notion_client.get_page_info(page_id)
+            page_info = await run_notion(notion_client.get_page_info, page_id)
             page_name = page_info.get('title', 'Без названия')
         
         # Сохраняем конфигурацию
-        db.save_page_config(user_id, page_id, page_name)
+        await app_globals.storage.save_page_config(
+            user_id, page_id, page_name, target.type, target.data_source_id,
+            target.title_property, target.checkbox_property
+        )
         
+        await _resume_notifications(context, user_id)
+
+        target_label = "🗂 База данных" if target.is_database else "📄 Страница"
         await update.message.reply_text(
             f"✅ Страница успешно настроена!\n\n"
-            f"📄 Страница: {page_name}\n\n"
+            f"{target_label}: {page_name}\n\n"
             "Теперь просто отправляйте мне сообщения, и я буду добавлять их в ваш Inbox.\n\n"
             "Используйте /reset для перенастройки."
         )
@@ -177,13 +221,108 @@ async def handle_page_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return WAITING_FOR_PAGE
 
 
+async def _resume_notifications(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    """Вернуть пользователя в расписание рассылок после перенастройки."""
+    notif_mgr = context.bot_data.get('notification_manager')
+    if notif_mgr:
+        await notif_mgr.resume_user(user_id)
+
+
+def _schedule_page_index_build(context: ContextTypes.DEFAULT_TYPE, token: str):
+    """Запустить фоновое построение индекса страниц, если он отсутствует или устарел."""
+    if not app_globals.page_index.needs_build(token):
+        return
+    loader_client = NotionClient.for_token(token)
+    context.application.create_task(
+        run_notion(app_globals.page_index.build, token, loader_client.iter_pages)
+    )
+
+
+async def _find_page_candidates(context: ContextTypes.DEFAULT_TYPE, token: str, query: str) -> list:
+    """
+    Найти страницы-кандидаты по названию: из индекса, а пока его нет — живым поиском.
+
+    Индекс не знает страниц, созданных после его построения или не вошедших
+    в лимит, поэтому без точного или префиксного совпадения (и для
+    обрезанного индекса) дополнительно выполняется живой поиск.
+    """
+    _schedule_page_index_build(context, token)
+    if not app_globals.page_index.is_ready(token):
+        return await run_notion(NotionClient.for_token(token).search_pages, query)
+
+    candidates = app_globals.page_index.search(token, query)
+    if has_close_match(query, candidates) and not app_globals.page_index.is_truncated(token):
+        return candidates
+
+    try:
+        found = await run_notion(NotionClient.for_token(token).search_pages, query)
+    except Exception as e:
+        if not candidates:
+            raise
+        logger.warning(f"Живой поиск страниц не удался, используются результаты индекса: {e}")
+        return candidates
+    # Объединяем без повторов и ранжируем заново
+    merged = dict(candidates)
+    merged.update(found)
+    return rank_titles(query, merged.items())
+
+
+def _is_unambiguous(query: str, candidates: list) -> bool:
+    """Можно ли выбрать страницу без уточнения: кандидат один или единственный точный."""
+    if len(candidates) == 1:
+        return True
+    needle = normalize_title(query)
+    exact = [title for _, title in candidates if normalize_title(title) == needle]
+    return len(exact) == 1
+
+
+async def handle_page_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Обработка выбора страницы из списка найденных."""
+    query = update.callback_query
+    await query.answer()
+    user_id = update.effective_user.id
+    page_id = query.data.replace("page_select_", "")
+
+    config = await app_globals.storage.get_user_config(user_id)
+    if not config or not config.get('notion_token'):
+        await query.edit_message_text(
+            "❌ Токен не найден. Пожалуйста, начните с команды /start."
+        )
+        return ConversationHandler.END
+
+    try:
+        page_name = app_globals.page_index.get_title(config['notion_token'], page_id)
+        if not page_name:
+            page_info = await run_notion(NotionClient.for_token(config['notion_token']).get_page_info, page_id)
+            page_name = page_info.get('title', 'Без названия')
+
+        await app_globals.storage.save_page_config(user_id, page_id, page_name)
+        await _resume_notifications(context, user_id)
+
+        await query.edit_message_text(
+            f"✅ Страница успешно настроена!\n\n"
+            f"📄 Страница: {page_name}\n\n"
+            "Теперь просто отправляйте мне сообщения, и я буду добавлять их в ваш Inbox.\n\n"
+            "Используйте /reset для перенастройки."
+        )
+        return ConversationHandler.END
+
+    except Exception as e:
+        logger.error(f"Ошибка при выборе страницы: {e}")
+        await query.edit_message_text(
+            f"❌ Ошибка при настройке страницы: {str(e)}\n\n"
+            "Отправьте ссылку или название страницы ещё раз или /cancel для отмены."
+        )
+        return WAITING_FOR_PAGE
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка обычных сообщений для записи в Notion."""
     user_id = update.effective_user.id
     message_text = update.message.text
     
     # Проверяем конфигурацию пользователя
-    config = db.get_user_config(user_id)
+    config = await app_globals.storage.get_user_config(user_id)
     
     if not config or not config.get('notion_token') or not config.get('page_id'):
         await update.message.reply_text(
@@ -191,65 +330,273 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
+    target = InboxTarget.from_config(config)
+
+    # Notion перегружен — не копим ожидающие обработчики, а ставим заметку в очередь
+    if not app_globals.admission.try_acquire(user_id):
+        await _queue_capture(update, context, config, target, message_text)
+        return
+
     try:
-        notion_client.set_token(config['notion_token'])
+        notion_client = NotionClient.for_token(config['notion_token'])
         
-        # Добавляем заметку в Notion
-        notion_client.append_to_page(
-            page_id=config['page_id'],
-            content=message_text
+        # Добавляем заметку в Notion (повтор того же сообщения не создаст дубль)
+        await capture_note(
+            app_globals.db,
+            notion_client,
+            chat_id=update.effective_chat.id,
+            message_id=update.message.message_id,
+            target=target,
+            text=message_text,
+            per_line=context.user_data.get('split_lines', False)
         )
         
+        app_globals.inbox_changes.touch(user_id)
         await update.message.reply_text("✅ Заметка записана")
         
+    except ExecutorSaturated:
+        await _queue_capture(update, context, config, target, message_text)
+
+    except NotionClient.UNKNOWN_OUTCOME_ERRORS as e:
+        # Заметка могла быть записана: повтор через очередь сначала найдёт её по резерву
+        logger.warning(f"Неизвестен исход записи в Notion: {e}")
+        await _queue_capture(update, context, config, target, message_text, unknown_outcome=True)
+
     except Exception as e:
         logger.error(f"Ошибка при записи в Notion: {e}")
-        error_message = str(e)
-        
-        # Более понятные сообщения об ошибках
-        if "unauthorized" in error_message.lower() or "401" in error_message:
-            error_text = (
-                "❌ Ошибка авторизации в Notion.\n\n"
-                "Возможные причины:\n"
-                "• Токен стал недействительным\n"
-                "• Интеграция была удалена\n\n"
-                "Используйте /reset для перенастройки."
-            )
-        elif "not found" in error_message.lower() or "404" in error_message:
-            error_text = (
-                "❌ Страница не найдена.\n\n"
-                "Возможные причины:\n"
-                "• Страница была удалена\n"
-                "• У интеграции нет доступа к странице\n\n"
-                "Используйте /reset для перенастройки."
-            )
-        elif "permission" in error_message.lower() or "403" in error_message:
-            error_text = (
-                "❌ Нет доступа к странице.\n\n"
-                "Убедитесь, что:\n"
-                "• Интеграция добавлена на страницу\n"
-                "• У интеграции есть права на редактирование\n\n"
-                "Используйте /reset для перенастройки."
-            )
-        else:
-            error_text = (
-                f"❌ Ошибка при записи заметки: {error_message}\n\n"
-                "Попробуйте еще раз или используйте /reset для перенастройки."
-            )
-        
-        await update.message.reply_text(error_text)
+        await update.message.reply_text(_capture_error_text(e))
+
+    finally:
+        app_globals.admission.release(user_id)
+
+
+def _capture_error_text(error: Exception) -> str:
+    """Понятное сообщение об ошибке записи по типу ошибки Notion."""
+    if isinstance(error, NotionAuthError):
+        return (
+            "❌ Ошибка авторизации в Notion.\n\n"
+            "Возможные причины:\n"
+            "• Токен стал недействительным\n"
+            "• Интеграция была удалена\n\n"
+            "Используйте /reset для перенастройки."
+        )
+    if isinstance(error, NotionNotFoundError):
+        return (
+            "❌ Страница не найдена.\n\n"
+            "Возможные причины:\n"
+            "• Страница была удалена\n"
+            "• У интеграции нет доступа к странице\n\n"
+            "Используйте /reset для перенастройки."
+        )
+    if isinstance(error, NotionPermissionError):
+        return (
+            "❌ Нет доступа к странице.\n\n"
+            "Убедитесь, что:\n"
+            "• Интеграция добавлена на страницу\n"
+            "• У интеграции есть права на редактирование\n\n"
+            "Используйте /reset для перенастройки."
+        )
+    if isinstance(error, NotionError) and error.transient:
+        return (
+            "⏳ Notion сейчас недоступен или ограничивает число запросов, заметка не записана.\n\n"
+            "Отправьте её ещё раз через минуту."
+        )
+    return (
+        f"❌ Ошибка при записи заметки: {str(error)}\n\n"
+        "Попробуйте еще раз или используйте /reset для перенастройки."
+    )
+
+
+async def _queue_capture(update: Update, context: ContextTypes.DEFAULT_TYPE, config: dict,
+                         target: InboxTarget, message_text: str, unknown_outcome: bool = False):
+    """
+    Поставить заметку в фоновую очередь и ответить подтверждением «в очереди».
+
+    С unknown_outcome прошлая попытка записи оборвалась с неизвестным
+    исходом: очередь повторит её по тому же сообщению, и повтор сначала
+    поищет заметку в Notion (см. capture_note), поэтому дубля не будет.
+    """
+    if unknown_outcome:
+        ack = await update.message.reply_text(
+            "⏳ Notion не ответил вовремя, и неизвестно, записана ли заметка. "
+            "Бот проверит это сам и допишет её при необходимости — отправлять заново не нужно."
+        )
+    else:
+        ack = await update.message.reply_text(
+            "⏳ Notion сейчас отвечает медленно. Заметка в очереди и будет записана автоматически."
+        )
+    queued = await app_globals.capture_queue.submit(QueuedCapture(
+        update.effective_user.id, update.effective_chat.id, update.message.message_id,
+        config['notion_token'], target, message_text, ack.message_id, context.user_data.get('split_lines', False)
+    ))
+    if queued:
+        return
+    if unknown_outcome:
+        await ack.edit_text(
+            "❌ Бот перегружен и не может проверить заметку. "
+            "Прежде чем отправлять её заново, посмотрите, нет ли её уже в Notion."
+        )
+    else:
+        await ack.edit_text("❌ Бот перегружен, заметка не записана. Попробуйте отправить её через минуту.")
+
+
+async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка фото, документов и голосовых: файл записывается в Notion рядом с подписью."""
+    user_id = update.effective_user.id
+    item = media_from_message(update.message)
+    if item is None:
+        return
+
+    config = await app_globals.storage.get_user_config(user_id)
+    if not config or not config.get('notion_token') or not config.get('page_id'):
+        await update.message.reply_text(
+            "⚠️ Бот не настроен. Используйте /start для начала настройки."
+        )
+        return
+
+    try:
+        app_globals.media.check_size(item)
+    except MediaError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    ack = await update.message.reply_text("⏳ Загружаю файл в Notion...")
+    try:
+        await app_globals.media.capture(
+            context.bot,
+            NotionClient.for_token(config['notion_token']),
+            chat_id=update.effective_chat.id,
+            message_id=update.message.message_id,
+            target=InboxTarget.from_config(config),
+            item=item
+        )
+        app_globals.inbox_changes.touch(user_id)
+        await ack.edit_text("✅ Файл записан")
+    except MediaError as e:
+        await ack.edit_text(f"❌ {e}")
+    except ExecutorSaturated:
+        await ack.edit_text("❌ Notion сейчас перегружен, файл не записан. Попробуйте отправить его через минуту.")
+    except Exception as e:
+        logger.error(f"Ошибка при записи файла в Notion: {e}")
+        await ack.edit_text(
+            f"❌ Ошибка при записи файла: {str(e)}\n\n"
+            "Попробуйте еще раз или используйте /reset для перенастройки."
+        )
+
+
+async def handle_edited_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка отредактированных сообщений: обновляем уже созданную заметку."""
+    message = update.edited_message
+    user_id = update.effective_user.id
+
+    config = await app_globals.storage.get_user_config(user_id)
+    if not config or not config.get('notion_token') or not config.get('page_id'):
+        return
+
+    try:
+        notion_client = NotionClient.for_token(config['notion_token'])
+        updated = await update_note(
+            app_globals.db, notion_client, message.chat_id, message.message_id,
+            InboxTarget.from_config(config), message.text
+        )
+        if updated:
+            app_globals.inbox_changes.touch(user_id)
+            await message.reply_text("✏️ Заметка обновлена")
+
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении заметки: {e}")
+        await message.reply_text(
+            f"❌ Не удалось обновить заметку: {str(e)}\n\n"
+            "Попробуйте отредактировать сообщение ещё раз."
+        )
 
 
 async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сброс конфигурации пользователя."""
     user_id = update.effective_user.id
-    db.reset_user_config(user_id)
+    await app_globals.storage.reset_user_config(user_id)
     
     await update.message.reply_text(
         "🔄 Конфигурация сброшена. Используйте /start для новой настройки."
     )
 
 
+async def archive_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Настройка архивации выполненных задач.
+
+    /archive — текущие настройки, /archive off — выключить,
+    /archive <ссылка на страницу или базу> [дней] — включить.
+    """
+    user_id = update.effective_user.id
+    config = await app_globals.storage.get_user_config(user_id)
+    if not config or not config.get('notion_token') or not config.get('page_id'):
+        await update.message.reply_text(
+            "⚠️ Бот не настроен. Используйте /start для начала настройки."
+        )
+        return
+
+    if InboxTarget.from_config(config).is_database:
+        await update.message.reply_text(
+            "🗂 Ваш инбокс — база данных Notion: выполненные задачи отфильтровываются "
+            "на стороне Notion, архивация не нужна."
+        )
+        return
+
+    args = context.args or []
+    if not args:
+        settings = await run_db(app_globals.db.get_compaction_settings, user_id)
+        if not settings.get('enabled'):
+            await update.message.reply_text(
+                "🗄 Архивация выключена.\n\n"
+                "Чтобы раз в сутки переносить выполненные задачи из инбокса, отправьте:\n"
+                f"/archive <ссылка на архивную страницу или базу> [через сколько дней, по умолчанию {COMPACTOR_MIN_AGE_DAYS}]"
+            )
+            return
+        text = (
+            f"🗄 Архивация включена: {settings['archive_name']}\n"
+            f"Переносятся выполненные задачи старше {settings['min_age_days']} дн."
+        )
+        if settings.get('last_run_at'):
+            text += (
+                f"\n\nПоследний прогон: перенесено {settings['last_moved']}, "
+                f"на странице осталось блоков: {settings['last_block_count']}."
+            )
+        await update.message.reply_text(text + "\n\n/archive off — выключить")
+        return
+
+    if args[0].lower() == 'off':
+        await run_db(app_globals.db.disable_compaction, user_id)
+        await update.message.reply_text("🗄 Архивация выключена.")
+        return
+
+    try:
+        min_age_days = int(args[1]) if len(args) > 1 else COMPACTOR_MIN_AGE_DAYS
+        if min_age_days < 0:
+            raise ValueError("Срок не может быть отрицательным")
+
+        notion_client = NotionClient.for_token(config['notion_token'])
+        archive_id = notion_client.extract_page_id_from_url(args[0])
+        if not archive_id:
+            raise ValueError("Не удалось извлечь ID страницы из ссылки")
+        if archive_id.replace('-', '') == config['page_id'].replace('-', ''):
+            raise ValueError("Архив должен отличаться от страницы инбокса")
+
+        archive, archive_name = await run_notion(notion_client.resolve_target, archive_id)
+        await run_db(
+            app_globals.db.save_compaction_settings,
+            user_id, archive.type, archive.id, archive_name, min_age_days,
+            archive.data_source_id, archive.title_property, archive.checkbox_property
+        )
+        await update.message.reply_text(
+            f"✅ Архивация включена: {archive_name}\n\n"
+            f"Раз в сутки выполненные задачи старше {min_age_days} дн. будут переноситься из инбокса в архив."
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при настройке архивации: {e}")
+        await update.message.reply_text(f"❌ Не удалось включить архивацию: {str(e)}")
+
+
 async def check_and_show_changelog(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Проверить и показать changelog для новых версий.
@@ -260,7 +607,7 @@ async def check_and_show_changelog(update: Update, context: ContextTypes.DEFAULT
     - Обновляем версию пользователя
     """
     user_id = update.effective_user.id
-    user_version = db.get_user_version(user_id)
+    user_version = await app_globals.storage.get_user_version(user_id)
     current_version = VERSION
 
     # Проверяем есть ли новая версия
@@ -285,7 +632,7 @@ async def check_and_show_changelog(update: Update, context: ContextTypes.DEFAULT
                 await update.message.reply_text(changelog_msg)
 
         # Обновляем версию пользователя
-        db.set_user_version(user_id, current_version)
+        await app_globals.storage.set_user_version(user_id, current_version)
 
     return None
 
@@ -293,7 +640,7 @@ async def check_and_show_changelog(update: Update, context: ContextTypes.DEFAULT
 async def notifications_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать текущие настройки уведомлений."""
     user_id = update.effective_user.id
-    settings = db.get_notification_settings(user_id)
+    settings = await app_globals.storage.get_notification_settings(user_id)
     
     if not settings.get('notification_enabled'):
         # Если уведомления выключены - показываем кнопки Да/Нет
@@ -335,7 +682,7 @@ async def handle_notification_callback(update: Update, context: ContextTypes.DEF
     
     if data == "notif_yes":
         # Проверяем, выбран ли уже часовой пояс
-        settings = db.get_notification_settings(user_id)
+        settings = await app_globals.storage.get_notification_settings(user_id)
         if settings.get('timezone_offset') is None:
             # Новый пользователь - сначала выбираем таймзону
             await query.edit_message_text(
@@ -353,7 +700,7 @@ async def handle_notification_callback(update: Update, context: ContextTypes.DEF
     
     elif data == "notif_no":
         # Отметить что приветствие показано (устанавливаем текущую версию)
-        db.set_user_version(user_id, VERSION)
+        await app_globals.storage.set_user_version(user_id, VERSION)
         await query.edit_message_text(
             "Окей! Если передумаете - используйте команду /notifications"
         )
@@ -361,7 +708,7 @@ async def handle_notification_callback(update: Update, context: ContextTypes.DEF
     
     elif data == "notif_change":
         # Проверяем, выбран ли уже часовой пояс
-        settings = db.get_notification_settings(user_id)
+        settings = await app_globals.storage.get_notification_settings(user_id)
         if settings.get('timezone_offset') is None:
             # Таймзона не выбрана - сначала выбираем
             await query.edit_message_text(
@@ -379,8 +726,10 @@ async def handle_notification_callback(update: Update, context: ContextTypes.DEF
     
     elif data == "notif_disable":
         # Отключить уведомления
-        db.save_notification_settings(user_id, False, None, None)
-        notification_manager.update_user_schedule(user_id, False, None, None)
+        await app_globals.storage.save_notification_settings(user_id, False, None, None)
+        notif_mgr = context.bot_data.get('notification_manager')
+        if notif_mgr:
+            notif_mgr.update_user_schedule(user_id, False, None, None)
         await query.edit_message_text(
             "🔕 Уведомления отключены.\n\n"
             "Используйте /notifications чтобы включить снова."
@@ -438,8 +787,8 @@ async def handle_notification_callback(update: Update, context: ContextTypes.DEF
         else:
             utc_time = local_time  # Для старых пользователей без таймзоны
         
-        db.save_notification_settings(user_id, True, utc_time, days, timezone_offset)
-        db.set_user_version(user_id, VERSION)
+        await app_globals.storage.save_notification_settings(user_id, True, utc_time, days, timezone_offset)
+        await app_globals.storage.set_user_version(user_id, VERSION)
         
         # Запланировать в notification_manager (используем UTC время)
         notif_mgr = context.bot_data.get('notification_manager')
@@ -462,43 +811,32 @@ async def handle_notification_callback(update: Update, context: ContextTypes.DEF
 
 
 async def list_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать список заметок из Notion."""
+    """Показать первую страницу заметок из Notion."""
     user_id = update.effective_user.id
     
     # Проверяем конфигурацию
-    config = db.get_user_config(user_id)
+    config = await app_globals.storage.get_user_config(user_id)
     if not config or not config.get('notion_token') or not config.get('page_id'):
         await update.message.reply_text(
             "⚠️ Бот не настроен. Используйте /start для начала настройки."
         )
         return
     
+    target = InboxTarget.from_config(config)
+
+    # Notion перегружен — отвечаем из кэша
+    if not app_globals.admission.try_acquire(user_id):
+        await _reply_with_cached_notes(update, user_id, target)
+        return
+
     try:
-        # Устанавливаем токен
-        notion_client.set_token(config['notion_token'])
-        
-        # Получаем заметки
-        notes = notion_client.get_page_content(config['page_id'], limit=20)
-        
-        if not notes:
-            await update.message.reply_text("📭 Заметок пока нет")
-            return
-        
-        # Форматируем вывод
-        lines = [f"📋 Ваши последние заметки ({len(notes)}):\n"]
-        
-        for text, is_checked in notes:
-            if is_checked is True:
-                checkbox = "☑"
-            elif is_checked is False:
-                checkbox = "☐"
-            else:
-                checkbox = "•"  # Для paragraph
-            lines.append(f"{checkbox} {text}")
-        
-        message = "\n".join(lines)
-        await update.message.reply_text(message)
+        app_globals.list_cursors.reset(user_id, target.id)
+        text, keyboard = await _load_list_page(user_id, config, target, 0, None)
+        await update.message.reply_text(text, reply_markup=keyboard)
         
+    except ExecutorSaturated:
+        await _reply_with_cached_notes(update, user_id, target)
+
     except Exception as e:
         logger.error(f"Ошибка при получении заметок: {e}")
         await update.message.reply_text(
@@ -506,6 +844,218 @@ async def list_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Попробуйте позже или используйте /reset для перенастройки."
         )
 
+    finally:
+        app_globals.admission.release(user_id)
+
+
+async def handle_list_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Перейти на другую страницу /list, отредактировав то же сообщение."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    page_number = int(query.data[len('list_page_'):])
+
+    config = await app_globals.storage.get_user_config(user_id)
+    if not config or not config.get('notion_token') or not config.get('page_id'):
+        await query.answer("⚠️ Бот не настроен. Используйте /start.", show_alert=True)
+        return
+
+    target = InboxTarget.from_config(config)
+    cursor = app_globals.list_cursors.get(user_id, target.id, page_number)
+    if ListCursorCache.is_missing(cursor):
+        await query.answer()
+        await query.edit_message_text("⌛ Список устарел. Используйте /list, чтобы открыть его заново.")
+        return
+
+    if not app_globals.admission.try_acquire(user_id):
+        await query.answer("⏳ Notion сейчас отвечает медленно. Попробуйте через минуту.", show_alert=True)
+        return
+
+    try:
+        text, keyboard = await _load_list_page(user_id, config, target, page_number, cursor)
+    except ExecutorSaturated:
+        await query.answer("⏳ Notion сейчас отвечает медленно. Попробуйте через минуту.", show_alert=True)
+        return
+    except Exception as e:
+        logger.error(f"Ошибка при получении страницы заметок: {e}")
+        await query.answer(f"❌ Ошибка при получении заметок: {str(e)}"[:200], show_alert=True)
+        return
+    finally:
+        app_globals.admission.release(user_id)
+
+    await query.answer()
+    try:
+        await query.edit_message_text(text, reply_markup=keyboard)
+    except BadRequest as e:
+        # Повторное нажатие на ту же кнопку: содержимое не изменилось
+        if 'not modified' not in str(e).lower():
+            raise
+
+
+async def handle_mark_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отметить заметку выполненной по кнопке в /list или рассылке."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+
+    if query.data.startswith('done_ok_'):
+        await query.answer("Уже отмечено ✅")
+        return
+    note_id = dashed_id(query.data[len('done_'):])
+
+    config = await app_globals.storage.get_user_config(user_id)
+    if not config or not config.get('notion_token') or not config.get('page_id'):
+        await query.answer("⚠️ Бот не настроен. Используйте /start.", show_alert=True)
+        return
+
+    # Оптимистично отмечаем кнопку, не дожидаясь Notion
+    batcher = app_globals.mark_done
+    key = (query.message.chat_id, query.message.message_id)
+    markup = set_mark_done_button(batcher.get_view(key, query.message.reply_markup), note_id, done=True)
+    if markup is None:
+        await query.answer("Уже отмечено ✅")
+        return
+    batcher.put_view(key, markup)
+    await query.answer("✅ Отмечено")
+    await _edit_reply_markup(context, key, markup)
+
+    future = batcher.submit(config['notion_token'], InboxTarget.from_config(config), note_id)
+    context.application.create_task(_confirm_mark_done(context, user_id, key, note_id, future))
+
+
+async def _confirm_mark_done(context: ContextTypes.DEFAULT_TYPE, user_id: int, key: tuple,
+                             note_id: str, future):
+    """Дождаться ответа Notion и откатить кнопку при ошибке."""
+    if await future:
+        app_globals.inbox_cache.invalidate(user_id)
+        app_globals.inbox_changes.touch(user_id)
+        await set_checked(app_globals.db, [note_id], True)
+        return
+
+    batcher = app_globals.mark_done
+    markup = set_mark_done_button(batcher.get_view(key), note_id, done=False)
+    if markup is not None:
+        batcher.put_view(key, markup)
+        await _edit_reply_markup(context, key, markup)
+    await context.bot.send_message(
+        chat_id=key[0], text="❌ Не удалось отметить задачу в Notion. Попробуйте ещё раз."
+    )
+
+
+async def _edit_reply_markup(context: ContextTypes.DEFAULT_TYPE, key: tuple, markup):
+    """Обновить клавиатуру сообщения, игнорируя повтор того же состояния."""
+    try:
+        await context.bot.edit_message_reply_markup(chat_id=key[0], message_id=key[1], reply_markup=markup)
+    except BadRequest as e:
+        if 'not modified' not in str(e).lower():
+            logger.error(f"Не удалось обновить кнопки сообщения: {e}")
+
+
+async def _load_list_page(user_id: int, config: dict, target: InboxTarget, page_number: int,
+                          cursor: Union[str, TailCursor, None]):
+    """
+    Загрузить из Notion одну страницу /list.
+
+    Returns:
+        tuple: (текст сообщения, клавиатура навигации или None)
+    """
+    # Первая порция из кэша, если по вебхукам Notion инбокс не менялся после чтения
+    cached = app_globals.inbox_cache.get_page(user_id, target.id) if page_number == 0 else None
+    if cached is not None and app_globals.inbox_changes.is_unchanged(user_id, cached[2]):
+        records, next_cursor, _ = cached
+        notes = [(record.text, record.checked) for record in records if record.text]
+    else:
+        fetched_at = time.time()
+        notion_client = NotionClient.for_token(config['notion_token'])
+        records, next_cursor = await run_notion(
+            notion_client.list_target_page, target, cursor, LIST_PAGE_SIZE
+        )
+        notes = [(record.text, record.checked) for record in records if record.text]
+        if page_number == 0:
+            app_globals.inbox_cache.put(user_id, target.id, notes, records, next_cursor, fetched_at)
+        await index_records(app_globals.db, target.id, records)
+
+    if next_cursor:
+        app_globals.list_cursors.store(user_id, target.id, page_number + 1, next_cursor)
+
+    open_items = [
+        (record.id, record.text) for record in records
+        if record.type == 'to_do' and not record.checked and record.text
+    ]
+    keyboard = get_list_navigation_keyboard(page_number, next_cursor is not None, open_items)
+    if not notes:
+        text = "📭 Заметок пока нет" if page_number == 0 and keyboard is None else "📭 На этой странице нет заметок"
+        return text, keyboard
+    return _format_notes(notes, f"📋 Ваши заметки — стр. {page_number + 1}:\n"), keyboard
+
+
+def _format_notes(notes: list, header: str = None, footer: str = "") -> str:
+    """Сформировать текст списка заметок в пределах одного сообщения."""
+    if header is None:
+        header = f"📋 Ваши последние заметки ({len(notes)}):\n"
+    return format_notes(notes, header, footer)
+
+
+async def _reply_with_cached_notes(update: Update, user_id: int, target: InboxTarget):
+    """Ответить на /list из кэша с пометкой о давности данных."""
+    cached = app_globals.inbox_cache.get(user_id, target.id)
+    if cached is None:
+        await update.message.reply_text(
+            "⏳ Notion сейчас отвечает медленно. Попробуйте /list через минуту."
+        )
+        return
+
+    notes, age = cached
+    minutes = int(age // 60)
+    staleness = "меньше минуты" if minutes < 1 else f"{minutes} мин"
+    footer = f"\n⚠️ Notion сейчас отвечает медленно — показаны данные {staleness} назад."
+    text = _format_notes(notes, footer=footer) if notes else f"📭 Заметок пока нет\n{footer}"
+    await update.message.reply_text(text)
+
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Найти заметки по словам в локальном индексе, без запроса к Notion."""
+    user_id = update.effective_user.id
+
+    config = await app_globals.storage.get_user_config(user_id)
+    if not config or not config.get('notion_token') or not config.get('page_id'):
+        await update.message.reply_text(
+            "⚠️ Бот не настроен. Используйте /start для начала настройки."
+        )
+        return
+
+    checked, terms = parse_find_args(context.args or [])
+    if not terms:
+        await update.message.reply_text(
+            "🔍 Использование: /find <слова>\n\n"
+            "Ищутся заметки, содержащие все слова (можно начало слова).\n"
+            "Только невыполненные: /find open <слова>\n"
+            "Только выполненные: /find done <слова>"
+        )
+        return
+
+    target = InboxTarget.from_config(config)
+    try:
+        results = await app_globals.search.find(target.id, terms, checked)
+        first_sync = await app_globals.search.ensure_fresh(config['notion_token'], target)
+    except Exception as e:
+        logger.error(f"Ошибка поиска заметок: {e}")
+        await update.message.reply_text(f"❌ Ошибка поиска: {str(e)}")
+        return
+
+    footer = ""
+    if first_sync:
+        footer = "\n⏳ Индекс заметок ещё заполняется из Notion — повторите поиск через минуту."
+
+    if not results:
+        await update.message.reply_text(f"🔍 Ничего не найдено{footer}")
+        return
+
+    notes = [(result['text'], result['checked']) for result in results]
+    open_items = [(result['block_id'], result['text']) for result in results if result['checked'] is False]
+    await update.message.reply_text(
+        format_notes(notes, f"🔍 Найдено заметок: {len(results)}\n", footer),
+        reply_markup=get_mark_done_keyboard(open_items)
+    )
+
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена текущей операции."""
@@ -515,19 +1065,42 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+async def split_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Включить или выключить запись каждой строки сообщения отдельной задачей."""
+    enabled = not context.user_data.get('split_lines', False)
+    context.user_data['split_lines'] = enabled
+
+    if enabled:
+        text = (
+            "✂️ Построчная запись включена.\n\n"
+            "Каждая строка или пункт списка в сообщении станет отдельной задачей. "
+            "Маркеры списка (-, *, •, 1.) убираются.\n"
+            "В инбоксе-базе данных сообщение по-прежнему записывается одной записью.\n\n"
+            "Выключить: /split"
+        )
+    else:
+        text = "📝 Построчная запись выключена: каждое сообщение — одна задача.\n\nВключить: /split"
+    await update.message.reply_text(text)
+
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Справка по использованию бота."""
     help_text = (
         "📖 Справка по использованию бота:\n\n"
         "Команды:\n"
         "• /start - Начать настройку бота\n"
-        "• /list - Показать последние 20 заметок\n"
+        "• /list - Показать заметки (листайте кнопками ◀️ ▶️)\n"
+        "• /find - Найти заметки по словам (/find open ... — только невыполненные)\n"
         "• /notifications - Настроить уведомления о неразобранном инбоксе\n"
+        "• /archive - Переносить выполненные задачи в архив\n"
+        "• /split - Записывать каждую строку сообщения отдельной задачей\n"
         "• /reset - Сбросить текущую конфигурацию\n"
         "• /help - Показать эту справку\n\n"
         "Использование:\n"
         "После настройки просто отправляйте сообщения боту, "
-        "и они будут автоматически добавляться в ваш Notion Inbox."
+        "и они будут автоматически добавляться в ваш Notion Inbox.\n"
+        "Фото, файлы и голосовые сообщения тоже записываются — "
+        "вместе с подписью в виде задачи."
     )
     await update.message.reply_text(help_text)
 
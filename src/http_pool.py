@@ -0,0 +1,246 @@
+"""
+Общий пул HTTP-соединений для всех запросов к Notion API.
+
+Все клиенты Notion (по одному на токен) используют один транспорт уровня
+процесса: ограниченный пул keep-alive соединений к api.notion.com, HTTP/2
+(если установлен пакет h2) и кэш DNS. Транспорт собирает статистику
+переиспользования соединений и доли задержки, ушедшей на установку
+TCP/TLS соединений.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import httpcore
+
+logger = logging.getLogger(__name__)
+
+# Размер пула соединений
+NOTION_POOL_MAX_CONNECTIONS = int(os.getenv('NOTION_POOL_MAX_CONNECTIONS', '20'))
+NOTION_POOL_MAX_KEEPALIVE = int(os.getenv('NOTION_POOL_MAX_KEEPALIVE', '10'))
+NOTION_POOL_KEEPALIVE_EXPIRY = float(os.getenv('NOTION_POOL_KEEPALIVE_EXPIRY', '60'))
+# Время жизни записей кэша DNS в секундах
+NOTION_DNS_TTL = float(os.getenv('NOTION_DNS_TTL', '300'))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class CachingDNSBackend(httpcore.SyncBackend):
+    """Сетевой бэкенд httpcore с кэшированием DNS-ответов.
+
+    Подключается по закэшированному IP-адресу; имя хоста для TLS (SNI и
+    проверка сертификата) httpcore берёт из URL запроса, поэтому оно не
+    меняется.
+    """
+
+    def __init__(self, ttl: float = NOTION_DNS_TTL):
+        """Инициализация бэкенда."""
+        self.ttl = ttl
+        self._cache: Dict[Tuple[str, int], Tuple[List[str], float]] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def _resolve(self, host: str, port: int) -> List[str]:
+        """Получить адреса хоста из кэша или через getaddrinfo."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get((host, port))
+            if cached and cached[1] > now:
+                self.hits += 1
+                return cached[0]
+
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self.lookups += 1
+            self._cache[(host, port)] = (addresses, now + self.ttl)
+        return addresses
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        """Установить TCP-соединение, используя кэш DNS."""
+        try:
+            addresses = self._resolve(host, port)
+        except OSError:
+            # Не удалось разрешить имя — пусть httpcore сделает это сам
+            return super().connect_tcp(host, port, timeout, local_address, socket_options)
+
+        last_error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return super().connect_tcp(address, port, timeout, local_address, socket_options)
+            except httpcore.ConnectError as e:
+                last_error = e
+        # Все адреса недоступны — сбрасываем кэш, чтобы в следующий раз спросить DNS заново
+        with self._lock:
+            self._cache.pop((host, port), None)
+        raise last_error
+
+
+class PoolStats:
+    """Счётчики использования пула соединений."""
+
+    def __init__(self):
+        """Инициализация счётчиков."""
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.total_seconds = 0.0
+        self.handshake_seconds = 0.0
+
+    def record(self, new_connection: bool, total: float, handshake: float):
+        """Учесть завершённый запрос."""
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += total
+            self.handshake_seconds += handshake
+            if new_connection:
+                self.new_connections += 1
+
+    def snapshot(self) -> dict:
+        """Получить текущие значения и производные метрики."""
+        with self._lock:
+            requests = self.requests
+            reused = requests - self.new_connections
+            return {
+                'requests': requests,
+                'new_connections': self.new_connections,
+                'reused': reused,
+                'reuse_ratio': reused / requests if requests else 0.0,
+                'handshake_share': (
+                    self.handshake_seconds / self.total_seconds if self.total_seconds else 0.0
+                ),
+            }
+
+
+class _RequestTrace:
+    """Трассировка одного запроса через расширение httpcore `trace`."""
+
+    __slots__ = ('started', 'handshake')
+
+    def __init__(self):
+        self.started: Dict[str, float] = {}
+        self.handshake = 0.0
+
+    def __call__(self, event_name: str, info: dict):
+        if not event_name.startswith(('connection.connect_tcp.', 'connection.start_tls.')):
+            return
+        step, _, phase = event_name.rpartition('.')
+        if phase == 'started':
+            self.started[step] = time.perf_counter()
+        elif step in self.started:
+            self.handshake += time.perf_counter() - self.started[step]
+
+
+class NotionTransport(httpx.HTTPTransport):
+    """HTTP-транспорт с общим пулом, кэшем DNS и сбором статистики."""
+
+    def __init__(self, stats: PoolStats, dns_backend: CachingDNSBackend, http2: bool = HTTP2_AVAILABLE):
+        """Инициализация транспорта."""
+        limits = httpx.Limits(
+            max_connections=NOTION_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=NOTION_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=NOTION_POOL_KEEPALIVE_EXPIRY,
+        )
+        # Один SSL-контекст для httpx и пула httpcore: не зависим от их внутренних полей
+        ssl_context = httpx.create_ssl_context(http2=http2)
+        super().__init__(verify=ssl_context, http2=http2, limits=limits)
+        # httpx не позволяет передать свой сетевой бэкенд, поэтому пересоздаём
+        # пул httpcore с теми же параметрами и кэширующим DNS бэкендом
+        self._pool = httpcore.ConnectionPool(
+            ssl_context=ssl_context,
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=dns_backend,
+        )
+        self.stats = stats
+        self.dns = dns_backend
+        self.http2 = http2
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """Выполнить запрос, замеряя время и установку соединения."""
+        trace = _RequestTrace()
+        request.extensions['trace'] = trace
+        started = time.perf_counter()
+        response = super().handle_request(request)
+        # Замер до получения заголовков ответа: тело читается потребителем позже
+        self.stats.record(
+            new_connection=bool(trace.started),
+            total=time.perf_counter() - started,
+            handshake=trace.handshake,
+        )
+        return response
+
+    def close(self):
+        """Общий транспорт не закрывается клиентами отдельных токенов."""
+
+    def shutdown(self):
+        """Закрыть пул соединений при остановке процесса."""
+        super().close()
+
+
+_transport: Optional[NotionTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_shared_transport() -> NotionTransport:
+    """Получить транспорт уровня процесса (создаётся при первом обращении)."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = NotionTransport(PoolStats(), CachingDNSBackend())
+            logger.info(
+                f"Создан общий пул соединений Notion: до {NOTION_POOL_MAX_CONNECTIONS} соединений, "
+                f"HTTP/2 {'включён' if _transport.http2 else 'недоступен (нет пакета h2)'}"
+            )
+        return _transport
+
+
+def create_http_client() -> httpx.Client:
+    """Создать httpx-клиент поверх общего транспорта.
+
+    Заголовки (в том числе токен) у каждого клиента свои, соединения — общие.
+    """
+    return httpx.Client(transport=get_shared_transport())
+
+
+def get_pool_stats() -> dict:
+    """Получить статистику общего пула соединений."""
+    transport = get_shared_transport()
+    stats = transport.stats.snapshot()
+    stats['dns_lookups'] = transport.dns.lookups
+    stats['dns_hits'] = transport.dns.hits
+    stats['http2'] = transport.http2
+    return stats
+
+
+def format_pool_stats() -> str:
+    """Статистика пула в виде строки для логов."""
+    stats = get_pool_stats()
+    return (
+        f"Пул Notion: запросов {stats['requests']}, новых соединений {stats['new_connections']}, "
+        f"переиспользование {stats['reuse_ratio']:.0%}, "
+        f"доля рукопожатий в задержке {stats['handshake_share']:.1%}, "
+        f"DNS: {stats['dns_lookups']} запросов / {stats['dns_hits']} из кэша"
+    )
+
+
+def shutdown_shared_transport():
+    """Закрыть общий транспорт."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.shutdown()
+            _transport = None
@@ -0,0 +1,115 @@
+"""
+Кэш последнего прочитанного содержимого инбокса пользователей.
+
+Используется для ответа на /list, когда Notion перегружен или недоступен.
+Если подключены вебхуки Notion (см. src/webhooks.py), ChangeTracker знает,
+менялся ли инбокс после чтения, и свежий кэш отдаётся без запроса к Notion.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+INBOX_CACHE_MAX_USERS = int(os.getenv('INBOX_CACHE_MAX_USERS', '1000'))
+# Сколько секунд доверять отсутствию событий (страховка от потерянных вебхуков)
+NOTION_WEBHOOK_MAX_TRUST = float(os.getenv('NOTION_WEBHOOK_MAX_TRUST', '3600'))
+
+
+class InboxCache:
+    """Ограниченный по размеру кэш заметок по пользователям."""
+
+    def __init__(self, max_users: int = INBOX_CACHE_MAX_USERS):
+        """Инициализация кэша."""
+        self.max_users = max_users
+        # user_id -> (page_id, заметки, время чтения, записи блоков, курсор следующей порции)
+        self._entries: 'OrderedDict[int, Tuple[str, list, float, list, Optional[str]]]' = OrderedDict()
+
+    def put(self, user_id: int, page_id: str, notes: list, records: Optional[list] = None,
+            next_cursor: Optional[str] = None, fetched_at: Optional[float] = None):
+        """Сохранить заметки пользователя (fetched_at — время начала чтения из Notion)."""
+        self._entries[user_id] = (page_id, notes, fetched_at or time.time(), records or [], next_cursor)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def get(self, user_id: int, page_id: str) -> Optional[Tuple[list, float]]:
+        """
+        Получить заметки пользователя.
+
+        Returns:
+            tuple: (заметки, возраст в секундах) или None
+        """
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] != page_id:
+            return None
+        return entry[1], time.time() - entry[2]
+
+    def get_page(self, user_id: int, page_id: str) -> Optional[Tuple[list, Optional[str], float]]:
+        """
+        Получить первую порцию /list в исходном виде.
+
+        Returns:
+            tuple: (записи блоков, курсор следующей порции, время чтения) или None
+        """
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] != page_id:
+            return None
+        return entry[3], entry[4], entry[2]
+
+    def invalidate(self, user_id: int):
+        """Удалить запись пользователя."""
+        self._entries.pop(user_id, None)
+
+
+class ChangeTracker:
+    """Время последнего изменения инбокса каждого пользователя по событиям Notion."""
+
+    def __init__(self, max_trust: float = NOTION_WEBHOOK_MAX_TRUST):
+        """Инициализация трекера."""
+        self.max_trust = max_trust
+        # Время, с которого приходят проверенные события; None — вебхуки не подключены
+        self.started_at: Optional[float] = None
+        self._changed_at: Dict[int, float] = {}
+        # Пользователи, по инбоксам которых уже пришло проверенное событие: подписка
+        # их интеграции работает. У остальных отсутствие событий ничего не значит
+        self._subscribed: Set[int] = set()
+
+    @property
+    def active(self) -> bool:
+        return self.started_at is not None
+
+    def activate(self):
+        """Начать доверять событиям (приёмник вебхуков запущен)."""
+        self.started_at = time.time()
+
+    def deactivate(self):
+        """Перестать доверять событиям (приёмник остановлен)."""
+        self.started_at = None
+        self._subscribed.clear()
+
+    def touch(self, user_id: int):
+        """Отметить, что инбокс пользователя изменился."""
+        self._changed_at[user_id] = time.time()
+
+    def record_events(self, user_ids: List[int]):
+        """Учесть проверенное событие Notion: инбоксы изменились, подписка пользователей работает."""
+        now = time.time()
+        for user_id in user_ids:
+            self._changed_at[user_id] = now
+            self._subscribed.add(user_id)
+
+    def is_unchanged(self, user_id: int, since: float) -> bool:
+        """
+        Проверить, что инбокс точно не менялся после момента since.
+
+        Без подключённых вебхуков, для пользователей, по инбоксам которых
+        ещё не приходило событий (у их интеграции может не быть подписки),
+        для чтений до запуска приёмника и для слишком старых чтений ответ
+        всегда False — нужно спросить Notion.
+        """
+        if self.started_at is None or since < self.started_at or user_id not in self._subscribed:
+            return False
+        if time.time() - since > self.max_trust:
+            return False
+        return self._changed_at.get(user_id, 0.0) < since
@@ -0,0 +1,123 @@
+"""
+Постраничный просмотр заметок в /list.
+
+Notion отдаёт содержимое порциями с курсором на следующую порцию. Курсоры
+уже просмотренных порций запоминаются, поэтому переход на любую открытую
+ранее страницу стоит одного запроса к Notion за нужной порцией (для
+страницы-инбокса — одного-двух, см. TailCursor в src/notion_api.py).
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Заметок на одной странице /list
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '20'))
+# Сколько живут сохранённые курсоры Notion
+LIST_CURSOR_TTL = int(os.getenv('LIST_CURSOR_TTL', '900'))
+LIST_CURSOR_MAX_USERS = int(os.getenv('LIST_CURSOR_MAX_USERS', '1000'))
+
+# Ограничение Telegram на длину текста сообщения (в единицах UTF-16)
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Короче этого заметка не обрезается, даже если места мало
+MIN_NOTE_LENGTH = 40
+# Запас под строку «… и ещё N»
+_OVERFLOW_RESERVE = 32
+
+# Курсор ещё не известен: страница не открывалась
+_MISSING = object()
+
+
+class ListCursorCache:
+    """Курсоры Notion для страниц /list по пользователям."""
+
+    def __init__(self, ttl: int = LIST_CURSOR_TTL, max_users: int = LIST_CURSOR_MAX_USERS):
+        """Инициализация кэша."""
+        self.ttl = ttl
+        self.max_users = max_users
+        # user_id -> (target_id, курсоры по номерам страниц, время обновления)
+        self._entries: 'OrderedDict[int, Tuple[str, Dict[int, object], float]]' = OrderedDict()
+
+    def reset(self, user_id: int, target_id: str):
+        """Начать новый просмотр: первая страница открывается без курсора."""
+        self._entries[user_id] = (target_id, {0: None}, time.time())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def get(self, user_id: int, target_id: str, page: int):
+        """
+        Получить курсор страницы.
+
+        Returns:
+            Курсор (None для первой страницы) или _MISSING, если страница
+            не открывалась либо просмотр устарел
+        """
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] != target_id or time.time() - entry[2] > self.ttl:
+            return _MISSING
+        return entry[1].get(page, _MISSING)
+
+    def store(self, user_id: int, target_id: str, page: int, cursor: object):
+        """Запомнить курсор страницы, следующей за только что загруженной."""
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] != target_id:
+            return
+        entry[1][page] = cursor
+        self._entries[user_id] = (target_id, entry[1], time.time())
+        self._entries.move_to_end(user_id)
+
+    @staticmethod
+    def is_missing(cursor) -> bool:
+        """Курсор не найден."""
+        return cursor is _MISSING
+
+
+def message_length(text: str) -> int:
+    """Длина текста так, как её считает Telegram (эмодзи занимают две единицы)."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _truncate(text: str, max_length: int) -> str:
+    """Обрезать текст до max_length единиц UTF-16 с многоточием."""
+    if message_length(text) <= max_length:
+        return text
+    text = text[:max_length - 1]
+    while message_length(text) > max_length - 1:
+        text = text[:-1]
+    return text + "…"
+
+
+def _checkbox(is_checked: Optional[bool]) -> str:
+    if is_checked is True:
+        return "☑"
+    if is_checked is False:
+        return "☐"
+    return "•"  # Для paragraph
+
+
+def format_notes(notes: List[tuple], header: str, footer: str = "",
+                 limit: int = TELEGRAM_MESSAGE_LIMIT) -> str:
+    """
+    Сформировать текст списка заметок, укладывающийся в одно сообщение.
+
+    Если заметки не помещаются целиком, длинные обрезаются: каждой
+    достаётся равная доля оставшегося места, короткие отдают излишек следующим.
+    """
+    budget = limit - message_length(header) - message_length(footer) - _OVERFLOW_RESERVE
+    lines = [header]
+    for index, (text, is_checked) in enumerate(notes):
+        prefix = f"{_checkbox(is_checked)} "
+        # Доля места на эту заметку с учётом префикса и перевода строки
+        share = budget // (len(notes) - index) - message_length(prefix) - 1
+        line = prefix + _truncate(text, max(share, MIN_NOTE_LENGTH))
+        if message_length(line) + 1 > budget:
+            lines.append(f"… и ещё {len(notes) - index}")
+            break
+        lines.append(line)
+        budget -= message_length(line) + 1
+
+    if footer:
+        lines.append(footer)
+    return "\n".join(lines)
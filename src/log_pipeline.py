@@ -0,0 +1,209 @@
+"""
+Неблокирующий конвейер логов.
+
+Раньше обработчики писали логи прямо в stderr из цикла событий, и под
+нагрузкой запись логов сама заметно добавляла к задержке. Теперь корневой
+логгер только кладёт запись в очередь, а в поток вывода её пишет фоновый
+поток QueueListener:
+
+* форматирование ленивое: горячие места логируют в стиле
+  logger.info("... %s", arg), а сообщение собирается уже в фоновом потоке
+  (аргументы не должны меняться после вызова);
+* структурированные поля передаются через extra: event (тип события),
+  user_id, page_id и т. п. В текстовом формате они дописываются как
+  key=value, при LOG_FORMAT=json каждая строка — JSON-объект;
+* выборка и лимиты по типам событий (LOG_SAMPLING, LOG_RATE_LIMITS)
+  применяются до постановки в очередь. Тип события — поле event, а без
+  него имя логгера. Предупреждения и ошибки не отбрасываются никогда, а
+  число отброшенных строк попадает в поле suppressed следующей
+  пропущенной строки того же типа;
+* shutdown_logging() дописывает очередь до конца и переключает логгер на
+  прямую запись, поэтому строки при остановке не теряются.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, TextIO
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# text — привычные строки, json — по объекту на строку
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Доля сохраняемых строк по типам событий: «db.write:0.1,notion.append:0.5»
+LOG_SAMPLING = os.getenv('LOG_SAMPLING', '')
+# Не больше N строк в секунду по типам событий: «digest.sent:20»
+LOG_RATE_LIMITS = os.getenv('LOG_RATE_LIMITS', '')
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Стандартные атрибуты LogRecord; всё остальное пришло через extra
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+def parse_rules(value: str) -> Dict[str, float]:
+    """Разобрать «тип:число,тип:число»; некорректные пары пропускаются."""
+    rules = {}
+    for pair in value.split(','):
+        key, _, number = pair.strip().rpartition(':')
+        try:
+            if key:
+                rules[key] = float(number)
+        except ValueError:
+            continue
+    return rules
+
+
+def structured_fields(record: logging.LogRecord) -> dict:
+    """Поля, переданные в запись через extra."""
+    return {
+        key: value for key, value in vars(record).items()
+        if key not in _RECORD_ATTRS and not key.startswith('_')
+    }
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат с дописанными полями key=value."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = structured_fields(record)
+        if not fields:
+            return text
+        return text + ' | ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись как JSON-объект в одну строку."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(structured_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка и ограничение частоты строк по типам событий."""
+
+    def __init__(self, sampling: Optional[Dict[str, float]] = None, rate_limits: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic, rand: Callable[[], float] = random.random):
+        """Инициализация фильтра."""
+        super().__init__()
+        self.sampling = sampling if sampling is not None else parse_rules(LOG_SAMPLING)
+        self.rate_limits = rate_limits if rate_limits is not None else parse_rules(LOG_RATE_LIMITS)
+        self.clock = clock
+        self.rand = rand
+        # тип события -> (доступные строки, момент пополнения)
+        self._buckets: Dict[str, list] = {}
+        self._suppressed: Dict[str, int] = {}
+        # Логируют и цикл событий, и потоки пулов
+        self._lock = threading.Lock()
+
+    def _rule_key(self, record: logging.LogRecord, rules: Dict[str, float]) -> Optional[str]:
+        event = getattr(record, 'event', None)
+        if event in rules:
+            return event
+        return record.name if record.name in rules else None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not (self.sampling or self.rate_limits):
+            return True
+        sample_key = self._rule_key(record, self.sampling)
+        limit_key = self._rule_key(record, self.rate_limits)
+        if sample_key is None and limit_key is None:
+            return True
+
+        key = sample_key or limit_key
+        with self._lock:
+            keep = sample_key is None or self.rand() < self.sampling[sample_key]
+            if keep and limit_key is not None:
+                keep = self._take(limit_key)
+            if not keep:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def _take(self, key: str) -> bool:
+        """Токен-бакет: не больше rate строк в секунду с запасом на секунду."""
+        rate = self.rate_limits[key]
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [rate, now]
+        bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() собирает сообщение и traceback до постановки в
+    очередь — то есть в цикле событий. Очередь здесь внутри процесса,
+    поэтому запись передаётся как есть и форматируется в потоке записи.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT,
+                  stream: Optional[TextIO] = None) -> logging.handlers.QueueListener:
+    """Направить корневой логгер через очередь в фоновый поток записи."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter(TEXT_FORMAT))
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        root.handlers[:] = [handler]
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Дописать очередь и перейти на прямую запись (строки после остановки тоже не теряются)."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        listener, _listener = _listener, None
+        # Сначала новые строки идут напрямую, затем очередь дописывается до конца
+        logging.getLogger().handlers[:] = list(listener.handlers)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.flush()
@@ -0,0 +1,126 @@
+"""
+Отметка заметок выполненными по кнопкам в /list и рассылке.
+
+Нажатия сразу отражаются в клавиатуре сообщения (оптимистично), а запросы
+к Notion копятся в течение короткого окна и отправляются пачкой:
+параллельно, но не быстрее бюджета запросов на токен. Если Notion
+отказал, кнопка возвращается в исходное состояние.
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.executors import run_notion
+from src.notion_api import InboxTarget, NotionClient
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать следующих нажатий перед отправкой пачки, секунд
+MARK_DONE_BATCH_WINDOW = float(os.getenv('MARK_DONE_BATCH_WINDOW', '0.5'))
+# Одновременных запросов из одной пачки
+MARK_DONE_CONCURRENCY = int(os.getenv('MARK_DONE_CONCURRENCY', '3'))
+# Бюджет запросов к Notion на один токен (лимит Notion — в среднем 3 в секунду)
+NOTION_REQUESTS_PER_SECOND = float(os.getenv('NOTION_REQUESTS_PER_SECOND', '3'))
+MARK_DONE_MAX_VIEWS = int(os.getenv('MARK_DONE_MAX_VIEWS', '1000'))
+
+ViewKey = Tuple[int, int]
+
+
+class RateBudget:
+    """Равномерное распределение запросов по времени отдельно для каждого ключа."""
+
+    def __init__(self, rate: float = NOTION_REQUESTS_PER_SECOND):
+        """Инициализация бюджета."""
+        self.interval = 1.0 / rate
+        self._next_slot: Dict[str, float] = {}
+
+    async def acquire(self, key: str):
+        """Дождаться своего слота."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot.get(key, 0.0))
+        self._next_slot[key] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class MarkDoneBatcher:
+    """Сборщик нажатий «выполнено» в пачки по токену."""
+
+    def __init__(self, window: float = MARK_DONE_BATCH_WINDOW,
+                 concurrency: int = MARK_DONE_CONCURRENCY, budget: Optional[RateBudget] = None):
+        """Инициализация сборщика."""
+        self.window = window
+        self.concurrency = concurrency
+        self.budget = budget or RateBudget()
+        self._pending: Dict[str, List[Tuple[InboxTarget, str, asyncio.Future]]] = {}
+        # Локальное представление клавиатур: (chat_id, message_id) -> разметка
+        self._views: 'OrderedDict[ViewKey, object]' = OrderedDict()
+        self.batches = 0
+        self.applied = 0
+        self.failed = 0
+
+    def submit(self, token: str, target: InboxTarget, note_id: str) -> asyncio.Future:
+        """
+        Поставить отметку в текущую пачку токена.
+
+        Returns:
+            Future с True, если Notion принял изменение, иначе False
+        """
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.get(token)
+        if batch is None:
+            batch = self._pending[token] = []
+            asyncio.get_running_loop().create_task(self._flush_later(token))
+        batch.append((target, note_id, future))
+        return future
+
+    async def _flush_later(self, token: str):
+        await asyncio.sleep(self.window)
+        batch = self._pending.pop(token, [])
+        if batch:
+            await self._apply(token, batch)
+
+    async def _apply(self, token: str, batch: List[Tuple[InboxTarget, str, asyncio.Future]]):
+        """Отправить пачку параллельными запросами в пределах бюджета."""
+        self.batches += 1
+        notion = NotionClient.for_token(token)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Повторные нажатия на одну заметку — один запрос
+        futures_by_note: Dict[str, List[asyncio.Future]] = {}
+        targets: Dict[str, InboxTarget] = {}
+        for target, note_id, future in batch:
+            futures_by_note.setdefault(note_id, []).append(future)
+            targets[note_id] = target
+
+        async def apply_one(note_id: str):
+            async with semaphore:
+                await self.budget.acquire(token)
+                try:
+                    await run_notion(notion.mark_done, targets[note_id], note_id)
+                    ok = True
+                    self.applied += 1
+                except Exception as e:
+                    logger.error(f"Не удалось отметить заметку {note_id}: {e}")
+                    ok = False
+                    self.failed += 1
+            for future in futures_by_note[note_id]:
+                if not future.done():
+                    future.set_result(ok)
+
+        await asyncio.gather(*(apply_one(note_id) for note_id in futures_by_note))
+        logger.info(f"Пачка отметок: {len(futures_by_note)} заметок")
+
+    def get_view(self, key: ViewKey, default=None):
+        """Последняя отрисованная клавиатура сообщения."""
+        return self._views.get(key, default)
+
+    def put_view(self, key: ViewKey, markup):
+        """Запомнить отрисованную клавиатуру сообщения."""
+        self._views[key] = markup
+        self._views.move_to_end(key)
+        while len(self._views) > MARK_DONE_MAX_VIEWS:
+            self._views.popitem(last=False)
@@ -0,0 +1,269 @@
+"""
+Запись фото, документов и голосовых сообщений в Notion.
+
+Файл скачивается из Telegram кусками по MEDIA_CHUNK_SIZE и сразу
+отправляется в Notion (File Upload API) частями по MEDIA_PART_SIZE, так что
+в памяти находится буфер одной части и её отправляемая копия, а не весь
+файл. Большие файлы загружаются в режиме multi_part, маленькие — одним
+запросом. После загрузки рядом с задачей-подписью добавляется блок image,
+audio или file.
+
+Одновременных загрузок не больше MEDIA_CONCURRENCY, поэтому общий объём
+буферов ограничен примерно 2 × MEDIA_CONCURRENCY × MEDIA_PART_SIZE.
+
+Запись идемпотентна так же, как у текстовых заметок (src/capture.py): если
+добавление заметки с файлом оборвалось с неизвестным исходом, резерв
+сообщения остаётся, и повтор сначала ищет задачу-подпись в Notion, а не
+загружает файл заново.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from src.database import Database
+from src.executors import run_db, run_notion
+from src.notion_api import InboxTarget, NotionClient
+from src.search import index_note_texts
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Файлы больше этого размера не принимаются (Bot API отдаёт файлы до 20 МБ)
+MEDIA_MAX_FILE_SIZE = int(os.getenv('MEDIA_MAX_FILE_SIZE', str(20 * MB)))
+# Размер части multi_part загрузки: Notion принимает части от 5 до 20 МБ
+MEDIA_PART_SIZE = min(max(int(os.getenv('MEDIA_PART_SIZE', str(5 * MB))), 5 * MB), 20 * MB)
+# Размер куска при скачивании из Telegram
+MEDIA_CHUNK_SIZE = int(os.getenv('MEDIA_CHUNK_SIZE', str(64 * 1024)))
+MEDIA_CONCURRENCY = int(os.getenv('MEDIA_CONCURRENCY', '2'))
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv('MEDIA_DOWNLOAD_TIMEOUT', '60'))
+
+
+class MediaError(Exception):
+    """Файл нельзя записать (слишком большой, неизвестного размера, оборван)."""
+
+
+class MediaItem:
+    """Файл из сообщения Telegram и то, как его показать в Notion."""
+
+    __slots__ = ('file_id', 'file_size', 'filename', 'content_type', 'block_type', 'caption')
+
+    def __init__(self, file_id: str, file_size: Optional[int], filename: str,
+                 content_type: str, block_type: str, caption: str):
+        self.file_id = file_id
+        self.file_size = file_size
+        self.filename = filename
+        self.content_type = content_type
+        self.block_type = block_type
+        self.caption = caption
+
+
+def media_from_message(message) -> Optional[MediaItem]:
+    """Описать файл из сообщения (фото, документ, голосовое, аудио) или None."""
+    caption = message.caption
+    if message.photo:
+        # Самый большой вариант фото — последний
+        photo = message.photo[-1]
+        return MediaItem(
+            photo.file_id, photo.file_size, f"photo_{message.message_id}.jpg",
+            'image/jpeg', 'image', caption or "📷 Фото"
+        )
+    if message.voice:
+        voice = message.voice
+        return MediaItem(
+            voice.file_id, voice.file_size, f"voice_{message.message_id}.ogg",
+            voice.mime_type or 'audio/ogg', 'audio', caption or "🎤 Голосовое сообщение"
+        )
+    if message.audio:
+        audio = message.audio
+        filename = audio.file_name or f"audio_{message.message_id}.mp3"
+        return MediaItem(
+            audio.file_id, audio.file_size, filename,
+            audio.mime_type or 'audio/mpeg', 'audio', caption or f"🎵 {filename}"
+        )
+    if message.document:
+        document = message.document
+        filename = document.file_name or f"file_{message.message_id}"
+        content_type = document.mime_type or 'application/octet-stream'
+        block_type = 'image' if content_type.startswith('image/') else 'file'
+        return MediaItem(
+            document.file_id, document.file_size, filename,
+            content_type, block_type, caption or f"📎 {filename}"
+        )
+    return None
+
+
+class MediaCapture:
+    """Потоковая загрузка файлов из Telegram в Notion."""
+
+    def __init__(self, db: Database, concurrency: int = MEDIA_CONCURRENCY,
+                 part_size: int = MEDIA_PART_SIZE, chunk_size: int = MEDIA_CHUNK_SIZE,
+                 max_file_size: int = MEDIA_MAX_FILE_SIZE):
+        """Инициализация загрузчика."""
+        self.db = db
+        self.part_size = part_size
+        self.chunk_size = chunk_size
+        self.max_file_size = max_file_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._http: Optional[httpx.AsyncClient] = None
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.peak_buffer = 0
+
+    def check_size(self, item: MediaItem):
+        """Отклонить файл, превышающий лимит, до скачивания."""
+        if item.file_size and item.file_size > self.max_file_size:
+            raise MediaError(
+                f"Файл больше {self.max_file_size // MB} МБ "
+                f"({item.file_size / MB:.1f} МБ), такие файлы бот не записывает"
+            )
+
+    async def capture(self, bot, notion: NotionClient, chat_id: int, message_id: int,
+                      target: InboxTarget, item: MediaItem) -> str:
+        """
+        Записать файл из сообщения в инбокс ровно один раз.
+
+        Returns:
+            str: ID задачи-подписи (или страницы базы данных) в Notion
+        """
+        self.check_size(item)
+        mapping = await run_db(self.db.get_message_block, chat_id, message_id)
+        if mapping.get('block_id'):
+            return mapping['block_id']
+        if mapping:
+            # Прошлая попытка оборвалась. Резерв остаётся только после таймаута или 5xx
+            # в add_media_note, когда подпись с файлом могла быть уже добавлена: ищем
+            # задачу-подпись до новой загрузки, иначе файл появится в инбоксе дважды.
+            # Подписи, уже привязанные к другим сообщениям, исключаются
+            note_id = None
+            if mapping['page_id'] == target.id:
+                exclude = await run_db(self.db.get_mapped_block_ids, target.id)
+                note_id = await run_notion(notion.find_note_by_text, target, mapping['content'], exclude)
+            if note_id:
+                logger.info(f"Найдена ранее записанная заметка с файлом для сообщения {chat_id}/{message_id}")
+                await run_db(self.db.save_message_block, chat_id, message_id, note_id, mapping['content'])
+                await index_note_texts(self.db, target.id, [note_id], [mapping['content']])
+                return note_id
+            await run_db(self.db.delete_message_block, chat_id, message_id)
+
+        await run_db(self.db.reserve_message_block, chat_id, message_id, target.id, item.caption)
+        try:
+            async with self._semaphore:
+                tg_file = await bot.get_file(item.file_id)
+                size = tg_file.file_size or item.file_size
+                upload_id = await self.upload(notion, self.iter_file(tg_file.file_path), item, size)
+        except Exception:
+            # Заметка ещё не создавалась — повтор загрузит файл заново
+            await run_db(self.db.delete_message_block, chat_id, message_id)
+            raise
+
+        try:
+            note_id = await run_notion(
+                notion.add_media_note, target, item.caption, item.block_type, upload_id, item.filename
+            )
+        except NotionClient.UNKNOWN_OUTCOME_ERRORS:
+            # Заметка могла быть создана — оставляем резерв для проверки при повторе
+            raise
+        except Exception:
+            await run_db(self.db.delete_message_block, chat_id, message_id)
+            raise
+
+        await run_db(self.db.save_message_block, chat_id, message_id, note_id, item.caption)
+        await index_note_texts(self.db, target.id, [note_id], [item.caption])
+        return note_id
+
+    async def upload(self, notion: NotionClient, chunks: AsyncIterator[bytes],
+                     item: MediaItem, size: Optional[int]) -> str:
+        """
+        Загрузить поток кусков в Notion частями.
+
+        Returns:
+            str: ID загрузки для блока файла
+        """
+        if not size:
+            raise MediaError("Telegram не сообщил размер файла")
+        if size > self.max_file_size:
+            raise MediaError(f"Файл больше {self.max_file_size // MB} МБ")
+
+        started = time.perf_counter()
+        parts = max(1, math.ceil(size / self.part_size))
+        upload_id = await run_notion(notion.create_file_upload, item.filename, item.content_type, parts)
+
+        buffer = bytearray()
+        received = 0
+        part_number = 0
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > size:
+                raise MediaError("Файл оказался больше заявленного размера")
+            buffer += chunk
+            self.peak_buffer = max(self.peak_buffer, len(buffer))
+            # Последнюю часть отправляем после конца потока
+            while len(buffer) >= self.part_size and part_number + 1 < parts:
+                part_number += 1
+                # Копия части без промежуточного среза bytearray
+                with memoryview(buffer) as view:
+                    part = bytes(view[:self.part_size])
+                del buffer[:self.part_size]
+                await run_notion(
+                    notion.send_file_part, upload_id, part, item.filename, item.content_type, part_number
+                )
+                del part
+        if received != size:
+            raise MediaError(f"Файл скачан не полностью: {received} из {size} байт")
+
+        await run_notion(
+            notion.send_file_part, upload_id, bytes(buffer), item.filename, item.content_type,
+            part_number + 1 if parts > 1 else None
+        )
+        buffer.clear()
+        if parts > 1:
+            await run_notion(notion.complete_file_upload, upload_id)
+
+        elapsed = time.perf_counter() - started
+        self.files += 1
+        self.bytes += size
+        self.seconds += elapsed
+        logger.info(
+            f"Файл {item.filename} загружен в Notion: {size / MB:.1f} МБ, частей {parts}, "
+            f"{size / MB / elapsed if elapsed else 0:.1f} МБ/с, буфер до {self.peak_buffer / MB:.1f} МБ"
+        )
+        return upload_id
+
+    async def iter_file(self, file_path: str) -> AsyncIterator[bytes]:
+        """Читать файл Telegram кусками: по URL Bot API или с диска (локальный Bot API)."""
+        if not file_path.startswith(('http://', 'https://')):
+            with open(file_path, 'rb') as f:
+                while True:
+                    chunk = await asyncio.to_thread(f.read, self.chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=MEDIA_DOWNLOAD_TIMEOUT)
+        async with self._http.stream('GET', file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                yield chunk
+
+    def format_stats(self) -> str:
+        """Статистика загрузок для логов."""
+        throughput = self.bytes / MB / self.seconds if self.seconds else 0.0
+        return (
+            f"Файлы: загружено {self.files}, {self.bytes / MB:.1f} МБ, "
+            f"в среднем {throughput:.1f} МБ/с, пиковый буфер {self.peak_buffer / MB:.1f} МБ"
+        )
+
+    async def stop(self):
+        """Закрыть HTTP-клиент скачивания."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
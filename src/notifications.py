@@ -2,35 +2,87 @@
 Модуль для управления уведомлениями о неразобранном инбоксе.
 """
 
-import asyncio
+import hashlib
 import logging
-from typing import Any
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 from telegram import Bot
 
+from src.circuit_breaker import (
+    KIND_CHAT,
+    KIND_PAGE,
+    KIND_TOKEN,
+    CircuitBreakerRegistry,
+    chat_key,
+    classify_permanent_error,
+    page_key,
+    token_key,
+)
 from src.database import Database
-from src.notion_api import NotionClient
+from src.executors import run_db, run_notion
+from src.fair_queue import current_user
+from src.inbox_cache import ChangeTracker
+from src.list_view import format_notes
+from src.notion_api import InboxTarget, NotionClient
+from src.search import index_records
+from src.storage import MemoryUserStore, SQLiteUserStore, UserStore
+from src.utils import get_mark_done_keyboard
 
 logger = logging.getLogger(__name__)
 
+# Что отправлять, если инбокс не изменился с прошлой рассылки:
+# skip — ничего, compact — короткое напоминание, full — полный список
+UNCHANGED_POLICIES = ('skip', 'compact', 'full')
+DIGEST_UNCHANGED_POLICY = os.getenv('DIGEST_UNCHANGED_POLICY', 'compact')
+
+DIGEST_MODE_INLINE = 'inline'
+DIGEST_MODE_QUEUE = 'queue'
+# inline — рассылка формируется в процессе бота; queue — планировщик только
+# ставит задания в очередь SQLite, их выполняют процессы src/digest_worker.py
+DIGEST_MODE = os.getenv('DIGEST_MODE', DIGEST_MODE_INLINE)
+
 
 class NotificationManager:
     """Менеджер для управления рассылкой уведомлений."""
 
-    def __init__(self, db: Database, notion_client: NotionClient, bot: Bot):
+    def __init__(self, db: Database, bot: Bot, storage: Optional[UserStore] = None,
+                 changes: Optional[ChangeTracker] = None, unchanged_policy: str = DIGEST_UNCHANGED_POLICY):
         """Инициализация менеджера уведомлений."""
         self.db = db
-        self.notion = notion_client
+        self.storage = storage or SQLiteUserStore(db)
+        self.changes = changes
         self.bot = bot
-        self.scheduler = AsyncIOScheduler()
+        self._scheduler = None
         self.jobs = {}  # user_id -> job_id
+        self.breakers = CircuitBreakerRegistry()
+        self.queue_mode = DIGEST_MODE == DIGEST_MODE_QUEUE
+        if self.queue_mode and isinstance(self.storage, MemoryUserStore):
+            # Процессы-обработчики не видят память бота
+            logger.warning("DIGEST_MODE=queue не работает с хранилищем в памяти, рассылки формируются в боте")
+            self.queue_mode = False
+        if unchanged_policy not in UNCHANGED_POLICIES:
+            logger.warning(
+                f"Неизвестное значение DIGEST_UNCHANGED_POLICY={unchanged_policy!r}, "
+                f"используется compact (допустимо: {', '.join(UNCHANGED_POLICIES)})"
+            )
+            unchanged_policy = 'compact'
+        self.unchanged_policy = unchanged_policy
 
-    def start(self):
+    @property
+    def scheduler(self):
+        """Планировщик (APScheduler загружается при первом обращении)."""
+        if self._scheduler is None:
+            from apscheduler.schedulers.asyncio import AsyncIOScheduler
+            self._scheduler = AsyncIOScheduler()
+        return self._scheduler
+
+    async def start(self):
         """Запустить планировщик и загрузить все задачи."""
         self.scheduler.start()
-        users = self.db.get_users_with_notifications()
+        users = await self.storage.get_users_with_notifications()
         for user in users:
             self.schedule_user(
                 user['user_id'],
@@ -41,19 +93,24 @@ class NotificationManager:
 
     def schedule_user(self, user_id: int, time: str, days: str):
         """Запланировать рассылку для конкретного пользователя."""
+        from apscheduler.triggers.cron import CronTrigger
+
         try:
             hour, minute = map(int, time.split(':'))
             day_of_week = self._convert_days_to_cron(days)
 
             job = self.scheduler.add_job(
-                self.send_notification,
+                self.enqueue_digest if self.queue_mode else self.send_notification,
                 CronTrigger(day_of_week=day_of_week, hour=hour, minute=minute),
                 args=[user_id],
                 id=f"user_{user_id}",
                 replace_existing=True
             )
             self.jobs[user_id] = job.id
-            logger.info(f"Запланирована рассылка для пользователя {user_id}: {time} в {days}")
+            logger.info(
+                "Запланирована рассылка для пользователя %s: %s в %s", user_id, time, days,
+                extra={'event': 'digest.scheduled', 'user_id': user_id}
+            )
         except Exception as e:
             logger.error(f"Ошибка при планировании уведомления для {user_id}: {e}")
 
@@ -63,7 +120,10 @@ class NotificationManager:
             try:
                 self.scheduler.remove_job(self.jobs[user_id])
                 del self.jobs[user_id]
-                logger.info(f"Удалена рассылка для пользователя {user_id}")
+                logger.info(
+                    "Удалена рассылка для пользователя %s", user_id,
+                    extra={'event': 'digest.unscheduled', 'user_id': user_id}
+                )
             except Exception as e:
                 logger.error(f"Ошибка при удалении уведомления для {user_id}: {e}")
 
@@ -73,6 +133,19 @@ class NotificationManager:
         if enabled:
             self.schedule_user(user_id, time, days)
 
+    async def resume_user(self, user_id: int):
+        """Возобновить рассылку пользователю после перенастройки."""
+        config = await self.storage.get_user_config(user_id)
+        if config.get('notion_token'):
+            self.breakers.reset(token_key(config['notion_token']))
+        if config.get('notion_token') and config.get('page_id'):
+            self.breakers.reset(page_key(config['notion_token'], config['page_id']))
+        self.breakers.reset(chat_key(user_id))
+
+        settings = await self.storage.get_notification_settings(user_id)
+        if settings.get('notification_enabled') and settings.get('notification_time'):
+            self.schedule_user(user_id, settings['notification_time'], settings['notification_days'])
+
     def _convert_days_to_cron(self, days_str: str) -> str:
         """Конвертировать дни недели в формат cron."""
         days_map = {
@@ -83,64 +156,203 @@ class NotificationManager:
         return ','.join([days_map[d] for d in days_list if d in days_map])
 
     async def send_notification(self, user_id: int):
-        """Отправить уведомление пользователю."""
+        """Отправить уведомление пользователю (ошибки учитываются выключателями)."""
+        config = {}
         try:
             # Получаем конфигурацию пользователя
-            config = self.db.get_user_config(user_id)
-            if not config or not config.get('notion_token') or not config.get('page_id'):
-                logger.warning(f"Нет конфигурации для пользователя {user_id}")
-                return
-
-            # Устанавливаем токен Notion
-            self.notion.set_token(config['notion_token'])
-
-            # Получаем все to_do блоки со страницы
-            if not self.notion.client:
-                logger.warning(f"Notion клиент не инициализирован для пользователя {user_id}")
-                return
-            
-            blocks: Any = await asyncio.to_thread(
-                self.notion.client.blocks.children.list,
-                config['page_id']
+            config = await self.storage.get_user_config(user_id)
+            await self.deliver_digest(user_id, config)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке уведомления пользователю {user_id}: {e}")
+            await self.handle_failure(user_id, config, e)
+
+    async def enqueue_digest(self, user_id: int):
+        """Поставить рассылку в очередь процессов-обработчиков (DIGEST_MODE=queue)."""
+        config = await self.storage.get_user_config(user_id)
+        if config.get('suspended_reason'):
+            # Приостановлен обработчиком в другом процессе
+            self.unschedule_user(user_id)
+            return
+        due_at = datetime.now(timezone.utc).replace(second=0, microsecond=0).isoformat()
+        if not await run_db(self.db.enqueue_digest_job, user_id, due_at, time.time()):
+            logger.info(
+                "Рассылка пользователю %s на %s уже в очереди", user_id, due_at,
+                extra={'event': 'digest.duplicate', 'user_id': user_id}
             )
-            results = blocks.get('results', []) if blocks else []
-
-            # Фильтруем только невыполненные to_do
-            unchecked_items = []
-            for block in results:
-                if block.get('type') == 'to_do':
-                    todo_data = block.get('to_do', {})
-                    if not todo_data.get('checked', False):
-                        text = self._extract_text(todo_data.get('rich_text', []))
-                        if text:
-                            unchecked_items.append(text)
-
-            # Формируем сообщение
-            if not unchecked_items:
-                message = "🤔 Инбокс пуст. Вы не забыли ничего записать?"
+
+    async def deliver_digest(self, user_id: int, config: dict):
+        """Сформировать и отправить рассылку.
+
+        Если страница не менялась с прошлой рассылки, список блоков не
+        запрашивается, а содержимое определяется политикой DIGEST_UNCHANGED_POLICY.
+
+        Состояние рассылки сохраняется только после успешной отправки:
+        иначе повтор после ошибки счёл бы инбокс неизменившимся и не
+        прислал бы список, который пользователь так и не получил.
+
+        Raises:
+            Exception: ошибка Notion или Telegram; выключатели не обновляются
+        """
+        # Запросы рассылки идут в очереди пользователя (src/fair_queue.py)
+        current_user.set(user_id)
+        if not config or not config.get('notion_token') or not config.get('page_id'):
+            logger.warning(f"Нет конфигурации для пользователя {user_id}")
+            return
+
+        # Клиент Notion для токена пользователя
+        notion = NotionClient.for_token(config['notion_token'])
+
+        # Получаем все to_do блоки со страницы
+        if not notion.client:
+            logger.warning(f"Notion клиент не инициализирован для пользователя {user_id}")
+            return
+
+        target = InboxTarget.from_config(config)
+        state = await run_db(self.db.get_digest_state, user_id)
+        checked_at = datetime.now(timezone.utc)
+
+        if self._webhooks_report_unchanged(user_id, state, target.id):
+            # Событий Notion об изменениях не было — Notion не спрашиваем вовсе
+            last_edited_time = state['last_edited_time']
+            unchanged = True
+        else:
+            # Дешёвая проверка: время последнего изменения страницы
+            last_edited_time = await run_notion(notion.get_last_edited_time, target)
+            unchanged = self._is_unchanged_since(state, target.id, last_edited_time)
+
+        # Кнопки «выполнено» есть только у свежего списка
+        reply_markup = None
+
+        if unchanged:
+            message = self._render_unchanged(state)
+            new_state = (
+                user_id, target.id, last_edited_time, state['items_hash'],
+                state['item_count'], state['message'], checked_at.isoformat()
+            )
+        else:
+            # Невыполненные to_do (для базы данных фильтр на стороне Notion)
+            records = await run_notion(notion.list_unchecked, target)
+            await index_records(self.db, target.id, records)
+            unchecked_items = [record.text for record in records]
+            items_hash = self._hash_items(records)
+            full_message = self._render_digest(unchecked_items)
+
+            if state and state.get('page_id') == target.id and state.get('items_hash') == items_hash:
+                # Страница менялась, но набор неразобранных задач тот же
+                message = self._render_unchanged(state)
             else:
-                lines = [f"📬 Неразобранный инбокс ({len(unchecked_items)} задачи):\n"]
-                for item in unchecked_items:
-                    lines.append(f"☐ {item}")
-                lines.append("\n💡 Используйте /list для просмотра всех заметок")
-                message = "\n".join(lines)
+                message = full_message
+                reply_markup = get_mark_done_keyboard(
+                    (record.id, record.text) for record in records
+                )
+            new_state = (
+                user_id, target.id, last_edited_time, items_hash,
+                len(unchecked_items), full_message, checked_at.isoformat()
+            )
 
-            # Отправляем сообщение
-            await self.bot.send_message(chat_id=user_id, text=message)  # type: ignore
-            logger.info(f"Отправлено уведомление пользователю {user_id}")
+        self.breakers.record_success(token_key(config['notion_token']))
+        self.breakers.record_success(page_key(config['notion_token'], target.id))
 
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления пользователю {user_id}: {e}")
+        if message is None:
+            await run_db(self.db.save_digest_state, *new_state)
+            logger.info(
+                "Инбокс пользователя %s не изменился, уведомление пропущено", user_id,
+                extra={'event': 'digest.skipped', 'user_id': user_id}
+            )
+            return
+
+        # Отправляем сообщение
+        await self.bot.send_message(chat_id=user_id, text=message, reply_markup=reply_markup)  # type: ignore
+        self.breakers.record_success(chat_key(user_id))
+        await run_db(self.db.save_digest_state, *new_state)
+        logger.info("Отправлено уведомление пользователю %s", user_id, extra={'event': 'digest.sent', 'user_id': user_id})
+
+    async def handle_failure(self, user_id: int, config: dict, error: Exception):
+        """Учесть постоянную ошибку и приостановить пользователей при размыкании выключателя."""
+        classified = classify_permanent_error(error)
+        if classified is None:
+            return
+        kind, reason = classified
+
+        if kind == KIND_TOKEN and config.get('notion_token'):
+            key, scope = token_key(config['notion_token']), {'notion_token': config['notion_token']}
+        elif kind == KIND_PAGE and config.get('notion_token') and config.get('page_id'):
+            key = page_key(config['notion_token'], config['page_id'])
+            scope = {'notion_token': config['notion_token'], 'page_id': config['page_id']}
+        elif kind == KIND_CHAT:
+            key, scope = chat_key(user_id), {'user_id': user_id}
+        else:
+            return
+
+        if not self.breakers.record_failure(key):
+            return
+
+        suspended = await self.storage.suspend_users(reason, **scope)
+        for suspended_id in suspended:
+            self.unschedule_user(suspended_id)
+        logger.warning(f"Рассылка приостановлена для {len(suspended)} пользователей: {reason}")
+
+    def _webhooks_report_unchanged(self, user_id: int, state: dict, page_id: str) -> bool:
+        """Проверить по вебхукам Notion, что инбокс не менялся с прошлой проверки."""
+        if self.changes is None or not state or state.get('page_id') != page_id or not state.get('checked_at'):
+            return False
+        checked = datetime.fromisoformat(state['checked_at'])
+        return self.changes.is_unchanged(user_id, checked.timestamp())
+
+    @staticmethod
+    def _is_unchanged_since(state: dict, page_id: str, last_edited_time: Optional[str]) -> bool:
+        """Проверить, что страница не менялась с прошлой проверки.
+
+        Notion округляет last_edited_time до минуты, поэтому совпадение
+        времени считается надёжным, только если прошлая проверка была
+        позже конца этой минуты.
+        """
+        if not state or not last_edited_time or state.get('page_id') != page_id:
+            return False
+        if state.get('last_edited_time') != last_edited_time or not state.get('checked_at'):
+            return False
+        edited = datetime.fromisoformat(last_edited_time.replace('Z', '+00:00'))
+        checked = datetime.fromisoformat(state['checked_at'])
+        return checked >= edited + timedelta(minutes=1)
+
+    @staticmethod
+    def _hash_items(records: list) -> str:
+        """Хэш набора неразобранных задач."""
+        digest = hashlib.sha256()
+        for record in records:
+            digest.update(f"{record.id}\x00{record.text}\x00".encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _render_digest(unchecked_items: list) -> str:
+        """Сформировать полный текст уведомления в пределах одного сообщения Telegram."""
+        if not unchecked_items:
+            return "🤔 Инбокс пуст. Вы не забыли ничего записать?"
+
+        return format_notes(
+            [(item, False) for item in unchecked_items],
+            f"📬 Неразобранный инбокс ({len(unchecked_items)} задачи):\n",
+            "\n💡 Используйте /list для просмотра всех заметок",
+        )
+
+    def _render_unchanged(self, state: dict) -> Optional[str]:
+        """Текст уведомления для неизменившегося инбокса по политике.
 
-    def _extract_text(self, rich_text: list) -> str:
-        """Извлечь текст из rich_text массива."""
-        text_parts = []
-        for item in rich_text:
-            if item.get('type') == 'text':
-                text_parts.append(item.get('text', {}).get('content', ''))
-        return ''.join(text_parts)
+        Returns:
+            str или None, если уведомление нужно пропустить
+        """
+        if self.unchanged_policy == 'skip':
+            return None
+        if self.unchanged_policy == 'full' or not state['item_count']:
+            return state['message']
+        return (
+            f"📬 В инбоксе по-прежнему {state['item_count']} неразобранных задач.\n\n"
+            "💡 Используйте /list для просмотра всех заметок"
+        )
 
     def shutdown(self):
         """Остановить планировщик."""
-        self.scheduler.shutdown()
+        if self._scheduler is None or not self._scheduler.running:
+            return
+        self._scheduler.shutdown()
         logger.info("Планировщик уведомлений остановлен")
@@ -4,7 +4,9 @@
 
 import re
 import logging
-from typing import Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
 
 try:
     from notion_client import Client
@@ -14,11 +16,151 @@ except ImportError:
         "Установите его командой: pip install notion-client"
     )
 
+from src.blocks import BlockRecord, decode_block_list, decode_database_item
+from src.encoder import MAX_CHILDREN_PER_REQUEST, encode_note, note_texts, rich_text, todo_block
+from src.http_pool import create_http_client
+from src.notion_errors import UNKNOWN_OUTCOME_ERRORS, NotionError
+from src.notion_retry import RequestPolicy, endpoint_name, is_idempotent
+from src.page_index import rank_titles
+from src.single_flight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
+# Сколько клиентов (по одному на токен) держать в кэше
+NOTION_CLIENT_CACHE_SIZE = 256
+
+# Название свойства-чекбокса, добавляемого в базу данных без чекбоксов
+DEFAULT_CHECKBOX_PROPERTY = 'Готово'
+
+# Наибольшая порция дочерних блоков в одном ответе Notion
+BLOCK_LIST_CHUNK_SIZE = 100
+
+TARGET_PAGE = 'page'
+TARGET_DATABASE = 'database'
+
+# Типы блоков, которые можно воссоздать в архиве по ответу Notion
+# (вложенные страницы, базы данных и файлы Notion так не копируются)
+COPYABLE_BLOCK_TYPES = frozenset({
+    'paragraph', 'to_do', 'bulleted_list_item', 'numbered_list_item', 'toggle', 'quote', 'callout',
+    'heading_1', 'heading_2', 'heading_3', 'code', 'divider', 'equation', 'bookmark',
+})
+
+
+def _writable_rich_text(items: list) -> list:
+    """rich_text из ответа Notion без полей только для чтения (plain_text, href)."""
+    writable = []
+    for item in items:
+        kind = item.get('type')
+        entry = {'type': kind, kind: item.get(kind)}
+        if item.get('annotations'):
+            entry['annotations'] = item['annotations']
+        writable.append(entry)
+    return writable
+
+
+def _writable_block(block: dict) -> dict:
+    """Блок из ответа Notion в виде для blocks.children.append (без id и вложенных блоков)."""
+    kind = block['type']
+    payload = {key: value for key, value in (block.get(kind) or {}).items() if key != 'children'}
+    for key in ('rich_text', 'caption'):
+        if key in payload:
+            payload[key] = _writable_rich_text(payload[key])
+    return {'object': 'block', 'type': kind, kind: payload}
+
+
+def count_tree_writes(tree: dict) -> int:
+    """Число запросов на запись дерева блоков: сам блок и по запросу на 100 детей каждого родителя."""
+    children = tree['children']
+    requests = 1 + (len(children) + MAX_CHILDREN_PER_REQUEST - 1) // MAX_CHILDREN_PER_REQUEST
+    return requests + sum(count_tree_writes(child) - 1 for child in children)
+
+
+class TailCursor(NamedTuple):
+    """
+    Курсор /list по странице-инбоксу от новых блоков к старым.
+
+    Notion листает дочерние блоки только сверху вниз, поэтому при открытии
+    /list страница проходится один раз и запоминаются курсоры порций по
+    BLOCK_LIST_CHUNK_SIZE блоков. Следующая порция /list читается по ним
+    одним-двумя запросами.
+    """
+    chunk_cursors: Tuple[Optional[str], ...]
+    # Блоки с номерами меньше end ещё не показаны
+    end: int
+
+
+class InboxTarget:
+    """Куда пишутся заметки: страница или база данных Notion."""
+
+    __slots__ = ('type', 'id', 'data_source_id', 'title_property', 'checkbox_property')
+
+    def __init__(self, type: str, id: str, data_source_id: Optional[str] = None,
+                 title_property: Optional[str] = None, checkbox_property: Optional[str] = None):
+        self.type = type
+        self.id = id
+        self.data_source_id = data_source_id
+        self.title_property = title_property
+        self.checkbox_property = checkbox_property
+
+    @property
+    def is_database(self) -> bool:
+        return self.type == TARGET_DATABASE
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'InboxTarget':
+        """Собрать цель из конфигурации пользователя в БД."""
+        return cls(
+            config.get('target_type') or TARGET_PAGE,
+            config['page_id'],
+            config.get('data_source_id'),
+            config.get('title_property'),
+            config.get('checkbox_property'),
+        )
+
+
+class PolicyClient(Client):
+    """Клиент notion_client, все запросы которого проходят через политику повторов."""
+
+    def __init__(self, policy: RequestPolicy, **kwargs):
+        """Инициализация клиента."""
+        super().__init__(**kwargs)
+        self.policy = policy
+
+    def request(self, path: str, method: str, query=None, body=None, form_data=None, auth=None):
+        """Выполнить запрос; ошибки приходят как NotionError (см. src/notion_errors.py)."""
+        return self.policy.call(
+            lambda: super(PolicyClient, self).request(path, method, query, body, form_data, auth),
+            endpoint_name(method, path), is_idempotent(method, path)
+        )
+
+    def get_raw(self, path: str, query: dict) -> bytes:
+        """
+        Выполнить GET и вернуть тело ответа без разбора JSON.
+
+        Единственное место, опирающееся на внутренности notion_client
+        (httpx-клиент `client` с настроенными заголовками и `_parse_response`
+        для ошибок); поведение проверяется тестом на закреплённой версии
+        пакета. Политика повторов сюда не входит — её применяет вызывающий.
+        """
+        response = self.client.get(path, params=query)
+        if response.is_error:
+            # Разбор ошибки notion_client выбрасывает его исключение, политика переведёт его в NotionError
+            self._parse_response(response)
+        return response.content
+
 
 class NotionClient:
     """Класс для работы с Notion API."""
+
+    # Ошибки, после которых неизвестно, выполнил ли Notion запрос
+    UNKNOWN_OUTCOME_ERRORS = UNKNOWN_OUTCOME_ERRORS
+
+    _instances: 'OrderedDict[str, NotionClient]' = OrderedDict()
+    _instances_lock = threading.Lock()
+    # Объединение одинаковых одновременных чтений всех клиентов (см. src/single_flight.py)
+    reads = SingleFlight()
+    # Повторы и хеджирование запросов всех клиентов (см. src/notion_retry.py)
+    policy = RequestPolicy()
     
     def __init__(self, token: Optional[str] = None):
         """Инициализация клиента Notion."""
@@ -27,11 +169,37 @@ class NotionClient:
         if token:
             self.set_token(token)
     
+    @classmethod
+    def for_token(cls, token: str) -> 'NotionClient':
+        """Получить клиент для токена из кэша или создать новый.
+
+        Клиенты разных пользователей не разделяют состояние, но используют
+        общий пул соединений.
+        """
+        with cls._instances_lock:
+            instance = cls._instances.get(token)
+            if instance is not None:
+                cls._instances.move_to_end(token)
+                return instance
+            instance = cls(token)
+            cls._instances[token] = instance
+            while len(cls._instances) > NOTION_CLIENT_CACHE_SIZE:
+                cls._instances.popitem(last=False)
+            return instance
+
     def set_token(self, token: str):
-        """Установить токен и создать клиент."""
+        """Установить токен и создать клиент поверх общего пула соединений."""
         self.token = token
-        self.client = Client(auth=token)
+        self.client = PolicyClient(self.policy, auth=token, client=create_http_client())
     
+    def _shared_read(self, endpoint: str, params: tuple, fn, *args, **kwargs):
+        """Выполнить чтение, объединив его с одинаковым идущим чтением того же токена."""
+        return self.reads.do((self.token, endpoint, params), fn, *args, **kwargs)
+
+    def _forget_reads(self):
+        """Не отдавать сохранённые чтения токена после записи."""
+        self.reads.forget(self.token)
+
     def test_connection(self):
         """Проверить соединение с Notion API."""
         if not self.client:
@@ -41,9 +209,9 @@ class NotionClient:
             # Пробуем получить список пользователей
             self.client.users.me()
             return True
-        except Exception as e:
+        except NotionError as e:
             logger.error(f"Ошибка при проверке соединения: {e}")
-            raise Exception(f"Не удалось подключиться к Notion: {str(e)}")
+            raise
     
     def extract_page_id_from_url(self, url: str) -> Optional[str]:
         """Извлечь ID страницы из URL Notion."""
@@ -83,38 +251,77 @@ class NotionClient:
         return None
     
     def find_page_by_name(self, page_name: str) -> Tuple[Optional[str], Optional[str]]:
-        """Найти страницу по названию."""
+        """Найти страницу по названию (лучшее совпадение)."""
+        candidates = self.search_pages(page_name, limit=1)
+        if not candidates:
+            raise ValueError(f"Страница '{page_name}' не найдена")
+        return candidates[0]
+
+    def search_pages(self, query: str, limit: int = 5) -> List[Tuple[str, str]]:
+        """
+        Найти страницы по названию через живой поиск Notion.
+
+        Результаты ранжируются по совпадению названия, а не по порядку выдачи
+        Notion.
+
+        Returns:
+            list: Пары (page_id, title), лучшие первыми
+        """
         if not self.client:
             raise ValueError("Токен не установлен")
-        
+
         try:
-            # Ищем страницы в рабочей области пользователя
             search_results = self.client.search(
-                query=page_name,
+                query=query,
                 filter={
                     "property": "object",
                     "value": "page"
                 }
             )
-            
-            results = search_results.get('results', [])
-            
-            if not results:
-                raise ValueError(f"Страница '{page_name}' не найдена")
-            
-            # Берем первую найденную страницу
-            page = results[0]
-            page_id = page['id']
-            
-            # Получаем название страницы
-            title = self._get_page_title(page)
-            
-            return page_id, title
-            
+            pages = [
+                (page['id'], self._get_page_title(page))
+                for page in search_results.get('results', [])
+            ]
+            return rank_titles(query, pages, limit)
+
         except Exception as e:
             logger.error(f"Ошибка при поиске страницы: {e}")
             raise
-    
+
+    def iter_pages(self, max_pages: int) -> Iterator[Tuple[str, str]]:
+        """
+        Перебрать все доступные интеграции страницы постранично.
+
+        Args:
+            max_pages: Максимум страниц, после которого перебор прекращается
+
+        Yields:
+            tuple: (page_id, title)
+        """
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        cursor = None
+        count = 0
+        while count < max_pages:
+            params = {
+                "filter": {"property": "object", "value": "page"},
+                "page_size": 100,
+            }
+            if cursor:
+                params["start_cursor"] = cursor
+            response = self.client.search(**params)
+
+            for page in response.get('results', []):
+                yield page['id'], self._get_page_title(page)
+                count += 1
+                if count >= max_pages:
+                    return
+
+            if not response.get('has_more'):
+                return
+            cursor = response.get('next_cursor')
+
     def get_page_info(self, page_id: str) -> dict:
         """Получить информацию о странице."""
         if not self.client:
@@ -129,9 +336,9 @@ class NotionClient:
                 'title': title,
                 'url': page.get('url', '')
             }
-        except Exception as e:
+        except NotionError as e:
             logger.error(f"Ошибка при получении информации о странице: {e}")
-            raise Exception(f"Не удалось получить информацию о странице: {str(e)}")
+            raise
     
     def _get_page_title(self, page: dict) -> str:
         """Извлечь название страницы из объекта страницы."""
@@ -159,53 +366,693 @@ class NotionClient:
         
         return 'Без названия'
     
-    def append_to_page(self, page_id: str, content: str):
-        """Добавить контент на страницу Notion."""
+    def append_to_page(self, page_id: str, content: str, per_line: bool = False) -> List[str]:
+        """
+        Добавить заметку на страницу Notion.
+
+        Длинный текст делится на сегменты rich_text, в режиме per_line каждая
+        строка становится отдельной задачей. Все блоки уходят одним запросом
+        (больше 100 блоков — несколькими).
+
+        Returns:
+            list: ID созданных блоков по порядку
+
+        Raises:
+            NotionTimeoutError, NotionServerError: исход записи неизвестен —
+                блоки могли быть созданы (find_note_blocks найдёт записанное
+                начало заметки)
+            NotionError: Notion отклонил запись; блоки из уже записанных
+                пачек удалены
+        """
+        self._forget_reads()
         if not self.client:
             raise ValueError("Токен не установлен")
         
+        block_ids = []
         try:
-            # Получаем информацию о странице
-            page = self.client.pages.retrieve(page_id)
+            blocks = encode_note(content, per_line)
+            for start in range(0, len(blocks), MAX_CHILDREN_PER_REQUEST):
+                response = self.client.blocks.children.append(
+                    page_id, children=blocks[start:start + MAX_CHILDREN_PER_REQUEST]
+                )
+                block_ids.extend(block['id'] for block in response['results'])
             
-            # Получаем ID дочерних блоков страницы
-            children = self.client.blocks.children.list(page_id)
+            logger.info(
+                "Контент добавлен на страницу %s: блоков %d", page_id, len(block_ids),
+                extra={'event': 'notion.append', 'page_id': page_id}
+            )
+            return block_ids
             
-            # Создаем новый блок с текстом (чекбокс)
-            new_block = {
-                "object": "block",
-                "type": "to_do",
-                "to_do": {
-                    "rich_text": [
-                        {
-                            "type": "text",
-                            "text": {
-                                "content": content
-                            }
-                        }
-                    ],
-                    "checked": False
+        except self.UNKNOWN_OUTCOME_ERRORS as e:
+            # Исход неизвестен: вызывающий код проверит, создан ли блок
+            logger.error(f"Ошибка сети при добавлении контента: {e}")
+            raise
+        except NotionError as e:
+            logger.error(f"Ошибка при добавлении контента: {type(e).__name__} ({e.status}, {e.code}): {e}")
+            if block_ids:
+                # Отклонена одна из следующих пачек: убираем начало заметки, чтобы не оставить его без привязки
+                self._rollback_blocks(block_ids)
+            raise
+
+    def _rollback_blocks(self, block_ids: List[str]):
+        """Удалить блоки частично записанной заметки."""
+        for block_id in block_ids:
+            try:
+                self.client.blocks.delete(block_id)
+            except NotionError as e:
+                logger.error(f"Не удалось удалить блок {block_id} частично записанной заметки: {e}")
+
+    def resolve_target(self, target_id: str) -> Tuple[InboxTarget, str]:
+        """
+        Определить, страница это или база данных, и проверить доступ.
+
+        Для базы данных находит источник данных, свойство-заголовок и
+        свойство-чекбокс (при отсутствии чекбокса добавляет его).
+
+        Returns:
+            tuple: (InboxTarget, название)
+        """
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        try:
+            page_info = self.get_page_info(target_id)
+            return InboxTarget(TARGET_PAGE, target_id), page_info.get('title', 'Без названия')
+        except Exception as page_error:
+            try:
+                database = self.client.databases.retrieve(target_id)
+            except NotionError:
+                # Это и не база данных — возвращаем исходную ошибку страницы
+                raise page_error
+
+        title = ''.join(item.get('plain_text', '') for item in database.get('title', [])) or 'Без названия'
+        data_sources = database.get('data_sources', [])
+        if not data_sources:
+            raise ValueError("У базы данных нет источников данных")
+        data_source_id = data_sources[0]['id']
+
+        properties = self.client.data_sources.retrieve(data_source_id).get('properties', {})
+        title_property = next((name for name, prop in properties.items() if prop.get('type') == 'title'), None)
+        checkbox_property = next((name for name, prop in properties.items() if prop.get('type') == 'checkbox'), None)
+        if not title_property:
+            raise ValueError("В базе данных нет свойства-заголовка")
+        if not checkbox_property:
+            checkbox_property = DEFAULT_CHECKBOX_PROPERTY
+            self.client.data_sources.update(
+                data_source_id, properties={checkbox_property: {"checkbox": {}}}
+            )
+            logger.info(f"В базу данных {target_id} добавлено свойство {checkbox_property}")
+
+        target = InboxTarget(TARGET_DATABASE, target_id, data_source_id, title_property, checkbox_property)
+        return target, title
+
+    def add_note(self, target: InboxTarget, content: str, per_line: bool = False) -> List[str]:
+        """
+        Добавить заметку в страницу или базу данных.
+
+        Построчная запись (per_line) действует только для страницы: в базе
+        данных заметка — одна запись.
+
+        Returns:
+            list: ID созданных блоков или [ID страницы базы данных]
+        """
+        self._forget_reads()
+        if not target.is_database:
+            return self.append_to_page(target.id, content, per_line)
+
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        try:
+            page = self.client.pages.create(
+                parent={"type": "data_source_id", "data_source_id": target.data_source_id},
+                properties={
+                    target.title_property: {"title": self._text_rich_text(content)},
+                    target.checkbox_property: {"checkbox": False},
                 }
-            }
-            
-            # Добавляем блок на страницу
-            self.client.blocks.children.append(page_id, children=[new_block])
-            
-            logger.info(f"Контент добавлен на страницу {page_id}")
-            
+            )
+            logger.info(
+                "Заметка добавлена в базу данных %s", target.id,
+                extra={'event': 'notion.add', 'page_id': target.id}
+            )
+            return [page['id']]
+        except NotionError as e:
+            logger.error(f"Ошибка при добавлении заметки в базу данных: {e}")
+            raise
+
+    def update_note(self, target: InboxTarget, note_ids: List[str], content: str,
+                    per_line: bool = False) -> List[str]:
+        """
+        Заменить текст заметки (блоков страницы или записи базы данных).
+
+        Returns:
+            list: ID блоков заметки после изменения
+        """
+        self._forget_reads()
+        if not target.is_database:
+            return self.replace_note_blocks(target.id, note_ids, content, per_line)
+
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        try:
+            self.client.pages.update(
+                note_ids[0], properties={target.title_property: {"title": self._text_rich_text(content)}}
+            )
+            logger.info("Заметка %s обновлена", note_ids[0], extra={'event': 'notion.update', 'note_id': note_ids[0]})
+            return note_ids
+        except NotionError as e:
+            logger.error(f"Ошибка при обновлении заметки: {e}")
+            raise
+
+    def mark_done(self, target: InboxTarget, note_id: str):
+        """Отметить заметку выполненной (чекбокс блока или свойство базы данных)."""
+        self._forget_reads()
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        if target.is_database:
+            self.client.pages.update(note_id, properties={target.checkbox_property: {"checkbox": True}})
+        else:
+            self.client.blocks.update(note_id, to_do={"checked": True})
+        logger.info("Заметка %s отмечена выполненной", note_id, extra={'event': 'notion.done', 'note_id': note_id})
+
+    def archive_notes(self, archive: InboxTarget, texts: List[str]):
+        """
+        Скопировать выполненные заметки в архив.
+
+        В страницу все заметки добавляются одним запросом (до 100 блоков),
+        в базу данных — по запросу на заметку.
+        """
+        self._forget_reads()
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        if not archive.is_database:
+            self.client.blocks.children.append(
+                archive.id,
+                children=[
+                    {
+                        "object": "block",
+                        "type": "to_do",
+                        "to_do": {"rich_text": self._text_rich_text(text), "checked": True},
+                    }
+                    for text in texts
+                ],
+            )
+            return
+
+        for text in texts:
+            self.client.pages.create(
+                parent={"type": "data_source_id", "data_source_id": archive.data_source_id},
+                properties={
+                    archive.title_property: {"title": self._text_rich_text(text)},
+                    archive.checkbox_property: {"checkbox": True},
+                }
+            )
+
+    def get_block_tree(self, block_id: str) -> Optional[dict]:
+        """
+        Прочитать блок со всеми вложенными блоками для копирования в архив.
+
+        Returns:
+            dict: {'block': блок для записи, 'children': [поддеревья]} или None,
+                  если в дереве есть блок, который нельзя воссоздать
+        """
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        return self._read_block_tree(self.client.blocks.retrieve(block_id))
+
+    def _read_block_tree(self, block: dict) -> Optional[dict]:
+        if block.get('type') not in COPYABLE_BLOCK_TYPES:
+            return None
+        children = []
+        cursor = None
+        while block.get('has_children'):
+            params = {"page_size": 100}
+            if cursor:
+                params["start_cursor"] = cursor
+            response = self.client.blocks.children.list(block['id'], **params)
+            for child in response['results']:
+                subtree = self._read_block_tree(child)
+                if subtree is None:
+                    return None
+                children.append(subtree)
+            if not response.get('has_more'):
+                break
+            cursor = response['next_cursor']
+        return {'block': _writable_block(block), 'children': children}
+
+    def archive_block_tree(self, archive: InboxTarget, tree: dict):
+        """
+        Скопировать заметку в архив целиком: с оформлением текста, ссылками,
+        упоминаниями и всеми вложенными блоками.
+
+        В базе данных текст заметки становится названием записи, а вложенные
+        блоки — содержимым её страницы.
+        """
+        self._forget_reads()
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        block = tree['block']
+        if archive.is_database:
+            page = self.client.pages.create(
+                parent={"type": "data_source_id", "data_source_id": archive.data_source_id},
+                properties={
+                    archive.title_property: {"title": block[block['type']].get('rich_text', [])},
+                    archive.checkbox_property: {"checkbox": True},
+                }
+            )
+            self._append_block_trees(page['id'], tree['children'])
+            return
+
+        response = self.client.blocks.children.append(archive.id, children=[block])
+        self._append_block_trees(response['results'][0]['id'], tree['children'])
+
+    def _append_block_trees(self, parent_id: str, trees: List[dict]):
+        for start in range(0, len(trees), MAX_CHILDREN_PER_REQUEST):
+            batch = trees[start:start + MAX_CHILDREN_PER_REQUEST]
+            response = self.client.blocks.children.append(parent_id, children=[tree['block'] for tree in batch])
+            for tree, created in zip(batch, response['results']):
+                if tree['children']:
+                    self._append_block_trees(created['id'], tree['children'])
+
+    def delete_block(self, block_id: str):
+        """Удалить блок (в Notion он попадает в корзину)."""
+        self._forget_reads()
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        self.client.blocks.delete(block_id)
+
+    def create_file_upload(self, filename: str, content_type: str, parts: int) -> str:
+        """
+        Начать загрузку файла в Notion.
+
+        Файл из одной части загружается в режиме single_part, больший —
+        в режиме multi_part по частям.
+
+        Returns:
+            str: ID загрузки
+        """
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        params = {"filename": filename, "content_type": content_type}
+        if parts > 1:
+            params.update(mode="multi_part", number_of_parts=parts)
+        else:
+            params["mode"] = "single_part"
+        return self.client.file_uploads.create(**params)['id']
+
+    def send_file_part(self, upload_id: str, data: bytes, filename: str, content_type: str,
+                       part_number: Optional[int] = None):
+        """Отправить часть файла (или весь файл при single_part)."""
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        params = {"file": (filename, data, content_type)}
+        if part_number is not None:
+            params["part_number"] = str(part_number)
+        self.client.file_uploads.send(upload_id, **params)
+
+    def complete_file_upload(self, upload_id: str):
+        """Завершить загрузку из нескольких частей."""
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        self.client.file_uploads.complete(upload_id)
+
+    @staticmethod
+    def media_block(block_type: str, upload_id: str, filename: str) -> dict:
+        """Блок image, audio или file с загруженным файлом."""
+        content = {"type": "file_upload", "file_upload": {"id": upload_id}}
+        if block_type == 'file':
+            content["name"] = filename
+        return {"object": "block", "type": block_type, block_type: content}
+
+    def add_media_note(self, target: InboxTarget, caption: str, block_type: str,
+                       upload_id: str, filename: str) -> str:
+        """
+        Добавить заметку с файлом: to_do с подписью и блок файла рядом.
+
+        На страницу оба блока добавляются одним запросом; в базе данных
+        создаётся запись с подписью, а файл кладётся в её содержимое.
+
+        Returns:
+            str: ID блока to_do или страницы базы данных
+        """
+        self._forget_reads()
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        media = self.media_block(block_type, upload_id, filename)
+        if target.is_database:
+            note_id = self.add_note(target, caption)[0]
+            self.client.blocks.children.append(note_id, children=[media])
+            return note_id
+
+        caption_block = {
+            "object": "block",
+            "type": "to_do",
+            "to_do": {"rich_text": self._text_rich_text(caption), "checked": False},
+        }
+        response = self.client.blocks.children.append(target.id, children=[caption_block, media])
+        logger.info(
+            "Файл %s добавлен на страницу %s", filename, target.id,
+            extra={'event': 'notion.upload', 'page_id': target.id}
+        )
+        return response['results'][0]['id']
+
+    def find_note_blocks(self, target: InboxTarget, texts: List[str], exclude: set) -> List[str]:
+        """
+        Найти блоки заметки, запись которой оборвалась.
+
+        Ищется последний непривязанный чекбокс с текстом первого блока, а за
+        ним — идущие подряд чекбоксы со следующими текстами. Если запись
+        оборвалась на одной из пачек, найдётся только начало заметки.
+
+        Args:
+            texts: тексты блоков заметки по порядку
+            exclude: ID блоков, которые уже привязаны к другим сообщениям
+
+        Returns:
+            list: ID найденных блоков по порядку (пустой — заметка не записана)
+        """
+        if target.is_database:
+            note_id = self.find_note_by_text(target, texts[0], exclude)
+            return [note_id] if note_id else []
+
+        self._forget_reads()
+        records = self.list_all_block_records(target.id)
+
+        def matches(record: BlockRecord, text: str) -> bool:
+            return record.type == 'to_do' and record.text == text and record.id not in exclude
+
+        for index in range(len(records) - 1, -1, -1):
+            if not matches(records[index], texts[0]):
+                continue
+            found = [records[index].id]
+            for record, text in zip(records[index + 1:], texts[1:]):
+                if not matches(record, text):
+                    break
+                found.append(record.id)
+            return found
+        return []
+
+    def find_note_by_text(self, target: InboxTarget, content: str, exclude: set) -> Optional[str]:
+        """Найти последнюю заметку с заданным текстом (см. find_block_by_text)."""
+        self._forget_reads()
+        if not target.is_database:
+            return self.find_block_by_text(target.id, content, exclude)
+
+        response = self.client.data_sources.query(
+            target.data_source_id,
+            filter={"property": target.title_property, "title": {"equals": content}},
+            sorts=[{"timestamp": "created_time", "direction": "descending"}],
+            page_size=10,
+        )
+        for page in response.get('results', []):
+            if page['id'] not in exclude:
+                return page['id']
+        return None
+
+    def query_database_records(self, target: InboxTarget, unchecked_only: bool = False,
+                               descending: bool = False, page_size: int = 100,
+                               start_cursor: Optional[str] = None) -> Tuple[List[BlockRecord], Optional[str]]:
+        """
+        Получить страницу заметок базы данных с фильтрацией на стороне Notion.
+
+        Returns:
+            tuple: (записи, курсор следующей страницы или None)
+        """
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        return self._shared_read(
+            'data_sources.query',
+            (target.data_source_id, target.title_property, target.checkbox_property,
+             unchecked_only, descending, page_size, start_cursor),
+            self._query_database_records, target, unchecked_only, descending, page_size, start_cursor
+        )
+
+    def _query_database_records(self, target: InboxTarget, unchecked_only: bool, descending: bool,
+                                page_size: int, start_cursor: Optional[str]) -> Tuple[List[BlockRecord], Optional[str]]:
+        params = {
+            "sorts": [{
+                "timestamp": "created_time",
+                "direction": "descending" if descending else "ascending",
+            }],
+            "page_size": page_size,
+        }
+        if unchecked_only:
+            params["filter"] = {"property": target.checkbox_property, "checkbox": {"equals": False}}
+        if start_cursor:
+            params["start_cursor"] = start_cursor
+
+        response = self.client.data_sources.query(target.data_source_id, **params)
+        records = [
+            decode_database_item(page, target.title_property, target.checkbox_property)
+            for page in response.get('results', [])
+        ]
+        next_cursor = response.get('next_cursor') if response.get('has_more') else None
+        return records, next_cursor
+
+    def list_unchecked(self, target: InboxTarget) -> List[BlockRecord]:
+        """Получить все невыполненные заметки.
+
+        Для базы данных фильтр выполняется на стороне Notion, поэтому
+        стоимость запроса пропорциональна числу невыполненных заметок.
+        """
+        if not target.is_database:
+            records = self.list_all_block_records(target.id)
+            return [r for r in records if r.type == 'to_do' and not r.checked and r.text]
+
+        records: List[BlockRecord] = []
+        cursor = None
+        while True:
+            page, cursor = self.query_database_records(target, unchecked_only=True, start_cursor=cursor)
+            records.extend(r for r in page if r.text)
+            if not cursor:
+                return records
+
+    def list_all_notes(self, target: InboxTarget) -> List[BlockRecord]:
+        """Получить все заметки с текстом (для полной синхронизации индекса поиска)."""
+        if not target.is_database:
+            return [r for r in self.list_all_block_records(target.id) if r.text]
+
+        records: List[BlockRecord] = []
+        cursor = None
+        while True:
+            page, cursor = self.query_database_records(target, start_cursor=cursor)
+            records.extend(r for r in page if r.text)
+            if not cursor:
+                return records
+
+    def get_last_edited_time(self, target: InboxTarget) -> Optional[str]:
+        """Получить время последнего изменения страницы или источника данных."""
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        if target.is_database:
+            response = self._shared_read(
+                'data_sources.retrieve', (target.data_source_id,),
+                self.client.data_sources.retrieve, target.data_source_id
+            )
+        else:
+            response = self._shared_read('pages.retrieve', (target.id,), self.client.pages.retrieve, target.id)
+        return response.get('last_edited_time')
+
+    def get_target_content(self, target: InboxTarget, limit: int = 20) -> list:
+        """Получить последние N заметок страницы или базы данных (см. get_page_content)."""
+        if not target.is_database:
+            return self.get_page_content(target.id, limit)
+
+        try:
+            records, _ = self.query_database_records(target, descending=True, page_size=limit)
+            return [(record.text, record.checked) for record in reversed(records) if record.text]
         except Exception as e:
-            logger.error(f"Ошибка при добавлении контента: {e}")
-            error_msg = str(e)
-            
-            # Более понятные сообщения об ошибках
-            if "unauthorized" in error_msg.lower() or "401" in error_msg:
-                raise Exception("Ошибка авторизации. Проверьте токен.")
-            elif "not found" in error_msg.lower() or "404" in error_msg:
-                raise Exception("Страница не найдена. Проверьте ID страницы.")
-            elif "permission" in error_msg.lower() or "403" in error_msg:
-                raise Exception("Нет доступа к странице. Убедитесь, что интеграция добавлена на страницу.")
-            else:
-                raise Exception(f"Ошибка при записи в Notion: {error_msg}")
+            logger.error(f"Ошибка при получении содержимого: {e}")
+            raise
+
+    def list_target_page(self, target: InboxTarget, start_cursor: Union[str, TailCursor, None] = None,
+                         page_size: int = 20) -> Tuple[List[BlockRecord], Union[str, TailCursor, None]]:
+        """
+        Получить одну порцию заметок для постраничного /list.
+
+        И блоки страницы, и записи базы данных идут от новых к старым. Для
+        страницы курсор — TailCursor (см. его описание).
+
+        Returns:
+            tuple: (записи, курсор следующей порции или None)
+        """
+        if target.is_database:
+            return self.query_database_records(
+                target, descending=True, page_size=page_size, start_cursor=start_cursor
+            )
+        page_size = min(page_size, BLOCK_LIST_CHUNK_SIZE)
+        if start_cursor is None:
+            chunk_cursors, total, tail = self._scan_block_chunks(target.id)
+            end = total
+            records = tail[max(0, len(tail) - page_size):]
+        else:
+            chunk_cursors, end = start_cursor
+            records = self._read_block_range(target.id, chunk_cursors, max(0, end - page_size), end)
+        start = end - len(records)
+        next_cursor = TailCursor(chunk_cursors, start) if start > 0 else None
+        return list(reversed(records)), next_cursor
+
+    def _scan_block_chunks(self, block_id: str) -> Tuple[Tuple[Optional[str], ...], int, List[BlockRecord]]:
+        """
+        Пройти дочерние блоки порциями и запомнить курсор начала каждой порции.
+
+        Returns:
+            tuple: (курсоры порций, число блоков, записи двух последних порций)
+        """
+        chunk_cursors, tail, cursor = [], [], None
+        while True:
+            records, next_cursor = self.list_block_records(
+                block_id, start_cursor=cursor, page_size=BLOCK_LIST_CHUNK_SIZE
+            )
+            chunk_cursors.append(cursor)
+            tail = tail[-BLOCK_LIST_CHUNK_SIZE:] + records
+            if not next_cursor:
+                break
+            cursor = next_cursor
+        total = BLOCK_LIST_CHUNK_SIZE * (len(chunk_cursors) - 1) + len(records)
+        return tuple(chunk_cursors), total, tail
+
+    def _read_block_range(self, block_id: str, chunk_cursors: Tuple[Optional[str], ...],
+                          start: int, end: int) -> List[BlockRecord]:
+        """Прочитать блоки с номерами [start, end) по курсорам порций."""
+        first = start // BLOCK_LIST_CHUNK_SIZE
+        records = []
+        for index in range(first, (end - 1) // BLOCK_LIST_CHUNK_SIZE + 1):
+            chunk, _ = self.list_block_records(
+                block_id, start_cursor=chunk_cursors[index], page_size=BLOCK_LIST_CHUNK_SIZE
+            )
+            records.extend(chunk)
+        offset = first * BLOCK_LIST_CHUNK_SIZE
+        return records[start - offset:end - offset]
+
+    def replace_note_blocks(self, page_id: str, block_ids: List[str], content: str,
+                            per_line: bool = False) -> List[str]:
+        """
+        Привести блоки заметки на странице к новому тексту.
+
+        Совпадающие по порядку блоки обновляются на месте (отметки сохраняются),
+        лишние удаляются, недостающие добавляются сразу после последнего блока
+        заметки одним запросом.
+
+        Returns:
+            list: ID блоков заметки после изменения
+        """
+        self._forget_reads()
+        texts = note_texts(content, per_line)
+        kept = []
+        for block_id, text in zip(block_ids, texts):
+            self.update_block_text(block_id, text)
+            kept.append(block_id)
+        for block_id in block_ids[len(texts):]:
+            self.delete_block(block_id)
+
+        return kept + self.append_note_blocks(page_id, texts[len(kept):], kept[-1] if kept else None)
+
+    def append_note_blocks(self, page_id: str, texts: List[str], after: Optional[str] = None) -> List[str]:
+        """
+        Добавить чекбоксы с текстами сразу после блока after (или в конец страницы).
+
+        Returns:
+            list: ID созданных блоков по порядку
+        """
+        self._forget_reads()
+        added = [todo_block(text) for text in texts]
+        block_ids = []
+        for start in range(0, len(added), MAX_CHILDREN_PER_REQUEST):
+            params = {"children": added[start:start + MAX_CHILDREN_PER_REQUEST]}
+            if after:
+                params["after"] = after
+            response = self.client.blocks.children.append(page_id, **params)
+            block_ids.extend(block['id'] for block in response['results'])
+            after = block_ids[-1]
+        return block_ids
+
+    def update_block_text(self, block_id: str, content: str):
+        """Заменить текст блока-чекбокса."""
+        self._forget_reads()
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        try:
+            self.client.blocks.update(block_id, to_do={"rich_text": self._text_rich_text(content)})
+            logger.info("Блок %s обновлён", block_id, extra={'event': 'notion.update', 'note_id': block_id})
+        except NotionError as e:
+            logger.error(f"Ошибка при обновлении блока: {e}")
+            raise
+
+    def find_block_by_text(self, page_id: str, content: str, exclude: set) -> Optional[str]:
+        """
+        Найти на странице последний чекбокс с заданным текстом.
+
+        Используется после обрыва записи, чтобы узнать, создан ли блок.
+
+        Args:
+            exclude: ID блоков, которые уже привязаны к другим сообщениям
+        """
+        records = self.list_all_block_records(page_id)
+        for record in reversed(records):
+            if record.type == 'to_do' and record.text == content and record.id not in exclude:
+                return record.id
+        return None
+
+    @staticmethod
+    def _text_rich_text(content: str) -> list:
+        """Собрать rich_text из простого текста (сегментами до 2000 символов)."""
+        return rich_text(content)
+
+    def list_block_records(self, block_id: str, start_cursor: Optional[str] = None,
+                           page_size: int = 100) -> Tuple[List[BlockRecord], Optional[str]]:
+        """
+        Получить одну страницу дочерних блоков в виде компактных записей.
+
+        Ответ разбирается из сырых байтов напрямую в BlockRecord, минуя
+        полный словарь ответа notion_client.
+
+        Returns:
+            tuple: (записи блоков, курсор следующей страницы или None)
+        """
+        if not self.client:
+            raise ValueError("Токен не установлен")
+
+        return self._shared_read(
+            'blocks.children.list', (block_id, start_cursor, page_size),
+            self._fetch_block_records, block_id, start_cursor, page_size
+        )
+
+    def _fetch_block_records(self, block_id: str, start_cursor: Optional[str],
+                             page_size: int) -> Tuple[List[BlockRecord], Optional[str]]:
+        params = {"page_size": page_size}
+        if start_cursor:
+            params["start_cursor"] = start_cursor
+        path = f"blocks/{block_id}/children"
+        return self.policy.call(
+            lambda: self._get_block_list(path, params), endpoint_name('GET', path), idempotent=True
+        )
+
+    def _get_block_list(self, path: str, params: dict) -> Tuple[List[BlockRecord], Optional[str]]:
+        return decode_block_list(self.client.get_raw(path, params))
+
+    def list_all_block_records(self, block_id: str) -> List[BlockRecord]:
+        """Получить все дочерние блоки страницы в виде компактных записей."""
+        records: List[BlockRecord] = []
+        cursor = None
+        while True:
+            page, cursor = self.list_block_records(block_id, start_cursor=cursor)
+            records.extend(page)
+            if not cursor:
+                return records
 
     def get_page_content(self, page_id: str, limit: int = 20) -> list:
         """
@@ -215,32 +1062,10 @@ class NotionClient:
             list: Список кортежей (text, is_checked)
                   is_checked: True/False для to_do, None для paragraph
         """
-        if not self.client:
-            raise ValueError("Токен не установлен")
-
         try:
-            # Получаем блоки
-            blocks = self.client.blocks.children.list(page_id)
-            results = blocks.get('results', [])
-
-            notes = []
-            for block in results:
-                block_type = block.get('type')
-
-                if block_type == 'to_do':
-                    # Чекбокс
-                    todo_data = block.get('to_do', {})
-                    text = self._extract_text_from_rich_text(todo_data.get('rich_text', []))
-                    checked = todo_data.get('checked', False)
-                    if text:  # Пропускаем пустые
-                        notes.append((text, checked))
-
-                elif block_type == 'paragraph':
-                    # Обычный текст
-                    para_data = block.get('paragraph', {})
-                    text = self._extract_text_from_rich_text(para_data.get('rich_text', []))
-                    if text:
-                        notes.append((text, None))
+            records = self.list_all_block_records(page_id)
+            # Пропускаем пустые
+            notes = [(record.text, record.checked) for record in records if record.text]
 
             # Берём последние N записей
             return notes[-limit:] if len(notes) > limit else notes
@@ -248,11 +1073,3 @@ class NotionClient:
         except Exception as e:
             logger.error(f"Ошибка при получении содержимого: {e}")
             raise
-
-    def _extract_text_from_rich_text(self, rich_text: list) -> str:
-        """Извлечь текст из rich_text массива."""
-        text_parts = []
-        for item in rich_text:
-            if item.get('type') == 'text':
-                text_parts.append(item.get('text', {}).get('content', ''))
-        return ''.join(text_parts)
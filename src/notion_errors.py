@@ -0,0 +1,132 @@
+"""
+Типизированные ошибки Notion API.
+
+Ошибки notion_client и httpx переводятся в иерархию NotionError с HTTP-статусом,
+кодом ошибки Notion, заголовком Retry-After и request_id. По типу видно,
+временная ли ошибка (стоит повторить), постоянная (токен, доступ, страница)
+и выполнил ли Notion запрос (после таймаута или 5xx — неизвестно).
+"""
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+from notion_client.errors import APIResponseError, HTTPResponseError, RequestTimeoutError
+
+
+class NotionError(Exception):
+    """Ошибка запроса к Notion."""
+
+    # Временная ошибка: запрос стоит повторить позже
+    transient = False
+    # Notion мог выполнить запрос, несмотря на ошибку
+    outcome_unknown = False
+
+    def __init__(self, message: str, status: Optional[int] = None, code: Optional[str] = None,
+                 retry_after: Optional[float] = None, request_id: Optional[str] = None):
+        """Инициализация ошибки."""
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.retry_after = retry_after
+        self.request_id = request_id
+
+
+class NotionAuthError(NotionError):
+    """Токен недействителен или интеграция удалена (401)."""
+
+
+class NotionPermissionError(NotionError):
+    """У интеграции нет доступа к объекту (403)."""
+
+
+class NotionNotFoundError(NotionError):
+    """Объект не найден или не расшарен интеграции (404)."""
+
+
+class NotionRequestError(NotionError):
+    """Запрос отклонён как некорректный (400 и прочие 4xx)."""
+
+
+class NotionConflictError(NotionError):
+    """Конфликт при записи, запрос не выполнен (409)."""
+
+    transient = True
+
+
+class NotionRateLimitError(NotionError):
+    """Превышен лимит запросов, запрос не выполнен (429)."""
+
+    transient = True
+
+
+class NotionServerError(NotionError):
+    """Ошибка или недоступность Notion (5xx)."""
+
+    transient = True
+    outcome_unknown = True
+
+
+class NotionTimeoutError(NotionError):
+    """Ответ не получен: таймаут или обрыв соединения."""
+
+    transient = True
+    outcome_unknown = True
+
+
+# Ошибки, после которых неизвестно, выполнил ли Notion запрос
+UNKNOWN_OUTCOME_ERRORS = (NotionServerError, NotionTimeoutError)
+
+_STATUS_ERRORS = {
+    401: NotionAuthError,
+    403: NotionPermissionError,
+    404: NotionNotFoundError,
+    409: NotionConflictError,
+    429: NotionRateLimitError,
+}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Заголовок Retry-After в секундах (число секунд или HTTP-дата)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max((moment - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def error_for_status(status: int) -> type:
+    """Класс ошибки для HTTP-статуса."""
+    if status in _STATUS_ERRORS:
+        return _STATUS_ERRORS[status]
+    if status >= 500:
+        return NotionServerError
+    return NotionRequestError
+
+
+def translate_error(error: BaseException) -> BaseException:
+    """Перевести ошибку notion_client/httpx в NotionError; прочие ошибки вернуть как есть."""
+    if isinstance(error, NotionError):
+        return error
+    if isinstance(error, HTTPResponseError):
+        api_error = isinstance(error, APIResponseError)
+        return error_for_status(error.status)(
+            str(error), status=error.status,
+            code=error.code if api_error else None,
+            retry_after=parse_retry_after(error.headers.get('retry-after')),
+            request_id=error.request_id if api_error else None,
+        )
+    if isinstance(error, (RequestTimeoutError, httpx.TimeoutException)):
+        return NotionTimeoutError("Notion не ответил вовремя")
+    if isinstance(error, httpx.TransportError):
+        return NotionTimeoutError(f"Соединение с Notion прервано: {error}")
+    return error
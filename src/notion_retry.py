@@ -0,0 +1,252 @@
+"""
+Повторы и хеджирование запросов к Notion.
+
+Каждый HTTP-запрос к Notion проходит через RequestPolicy:
+
+* ошибка переводится в NotionError (см. src/notion_errors.py);
+* временные ошибки повторяются с экспоненциальной задержкой и полным
+  джиттером, а если Notion прислал Retry-After — не раньше него.
+  Запросы, которые нельзя безопасно повторить (запись), повторяются только
+  после ошибок, при которых Notion точно ничего не выполнил (409, 429);
+  после таймаута или 5xx исход записи решает вызывающий код;
+* идемпотентные чтения можно хеджировать (NOTION_HEDGE_READS=1): если ответ
+  не пришёл за p95 задержки этого endpoint'а, параллельно уходит второй
+  такой же запрос, используется ответ, пришедший первым. Пул хеджирования
+  вдвое больше пула Notion (основной запрос и дубль на каждый поток), а
+  когда он всё же занят, чтение идёт без дубля, а не ждёт в его очереди.
+
+Задержки между попытками выполняются в потоке пула Notion, поэтому общее
+время ожидания ограничено NOTION_RETRY_MAX_DELAY на попытку; Retry-After
+длиннее этого лимита не ждём, а сразу отдаём ошибку вызывающему.
+"""
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional
+
+from src.executors import NOTION_EXECUTOR_WORKERS
+from src.notion_errors import NotionError, translate_error
+
+logger = logging.getLogger(__name__)
+
+NOTION_RETRY_ATTEMPTS = int(os.getenv('NOTION_RETRY_ATTEMPTS', '3'))
+NOTION_RETRY_BASE_DELAY = float(os.getenv('NOTION_RETRY_BASE_DELAY', '0.5'))
+NOTION_RETRY_MAX_DELAY = float(os.getenv('NOTION_RETRY_MAX_DELAY', '8'))
+
+NOTION_HEDGE_READS = os.getenv('NOTION_HEDGE_READS', '').lower() in ('true', '1', 'yes')
+# Перцентиль задержки, после которого отправляется дублирующий запрос
+NOTION_HEDGE_PERCENTILE = float(os.getenv('NOTION_HEDGE_PERCENTILE', '0.95'))
+NOTION_HEDGE_MIN_DELAY = float(os.getenv('NOTION_HEDGE_MIN_DELAY', '0.05'))
+# Одновременных запросов в пуле хеджирования: основной и дублирующий на каждый поток пула Notion
+NOTION_HEDGE_WORKERS = int(os.getenv('NOTION_HEDGE_WORKERS', str(2 * NOTION_EXECUTOR_WORKERS)))
+# Сколько замеров нужно, прежде чем доверять перцентилю
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# ID объектов Notion в пути запроса (с дефисами и без)
+_ID_RE = re.compile(r'[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}')
+
+
+def endpoint_name(method: str, path: str) -> str:
+    """Имя endpoint'а без ID объектов: «GET blocks/*/children»."""
+    return f"{method.upper()} {_ID_RE.sub('*', path.strip('/'))}"
+
+
+def is_idempotent(method: str, path: str) -> bool:
+    """Можно ли безопасно повторить запрос: чтения, в том числе POST-запросы поиска."""
+    method = method.upper()
+    path = path.rstrip('/')
+    return method == 'GET' or (method == 'POST' and (path.endswith('/query') or path == 'search'))
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов по endpoint'ам."""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        """Инициализация трекера."""
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float):
+        """Учесть задержку запроса."""
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, endpoint: str, q: float) -> Optional[float]:
+        """Перцентиль задержки или None, если замеров мало."""
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class RequestPolicy:
+    """Повторы временных ошибок и хеджирование чтений."""
+
+    def __init__(self, attempts: int = NOTION_RETRY_ATTEMPTS, base_delay: float = NOTION_RETRY_BASE_DELAY,
+                 max_delay: float = NOTION_RETRY_MAX_DELAY, hedge: bool = NOTION_HEDGE_READS,
+                 hedge_percentile: float = NOTION_HEDGE_PERCENTILE, hedge_min_delay: float = NOTION_HEDGE_MIN_DELAY,
+                 hedge_workers: int = NOTION_HEDGE_WORKERS, sleep: Callable[[float], None] = time.sleep):
+        """Инициализация политики."""
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_workers = hedge_workers
+        self.sleep = sleep
+        self.latencies = LatencyTracker()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        # Запросов в пуле хеджирования (выполняющихся и ждущих потока)
+        self._hedge_inflight = 0
+        # Защищает пул, _hedge_inflight и счётчики: call() выполняется из всех потоков пула Notion
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.gave_up = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedge_skipped = 0
+
+    def backoff(self, attempt: int, error: NotionError) -> float:
+        """Задержка перед повтором: полный джиттер, но не раньше Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        return delay
+
+    @staticmethod
+    def should_retry(error: BaseException, idempotent: bool) -> bool:
+        """Повторять ли запрос после ошибки."""
+        if not isinstance(error, NotionError) or not error.transient:
+            return False
+        return idempotent or not error.outcome_unknown
+
+    def call(self, fn: Callable, endpoint: str, idempotent: bool):
+        """
+        Выполнить запрос с повторами.
+
+        Raises:
+            NotionError: последняя ошибка, если повторы не помогли
+        """
+        attempt = 0
+        while True:
+            try:
+                if idempotent and self.hedge:
+                    return self._hedged(fn, endpoint)
+                return self._timed(fn, endpoint)
+            except Exception as e:
+                error = translate_error(e)
+                attempt += 1
+                if attempt >= self.attempts or not self.should_retry(error, idempotent):
+                    if error is e:
+                        raise
+                    raise error from e
+
+                delay = self.backoff(attempt - 1, error)
+                if delay > self.max_delay:
+                    # Notion просит подождать дольше, чем разумно держать поток
+                    with self._lock:
+                        self.gave_up += 1
+                    raise error from e
+                with self._lock:
+                    self.retries += 1
+                logger.warning(
+                    f"Notion {endpoint}: {type(error).__name__} ({error.status or 'нет ответа'}), "
+                    f"повтор {attempt} через {delay:.2f} с"
+                )
+                self.sleep(delay)
+
+    def _timed(self, fn: Callable, endpoint: str):
+        started = time.monotonic()
+        result = fn()
+        self.latencies.record(endpoint, time.monotonic() - started)
+        return result
+
+    def _hedged(self, fn: Callable, endpoint: str):
+        """Выполнить чтение и продублировать его, если ответ задерживается дольше p95."""
+        threshold = self.latencies.percentile(endpoint, self.hedge_percentile)
+        if threshold is None:
+            return self._timed(fn, endpoint)
+
+        # Место сразу на основной запрос и дубль: иначе дубль встал бы в очередь пула
+        # и только добавил бы задержку
+        if not self._reserve_hedge_slots(2):
+            with self._lock:
+                self.hedge_skipped += 1
+            return self._timed(fn, endpoint)
+
+        primary = self._submit_hedge(fn, endpoint)
+        done, _ = wait([primary], timeout=max(threshold, self.hedge_min_delay))
+        if done:
+            self._release_hedge_slot()
+            return primary.result()
+
+        with self._lock:
+            self.hedged += 1
+        backup = self._submit_hedge(fn, endpoint)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    # Проигравший запрос досчитается в фоне, его результат не нужен
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _reserve_hedge_slots(self, count: int) -> bool:
+        """Занять места в пуле хеджирования, если свободных потоков хватает."""
+        with self._lock:
+            if self._hedge_inflight + count > self.hedge_workers:
+                return False
+            self._hedge_inflight += count
+            return True
+
+    def _release_hedge_slot(self, _future=None):
+        with self._lock:
+            self._hedge_inflight -= 1
+
+    def _submit_hedge(self, fn: Callable, endpoint: str):
+        """Запустить запрос в пуле хеджирования; место освобождается, когда запрос завершится."""
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=self.hedge_workers, thread_name_prefix='notion-hedge'
+                )
+            pool = self._hedge_pool
+        future = pool.submit(self._timed, fn, endpoint)
+        future.add_done_callback(self._release_hedge_slot)
+        return future
+
+    def format_stats(self) -> str:
+        """Статистика повторов и хеджирования для логов."""
+        return (
+            f"Повторы Notion: {self.retries}, отказов по Retry-After {self.gave_up}, "
+            f"хеджированных чтений {self.hedged} (дубль быстрее: {self.hedge_wins}, "
+            f"без дубля из-за занятого пула: {self.hedge_skipped})"
+        )
+
+    def shutdown(self):
+        """Остановить пул хеджирования."""
+        with self._lock:
+            if self._hedge_pool is not None:
+                self._hedge_pool.shutdown(wait=False, cancel_futures=True)
+                self._hedge_pool = None
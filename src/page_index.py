@@ -0,0 +1,218 @@
+"""
+Индекс названий страниц рабочего пространства Notion.
+
+Для каждого токена в фоне строится индекс (id, название) всех доступных
+интеграции страниц: `search` проходится постранично один раз после проверки
+токена. Поиск по индексу не ходит в сеть и поддерживает точное совпадение,
+совпадение по префиксу и нечёткое сравнение. Индекс живёт ограниченное время
+(TTL) и ограничен по числу страниц и числу токенов.
+"""
+
+import difflib
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Время жизни индекса в секундах, после которого он перестраивается в фоне
+PAGE_INDEX_TTL = int(os.getenv('PAGE_INDEX_TTL', '900'))
+# Максимум страниц в индексе одного токена
+PAGE_INDEX_MAX_PAGES = int(os.getenv('PAGE_INDEX_MAX_PAGES', '5000'))
+# Максимум одновременно хранимых индексов (вытесняются самые давние)
+PAGE_INDEX_MAX_TOKENS = int(os.getenv('PAGE_INDEX_MAX_TOKENS', '200'))
+
+# Минимальная похожесть для нечёткого совпадения
+FUZZY_CUTOFF = 0.6
+
+# Веса типов совпадений
+MATCH_EXACT = 3
+MATCH_PREFIX = 2
+MATCH_SUBSTRING = 1
+MATCH_FUZZY = 0
+
+
+def normalize_title(title: str) -> str:
+    """Нормализовать название для сравнения."""
+    return ' '.join(title.casefold().split())
+
+
+def rank_titles(query: str, pages: Iterable[Tuple[str, str]], limit: int = 5) -> List[Tuple[str, str]]:
+    """
+    Отранжировать страницы по соответствию запросу.
+
+    Args:
+        query: Строка поиска
+        pages: Пары (page_id, title)
+        limit: Сколько лучших кандидатов вернуть
+
+    Returns:
+        list: Пары (page_id, title), лучшие первыми
+    """
+    needle = normalize_title(query)
+    if not needle:
+        return []
+
+    scored = []
+    for page_id, title in pages:
+        candidate = normalize_title(title)
+        if candidate == needle:
+            kind, ratio = MATCH_EXACT, 1.0
+        elif candidate.startswith(needle):
+            kind, ratio = MATCH_PREFIX, len(needle) / len(candidate)
+        elif needle in candidate:
+            kind, ratio = MATCH_SUBSTRING, len(needle) / len(candidate)
+        else:
+            matcher = difflib.SequenceMatcher(None, needle, candidate)
+            # Дешёвые верхние оценки отсекают заведомо непохожие названия
+            if matcher.real_quick_ratio() < FUZZY_CUTOFF or matcher.quick_ratio() < FUZZY_CUTOFF:
+                continue
+            ratio = matcher.ratio()
+            if ratio < FUZZY_CUTOFF:
+                continue
+            kind = MATCH_FUZZY
+        scored.append((kind, ratio, -len(candidate), page_id, title))
+
+    scored.sort(reverse=True)
+    return [(page_id, title) for _, _, _, page_id, title in scored[:limit]]
+
+
+def has_close_match(query: str, candidates: Iterable[Tuple[str, str]]) -> bool:
+    """Есть ли среди кандидатов точное или префиксное совпадение с запросом."""
+    needle = normalize_title(query)
+    return bool(needle) and any(normalize_title(title).startswith(needle) for _, title in candidates)
+
+
+class _TokenIndex:
+    """Индекс страниц одного токена."""
+
+    __slots__ = ('pages', 'built_at', 'building', 'truncated')
+
+    def __init__(self):
+        self.pages: List[Tuple[str, str]] = []
+        self.built_at: Optional[float] = None
+        self.building = False
+        self.truncated = False
+
+
+class PageIndex:
+    """Потокобезопасный кэш индексов страниц по токенам."""
+
+    def __init__(
+        self,
+        ttl: int = PAGE_INDEX_TTL,
+        max_pages: int = PAGE_INDEX_MAX_PAGES,
+        max_tokens: int = PAGE_INDEX_MAX_TOKENS,
+    ):
+        """Инициализация индекса."""
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.max_tokens = max_tokens
+        self._indexes: 'OrderedDict[str, _TokenIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        """Ключ индекса: хэш токена, чтобы не хранить сам токен."""
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _get(self, token: str) -> Optional[_TokenIndex]:
+        key = self._key(token)
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+        return index
+
+    def is_ready(self, token: str) -> bool:
+        """Построен ли индекс для токена (пусть даже устаревший)."""
+        with self._lock:
+            index = self._get(token)
+            return index is not None and index.built_at is not None
+
+    def is_truncated(self, token: str) -> bool:
+        """Обрезан ли индекс токена по лимиту PAGE_INDEX_MAX_PAGES."""
+        with self._lock:
+            index = self._get(token)
+            return index is not None and index.truncated
+
+    def needs_build(self, token: str) -> bool:
+        """Нужно ли (пере)строить индекс: его нет или истёк TTL."""
+        with self._lock:
+            index = self._get(token)
+            if index is None:
+                return True
+            if index.building:
+                return False
+            return index.built_at is None or time.monotonic() - index.built_at > self.ttl
+
+    def build(self, token: str, loader: Callable[[int], Iterable[Tuple[str, str]]]):
+        """
+        Построить индекс для токена.
+
+        Args:
+            token: Токен Notion
+            loader: Функция, принимающая лимит страниц и возвращающая пары
+                    (page_id, title) — например, NotionClient.iter_pages
+        """
+        key = self._key(token)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = _TokenIndex()
+                self._indexes[key] = index
+                while len(self._indexes) > self.max_tokens:
+                    self._indexes.popitem(last=False)
+            elif index.building:
+                return
+            index.building = True
+
+        started = time.monotonic()
+        pages: List[Tuple[str, str]] = []
+        try:
+            for page in loader(self.max_pages + 1):
+                pages.append(page)
+                if len(pages) > self.max_pages:
+                    break
+        except Exception as e:
+            logger.error(f"Ошибка при построении индекса страниц: {e}")
+            with self._lock:
+                index.building = False
+            return
+
+        with self._lock:
+            index.truncated = len(pages) > self.max_pages
+            index.pages = pages[:self.max_pages]
+            index.built_at = time.monotonic()
+            index.building = False
+
+        logger.info(
+            f"Индекс страниц построен: {len(index.pages)} страниц "
+            f"за {time.monotonic() - started:.2f} с"
+            + (" (обрезан по лимиту)" if index.truncated else "")
+        )
+
+    def search(self, token: str, query: str, limit: int = 5) -> List[Tuple[str, str]]:
+        """Найти лучшие страницы по названию в индексе токена."""
+        with self._lock:
+            index = self._get(token)
+            pages = index.pages if index is not None else []
+        return rank_titles(query, pages, limit)
+
+    def get_title(self, token: str, page_id: str) -> Optional[str]:
+        """Получить название страницы из индекса."""
+        with self._lock:
+            index = self._get(token)
+            pages = index.pages if index is not None else []
+        for candidate_id, title in pages:
+            if candidate_id == page_id:
+                return title
+        return None
+
+    def invalidate(self, token: str):
+        """Удалить индекс токена."""
+        with self._lock:
+            self._indexes.pop(self._key(token), None)
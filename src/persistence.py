@@ -0,0 +1,186 @@
+"""
+Хранение состояния диалогов и user_data бота в SQLite.
+
+В отличие от PicklePersistence, которая переписывает весь файл, сюда
+пишутся только изменившиеся ключи: каждая запись user_data — отдельная
+строка (user_id, key), каждый диалог — строка (name, key). Все изменения
+одного прогона Application.update_persistence собираются в одну транзакцию.
+Диалоги, не менявшиеся дольше CONVERSATION_TTL, не восстанавливаются и
+периодически удаляются.
+
+bot_data, chat_data и callback_data не сохраняются: в bot_data лежат
+живые объекты (менеджер уведомлений), chat_data бот не использует.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from src.database import Database
+from src.executors import run_db
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд без изменений диалог считается брошенным
+CONVERSATION_TTL = int(os.getenv('CONVERSATION_TTL', '3600'))
+# Как часто Application сбрасывает изменения в хранилище, секунд
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', '5'))
+
+_MISSING = object()
+
+
+class SQLitePersistence(BasePersistence):
+    """BasePersistence поверх базы бота с поключевой записью."""
+
+    def __init__(self, db: Database, conversation_ttl: int = CONVERSATION_TTL,
+                 update_interval: float = PERSISTENCE_UPDATE_INTERVAL):
+        """Инициализация хранилища."""
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        self.conversation_ttl = conversation_ttl
+        # Последнее записанное содержимое user_data — для вычисления изменений
+        self._user_data: Dict[int, dict] = {}
+        self._user_upserts: Dict[Tuple[int, str], str] = {}
+        self._user_deletes: set = set()
+        self._dropped_users: set = set()
+        self._conversation_writes: Dict[Tuple[str, str], Optional[str]] = {}
+        self._commit: Optional[asyncio.Task] = None
+        self._last_purge = time.time()
+        self.batches = 0
+        self.rows_written = 0
+
+    # user_data
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        """Загрузить user_data всех пользователей при старте."""
+        rows = await run_db(self.db.load_persisted_user_data)
+        self._user_data = {
+            user_id: {key: json.loads(value) for key, value in values.items()}
+            for user_id, values in rows.items()
+        }
+        # Копия: изменения живых user_data не должны попадать в снимок
+        return copy.deepcopy(self._user_data)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        """Записать только изменившиеся и удалённые ключи user_data."""
+        previous = self._user_data.get(user_id, {})
+        for key, value in data.items():
+            if previous.get(key, _MISSING) != value:
+                self._user_deletes.discard((user_id, str(key)))
+                self._user_upserts[(user_id, str(key))] = json.dumps(value, ensure_ascii=False)
+        for key in previous.keys() - data.keys():
+            self._user_upserts.pop((user_id, str(key)), None)
+            self._user_deletes.add((user_id, str(key)))
+        self._user_data[user_id] = data
+        await self._schedule_commit()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._user_data.pop(user_id, None)
+        self._user_upserts = {k: v for k, v in self._user_upserts.items() if k[0] != user_id}
+        self._user_deletes = {k for k in self._user_deletes if k[0] != user_id}
+        self._dropped_users.add(user_id)
+        await self._schedule_commit()
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        # Единственный писатель — этот процесс, перечитывать нечего
+        pass
+
+    # Диалоги
+
+    async def get_conversations(self, name: str) -> dict:
+        """Загрузить незавершённые диалоги, не успевшие устареть."""
+        updated_after = time.time() - self.conversation_ttl
+        rows = await run_db(self.db.load_persisted_conversations, name, updated_after)
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows.items()}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        state = None if new_state is None else json.dumps(new_state)
+        self._conversation_writes[(name, json.dumps(list(key)))] = state
+        await self._schedule_commit()
+
+    # Не сохраняемые данные
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    # Запись
+
+    async def _schedule_commit(self):
+        """Дождаться общей транзакции, в которую попадут все изменения текущего прогона."""
+        if self._commit is None:
+            self._commit = asyncio.get_running_loop().create_task(self._commit_batch())
+        await asyncio.shield(self._commit)
+
+    async def _commit_batch(self):
+        # Даём остальным update_* этого прогона добавить свои изменения
+        await asyncio.sleep(0)
+        self._commit = None
+
+        user_upserts = [(user_id, key, value) for (user_id, key), value in self._user_upserts.items()]
+        user_deletes = list(self._user_deletes)
+        dropped_users = list(self._dropped_users)
+        conversation_upserts = []
+        conversation_deletes = []
+        now = time.time()
+        for (name, key), state in self._conversation_writes.items():
+            if state is None:
+                conversation_deletes.append((name, key))
+            else:
+                conversation_upserts.append((name, key, state, now))
+        self._user_upserts, self._user_deletes, self._dropped_users = {}, set(), set()
+        self._conversation_writes = {}
+
+        await run_db(
+            self.db.write_persistence_batch,
+            user_upserts, user_deletes, dropped_users, conversation_upserts, conversation_deletes
+        )
+        self.batches += 1
+        self.rows_written += (
+            len(user_upserts) + len(user_deletes) + len(dropped_users)
+            + len(conversation_upserts) + len(conversation_deletes)
+        )
+
+        if now - self._last_purge > min(self.conversation_ttl, 3600):
+            self._last_purge = now
+            purged = await run_db(self.db.purge_expired_conversations, now - self.conversation_ttl)
+            if purged:
+                logger.info(f"Удалено брошенных диалогов: {purged}")
+
+    async def flush(self) -> None:
+        """Дописать последнюю транзакцию при остановке бота."""
+        if self._commit is not None:
+            await self._commit
+        logger.info(f"Состояние бота сохранено: транзакций {self.batches}, строк {self.rows_written}")
@@ -0,0 +1,170 @@
+"""
+Локальный полнотекстовый поиск по заметкам инбокса (/find).
+
+Текст заметок хранится в SQLite в таблице note_index с индексом FTS5
+(см. Database.migrate_add_note_index): поиск идёт по словам с префиксным
+совпадением, результаты упорядочены по bm25, без запросов к Notion.
+
+Индекс пополняется тем, что бот узнаёт сам: записанные и отредактированные
+заметки, подписи файлов, отметки «выполнено», порции /list и списки
+невыполненных для рассылки. Задачи, созданные или удалённые прямо в Notion,
+подтягивает полная синхронизация страницы: её делает архивация, а /find
+запускает её в фоне, если индекс страницы старше SEARCH_FULL_SYNC_HOURS.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.database import Database
+from src.executors import run_db, run_notion
+from src.notion_api import InboxTarget, NotionClient
+
+logger = logging.getLogger(__name__)
+
+FIND_RESULTS_LIMIT = int(os.getenv('FIND_RESULTS_LIMIT', '10'))
+# Через сколько часов индекс страницы считается устаревшим
+SEARCH_FULL_SYNC_HOURS = float(os.getenv('SEARCH_FULL_SYNC_HOURS', '24'))
+# Слов в запросе, больше — отбрасываются
+MAX_QUERY_TERMS = 8
+
+# Первое слово запроса, задающее фильтр по отметке
+CHECKED_FILTERS = {
+    'open': False, 'открытые': False, 'невыполненные': False,
+    'done': True, 'выполненные': True, 'готовые': True,
+}
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def search_terms(query: str) -> List[str]:
+    """Слова запроса в нижнем регистре."""
+    return _TERM_RE.findall(query.lower())[:MAX_QUERY_TERMS]
+
+
+def parse_find_args(args: List[str]) -> Tuple[Optional[bool], List[str]]:
+    """
+    Разобрать аргументы /find.
+
+    Returns:
+        tuple: (фильтр по отметке или None, слова запроса)
+    """
+    checked = None
+    if args and args[0].lower() in CHECKED_FILTERS:
+        checked = CHECKED_FILTERS[args[0].lower()]
+        args = args[1:]
+    return checked, search_terms(' '.join(args))
+
+
+async def index_note_texts(db: Database, page_id: str, block_ids: List[str], texts: List[str],
+                           keep_checked: bool = False):
+    """
+    Добавить в индекс заметку, записанную ботом (ошибки индекса не мешают записи).
+
+    Новые блоки индексируются невыполненными; с keep_checked у уже известных
+    блоков сохраняется отметка (при редактировании сообщения).
+    """
+    rows = [(block_id, text, False) for block_id, text in zip(block_ids, texts) if text]
+    await _safe(db.index_notes, page_id, rows, time.time(), keep_checked)
+
+
+async def index_records(db: Database, page_id: str, records: list):
+    """Обновить в индексе заметки, прочитанные из Notion."""
+    rows = [(record.id, record.text, record.checked) for record in records if record.text]
+    if rows:
+        await _safe(db.index_notes, page_id, rows, time.time())
+
+
+async def sync_records(db: Database, page_id: str, records: list, fetched_at: float):
+    """Заменить индекс страницы полным списком заметок (fetched_at — время начала чтения)."""
+    rows = [(record.id, record.text, record.checked) for record in records if record.text]
+    await _safe(db.sync_page_index, page_id, rows, fetched_at)
+
+
+async def set_checked(db: Database, block_ids: List[str], checked: bool):
+    """Обновить отметку заметок в индексе."""
+    await _safe(db.set_notes_checked, block_ids, checked)
+
+
+async def forget_notes(db: Database, block_ids: List[str]):
+    """Убрать из индекса удалённые или перенесённые заметки."""
+    if block_ids:
+        await _safe(db.delete_indexed_notes, block_ids)
+
+
+async def _safe(method, *args):
+    try:
+        await run_db(method, *args)
+    except Exception as e:
+        logger.error(f"Ошибка обновления индекса поиска: {e}")
+
+
+class NoteSearch:
+    """Поиск по индексу и фоновая полная синхронизация страниц."""
+
+    def __init__(self, db: Database, full_sync_hours: float = SEARCH_FULL_SYNC_HOURS):
+        """Инициализация поиска."""
+        self.db = db
+        self.full_sync_seconds = full_sync_hours * 3600
+        # page_id -> задача полной синхронизации (одна на страницу)
+        self._syncing: Dict[str, asyncio.Task] = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.syncs = 0
+
+    async def find(self, page_id: str, terms: List[str], checked: Optional[bool] = None,
+                   limit: int = FIND_RESULTS_LIMIT) -> List[dict]:
+        """Найти заметки страницы в локальном индексе."""
+        started = time.perf_counter()
+        results = await run_db(self.db.search_notes, page_id, terms, checked, limit)
+        self.queries += 1
+        self.query_seconds += time.perf_counter() - started
+        return results
+
+    async def ensure_fresh(self, token: str, target: InboxTarget) -> bool:
+        """
+        Запустить фоновую синхронизацию, если индекс страницы устарел.
+
+        Returns:
+            bool: True, если страница ещё ни разу не синхронизировалась
+            (результаты могут быть неполными)
+        """
+        synced_at = await run_db(self.db.get_index_synced_at, target.id)
+        if synced_at is not None and time.time() - synced_at < self.full_sync_seconds:
+            return False
+        if target.id not in self._syncing:
+            task = asyncio.get_running_loop().create_task(self.sync(token, target))
+            self._syncing[target.id] = task
+            task.add_done_callback(lambda _: self._syncing.pop(target.id, None))
+        return synced_at is None
+
+    async def sync(self, token: str, target: InboxTarget):
+        """Прочитать все заметки из Notion и заменить ими индекс страницы."""
+        fetched_at = time.time()
+        try:
+            records = await run_notion(NotionClient.for_token(token).list_all_notes, target)
+        except Exception as e:
+            logger.error(f"Не удалось синхронизировать индекс поиска страницы {target.id}: {e}")
+            return
+        await sync_records(self.db, target.id, records, fetched_at)
+        self.syncs += 1
+        logger.info(f"Индекс поиска страницы {target.id} синхронизирован: заметок {len(records)}")
+
+    def format_stats(self) -> str:
+        """Статистика поиска для логов."""
+        average_ms = self.query_seconds / self.queries * 1000 if self.queries else 0.0
+        return (
+            f"Поиск: запросов {self.queries}, в среднем {average_ms:.1f} мс, "
+            f"полных синхронизаций {self.syncs}"
+        )
+
+    async def stop(self):
+        """Прервать незавершённые синхронизации."""
+        tasks = list(self._syncing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._syncing.clear()
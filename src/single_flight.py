@@ -0,0 +1,105 @@
+"""
+Объединение одинаковых одновременных чтений из Notion (single-flight).
+
+Рассылка, /list и рассылки других пользователей с тем же токеном могут
+одновременно запросить одну и ту же порцию блоков страницы. Запросы с
+одинаковым ключом (токен, endpoint, параметры) объединяются: к Notion уходит
+один вызов, остальные ждут его и получают тот же результат или ту же ошибку.
+
+Дополнительно результат можно переиспользовать в течение короткого окна
+NOTION_READ_SHARE_WINDOW секунд после завершения (по умолчанию выключено).
+Запись через тот же токен увеличивает поколение токена: чтения, начатые до
+записи, больше не объединяются с новыми и не сохраняются в окно, поэтому
+пользователь сразу видит свои изменения.
+
+Вызовы выполняются в потоках пула Notion, поэтому объединение сделано на
+потоках: ожидающие блокируются на concurrent.futures.Future ведущего вызова.
+Общий результат нельзя изменять на месте.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Tuple
+
+# Сколько секунд отдавать готовый результат повторным чтениям (0 — только одновременные)
+NOTION_READ_SHARE_WINDOW = float(os.getenv('NOTION_READ_SHARE_WINDOW', '0'))
+# Сколько готовых результатов держать для окна
+NOTION_READ_SHARE_MAX = int(os.getenv('NOTION_READ_SHARE_MAX', '1000'))
+
+
+class SingleFlight:
+    """Объединение одновременных вызовов с одинаковым ключом."""
+
+    def __init__(self, window: float = NOTION_READ_SHARE_WINDOW, max_results: int = NOTION_READ_SHARE_MAX):
+        """Инициализация объединителя."""
+        self.window = window
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        # ключ -> (момент истечения, результат); первый элемент ключа — группа (токен)
+        self._recent: 'OrderedDict[Tuple, Tuple[float, object]]' = OrderedDict()
+        # группа -> число записей; идущие вызовы объединяются только в пределах поколения
+        self._generations: Dict[Hashable, int] = {}
+        self.calls = 0
+        self.shared = 0
+        self.reused = 0
+
+    def do(self, key: Tuple, fn: Callable, *args, **kwargs):
+        """Выполнить fn или дождаться уже идущего вызова с тем же ключом."""
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is not None:
+                if recent[0] > time.monotonic():
+                    self.reused += 1
+                    return recent[1]
+                del self._recent[key]
+
+            generation = self._generations.get(key[0], 0)
+            flight = (generation, key)
+            future = self._inflight.get(flight)
+            leader = future is None
+            if leader:
+                future = self._inflight[flight] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[flight]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[flight]
+            # Результат чтения, начатого до записи, в окно не попадает
+            if self.window > 0 and self._generations.get(key[0], 0) == generation:
+                self._recent[key] = (time.monotonic() + self.window, result)
+                while len(self._recent) > self.max_results:
+                    self._recent.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def forget(self, group: Hashable):
+        """Начать новое поколение группы и сбросить её готовые результаты (при записи через токен)."""
+        with self._lock:
+            self._generations[group] = self._generations.get(group, 0) + 1
+            for key in [key for key in self._recent if key[0] == group]:
+                del self._recent[key]
+
+    def format_stats(self) -> str:
+        """Статистика объединения для логов."""
+        total = self.calls + self.shared + self.reused
+        saved = (self.shared + self.reused) / total if total else 0.0
+        return (
+            f"Чтения Notion: выполнено {self.calls}, объединено с идущими {self.shared}, "
+            f"из окна {self.reused}, сэкономлено {saved:.0%}"
+        )
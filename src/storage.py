@@ -0,0 +1,440 @@
+"""
+Хранилище пользователей: конфигурация, настройки уведомлений, версии.
+
+UserStore — асинхронный интерфейс с тремя реализациями:
+  * sqlite   — локальный файл через Database (по умолчанию);
+  * memory   — словарь в памяти процесса (тесты, одноразовые запуски);
+  * postgres — серверная база через пул соединений asyncpg.
+
+Реализация выбирается переменной STORAGE_BACKEND, адрес серверной базы —
+DATABASE_URL. В PostgreSQL переносится только конфигурация пользователей;
+диалоги, привязки сообщений, индекс поиска, очереди заметок и рассылок,
+состояние рассылок и архивации по-прежнему хранятся в локальном SQLite.
+Поэтому бот с любым хранилищем запускается в одном экземпляре: вторая
+реплика разделила бы это состояние.
+"""
+
+import copy
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from src.database import Database
+from src.executors import run_db
+
+logger = logging.getLogger(__name__)
+
+STORAGE_SQLITE = 'sqlite'
+STORAGE_MEMORY = 'memory'
+STORAGE_POSTGRES = 'postgres'
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', STORAGE_SQLITE)
+DATABASE_URL = os.getenv('DATABASE_URL')
+STORAGE_POOL_MIN_SIZE = int(os.getenv('STORAGE_POOL_MIN_SIZE', '2'))
+STORAGE_POOL_MAX_SIZE = int(os.getenv('STORAGE_POOL_MAX_SIZE', '10'))
+
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    asyncpg = None
+    ASYNCPG_AVAILABLE = False
+
+DEFAULT_NOTIFICATION_DAYS = '1,2,3,4,5'
+DEFAULT_VERSION = '0.0.0'
+
+
+class UserStore(ABC):
+    """Асинхронный интерфейс хранилища пользователей."""
+
+    async def init(self):
+        """Подготовить хранилище (соединения, схема)."""
+
+    async def close(self):
+        """Освободить ресурсы хранилища."""
+
+    @abstractmethod
+    async def get_user_config(self, user_id: int) -> dict:
+        """Получить конфигурацию пользователя ({} если пользователя нет)."""
+
+    @abstractmethod
+    async def save_notion_token(self, user_id: int, token: str):
+        """Сохранить токен Notion (создаёт пользователя, снимает приостановку)."""
+
+    @abstractmethod
+    async def save_page_config(self, user_id: int, page_id: str, page_name: str, target_type: str = 'page',
+                               data_source_id: str = None, title_property: str = None,
+                               checkbox_property: str = None):
+        """Сохранить страницу или базу данных инбокса (снимает приостановку)."""
+
+    @abstractmethod
+    async def reset_user_config(self, user_id: int):
+        """Удалить пользователя."""
+
+    @abstractmethod
+    async def save_notification_settings(self, user_id: int, enabled: bool, time: str, days: str,
+                                         timezone_offset: int = None):
+        """Сохранить настройки уведомлений существующего пользователя."""
+
+    @abstractmethod
+    async def get_notification_settings(self, user_id: int) -> dict:
+        """Получить настройки уведомлений ({} если пользователя нет)."""
+
+    @abstractmethod
+    async def get_user_version(self, user_id: int) -> str:
+        """Получить последнюю просмотренную версию ('0.0.0' по умолчанию)."""
+
+    @abstractmethod
+    async def set_user_version(self, user_id: int, version: str):
+        """Установить версию существующему пользователю."""
+
+    @abstractmethod
+    async def get_users_with_notifications(self) -> list:
+        """Получить неприостановленных пользователей с включенными уведомлениями."""
+
+    @abstractmethod
+    async def suspend_users(self, reason: str, user_id: int = None, notion_token: str = None,
+                            page_id: str = None) -> list:
+        """Приостановить пользователей по ID, токену и (или) странице (условия через И); вернуть их ID."""
+
+    @abstractmethod
+    async def get_users_by_notion_ids(self, notion_ids: list) -> list:
+        """Получить ID пользователей, чей инбокс (страница, база или источник данных) среди notion_ids."""
+
+
+class SQLiteUserStore(UserStore):
+    """Хранилище в локальном SQLite (вызовы Database в пуле SQLite)."""
+
+    def __init__(self, db: Database):
+        """Инициализация хранилища."""
+        self.db = db
+
+    async def get_user_config(self, user_id: int) -> dict:
+        return await run_db(self.db.get_user_config, user_id)
+
+    async def save_notion_token(self, user_id: int, token: str):
+        await run_db(self.db.save_notion_token, user_id, token)
+
+    async def save_page_config(self, user_id: int, page_id: str, page_name: str, target_type: str = 'page',
+                               data_source_id: str = None, title_property: str = None,
+                               checkbox_property: str = None):
+        await run_db(
+            self.db.save_page_config, user_id, page_id, page_name, target_type,
+            data_source_id, title_property, checkbox_property
+        )
+
+    async def reset_user_config(self, user_id: int):
+        await run_db(self.db.reset_user_config, user_id)
+
+    async def save_notification_settings(self, user_id: int, enabled: bool, time: str, days: str,
+                                         timezone_offset: int = None):
+        await run_db(self.db.save_notification_settings, user_id, enabled, time, days, timezone_offset)
+
+    async def get_notification_settings(self, user_id: int) -> dict:
+        return await run_db(self.db.get_notification_settings, user_id)
+
+    async def get_user_version(self, user_id: int) -> str:
+        return await run_db(self.db.get_user_version, user_id)
+
+    async def set_user_version(self, user_id: int, version: str):
+        await run_db(self.db.set_user_version, user_id, version)
+
+    async def get_users_with_notifications(self) -> list:
+        return await run_db(self.db.get_users_with_notifications)
+
+    async def suspend_users(self, reason: str, user_id: int = None, notion_token: str = None,
+                            page_id: str = None) -> list:
+        return await run_db(
+            self.db.suspend_users, reason, user_id=user_id, notion_token=notion_token, page_id=page_id
+        )
+
+    async def get_users_by_notion_ids(self, notion_ids: list) -> list:
+        return await run_db(self.db.get_users_by_notion_ids, [notion_id_key(i) for i in notion_ids])
+
+
+def notion_id_key(notion_id: str) -> str:
+    """ID Notion в сравнимом виде: без дефисов, в нижнем регистре."""
+    return notion_id.replace('-', '').lower()
+
+
+def _suspend_filters(user_id: Optional[int], notion_token: Optional[str], page_id: Optional[str]) -> list:
+    """Пары (поле, значение) для выбора приостанавливаемых пользователей; объединяются через И."""
+    filters = [
+        (field, value) for field, value in
+        (('user_id', user_id), ('notion_token', notion_token), ('page_id', page_id))
+        if value is not None
+    ]
+    if not filters:
+        raise ValueError("Не указано, кого приостановить")
+    return filters
+
+
+class MemoryUserStore(UserStore):
+    """Хранилище в памяти процесса с той же семантикой, что и SQLite."""
+
+    def __init__(self):
+        """Инициализация хранилища."""
+        self._users: Dict[int, dict] = {}
+
+    @staticmethod
+    def _new_user(user_id: int) -> dict:
+        return {
+            'user_id': user_id,
+            'notion_token': None,
+            'page_id': None,
+            'page_name': None,
+            'target_type': 'page',
+            'data_source_id': None,
+            'title_property': None,
+            'checkbox_property': None,
+            'notification_enabled': False,
+            'notification_time': None,
+            'notification_days': DEFAULT_NOTIFICATION_DAYS,
+            'timezone_offset': None,
+            'last_seen_version': DEFAULT_VERSION,
+            'suspended_reason': None,
+        }
+
+    async def get_user_config(self, user_id: int) -> dict:
+        user = self._users.get(user_id)
+        if user is None:
+            return {}
+        keys = ('notion_token', 'page_id', 'page_name', 'target_type', 'data_source_id',
+                'title_property', 'checkbox_property', 'suspended_reason')
+        return {key: user[key] for key in keys}
+
+    async def save_notion_token(self, user_id: int, token: str):
+        user = self._users.setdefault(user_id, self._new_user(user_id))
+        user.update(notion_token=token, suspended_reason=None)
+
+    async def save_page_config(self, user_id: int, page_id: str, page_name: str, target_type: str = 'page',
+                               data_source_id: str = None, title_property: str = None,
+                               checkbox_property: str = None):
+        user = self._users.get(user_id)
+        if user is not None:
+            user.update(
+                page_id=page_id, page_name=page_name, target_type=target_type,
+                data_source_id=data_source_id, title_property=title_property,
+                checkbox_property=checkbox_property, suspended_reason=None
+            )
+
+    async def reset_user_config(self, user_id: int):
+        self._users.pop(user_id, None)
+
+    async def save_notification_settings(self, user_id: int, enabled: bool, time: str, days: str,
+                                         timezone_offset: int = None):
+        user = self._users.get(user_id)
+        if user is not None:
+            user.update(
+                notification_enabled=bool(enabled), notification_time=time,
+                notification_days=days, timezone_offset=timezone_offset
+            )
+
+    async def get_notification_settings(self, user_id: int) -> dict:
+        user = self._users.get(user_id)
+        if user is None:
+            return {}
+        keys = ('notification_enabled', 'notification_time', 'notification_days',
+                'last_seen_version', 'timezone_offset')
+        return {key: user[key] for key in keys}
+
+    async def get_user_version(self, user_id: int) -> str:
+        user = self._users.get(user_id)
+        return user['last_seen_version'] if user and user['last_seen_version'] else DEFAULT_VERSION
+
+    async def set_user_version(self, user_id: int, version: str):
+        user = self._users.get(user_id)
+        if user is not None:
+            user['last_seen_version'] = version
+
+    async def get_users_with_notifications(self) -> list:
+        return [
+            {key: user[key] for key in ('user_id', 'notification_time', 'notification_days', 'timezone_offset')}
+            for user in self._users.values()
+            if user['notification_enabled'] and user['notification_time'] is not None
+            and user['suspended_reason'] is None
+        ]
+
+    async def suspend_users(self, reason: str, user_id: int = None, notion_token: str = None,
+                            page_id: str = None) -> list:
+        filters = _suspend_filters(user_id, notion_token, page_id)
+        suspended = []
+        for user in self._users.values():
+            if all(user[field] == value for field, value in filters) and user['suspended_reason'] is None:
+                user['suspended_reason'] = reason
+                suspended.append(user['user_id'])
+        return suspended
+
+    async def get_users_by_notion_ids(self, notion_ids: list) -> list:
+        keys = {notion_id_key(notion_id) for notion_id in notion_ids}
+        return [
+            user['user_id'] for user in self._users.values()
+            if any(user[field] and notion_id_key(user[field]) in keys for field in ('page_id', 'data_source_id'))
+        ]
+
+    def snapshot(self) -> Dict[int, dict]:
+        """Копия всех записей (для тестов и отладки)."""
+        return copy.deepcopy(self._users)
+
+
+_POSTGRES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        notion_token TEXT,
+        page_id TEXT,
+        page_name TEXT,
+        target_type TEXT DEFAULT 'page',
+        data_source_id TEXT,
+        title_property TEXT,
+        checkbox_property TEXT,
+        notification_enabled BOOLEAN DEFAULT FALSE,
+        notification_time TEXT,
+        notification_days TEXT DEFAULT '1,2,3,4,5',
+        timezone_offset INTEGER,
+        last_seen_version TEXT DEFAULT '0.0.0',
+        suspended_at TIMESTAMPTZ,
+        suspended_reason TEXT,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        updated_at TIMESTAMPTZ DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS users_notifications_idx
+        ON users (notification_enabled) WHERE suspended_at IS NULL;
+'''
+
+
+class PostgresUserStore(UserStore):
+    """Конфигурация пользователей в PostgreSQL через пул соединений asyncpg (остальное состояние — в SQLite)."""
+
+    def __init__(self, dsn: str, min_size: int = STORAGE_POOL_MIN_SIZE, max_size: int = STORAGE_POOL_MAX_SIZE):
+        """Инициализация хранилища (соединения открываются в init())."""
+        if not ASYNCPG_AVAILABLE:
+            raise RuntimeError("Для STORAGE_BACKEND=postgres установите пакет asyncpg")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def init(self):
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        async with self.pool.acquire() as conn:
+            await conn.execute(_POSTGRES_SCHEMA)
+        logger.info(f"Пул PostgreSQL открыт: {self.min_size}-{self.max_size} соединений")
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def get_user_config(self, user_id: int) -> dict:
+        row = await self.pool.fetchrow(
+            '''SELECT notion_token, page_id, page_name, target_type, data_source_id,
+                      title_property, checkbox_property, suspended_reason
+               FROM users WHERE user_id = $1''',
+            user_id
+        )
+        if row is None:
+            return {}
+        config = dict(row)
+        config['target_type'] = config['target_type'] or 'page'
+        return config
+
+    async def save_notion_token(self, user_id: int, token: str):
+        await self.pool.execute('''
+            INSERT INTO users (user_id, notion_token, updated_at) VALUES ($1, $2, now())
+            ON CONFLICT (user_id) DO UPDATE SET
+                notion_token = excluded.notion_token,
+                suspended_at = NULL,
+                suspended_reason = NULL,
+                updated_at = now()
+        ''', user_id, token)
+
+    async def save_page_config(self, user_id: int, page_id: str, page_name: str, target_type: str = 'page',
+                               data_source_id: str = None, title_property: str = None,
+                               checkbox_property: str = None):
+        await self.pool.execute('''
+            UPDATE users
+            SET page_id = $2, page_name = $3, target_type = $4, data_source_id = $5,
+                title_property = $6, checkbox_property = $7, suspended_at = NULL, suspended_reason = NULL,
+                updated_at = now()
+            WHERE user_id = $1
+        ''', user_id, page_id, page_name, target_type, data_source_id, title_property, checkbox_property)
+
+    async def reset_user_config(self, user_id: int):
+        await self.pool.execute('DELETE FROM users WHERE user_id = $1', user_id)
+
+    async def save_notification_settings(self, user_id: int, enabled: bool, time: str, days: str,
+                                         timezone_offset: int = None):
+        await self.pool.execute('''
+            UPDATE users
+            SET notification_enabled = $2, notification_time = $3, notification_days = $4,
+                timezone_offset = $5, updated_at = now()
+            WHERE user_id = $1
+        ''', user_id, bool(enabled), time, days, timezone_offset)
+
+    async def get_notification_settings(self, user_id: int) -> dict:
+        row = await self.pool.fetchrow(
+            '''SELECT notification_enabled, notification_time, notification_days, last_seen_version,
+                      timezone_offset
+               FROM users WHERE user_id = $1''',
+            user_id
+        )
+        if row is None:
+            return {}
+        settings = dict(row)
+        settings['notification_enabled'] = bool(settings['notification_enabled'])
+        return settings
+
+    async def get_user_version(self, user_id: int) -> str:
+        version = await self.pool.fetchval('SELECT last_seen_version FROM users WHERE user_id = $1', user_id)
+        return version or DEFAULT_VERSION
+
+    async def set_user_version(self, user_id: int, version: str):
+        await self.pool.execute(
+            'UPDATE users SET last_seen_version = $2, updated_at = now() WHERE user_id = $1',
+            user_id, version
+        )
+
+    async def get_users_with_notifications(self) -> list:
+        rows = await self.pool.fetch('''
+            SELECT user_id, notification_time, notification_days, timezone_offset
+            FROM users
+            WHERE notification_enabled AND notification_time IS NOT NULL AND suspended_at IS NULL
+        ''')
+        return [dict(row) for row in rows]
+
+    async def suspend_users(self, reason: str, user_id: int = None, notion_token: str = None,
+                            page_id: str = None) -> list:
+        filters = _suspend_filters(user_id, notion_token, page_id)
+        condition = ' AND '.join(f'{field} = ${index}' for index, (field, _) in enumerate(filters, start=2))
+        rows = await self.pool.fetch(f'''
+            UPDATE users
+            SET suspended_at = now(), suspended_reason = $1, updated_at = now()
+            WHERE {condition} AND suspended_at IS NULL
+            RETURNING user_id
+        ''', reason, *(value for _, value in filters))
+        user_ids = [row['user_id'] for row in rows]
+        logger.info(f"Приостановлены пользователи {user_ids}: {reason}")
+        return user_ids
+
+    async def get_users_by_notion_ids(self, notion_ids: list) -> list:
+        keys = [notion_id_key(notion_id) for notion_id in notion_ids]
+        rows = await self.pool.fetch('''
+            SELECT user_id FROM users
+            WHERE replace(lower(page_id), '-', '') = ANY($1::text[])
+               OR replace(lower(data_source_id), '-', '') = ANY($1::text[])
+        ''', keys)
+        return [row['user_id'] for row in rows]
+
+
+def create_user_store(db: Database, backend: str = STORAGE_BACKEND) -> UserStore:
+    """Создать хранилище пользователей по имени бэкенда."""
+    if backend == STORAGE_SQLITE:
+        return SQLiteUserStore(db)
+    if backend == STORAGE_MEMORY:
+        return MemoryUserStore()
+    if backend == STORAGE_POSTGRES:
+        if not DATABASE_URL:
+            raise ValueError("Для STORAGE_BACKEND=postgres задайте DATABASE_URL")
+        return PostgresUserStore(DATABASE_URL)
+    raise ValueError(f"Неизвестное хранилище: {backend}")
@@ -151,3 +151,78 @@ def get_notifications_actions_keyboard():
         [InlineKeyboardButton("📝 Изменить", callback_data="notif_change"),
          InlineKeyboardButton("🔕 Отключить", callback_data="notif_disable")]
     ])
+
+
+def get_page_candidates_keyboard(candidates):
+    """Клавиатура с найденными страницами для выбора."""
+    keyboard = []
+    for page_id, title in candidates:
+        label = title if len(title) <= 60 else title[:57] + "..."
+        keyboard.append([InlineKeyboardButton(f"📄 {label}", callback_data=f"page_select_{page_id}")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def get_list_navigation_keyboard(page: int, has_next: bool, open_items=()):
+    """Кнопки отметки заметок и перехода между страницами /list (None, если кнопок нет)."""
+    keyboard = get_mark_done_rows(open_items)
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️ Назад", callback_data=f"list_page_{page - 1}"))
+    if has_next:
+        row.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"list_page_{page + 1}"))
+    if row:
+        keyboard.append(row)
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+
+def mark_done_callback(note_id: str, done: bool = False) -> str:
+    """callback_data кнопки отметки (ID без дефисов, чтобы уложиться в 64 байта)."""
+    prefix = "done_ok_" if done else "done_"
+    return prefix + note_id.replace('-', '')
+
+
+def dashed_id(note_id: str) -> str:
+    """Вернуть дефисы ID Notion из callback_data (в индексе поиска ID хранятся с дефисами)."""
+    if len(note_id) != 32 or '-' in note_id:
+        return note_id
+    return f"{note_id[:8]}-{note_id[8:12]}-{note_id[12:16]}-{note_id[16:20]}-{note_id[20:]}"
+
+
+def get_mark_done_rows(items, limit: int = 30):
+    """Ряды кнопок «отметить выполненным» для пар (ID, текст)."""
+    rows = []
+    for note_id, text in list(items)[:limit]:
+        label = text if len(text) <= 40 else text[:37] + "..."
+        rows.append([InlineKeyboardButton(f"☐ {label}", callback_data=mark_done_callback(note_id))])
+    return rows
+
+
+def get_mark_done_keyboard(items):
+    """Клавиатура отметки заметок для рассылки (None, если заметок нет)."""
+    rows = get_mark_done_rows(items)
+    return InlineKeyboardMarkup(rows) if rows else None
+
+
+def set_mark_done_button(markup, note_id: str, done: bool):
+    """
+    Копия клавиатуры с переключённой кнопкой заметки.
+
+    Returns:
+        InlineKeyboardMarkup или None, если кнопки заметки в нужном состоянии нет
+    """
+    current = mark_done_callback(note_id, done=not done)
+    found = False
+    keyboard = []
+    for row in markup.inline_keyboard:
+        new_row = []
+        for button in row:
+            if button.callback_data == current:
+                found = True
+                label = button.text[2:] if button.text[:2] in ("☐ ", "☑ ") else button.text
+                button = InlineKeyboardButton(
+                    f"{'☑' if done else '☐'} {label}",
+                    callback_data=mark_done_callback(note_id, done=done)
+                )
+            new_row.append(button)
+        keyboard.append(new_row)
+    return InlineKeyboardMarkup(keyboard) if found else None
@@ -0,0 +1,256 @@
+"""
+Приём вебхуков Notion об изменениях инбоксов.
+
+Notion присылает POST с событием (page.content_updated, page.created,
+data_source.content_updated и т.п.) и подписью X-Notion-Signature —
+HMAC-SHA256 тела на токене проверки подписки. Приёмник проверяет подпись,
+находит пользователей, чей инбокс — сама сущность события или её родитель,
+и отмечает их инбоксы изменёнными в ChangeTracker. Пока событий нет, /list
+отвечает из кэша, а рассылка не запрашивает время изменения страницы —
+но только у пользователей, по инбоксам которых уже приходили проверенные
+события: у интеграций других пользователей подписки может не быть.
+
+Настройка: NOTION_WEBHOOK_PORT включает приёмник. При создании подписки
+Notion присылает verification_token — он сохраняется в файл
+NOTION_WEBHOOK_TOKEN_FILE (не в лог), его нужно подтвердить в настройках
+интеграции и задать в NOTION_WEBHOOK_SECRET. Без секрета события не
+принимаются и кэш не считается свежим.
+
+Для локальной проверки есть симулятор: build_event/send_event и
+scripts/simulate_webhooks.py.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+from typing import List, Optional
+
+import httpx
+
+from src.inbox_cache import ChangeTracker
+from src.storage import UserStore
+
+logger = logging.getLogger(__name__)
+
+NOTION_WEBHOOK_SECRET = os.getenv('NOTION_WEBHOOK_SECRET')
+NOTION_WEBHOOK_HOST = os.getenv('NOTION_WEBHOOK_HOST', '0.0.0.0')
+# Порт приёмника; не задан — вебхуки выключены
+NOTION_WEBHOOK_PORT = os.getenv('NOTION_WEBHOOK_PORT')
+NOTION_WEBHOOK_PATH = os.getenv('NOTION_WEBHOOK_PATH', '/notion/webhook')
+# Куда сохранить токен проверки подписки (доступен только владельцу файла)
+NOTION_WEBHOOK_TOKEN_FILE = os.getenv(
+    'NOTION_WEBHOOK_TOKEN_FILE', os.path.join(os.getenv('DATA_DIR', 'data'), 'notion_webhook_token')
+)
+
+# Максимальный размер тела запроса
+MAX_BODY_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 10
+
+# События, которые могут менять содержимое инбокса
+INBOX_EVENT_PREFIXES = ('page.', 'database.', 'data_source.')
+
+SIGNATURE_HEADER = 'x-notion-signature'
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large',
+}
+
+
+def sign_body(body: bytes, secret: str) -> str:
+    """Подпись тела в формате заголовка X-Notion-Signature."""
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body: bytes, signature: Optional[str], secret: str) -> bool:
+    """Проверить подпись Notion за постоянное время."""
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_body(body, secret), signature)
+
+
+def affected_ids(event: dict) -> List[str]:
+    """ID сущностей Notion, изменение которых затрагивает инбокс: сама сущность и её родитель."""
+    if not str(event.get('type', '')).startswith(INBOX_EVENT_PREFIXES):
+        return []
+    ids = []
+    entity = event.get('entity') or {}
+    if entity.get('id'):
+        ids.append(entity['id'])
+    parent = (event.get('data') or {}).get('parent') or {}
+    if parent.get('id'):
+        ids.append(parent['id'])
+    return ids
+
+
+class WebhookReceiver:
+    """Минимальный HTTP-сервер для событий Notion поверх asyncio."""
+
+    def __init__(self, storage: UserStore, changes: ChangeTracker, secret: Optional[str] = NOTION_WEBHOOK_SECRET,
+                 host: str = NOTION_WEBHOOK_HOST, port: int = int(NOTION_WEBHOOK_PORT or 0),
+                 path: str = NOTION_WEBHOOK_PATH, token_file: str = NOTION_WEBHOOK_TOKEN_FILE):
+        """Инициализация приёмника."""
+        self.storage = storage
+        self.changes = changes
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.path = path
+        self.token_file = token_file
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.received = 0
+        self.rejected = 0
+        self.invalidated = 0
+
+    async def start(self):
+        """Начать приём событий."""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.secret:
+            self.changes.activate()
+            logger.info(f"Приёмник вебхуков Notion слушает порт {self.port}, путь {self.path}")
+        else:
+            logger.warning(
+                f"Приёмник вебхуков Notion слушает порт {self.port}, но NOTION_WEBHOOK_SECRET не задан: "
+                f"события не принимаются до подтверждения подписки"
+            )
+
+    async def stop(self):
+        """Остановить приём событий."""
+        self.changes.deactivate()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        logger.info(
+            f"Вебхуки Notion: получено {self.received}, отклонено {self.rejected}, "
+            f"инбоксов отмечено изменёнными {self.invalidated}"
+        )
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status = await asyncio.wait_for(self._read_and_handle(reader), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, UnicodeDecodeError):
+            status = 400
+        except Exception as e:
+            logger.error(f"Ошибка обработки вебхука Notion: {e}")
+            status = 400
+        try:
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+                .encode('ascii')
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _read_and_handle(self, reader: asyncio.StreamReader) -> int:
+        request_line = (await reader.readline()).decode('latin-1')
+        method, path, _ = request_line.split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', '0'))
+        if length > MAX_BODY_SIZE:
+            return 413
+        body = await reader.readexactly(length)
+        return await self.handle_request(method, path.split('?', 1)[0], headers, body)
+
+    async def handle_request(self, method: str, path: str, headers: dict, body: bytes) -> int:
+        """
+        Обработать запрос к приёмнику.
+
+        Returns:
+            int: HTTP-статус ответа
+        """
+        if path != self.path:
+            return 404
+        if method != 'POST':
+            return 405
+        try:
+            event = json.loads(body)
+        except ValueError:
+            return 400
+        if not isinstance(event, dict):
+            return 400
+
+        if 'verification_token' in event and 'type' not in event:
+            # Создание подписки: токен нужно подтвердить в Notion и задать в NOTION_WEBHOOK_SECRET
+            self._save_verification_token(str(event['verification_token']))
+            logger.warning(
+                f"Получен токен проверки подписки Notion, он сохранён в {self.token_file}. "
+                f"Подтвердите его в настройках интеграции и задайте NOTION_WEBHOOK_SECRET."
+            )
+            return 200
+
+        self.received += 1
+        if not self.secret or not verify_signature(body, headers.get(SIGNATURE_HEADER), self.secret):
+            self.rejected += 1
+            return 401
+
+        await self.apply_event(event)
+        return 200
+
+    def _save_verification_token(self, token: str):
+        """Записать токен проверки в файл с доступом только для владельца."""
+        directory = os.path.dirname(self.token_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # Файл мог остаться от прежней подписки с другими правами
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            file.write(token + '\n')
+
+    async def apply_event(self, event: dict) -> List[int]:
+        """Отметить изменёнными инбоксы пользователей, затронутых событием."""
+        ids = affected_ids(event)
+        if not ids:
+            return []
+        user_ids = await self.storage.get_users_by_notion_ids(ids)
+        if user_ids:
+            self.changes.record_events(user_ids)
+            self.invalidated += len(user_ids)
+            logger.info(f"Событие Notion {event.get('type')}: инбоксы изменились у {len(user_ids)} пользователей")
+        return user_ids
+
+
+# Симулятор событий для тестов и локальной проверки
+
+def build_event(event_type: str, entity_id: str, entity_type: str = 'page',
+                parent_id: Optional[str] = None, parent_type: str = 'page') -> dict:
+    """Собрать событие в формате вебхуков Notion."""
+    event = {
+        "id": hashlib.sha256(f"{event_type}{entity_id}{parent_id}".encode('utf-8')).hexdigest()[:32],
+        "timestamp": "2026-01-01T00:00:00.000Z",
+        "type": event_type,
+        "entity": {"id": entity_id, "type": entity_type},
+        "data": {},
+    }
+    if parent_id:
+        event["data"]["parent"] = {"id": parent_id, "type": parent_type}
+    return event
+
+
+async def send_event(url: str, event: dict, secret: Optional[str]) -> int:
+    """
+    Отправить событие приёмнику, подписав его как Notion.
+
+    Returns:
+        int: HTTP-статус ответа
+    """
+    body = json.dumps(event).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if secret:
+        headers['X-Notion-Signature'] = sign_body(body, secret)
+    async with httpx.AsyncClient() as client:
+        response = await client.post(url, content=body, headers=headers)
+    return response.status_code
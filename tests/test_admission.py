@@ -0,0 +1,231 @@
+"""
+Тесты деградации при перегрузке Notion: допуск, очередь заметок и кэш /list.
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src import app_globals, handlers
+from src.admission import AdmissionController
+from src.capture import CaptureQueue, QueuedCapture
+from src.database import Database
+from src.inbox_cache import InboxCache
+from src.notion_api import InboxTarget, NotionClient, TARGET_PAGE
+from src.notion_errors import NotionNotFoundError, NotionRateLimitError
+from tests.test_capture import FakeNotion
+
+CONFIG = {'notion_token': 'secret', 'page_id': 'page', 'target_type': TARGET_PAGE}
+TARGET = InboxTarget(TARGET_PAGE, "page")
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    database.init_database()
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def notion(monkeypatch):
+    fake = FakeNotion()
+    monkeypatch.setattr(NotionClient, 'for_token', classmethod(lambda cls, token: fake))
+    return fake
+
+
+class FakeStorage:
+    def __init__(self, configs):
+        self.configs = configs
+
+    async def get_user_config(self, user_id):
+        return self.configs.get(user_id, {})
+
+
+class FakeBot:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_text(self, text, chat_id, message_id):
+        self.edits.append((chat_id, message_id, text))
+
+
+class FakeMessage:
+    def __init__(self, message_id, text=None):
+        self.message_id = message_id
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        reply = FakeMessage(1000 + len(self.replies), text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+
+
+def test_admission_limits():
+    admission = AdmissionController(global_limit=2, per_user_limit=1)
+    assert admission.try_acquire(1)
+    assert not admission.try_acquire(1)
+    assert admission.try_acquire(2)
+    assert not admission.try_acquire(3)
+
+    async def scenario():
+        waiter = asyncio.ensure_future(admission.acquire(3))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        admission.release(1)
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(scenario())
+    assert admission.stats()['in_flight'] == 2
+    assert admission.stats()['denied'] == 2
+
+
+def test_inbox_cache_evicts_oldest_and_checks_page():
+    cache = InboxCache(max_users=2)
+    cache.put(1, "page", [("a", False)], fetched_at=time.time() - 120)
+    cache.put(2, "page", [])
+    cache.put(3, "page", [])
+    assert cache.get(1, "page") is None
+    assert cache.get(2, "other") is None
+    notes, age = cache.get(2, "page")
+    assert notes == [] and age < 5
+
+
+def test_queue_retries_transient_errors_and_edits_ack(db, notion):
+    failures = [NotionRateLimitError("rate limited", status=429)]
+    add_note = notion.add_note
+
+    def flaky_add_note(*args):
+        if failures:
+            raise failures.pop()
+        return add_note(*args)
+
+    notion.add_note = flaky_add_note
+    queue = CaptureQueue(db, AdmissionController(), retry_delay=0.01)
+    queue.bot = FakeBot()
+
+    async def scenario():
+        assert await queue.submit(QueuedCapture(1, 1, 10, 'secret', TARGET, "Заметка", ack_message_id=500))
+        assert db.get_queued_captures()[0]['content'] == "Заметка"
+        await asyncio.wait_for(asyncio.gather(*queue._tasks), 2)
+
+    asyncio.run(scenario())
+    assert list(notion.blocks.values()) == ["Заметка"]
+    assert queue.bot.edits == [(1, 500, "✅ Заметка записана")]
+    assert db.get_queued_captures() == []
+    assert queue.size == 0
+
+
+def test_queue_gives_up_on_permanent_errors(db, notion):
+    def missing_page(*args):
+        raise NotionNotFoundError("not found", status=404)
+
+    notion.add_note = missing_page
+    queue = CaptureQueue(db, AdmissionController(), retry_delay=0.01)
+    queue.bot = FakeBot()
+
+    async def scenario():
+        await queue.submit(QueuedCapture(1, 1, 11, 'secret', TARGET, "Заметка", ack_message_id=501))
+        await asyncio.wait_for(asyncio.gather(*queue._tasks), 2)
+
+    asyncio.run(scenario())
+    assert queue.bot.edits[0][2].startswith("❌")
+    assert db.get_queued_captures() == []
+
+
+def test_queue_survives_restart(db, notion):
+    """Недописанная при остановке заметка записывается после следующего запуска."""
+    blocked = AdmissionController(global_limit=0)
+
+    async def first_run():
+        queue = CaptureQueue(db, blocked)
+        await queue.submit(QueuedCapture(1, 1, 12, 'secret', TARGET, "Не потеряется", ack_message_id=502))
+        assert await queue.drain(timeout=0.05) == 1
+
+    asyncio.run(first_run())
+    assert notion.blocks == {}
+    assert [row['message_id'] for row in db.get_queued_captures()] == [12]
+
+    bot = FakeBot()
+
+    async def second_run():
+        queue = CaptureQueue(db, AdmissionController())
+        assert await queue.start(bot, FakeStorage({1: CONFIG})) == 1
+        assert await queue.drain(timeout=2) == 0
+
+    asyncio.run(second_run())
+    assert list(notion.blocks.values()) == ["Не потеряется"]
+    assert bot.edits == [(1, 502, "✅ Заметка записана")]
+
+
+@pytest.fixture
+def overloaded(db, monkeypatch):
+    """Глобальные объекты бота с исчерпанным лимитом запросов к Notion."""
+    admission = AdmissionController(global_limit=0)
+    monkeypatch.setattr(app_globals, 'db', db)
+    monkeypatch.setattr(app_globals, 'storage', FakeStorage({1: CONFIG}))
+    monkeypatch.setattr(app_globals, 'admission', admission)
+    monkeypatch.setattr(app_globals, 'capture_queue', CaptureQueue(db, admission))
+    monkeypatch.setattr(app_globals, 'inbox_cache', InboxCache())
+
+
+def make_update(text):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=1), effective_chat=SimpleNamespace(id=1),
+        message=FakeMessage(20, text)
+    )
+
+
+def test_overloaded_capture_is_queued_with_ack(overloaded):
+    update = make_update("Купить хлеб")
+
+    async def scenario():
+        await handlers.handle_message(update, SimpleNamespace(user_data={}))
+        await app_globals.capture_queue.drain(timeout=0.05)
+
+    asyncio.run(scenario())
+    ack = update.message.replies[0]
+    assert "в очереди" in ack.text
+    assert [(row['content'], row['ack_message_id']) for row in app_globals.db.get_queued_captures()] == [
+        ("Купить хлеб", ack.message_id)
+    ]
+
+
+def test_overloaded_list_answers_from_cache_with_staleness(overloaded):
+    app_globals.inbox_cache.put(1, "page", [("Старая заметка", False)], fetched_at=time.time() - 300)
+    update = make_update("/list")
+
+    asyncio.run(handlers.list_notes(update, SimpleNamespace(user_data={}, args=[])))
+    reply = update.message.replies[0].text
+    assert "Старая заметка" in reply
+    assert "показаны данные 5 мин назад" in reply
+
+
+def test_unknown_outcome_is_rechecked_instead_of_resent(db, notion, monkeypatch):
+    """После таймаута записи бот не просит отправить заметку заново, а сам проверяет её по резерву."""
+    admission = AdmissionController()
+    queue = CaptureQueue(db, admission)
+    queue.bot = FakeBot()
+    monkeypatch.setattr(app_globals, 'db', db)
+    monkeypatch.setattr(app_globals, 'storage', FakeStorage({1: CONFIG}))
+    monkeypatch.setattr(app_globals, 'admission', admission)
+    monkeypatch.setattr(app_globals, 'capture_queue', queue)
+    notion.fail_after_write = True
+    update = make_update("Купить хлеб")
+
+    async def scenario():
+        await handlers.handle_message(update, SimpleNamespace(user_data={}))
+        await queue.drain(timeout=2)
+
+    asyncio.run(scenario())
+    ack = update.message.replies[0]
+    assert "неизвестно, записана ли заметка" in ack.text
+    assert list(notion.blocks.values()) == ["Купить хлеб"]
+    assert notion.appends == 1
+    assert queue.bot.edits == [(1, ack.message_id, "✅ Заметка записана")]
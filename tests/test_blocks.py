@@ -0,0 +1,65 @@
+"""
+Тесты декодирования блоков Notion.
+"""
+
+import json
+
+from src.blocks import BlockRecord, decode_block, decode_block_list, extract_text
+
+
+def test_extract_text_skips_non_text_items():
+    """Текст собирается только из элементов типа text."""
+    rich_text = [
+        {"type": "text", "text": {"content": "Купить "}},
+        {"type": "mention", "mention": {}},
+        {"type": "text", "text": {"content": "молоко"}},
+    ]
+    assert extract_text(rich_text) == "Купить молоко"
+
+
+def test_decode_block_types():
+    """to_do сохраняет отметку, paragraph — None, прочие блоки пропускаются."""
+    todo = {
+        "id": "b1", "type": "to_do", "last_edited_time": "2026-01-01T00:00:00.000Z",
+        "to_do": {"rich_text": [{"type": "text", "text": {"content": "a"}}], "checked": True},
+    }
+    paragraph = {"id": "b2", "type": "paragraph", "paragraph": {"rich_text": []}}
+
+    assert decode_block(todo) == BlockRecord("b1", "to_do", "a", True, "2026-01-01T00:00:00.000Z")
+    assert decode_block(paragraph) == BlockRecord("b2", "paragraph", "", None, None)
+    assert decode_block({"id": "b3", "type": "divider", "divider": {}}) is None
+
+
+def test_decode_block_flags_children_and_formatting():
+    """Вложенные блоки и оформление текста отмечаются, чтобы архив копировал такие заметки целиком."""
+    linked = {
+        "id": "b1", "type": "to_do", "has_children": True,
+        "to_do": {"rich_text": [{"type": "text", "text": {"content": "a", "link": {"url": "https://x"}}}]},
+    }
+    bold = {
+        "id": "b2", "type": "to_do",
+        "to_do": {"rich_text": [{"type": "text", "text": {"content": "a"}, "annotations": {"bold": True}}]},
+    }
+    plain = {
+        "id": "b3", "type": "to_do",
+        "to_do": {"rich_text": [{"type": "text", "text": {"content": "a"}, "annotations": {"color": "default"}}]},
+    }
+    record = decode_block(linked)
+    assert record.has_children and not record.plain
+    assert not decode_block(bold).plain
+    assert decode_block(plain).plain and not decode_block(plain).has_children
+
+
+def test_decode_block_list_cursor():
+    """Курсор возвращается только если есть следующая страница."""
+    raw = json.dumps({
+        "results": [{"id": "b1", "type": "to_do", "to_do": {"rich_text": [], "checked": False}}],
+        "next_cursor": "next",
+        "has_more": True,
+    }).encode()
+    records, cursor = decode_block_list(raw)
+    assert [r.id for r in records] == ["b1"]
+    assert cursor == "next"
+
+    _, cursor = decode_block_list(b'{"results": [], "next_cursor": null, "has_more": false}')
+    assert cursor is None
@@ -0,0 +1,182 @@
+"""
+Тесты идемпотентной записи заметок.
+"""
+
+import asyncio
+
+import pytest
+
+from src.capture import capture_note, update_note
+from src.database import Database
+from src.encoder import note_texts
+from src.notion_api import InboxTarget, TARGET_PAGE
+from src.notion_errors import UNKNOWN_OUTCOME_ERRORS, NotionTimeoutError
+
+TARGET = InboxTarget(TARGET_PAGE, "page")
+
+
+class FakeNotion:
+    """Заглушка NotionClient, хранящая блоки в памяти."""
+
+    UNKNOWN_OUTCOME_ERRORS = UNKNOWN_OUTCOME_ERRORS
+
+    def __init__(self):
+        self.blocks = {}
+        self.appends = 0
+        self.fail_after_write = False
+        # Сколько блоков успеть записать до таймаута (None — все)
+        self.written_before_failure = None
+        self.created = 0
+
+    def _new_block(self, text):
+        self.created += 1
+        block_id = f"block-{self.created}"
+        self.blocks[block_id] = text
+        return block_id
+
+    def add_note(self, target, content, per_line=False):
+        self.appends += 1
+        texts = note_texts(content, per_line)
+        if self.fail_after_write and self.written_before_failure is not None:
+            texts = texts[:self.written_before_failure]
+        block_ids = [self._new_block(text) for text in texts]
+        if self.fail_after_write:
+            self.fail_after_write = False
+            raise NotionTimeoutError("таймаут")
+        return block_ids
+
+    def find_note_blocks(self, target, texts, exclude):
+        order = list(self.blocks)
+        for index in range(len(order) - 1, -1, -1):
+            if self.blocks[order[index]] != texts[0] or order[index] in exclude:
+                continue
+            found = [order[index]]
+            for block_id, text in zip(order[index + 1:], texts[1:]):
+                if self.blocks[block_id] != text or block_id in exclude:
+                    break
+                found.append(block_id)
+            return found
+        return []
+
+    def append_note_blocks(self, page_id, texts, after=None):
+        return [self._new_block(text) for text in texts]
+
+    def find_note_by_text(self, target, content, exclude):
+        for block_id in reversed(list(self.blocks)):
+            if self.blocks[block_id] == content and block_id not in exclude:
+                return block_id
+        return None
+
+    def update_note(self, target, block_ids, content, per_line=False):
+        texts = note_texts(content, per_line)
+        kept = list(block_ids[:len(texts)])
+        for block_id, text in zip(kept, texts):
+            self.blocks[block_id] = text
+        for block_id in block_ids[len(texts):]:
+            del self.blocks[block_id]
+        return kept + [self._new_block(text) for text in texts[len(kept):]]
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    database.init_database()
+    yield database
+    database.close()
+
+
+def test_capture_is_idempotent(db):
+    """Повторная обработка сообщения не создаёт второй блок."""
+    notion = FakeNotion()
+    first = asyncio.run(capture_note(db, notion, 1, 10, TARGET, "Купить молоко"))
+    second = asyncio.run(capture_note(db, notion, 1, 10, TARGET, "Купить молоко"))
+    assert first == second
+    assert notion.appends == 1
+
+
+def test_capture_recovers_after_timeout(db):
+    """Запись, завершившаяся таймаутом после создания блока, не дублируется."""
+    notion = FakeNotion()
+    notion.fail_after_write = True
+    with pytest.raises(NotionTimeoutError):
+        asyncio.run(capture_note(db, notion, 1, 11, TARGET, "Позвонить"))
+
+    block_id = asyncio.run(capture_note(db, notion, 1, 11, TARGET, "Позвонить"))
+    assert block_id == "block-1"
+    assert notion.appends == 1
+
+
+def test_update_note(db):
+    """Редактирование обновляет привязанный блок, непривязанные сообщения игнорируются."""
+    notion = FakeNotion()
+    block_id = asyncio.run(capture_note(db, notion, 1, 12, TARGET, "Опечтка"))
+    assert asyncio.run(update_note(db, notion, 1, 12, TARGET, "Опечатка"))
+    assert notion.blocks[block_id] == "Опечатка"
+    assert not asyncio.run(update_note(db, notion, 1, 99, TARGET, "Другое"))
+
+
+def test_edit_after_timeout_updates_the_written_note(db):
+    """Правка сообщения, запись которого оборвалась таймаутом, находит блок и обновляет его."""
+    notion = FakeNotion()
+    notion.fail_after_write = True
+    with pytest.raises(NotionTimeoutError):
+        asyncio.run(capture_note(db, notion, 1, 13, TARGET, "Опечтка"))
+
+    assert asyncio.run(update_note(db, notion, 1, 13, TARGET, "Опечатка"))
+    assert notion.blocks == {"block-1": "Опечатка"}
+    assert db.get_message_block(1, 13)['block_id'] == "block-1"
+
+
+def test_multi_line_note_maps_all_blocks(db):
+    """Построчная заметка привязывает к сообщению все созданные блоки."""
+    notion = FakeNotion()
+    first = asyncio.run(capture_note(db, notion, 1, 13, TARGET, "- хлеб\n- молоко\n- сыр", per_line=True))
+    mapping = db.get_message_block(1, 13)
+    assert first == "block-1"
+    assert mapping['block_ids'] == ["block-1", "block-2", "block-3"]
+    assert [notion.blocks[block_id] for block_id in mapping['block_ids']] == ["хлеб", "молоко", "сыр"]
+    assert db.get_mapped_block_ids(TARGET.id) == {"block-1", "block-2", "block-3"}
+
+
+def test_edit_keeps_split_mode_of_capture(db):
+    """Правка сообщения сохраняет режим /split, в котором заметка была записана."""
+    notion = FakeNotion()
+    asyncio.run(capture_note(db, notion, 1, 14, TARGET, "хлеб\nмолоко\nсыр", per_line=True))
+    # /split выключен после записи — заметка всё равно остаётся построчной
+    assert asyncio.run(update_note(db, notion, 1, 14, TARGET, "хлеб\nмолоко\nмасло"))
+    assert db.get_message_block(1, 14)['block_ids'] == ["block-1", "block-2", "block-3"]
+    assert [notion.blocks[block_id] for block_id in ("block-1", "block-2", "block-3")] == ["хлеб", "молоко", "масло"]
+
+    asyncio.run(capture_note(db, notion, 1, 15, TARGET, "одна\nзаметка"))
+    asyncio.run(update_note(db, notion, 1, 15, TARGET, "одна\nзаметка!"))
+    mapping = db.get_message_block(1, 15)
+    assert mapping['block_ids'] == ["block-4"]
+    assert notion.blocks["block-4"] == "одна\nзаметка!"
+
+
+def test_recovery_maps_all_blocks_of_multi_line_note(db):
+    """После таймаута построчной заметки к сообщению привязываются все её блоки."""
+    notion = FakeNotion()
+    notion.fail_after_write = True
+    with pytest.raises(NotionTimeoutError):
+        asyncio.run(capture_note(db, notion, 1, 16, TARGET, "а\nб\nв", per_line=True))
+
+    asyncio.run(capture_note(db, notion, 1, 16, TARGET, "а\nб\nв", per_line=True))
+    assert db.get_message_block(1, 16)['block_ids'] == ["block-1", "block-2", "block-3"]
+    assert notion.appends == 1
+
+    asyncio.run(update_note(db, notion, 1, 16, TARGET, "а\nб\nв\nг"))
+    assert list(notion.blocks.values()) == ["а", "б", "в", "г"]
+
+
+def test_recovery_completes_note_cut_between_batches(db):
+    """Запись, оборвавшаяся после первых пачек, дописывается без дублей."""
+    notion = FakeNotion()
+    notion.fail_after_write = True
+    notion.written_before_failure = 2
+    with pytest.raises(NotionTimeoutError):
+        asyncio.run(capture_note(db, notion, 1, 17, TARGET, "1\n2\n3\n4", per_line=True))
+
+    asyncio.run(capture_note(db, notion, 1, 17, TARGET, "1\n2\n3\n4", per_line=True))
+    assert list(notion.blocks.values()) == ["1", "2", "3", "4"]
+    assert db.get_message_block(1, 17)['block_ids'] == ["block-1", "block-2", "block-3", "block-4"]
@@ -0,0 +1,89 @@
+"""
+Тесты автоматических выключателей.
+"""
+
+import asyncio
+
+import httpx
+from notion_client.errors import APIResponseError
+from telegram.error import Forbidden
+
+from src.circuit_breaker import (
+    KIND_CHAT,
+    KIND_PAGE,
+    KIND_TOKEN,
+    CircuitBreakerRegistry,
+    classify_permanent_error,
+    page_key,
+)
+from src.database import Database
+from src.notifications import NotificationManager
+from src.storage import MemoryUserStore
+
+
+def _api_error(status: int) -> APIResponseError:
+    response = httpx.Response(status, request=httpx.Request('GET', 'https://api.notion.com'))
+    return APIResponseError(response, 'error', 'object_not_found')
+
+
+def test_classify_permanent_errors():
+    assert classify_permanent_error(_api_error(401))[0] == KIND_TOKEN
+    assert classify_permanent_error(_api_error(404))[0] == KIND_PAGE
+    assert classify_permanent_error(Forbidden('blocked'))[0] == KIND_CHAT
+    assert classify_permanent_error(_api_error(502)) is None
+    assert classify_permanent_error(TimeoutError()) is None
+
+
+def test_breaker_opens_at_threshold_and_resets():
+    breakers = CircuitBreakerRegistry(threshold=2)
+    key = page_key('token', 'page')
+    assert not breakers.record_failure(key)
+    assert breakers.record_failure(key)
+    assert breakers.is_open(key)
+    breakers.reset(key)
+    assert not breakers.is_open(key)
+
+
+def test_suspend_users_by_page_and_resume_on_reconfigure(tmp_path):
+    db = Database(str(tmp_path / 'bot.db'))
+    db.init_database()
+    for user_id in (1, 2, 3):
+        db.save_notion_token(user_id, 'token')
+        db.save_page_config(user_id, 'dead' if user_id < 3 else 'alive', 'Inbox')
+
+    suspended = db.suspend_users("Страница удалена", page_id='dead')
+    assert sorted(suspended) == [1, 2]
+    assert db.get_user_config(1)['suspended_reason'] == "Страница удалена"
+
+    db.save_page_config(1, 'new', 'Inbox')
+    assert db.get_user_config(1)['suspended_reason'] is None
+    db.close()
+
+
+def test_page_breaker_is_scoped_to_token(tmp_path):
+    """Токен, потерявший доступ к общей странице, не приостанавливает владельцев других токенов."""
+    db = Database(str(tmp_path / 'bot.db'))
+    db.init_database()
+    storage = MemoryUserStore()
+    manager = NotificationManager(db, bot=None, storage=storage)
+    manager.breakers.threshold = 2
+    configs = {}
+
+    async def scenario():
+        for user_id, token in ((1, 'revoked'), (2, 'valid'), (3, 'revoked')):
+            await storage.save_notion_token(user_id, token)
+            await storage.save_page_config(user_id, 'shared', 'Inbox')
+            configs[user_id] = await storage.get_user_config(user_id)
+
+        await manager.handle_failure(1, configs[1], _api_error(404))
+        # Успех другого токена на той же странице не сбрасывает счётчик
+        manager.breakers.record_success(page_key('valid', 'shared'))
+        await manager.handle_failure(1, configs[1], _api_error(404))
+
+        return [(await storage.get_user_config(user_id))['suspended_reason'] for user_id in (1, 2, 3)]
+
+    reasons = asyncio.run(scenario())
+    assert reasons[0] is not None and reasons[2] is not None
+    assert reasons[1] is None
+    assert not manager.breakers.is_open(page_key('valid', 'shared'))
+    db.close()
@@ -0,0 +1,124 @@
+"""
+Тесты архивации выполненных задач.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from src import compactor
+from src.blocks import BlockRecord
+from src.compactor import Compactor, listing_requests, select_compactable
+from src.database import Database
+from src.mark_done import RateBudget
+
+NOW = datetime(2026, 10, 19, tzinfo=timezone.utc)
+OLD = '2026-10-01T10:00:00.000Z'
+RECENT = '2026-10-18T10:00:00.000Z'
+
+
+class FakeNotion:
+    """Заглушка NotionClient со страницей инбокса и архивом в памяти."""
+
+    def __init__(self, records, failing_deletes=(), trees=None):
+        self.records = list(records)
+        self.archived = []
+        self.failing_deletes = set(failing_deletes)
+        # id блока -> дерево для копирования целиком (None — нельзя скопировать)
+        self.trees = trees or {}
+        self.archived_trees = []
+
+    def list_all_block_records(self, page_id):
+        return list(self.records)
+
+    def archive_notes(self, archive, texts):
+        self.archived.extend(texts)
+
+    def get_block_tree(self, block_id):
+        return self.trees[block_id]
+
+    def archive_block_tree(self, archive, tree):
+        self.archived_trees.append(tree)
+
+    def delete_block(self, block_id):
+        if block_id in self.failing_deletes:
+            raise Exception("conflict")
+        self.records = [record for record in self.records if record.id != block_id]
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    database.init_database()
+    yield database
+    database.close()
+
+
+def test_select_compactable_takes_only_old_checked_todos():
+    records = [
+        BlockRecord('a', 'to_do', 'old done', True, OLD),
+        BlockRecord('b', 'to_do', 'recent done', True, RECENT),
+        BlockRecord('c', 'to_do', 'old open', False, OLD),
+        BlockRecord('d', 'paragraph', 'text', None, OLD),
+    ]
+    assert [record.id for record in select_compactable(records, 7, NOW)] == ['a']
+
+
+def test_listing_requests():
+    assert listing_requests(0) == 1
+    assert listing_requests(100) == 1
+    assert listing_requests(101) == 2
+
+
+def test_compact_user_copies_then_deletes_and_reports(db, monkeypatch):
+    records = [BlockRecord(f'done-{i}', 'to_do', f'done {i}', True, OLD) for i in range(150)]
+    records += [BlockRecord(f'open-{i}', 'to_do', f'open {i}', False, OLD) for i in range(10)]
+    notion = FakeNotion(records, failing_deletes={'done-3'})
+    monkeypatch.setattr(compactor.NotionClient, 'for_token', classmethod(lambda cls, token: notion))
+
+    db.save_notion_token(1, 'token')
+    db.save_page_config(1, 'inbox', 'Inbox')
+    db.save_compaction_settings(1, 'page', 'archive', 'Archive', 0)
+
+    report = asyncio.run(Compactor(db, bot=None, budget=RateBudget(rate=10000)).compact_user(1))
+
+    assert len(notion.archived) == 150
+    assert report.moved == 149
+    assert report.failed == 1
+    assert report.blocks_before == 160
+    assert report.blocks_after == 11
+    assert listing_requests(report.blocks_after) == 1
+    assert db.get_compaction_settings(1)['last_moved'] == 149
+
+
+def test_compact_user_skips_users_without_opt_in(db):
+    db.save_notion_token(1, 'token')
+    db.save_page_config(1, 'inbox', 'Inbox')
+    assert asyncio.run(Compactor(db, bot=None).compact_user(1)) is None
+
+
+def test_compact_user_copies_nested_notes_whole(db, monkeypatch):
+    """Заметка со вложенным блоком копируется деревом; непереносимая остаётся в инбоксе."""
+    nested_tree = {
+        'block': {'type': 'to_do', 'to_do': {'rich_text': [], 'checked': True}},
+        'children': [{'block': {'type': 'paragraph', 'paragraph': {'rich_text': []}}, 'children': []}],
+    }
+    records = [
+        BlockRecord('plain', 'to_do', 'plain', True, OLD),
+        BlockRecord('nested', 'to_do', 'nested', True, OLD, has_children=True),
+        BlockRecord('with-page', 'to_do', 'with page', True, OLD, has_children=True),
+    ]
+    notion = FakeNotion(records, trees={'nested': nested_tree, 'with-page': None})
+    monkeypatch.setattr(compactor.NotionClient, 'for_token', classmethod(lambda cls, token: notion))
+
+    db.save_notion_token(1, 'token')
+    db.save_page_config(1, 'inbox', 'Inbox')
+    db.save_compaction_settings(1, 'page', 'archive', 'Archive', 0)
+
+    report = asyncio.run(Compactor(db, bot=None, budget=RateBudget(rate=10000)).compact_user(1))
+
+    assert notion.archived == ['plain']
+    assert notion.archived_trees == [nested_tree]
+    assert [record.id for record in notion.records] == ['with-page']
+    assert (report.moved, report.skipped) == (2, 1)
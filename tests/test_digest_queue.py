@@ -0,0 +1,121 @@
+"""
+Тесты очереди рассылок и процессов-обработчиков (DIGEST_MODE=queue).
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from src.database import Database
+from src.digest_worker import DigestWorker
+from src.notion_errors import NotionNotFoundError, NotionRateLimitError
+from src.storage import MemoryUserStore
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    database.init_database()
+    yield database
+    database.close()
+
+
+def statuses(db):
+    rows = db.get_connection().execute('SELECT user_id, status, attempts FROM digest_jobs ORDER BY id')
+    return [(row['user_id'], row['status'], row['attempts']) for row in rows]
+
+
+def test_enqueue_is_idempotent_per_slot(db):
+    assert db.enqueue_digest_job(1, "2026-01-01T09:00:00+00:00", 100.0)
+    assert not db.enqueue_digest_job(1, "2026-01-01T09:00:00+00:00", 101.0)
+    assert db.enqueue_digest_job(1, "2026-01-02T09:00:00+00:00", 102.0)
+
+
+def test_lease_claim_and_expiry(db):
+    """Задание в аренде не берёт другой обработчик, пока аренда не истекла."""
+    db.enqueue_digest_job(1, "slot", 100.0)
+    db.enqueue_digest_job(2, "slot", 100.0)
+
+    first = db.claim_digest_jobs("a", lease_seconds=60, limit=1, max_attempts=3, now=100.0)
+    second = db.claim_digest_jobs("b", lease_seconds=60, limit=5, max_attempts=3, now=101.0)
+    assert [job['user_id'] for job in first] == [1]
+    assert [job['user_id'] for job in second] == [2]
+    assert db.claim_digest_jobs("b", lease_seconds=60, limit=5, max_attempts=3, now=110.0) == []
+
+    # Обработчик «a» упал: после окончания аренды задание берёт «b»
+    retaken = db.claim_digest_jobs("b", lease_seconds=60, limit=5, max_attempts=3, now=160.5)
+    assert [(job['user_id'], job['attempts']) for job in retaken] == [(1, 2)]
+    assert not db.finish_digest_job(first[0]['id'], "a", 162.0)
+    assert not db.extend_digest_lease(first[0]['id'], "a", 300.0)
+    assert db.finish_digest_job(first[0]['id'], "b", 162.0)
+
+    stats = db.get_digest_queue_stats(170.0)
+    assert (stats['done'], stats['leased'], stats['pending']) == (1, 1, 0)
+
+
+def test_expired_lease_fails_after_max_attempts(db):
+    db.enqueue_digest_job(1, "slot", 0.0)
+    for attempt in range(2):
+        db.claim_digest_jobs("a", lease_seconds=10, limit=1, max_attempts=2, now=attempt * 20.0)
+    assert db.claim_digest_jobs("a", lease_seconds=10, limit=1, max_attempts=2, now=100.0) == []
+    assert statuses(db) == [(1, 'failed', 2)]
+    assert db.purge_digest_jobs(before=200.0) == 1
+
+
+class FakeManager:
+    """Менеджер рассылок, который падает для заданных пользователей."""
+
+    def __init__(self, errors):
+        self.storage = MemoryUserStore()
+        self.errors = errors
+        self.delivered = []
+        self.failures = []
+
+    async def deliver_digest(self, user_id, config):
+        if user_id in self.errors:
+            raise self.errors[user_id]
+        self.delivered.append(user_id)
+
+    async def handle_failure(self, user_id, config, error):
+        self.failures.append(user_id)
+
+
+def test_late_jobs_are_skipped(db):
+    """Задания, опоздавшие больше чем на max_lateness, не отправляются пачкой после простоя."""
+    db.enqueue_digest_job(1, "09:00", 0.0)
+    db.enqueue_digest_job(1, "10:00", 3600.0)
+    db.enqueue_digest_job(2, "13:00", 14400.0)
+
+    jobs = db.claim_digest_jobs("a", lease_seconds=60, limit=5, max_attempts=3, now=15000.0, max_lateness=3600)
+    assert [job['due_at'] for job in jobs] == ["13:00"]
+    assert statuses(db) == [(1, 'skipped', 0), (1, 'skipped', 0), (2, 'leased', 1)]
+    assert db.get_digest_queue_stats(15000.0)['skipped'] == 2
+    assert db.purge_digest_jobs(20000.0) == 2
+
+
+def test_worker_delivers_retries_and_fails(db):
+    """Временная ошибка Notion откладывает задание, постоянная завершает его с ошибкой."""
+    for user_id in (1, 2, 3):
+        db.enqueue_digest_job(user_id, "slot", time.time())
+    manager = FakeManager({
+        2: NotionRateLimitError("rate limited", status=429, retry_after=5),
+        3: NotionNotFoundError("not found", status=404),
+    })
+    worker = DigestWorker(db, manager, owner="w", retry_delay=30, poll_interval=0.01)
+
+    async def scenario():
+        stop = asyncio.Event()
+        runner = asyncio.ensure_future(worker.run(stop))
+        while worker.done + worker.retried + worker.failed < 3:
+            await asyncio.sleep(0.01)
+        stop.set()
+        await runner
+
+    asyncio.run(scenario())
+    assert manager.delivered == [1]
+    assert sorted(manager.failures) == [2, 3]
+    assert statuses(db) == [(1, 'done', 1), (2, 'pending', 1), (3, 'failed', 1)]
+    assert (worker.done, worker.retried, worker.failed, worker.lost) == (1, 1, 1, 0)
+    # Повтор — не раньше задержки
+    assert db.claim_digest_jobs("w", lease_seconds=60, limit=5, max_attempts=3, now=1.0) == []
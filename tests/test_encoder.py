@@ -0,0 +1,104 @@
+"""
+Тесты кодирования заметок в блоки Notion.
+"""
+
+from src.encoder import (
+    RICH_TEXT_LIMIT,
+    encode_note,
+    rich_text,
+    split_lines,
+    split_text,
+    text_length,
+)
+from src.notion_api import NotionClient
+
+
+def test_split_text_respects_limit_and_round_trips():
+    text = ("слово " * 900).strip()
+    segments = split_text(text)
+    assert ''.join(segments) == text
+    assert len(segments) == 3
+    assert all(text_length(segment) <= RICH_TEXT_LIMIT for segment in segments)
+    # Разрез по границе слова
+    assert segments[0].endswith(' ')
+
+    assert split_text("") == [""]
+    assert split_text("коротко") == ["коротко"]
+
+
+def test_split_text_counts_utf16_units():
+    # Эмодзи занимает две единицы UTF-16
+    text = "😀" * 1500
+    segments = split_text(text)
+    assert ''.join(segments) == text
+    assert [len(segment) for segment in segments] == [1000, 500]
+    assert len(rich_text(text)) == 2
+
+
+def test_split_lines_strips_bullets():
+    text = "Покупки:\n- хлеб\n* молоко\n\n• сыр\n1. яйца\n2) чай\n[ ] кофе"
+    assert split_lines(text) == ["Покупки:", "хлеб", "молоко", "сыр", "яйца", "чай", "кофе"]
+
+
+def test_encode_note_modes():
+    assert len(encode_note("a\nb")) == 1
+    blocks = encode_note("a\nb", per_line=True)
+    assert [block['to_do']['rich_text'][0]['text']['content'] for block in blocks] == ["a", "b"]
+    # Текст без непустых строк записывается как есть
+    assert len(encode_note("  \n ", per_line=True)) == 1
+
+
+class FakeSDK:
+    """Заглушка notion_client.Client, запоминающая запросы добавления блоков."""
+
+    def __init__(self):
+        self.appends = []
+        self.updates = []
+        self.deletes = []
+        self.blocks = self
+        self.children = self
+        self._next = 0
+
+    def append(self, block_id, children, after=None):
+        self.appends.append((block_id, len(children), after))
+        ids = []
+        for _ in children:
+            self._next += 1
+            ids.append({'id': f"b{self._next}"})
+        return {'results': ids}
+
+    def update(self, block_id, **kwargs):
+        self.updates.append(block_id)
+
+    def delete(self, block_id):
+        self.deletes.append(block_id)
+
+
+def make_client():
+    notion = NotionClient()
+    notion.client = FakeSDK()
+    return notion
+
+
+def test_paste_of_many_lines_is_one_request():
+    notion = make_client()
+    text = "\n".join(f"- пункт {i}" for i in range(30))
+    block_ids = notion.append_to_page("page", text, per_line=True)
+    assert len(block_ids) == 30
+    assert notion.client.appends == [("page", 30, None)]
+
+    long_note = notion.append_to_page("page", "x" * 5000)
+    assert len(long_note) == 1
+    assert len(notion.client.appends) == 2
+
+
+def test_replace_note_blocks_updates_deletes_and_inserts_after_last():
+    notion = make_client()
+    assert notion.replace_note_blocks("page", ["a", "b", "c"], "один\nдва", per_line=True) == ["a", "b"]
+    assert notion.client.updates == ["a", "b"]
+    assert notion.client.deletes == ["c"]
+
+    notion = make_client()
+    result = notion.replace_note_blocks("page", ["a"], "один\nдва\nтри", per_line=True)
+    assert result == ["a", "b1", "b2"]
+    assert notion.client.appends == [("page", 2, "a")]
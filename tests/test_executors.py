@@ -0,0 +1,61 @@
+"""
+Тесты ограниченных пулов потоков.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.executors import POLICY_REJECT, POLICY_SHED, POLICY_WAIT, BoundedExecutor, ExecutorSaturated
+
+
+def _blocking(event: threading.Event, value):
+    event.wait(5)
+    return value
+
+
+async def _saturate(policy: str):
+    """Занять единственный поток и место в очереди, затем отправить третью задачу."""
+    executor = BoundedExecutor('test', max_workers=1, max_queue=1, policy=policy)
+    release = threading.Event()
+    running = asyncio.ensure_future(executor.run(_blocking, release, 'running'))
+    queued = asyncio.ensure_future(executor.run(_blocking, release, 'queued'))
+    while executor.active != 1 or executor.queued != 1:
+        await asyncio.sleep(0.01)
+
+    third = asyncio.ensure_future(executor.run(_blocking, release, 'third'))
+    await asyncio.sleep(0.05)
+    release.set()
+    results = await asyncio.gather(running, queued, third, return_exceptions=True)
+    executor.shutdown()
+    return executor, results
+
+
+def test_reject_policy():
+    """При переполнении новая задача отклоняется."""
+    executor, results = asyncio.run(_saturate(POLICY_REJECT))
+    assert results[:2] == ['running', 'queued']
+    assert isinstance(results[2], ExecutorSaturated)
+    assert executor.stats()['rejected'] == 1
+
+
+def test_shed_policy():
+    """При переполнении вытесняется самая старая задача из очереди."""
+    executor, results = asyncio.run(_saturate(POLICY_SHED))
+    assert results[0] == 'running'
+    assert isinstance(results[1], ExecutorSaturated)
+    assert results[2] == 'third'
+    assert executor.stats()['shed'] == 1
+
+
+def test_wait_policy():
+    """При переполнении вызывающий ждёт, задачи не теряются."""
+    executor, results = asyncio.run(_saturate(POLICY_WAIT))
+    assert results == ['running', 'queued', 'third']
+    assert executor.stats()['completed'] == 3
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BoundedExecutor('test', 1, 1, policy='drop')
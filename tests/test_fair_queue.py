@@ -0,0 +1,127 @@
+"""
+Тесты справедливой очереди пользователей.
+"""
+
+import asyncio
+
+import pytest
+
+from src.fair_queue import FairScheduler, FairUpdateProcessor, QueueOverflow, current_user, parse_weights
+
+
+async def _run_order(scheduler: FairScheduler, jobs):
+    """Занять единственный слот, поставить задачи в очередь и вернуть порядок выполнения."""
+    order = []
+    gate = asyncio.Event()
+
+    async def job(key, label):
+        async with scheduler.slot(key):
+            order.append(label)
+
+    async def blocker():
+        async with scheduler.slot('blocker'):
+            await gate.wait()
+
+    first = asyncio.ensure_future(blocker())
+    await asyncio.sleep(0)
+    tasks = [asyncio.ensure_future(job(key, label)) for key, label in jobs]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(first, *tasks)
+    return order
+
+
+def test_light_user_not_stuck_behind_backlog():
+    """Задача лёгкого пользователя выполняется через круг, а не после всей очереди тяжёлого."""
+    scheduler = FairScheduler('test', capacity=1, weights={})
+    jobs = [('heavy', f'h{i}') for i in range(50)] + [('light', 'l0')]
+    order = asyncio.run(_run_order(scheduler, jobs))
+    assert order.index('l0') <= 1
+    assert scheduler.stats()['heavy']['served'] == 50
+    assert scheduler.stats()['light']['depth'] == 0
+
+
+def test_weights_share_slots():
+    """Пользователь с весом 2 получает два слота за обход."""
+    scheduler = FairScheduler('test', capacity=1, weights={'a': 2})
+    jobs = [('a', f'a{i}') for i in range(4)] + [('b', f'b{i}') for i in range(4)]
+    order = asyncio.run(_run_order(scheduler, jobs))
+    assert order[:6] == ['a0', 'a1', 'b0', 'a2', 'a3', 'b1']
+
+
+def test_overflow_sheds_longest_queue():
+    """При переполнении вытесняется задача самой длинной очереди, а её владельцу отказывают."""
+    async def scenario():
+        scheduler = FairScheduler('test', capacity=1, max_pending=3, weights={})
+        await scheduler.acquire('blocker')
+        heavy = [asyncio.ensure_future(scheduler.acquire('heavy')) for _ in range(3)]
+        await asyncio.sleep(0)
+        light = asyncio.ensure_future(scheduler.acquire('light'))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueOverflow):
+            await scheduler.acquire('heavy')
+        await asyncio.sleep(0)
+        assert isinstance(heavy[-1].exception(), QueueOverflow)
+        assert scheduler.depth('light') == 1
+        for task in heavy[:-1] + [light]:
+            task.cancel()
+        await asyncio.gather(*heavy[:-1], light, return_exceptions=True)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.pending == 0
+    assert scheduler.stats()['heavy']['dropped'] == 2
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        scheduler = FairScheduler('test', capacity=1, weights={})
+        await scheduler.acquire('a')
+        waiter = asyncio.ensure_future(scheduler.acquire('b'))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release('a')
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.active == 0
+    assert scheduler.pending == 0
+
+
+def test_update_processor_serializes_user():
+    """Обновления одного пользователя идут по одному и видят current_user."""
+    class User:
+        def __init__(self, user_id):
+            self.id = user_id
+
+    class Update:
+        def __init__(self, user_id):
+            self.effective_user = User(user_id)
+
+    async def scenario():
+        processor = FairUpdateProcessor(concurrency=4, weights={})
+        running = {1: 0, 2: 0}
+        peak = {1: 0, 2: 0}
+        seen = []
+
+        async def handle(user_id):
+            running[user_id] += 1
+            peak[user_id] = max(peak[user_id], running[user_id])
+            seen.append(current_user.get())
+            await asyncio.sleep(0.01)
+            running[user_id] -= 1
+
+        await asyncio.gather(*(
+            processor.process_update(Update(user_id), handle(user_id))
+            for user_id in (1, 1, 1, 2, 2)
+        ))
+        return peak, seen
+
+    peak, seen = asyncio.run(scenario())
+    assert peak == {1: 1, 2: 1}
+    assert sorted(seen) == [1, 1, 1, 2, 2]
+
+
+def test_parse_weights():
+    assert parse_weights("1:2, 2:0.5,bad,3:-1,4:x,") == {1: 2.0, 2: 0.5}
@@ -0,0 +1,79 @@
+"""
+Тесты общего пула соединений Notion и кэша DNS.
+"""
+
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import http_pool
+from src.http_pool import CachingDNSBackend, get_pool_stats, shutdown_shared_transport
+from src.notion_api import NotionClient
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def shared_transport():
+    shutdown_shared_transport()
+    yield
+    shutdown_shared_transport()
+
+
+def test_clients_of_different_tokens_share_connections(server, shared_transport):
+    """Клиенты разных токенов ходят через одно соединение общего пула."""
+    first, second = NotionClient.for_token("token-a"), NotionClient.for_token("token-b")
+    for client in (first, second, first):
+        assert client.client.client.get(f"{server}/v1/users/me").status_code == 200
+
+    stats = get_pool_stats()
+    assert (stats['requests'], stats['new_connections'], stats['reused']) == (3, 1, 2)
+    assert stats['reuse_ratio'] == pytest.approx(2 / 3)
+
+
+def test_dns_cache_respects_ttl(monkeypatch):
+    now = [100.0]
+    calls = []
+
+    def getaddrinfo(host, port, type=0):
+        calls.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', port))] * 2
+
+    monkeypatch.setattr(http_pool.socket, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(http_pool.time, 'monotonic', lambda: now[0])
+    backend = CachingDNSBackend(ttl=300)
+
+    assert backend._resolve('api.notion.com', 443) == ['10.0.0.1']
+    now[0] += 299
+    assert backend._resolve('api.notion.com', 443) == ['10.0.0.1']
+    assert (backend.lookups, backend.hits) == (1, 1)
+
+    now[0] += 2
+    backend._resolve('api.notion.com', 443)
+    assert calls == ['api.notion.com', 'api.notion.com']
+    assert (backend.lookups, backend.hits) == (2, 1)
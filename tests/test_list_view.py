@@ -0,0 +1,43 @@
+"""
+Тесты постраничного /list.
+"""
+
+from src.list_view import (
+    TELEGRAM_MESSAGE_LIMIT,
+    ListCursorCache,
+    format_notes,
+    message_length,
+)
+
+
+def test_cursors_are_scoped_to_user_target_and_page():
+    cursors = ListCursorCache()
+    cursors.reset(1, 'inbox')
+    cursors.store(1, 'inbox', 1, 'cursor-1')
+
+    assert cursors.get(1, 'inbox', 0) is None
+    assert cursors.get(1, 'inbox', 1) == 'cursor-1'
+    assert ListCursorCache.is_missing(cursors.get(1, 'inbox', 2))
+    assert ListCursorCache.is_missing(cursors.get(1, 'other', 1))
+    assert ListCursorCache.is_missing(cursors.get(2, 'inbox', 0))
+
+
+def test_expired_cursors_are_missing():
+    cursors = ListCursorCache(ttl=-1)
+    cursors.reset(1, 'inbox')
+    assert ListCursorCache.is_missing(cursors.get(1, 'inbox', 0))
+
+
+def test_format_notes_fits_telegram_limit():
+    notes = [("😀" * 1500, False) for _ in range(20)]
+    text = format_notes(notes, "📋 Заметки:\n", "footer")
+
+    assert message_length(text) <= TELEGRAM_MESSAGE_LIMIT
+    assert text.count("☐") == 20
+    assert text.endswith("footer")
+
+
+def test_format_notes_keeps_short_notes_intact():
+    notes = [("купить молоко", False), ("позвонить", True), ("абзац", None)]
+    text = format_notes(notes, "header")
+    assert text == "header\n☐ купить молоко\n☑ позвонить\n• абзац"
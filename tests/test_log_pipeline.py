@@ -0,0 +1,98 @@
+"""
+Тесты конвейера логов: очередь, ленивое форматирование, выборка и остановка.
+"""
+
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+from src import log_pipeline
+from src.log_pipeline import JsonFormatter, SamplingFilter, setup_logging, shutdown_logging
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    shutdown_logging()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def make_record(event=None, level=logging.INFO, name='test'):
+    record = logging.LogRecord(name, level, __file__, 1, "строка", (), None)
+    if event:
+        record.event = event
+    return record
+
+
+def test_sampling_keeps_warnings_and_counts_suppressed():
+    rolls = iter([0.9, 0.9, 0.05])
+    sampler = SamplingFilter(sampling={'db.write': 0.1}, rate_limits={}, rand=lambda: next(rolls))
+
+    assert not sampler.filter(make_record('db.write'))
+    assert not sampler.filter(make_record('db.write'))
+    assert sampler.filter(make_record('db.write', level=logging.WARNING))
+    assert sampler.filter(make_record('notion.append'))
+
+    kept = make_record('db.write')
+    assert sampler.filter(kept)
+    assert kept.suppressed == 2
+
+
+def test_rate_limit_refills_over_time():
+    now = [0.0]
+    sampler = SamplingFilter(sampling={}, rate_limits={'test': 2}, clock=lambda: now[0])
+
+    assert [sampler.filter(make_record()) for _ in range(3)] == [True, True, False]
+    now[0] = 0.5
+    record = make_record()
+    assert sampler.filter(record)
+    assert record.suppressed == 1
+    assert not sampler.filter(make_record())
+
+
+def test_message_is_formatted_in_listener_thread(root_logger):
+    stream = io.StringIO()
+    setup_logging('INFO', 'text', stream)
+    caller = threading.current_thread()
+    formatted_in = []
+
+    class Argument:
+        def __str__(self):
+            formatted_in.append(threading.current_thread())
+            return "значение"
+
+    logging.getLogger('test').info("аргумент %s", Argument(), extra={'event': 'test.lazy', 'user_id': 7})
+    shutdown_logging()
+
+    assert formatted_in and caller not in formatted_in
+    assert "аргумент значение | event=test.lazy user_id=7" in stream.getvalue()
+
+
+def test_shutdown_flushes_queue_and_switches_to_direct_output(root_logger):
+    stream = io.StringIO()
+    setup_logging('INFO', 'text', stream)
+    logger = logging.getLogger('test')
+    for index in range(1000):
+        logger.info("строка %d", index)
+    shutdown_logging()
+    logger.info("после остановки")
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1001
+    assert lines[999].endswith("строка 999")
+    assert lines[-1].endswith("после остановки")
+    assert log_pipeline._listener is None
+
+
+def test_json_formatter_includes_extra_fields():
+    record = make_record('digest.sent')
+    record.user_id = 42
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == "строка"
+    assert (entry['level'], entry['event'], entry['user_id']) == ('INFO', 'digest.sent', 42)
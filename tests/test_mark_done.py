@@ -0,0 +1,126 @@
+"""
+Тесты пакетной отметки заметок выполненными.
+"""
+
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from src import app_globals, handlers, mark_done
+from src.database import Database
+from src.inbox_cache import ChangeTracker, InboxCache
+from src.mark_done import MarkDoneBatcher, RateBudget
+from src.notion_api import InboxTarget, TARGET_PAGE
+from src.utils import get_mark_done_keyboard, set_mark_done_button
+
+TARGET = InboxTarget(TARGET_PAGE, "page")
+
+
+class FakeNotion:
+    """Заглушка NotionClient, запоминающая отмеченные заметки."""
+
+    def __init__(self, failing=()):
+        self.calls = []
+        self.failing = set(failing)
+        self._lock = threading.Lock()
+
+    def mark_done(self, target, note_id):
+        with self._lock:
+            self.calls.append(note_id)
+        if note_id in self.failing:
+            raise Exception("conflict")
+
+
+def test_taps_are_batched_deduplicated_and_report_failures(monkeypatch):
+    notion = FakeNotion(failing={'bad'})
+    monkeypatch.setattr(mark_done.NotionClient, 'for_token', classmethod(lambda cls, token: notion))
+
+    async def scenario():
+        batcher = MarkDoneBatcher(window=0.05, budget=RateBudget(rate=1000))
+        futures = [batcher.submit('token', TARGET, note_id) for note_id in ('a', 'b', 'a', 'bad')]
+        results = await asyncio.gather(*futures)
+        return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+    assert results == [True, True, True, False]
+    assert sorted(notion.calls) == ['a', 'b', 'bad']
+    assert batcher.batches == 1
+    assert batcher.failed == 1
+
+
+def test_rate_budget_spaces_requests_per_key():
+    async def scenario():
+        budget = RateBudget(rate=20)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*(budget.acquire('token') for _ in range(5)))
+        await budget.acquire('other')
+        return loop.time() - started
+
+    elapsed = asyncio.run(scenario())
+    assert 0.19 <= elapsed < 0.5
+
+
+def test_mark_done_button_toggles_and_rolls_back():
+    markup = get_mark_done_keyboard([('aaaa-bbbb', 'купить молоко'), ('cccc', 'позвонить')])
+
+    done = set_mark_done_button(markup, 'aaaa-bbbb', done=True)
+    assert done.inline_keyboard[0][0].text == "☑ купить молоко"
+    assert done.inline_keyboard[0][0].callback_data == "done_ok_aaaabbbb"
+    assert set_mark_done_button(done, 'aaaa-bbbb', done=True) is None
+
+    rolled_back = set_mark_done_button(done, 'aaaabbbb', done=False)
+    assert rolled_back.inline_keyboard == markup.inline_keyboard
+
+
+NOTE_ID = "1234abcd-0000-4000-8000-00000000abcd"
+
+
+class FakeStorage:
+    async def get_user_config(self, user_id):
+        return {'notion_token': 'token', 'page_id': 'page', 'target_type': TARGET_PAGE}
+
+
+class FakeBot:
+    async def edit_message_reply_markup(self, chat_id, message_id, reply_markup):
+        pass
+
+    async def send_message(self, chat_id, text):
+        raise AssertionError(text)
+
+
+def test_mark_done_tap_updates_search_index(tmp_path, monkeypatch):
+    """Отметка по кнопке доходит до строки индекса, хотя в callback_data ID без дефисов."""
+    db = Database(str(tmp_path / "test.db"))
+    db.init_database()
+    db.index_notes('page', [(NOTE_ID, "купить молоко", False)], 0.0)
+    notion = FakeNotion()
+    monkeypatch.setattr(mark_done.NotionClient, 'for_token', classmethod(lambda cls, token: notion))
+    monkeypatch.setattr(app_globals, 'db', db)
+    monkeypatch.setattr(app_globals, 'storage', FakeStorage())
+    monkeypatch.setattr(app_globals, 'inbox_cache', InboxCache())
+    monkeypatch.setattr(app_globals, 'inbox_changes', ChangeTracker())
+
+    markup = get_mark_done_keyboard([(NOTE_ID, "купить молоко")])
+    tasks = []
+
+    async def answer(*args, **kwargs):
+        pass
+
+    async def scenario():
+        monkeypatch.setattr(app_globals, 'mark_done', MarkDoneBatcher(window=0.01, budget=RateBudget(rate=1000)))
+        query = SimpleNamespace(
+            data=markup.inline_keyboard[0][0].callback_data, answer=answer,
+            message=SimpleNamespace(chat_id=1, message_id=5, reply_markup=markup),
+        )
+        update = SimpleNamespace(callback_query=query, effective_user=SimpleNamespace(id=1))
+        context = SimpleNamespace(bot=FakeBot(), application=SimpleNamespace(
+            create_task=lambda coro: tasks.append(asyncio.ensure_future(coro))
+        ))
+        await handlers.handle_mark_done(update, context)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert notion.calls == [NOTE_ID]
+    assert [row['checked'] for row in db.search_notes('page', ['молоко'])] == [True]
+    db.close()
@@ -0,0 +1,166 @@
+"""
+Тесты потоковой записи файлов в Notion.
+"""
+
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src.database import Database
+from src.media import MediaCapture, MediaError, MediaItem, media_from_message
+from src.notion_api import InboxTarget, NotionClient, TARGET_PAGE
+from src.notion_errors import UNKNOWN_OUTCOME_ERRORS, NotionTimeoutError
+
+TARGET = InboxTarget(TARGET_PAGE, "page")
+PART = 1000
+
+
+class FakeNotion:
+    """Заглушка NotionClient, запоминающая загрузки и части."""
+
+    UNKNOWN_OUTCOME_ERRORS = UNKNOWN_OUTCOME_ERRORS
+
+    def __init__(self):
+        self.uploads = []
+        self.parts = []
+        self.completed = []
+        self.notes = []
+        self.fail_after_write = False
+        self._lock = threading.Lock()
+
+    def create_file_upload(self, filename, content_type, parts):
+        self.uploads.append((filename, content_type, parts))
+        return f"upload-{len(self.uploads)}"
+
+    def send_file_part(self, upload_id, data, filename, content_type, part_number=None):
+        with self._lock:
+            self.parts.append((upload_id, part_number, len(data)))
+
+    def complete_file_upload(self, upload_id):
+        self.completed.append(upload_id)
+
+    def add_media_note(self, target, caption, block_type, upload_id, filename):
+        self.notes.append((caption, block_type, upload_id))
+        if self.fail_after_write:
+            self.fail_after_write = False
+            raise NotionTimeoutError("таймаут")
+        return f"note-{len(self.notes)}"
+
+    def find_note_by_text(self, target, content, exclude):
+        for index in range(len(self.notes), 0, -1):
+            if self.notes[index - 1][0] == content and f"note-{index}" not in exclude:
+                return f"note-{index}"
+        return None
+
+
+async def chunks(size: int, chunk_size: int = 300):
+    sent = 0
+    while sent < size:
+        step = min(chunk_size, size - sent)
+        sent += step
+        yield b"x" * step
+
+
+def make_item(size, filename="report.pdf"):
+    return MediaItem("file-id", size, filename, 'application/pdf', 'file', "📎 report.pdf")
+
+
+def test_large_file_is_sent_in_bounded_parts():
+    notion = FakeNotion()
+    media = MediaCapture(db=None, part_size=PART, chunk_size=300)
+
+    upload_id = asyncio.run(media.upload(notion, chunks(3500), make_item(3500), 3500))
+
+    assert notion.uploads == [("report.pdf", 'application/pdf', 4)]
+    assert notion.parts == [(upload_id, 1, 1000), (upload_id, 2, 1000), (upload_id, 3, 1000), (upload_id, 4, 500)]
+    assert notion.completed == [upload_id]
+    # В памяти не больше одной части и одного куска
+    assert media.peak_buffer < PART + 300
+    assert media.bytes == 3500
+
+
+def test_small_file_is_single_part():
+    notion = FakeNotion()
+    media = MediaCapture(db=None, part_size=PART)
+
+    asyncio.run(media.upload(notion, chunks(PART), make_item(PART), PART))
+
+    assert notion.uploads[0][2] == 1
+    assert notion.parts == [("upload-1", None, PART)]
+    assert notion.completed == []
+
+
+def test_size_mismatch_and_limit_are_rejected():
+    media = MediaCapture(db=None, part_size=PART, max_file_size=5000)
+
+    with pytest.raises(MediaError):
+        asyncio.run(media.upload(FakeNotion(), chunks(1500), make_item(1000), 1000))
+    with pytest.raises(MediaError):
+        asyncio.run(media.upload(FakeNotion(), chunks(900), make_item(1000), 1000))
+    with pytest.raises(MediaError):
+        media.check_size(make_item(6000))
+
+
+class FakeBot:
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_size=1200, file_path="https://example.invalid/file")
+
+
+def test_capture_maps_message_once(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    db.init_database()
+    notion = FakeNotion()
+    media = MediaCapture(db, part_size=PART)
+    media.iter_file = lambda file_path: chunks(1200)
+
+    async def scenario():
+        first = await media.capture(FakeBot(), notion, 1, 10, TARGET, make_item(1200))
+        second = await media.capture(FakeBot(), notion, 1, 10, TARGET, make_item(1200))
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second == "note-1"
+    assert len(notion.uploads) == 1
+    assert db.get_message_block(1, 10)['block_id'] == "note-1"
+
+
+def test_capture_after_timeout_does_not_upload_again(tmp_path):
+    """Повтор после таймаута, когда заметка всё же создана, не добавляет второй файл."""
+    db = Database(str(tmp_path / "test.db"))
+    db.init_database()
+    notion = FakeNotion()
+    notion.fail_after_write = True
+    media = MediaCapture(db, part_size=PART)
+    media.iter_file = lambda file_path: chunks(1200)
+
+    with pytest.raises(NotionTimeoutError):
+        asyncio.run(media.capture(FakeBot(), notion, 1, 11, TARGET, make_item(1200)))
+    assert db.get_message_block(1, 11)['block_id'] is None
+
+    note_id = asyncio.run(media.capture(FakeBot(), notion, 1, 11, TARGET, make_item(1200)))
+    assert note_id == "note-1"
+    assert len(notion.uploads) == len(notion.notes) == 1
+    assert db.get_message_block(1, 11)['block_id'] == "note-1"
+
+
+def test_media_from_message_and_block():
+    photo = SimpleNamespace(
+        message_id=5, caption=None, voice=None, audio=None, document=None,
+        photo=[SimpleNamespace(file_id="small", file_size=10), SimpleNamespace(file_id="big", file_size=99)],
+    )
+    item = media_from_message(photo)
+    assert (item.file_id, item.block_type, item.content_type) == ("big", 'image', 'image/jpeg')
+
+    voice = SimpleNamespace(
+        message_id=6, caption="купить молоко", photo=(), audio=None, document=None,
+        voice=SimpleNamespace(file_id="v", file_size=5, mime_type='audio/ogg'),
+    )
+    item = media_from_message(voice)
+    assert (item.block_type, item.caption) == ('audio', "купить молоко")
+
+    assert NotionClient.media_block('file', "u1", "a.pdf") == {
+        "object": "block", "type": "file",
+        "file": {"type": "file_upload", "file_upload": {"id": "u1"}, "name": "a.pdf"},
+    }
@@ -0,0 +1,184 @@
+"""
+Тесты рассылки: проверка неизменившегося инбокса и политики DIGEST_UNCHANGED_POLICY.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.blocks import BlockRecord
+from src.database import Database
+from src.list_view import TELEGRAM_MESSAGE_LIMIT, message_length
+from src.notifications import NotificationManager
+from src.notion_api import NotionClient, TARGET_PAGE
+from src.storage import MemoryUserStore
+
+CONFIG = {'notion_token': 'secret', 'page_id': 'page', 'target_type': TARGET_PAGE}
+EDITED = '2026-10-19T09:00:00.000Z'
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    database.init_database()
+    yield database
+    database.close()
+
+
+class FakeNotion:
+    def __init__(self, records, last_edited_time=EDITED):
+        self.client = object()
+        self.records = records
+        self.last_edited_time = last_edited_time
+        self.listed = 0
+
+    def get_last_edited_time(self, target):
+        return self.last_edited_time
+
+    def list_unchecked(self, target):
+        self.listed += 1
+        return self.records
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append((text, reply_markup))
+
+
+def make_state(**overrides):
+    state = {
+        'page_id': 'page', 'last_edited_time': EDITED, 'items_hash': 'hash', 'item_count': 2,
+        'message': "полный список", 'checked_at': '2026-10-19T09:05:00+00:00',
+    }
+    state.update(overrides)
+    return state
+
+
+def test_unchanged_requires_check_after_edited_minute():
+    assert NotificationManager._is_unchanged_since(make_state(), 'page', EDITED)
+    # Проверка в ту же минуту, что и правка: в этой минуте могли быть ещё изменения
+    assert not NotificationManager._is_unchanged_since(
+        make_state(checked_at='2026-10-19T09:00:30+00:00'), 'page', EDITED
+    )
+    assert not NotificationManager._is_unchanged_since(make_state(), 'page', '2026-10-19T09:04:00.000Z')
+    assert not NotificationManager._is_unchanged_since(make_state(), 'other', EDITED)
+    assert not NotificationManager._is_unchanged_since({}, 'page', EDITED)
+    assert not NotificationManager._is_unchanged_since(make_state(), 'page', None)
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('skip', None),
+    ('full', "полный список"),
+    ('compact', "📬 В инбоксе по-прежнему 2 неразобранных задач."),
+])
+def test_unchanged_policies(db, policy, expected):
+    manager = NotificationManager(db, bot=None, storage=MemoryUserStore(), unchanged_policy=policy)
+    message = manager._render_unchanged(make_state())
+    if expected is None:
+        assert message is None
+    else:
+        assert message.startswith(expected)
+    # Пустой инбокс напоминает полным текстом и в compact
+    if policy != 'skip':
+        assert manager._render_unchanged(make_state(item_count=0, message="пусто")) == "пусто"
+
+
+def test_unknown_policy_warns_and_uses_compact(db, caplog):
+    with caplog.at_level(logging.WARNING, logger='src.notifications'):
+        manager = NotificationManager(db, bot=None, storage=MemoryUserStore(), unchanged_policy='never')
+    assert manager.unchanged_policy == 'compact'
+    assert "DIGEST_UNCHANGED_POLICY" in caplog.text
+
+
+def deliver(db, notion, monkeypatch, policy='compact'):
+    monkeypatch.setattr(NotionClient, 'for_token', classmethod(lambda cls, token: notion))
+    bot = FakeBot()
+    manager = NotificationManager(db, bot=bot, storage=MemoryUserStore(), unchanged_policy=policy)
+    asyncio.run(manager.deliver_digest(1, CONFIG))
+    return bot.sent
+
+
+def test_deliver_digest_unchanged_and_changed_hash(db, monkeypatch):
+    records = [BlockRecord('a', 'to_do', "купить хлеб", False, None)]
+    notion = FakeNotion(records)
+
+    text, markup = deliver(db, notion, monkeypatch)[0]
+    assert "купить хлеб" in text and markup is not None
+    assert notion.listed == 1
+
+    # Время правки то же и проверка была позже этой минуты — список не запрашивается
+    checked_at = (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat()
+    state = db.get_digest_state(1)
+    db.save_digest_state(1, 'page', EDITED, state['items_hash'], 1, state['message'], checked_at)
+    text, markup = deliver(db, notion, monkeypatch)[0]
+    assert text.startswith("📬 В инбоксе по-прежнему 1") and markup is None
+    assert notion.listed == 1
+    assert deliver(db, notion, monkeypatch, policy='skip') == []
+
+    # Страница менялась, но набор задач тот же — напоминание без повторного списка
+    notion.last_edited_time = '2026-10-19T10:00:00.000Z'
+    text, _ = deliver(db, notion, monkeypatch)[0]
+    assert text.startswith("📬 В инбоксе по-прежнему")
+    assert notion.listed == 2
+
+    # Новая задача меняет хэш — полный список с кнопками
+    notion.records = records + [BlockRecord('b', 'to_do', "позвонить", False, None)]
+    notion.last_edited_time = '2026-10-19T11:00:00.000Z'
+    text, markup = deliver(db, notion, monkeypatch)[0]
+    assert "позвонить" in text and markup is not None
+    assert db.get_digest_state(1)['item_count'] == 2
+
+
+class FlakyBot(FakeBot):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Telegram недоступен")
+        await super().send_message(chat_id, text, reply_markup)
+
+
+def test_failed_send_keeps_full_digest_for_retry(db, monkeypatch):
+    records = [BlockRecord('a', 'to_do', "купить хлеб", False, None)]
+    notion = FakeNotion(records, last_edited_time='2026-10-19T08:00:00.000Z')
+    monkeypatch.setattr(NotionClient, 'for_token', classmethod(lambda cls, token: notion))
+    bot = FlakyBot(failures=1)
+    manager = NotificationManager(db, bot=bot, storage=MemoryUserStore(), unchanged_policy='compact')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(manager.deliver_digest(1, CONFIG))
+    # Неотправленная рассылка не считается доставленной
+    assert not db.get_digest_state(1)
+
+    # Повтор присылает полный список с кнопками, а не напоминание
+    asyncio.run(manager.deliver_digest(1, CONFIG))
+    text, markup = bot.sent[0]
+    assert "купить хлеб" in text and markup is not None
+    assert db.get_digest_state(1)['item_count'] == 1
+
+
+def test_large_inbox_digest_fits_one_message(db, monkeypatch):
+    records = [
+        BlockRecord(f"{index:032x}", 'to_do', f"задача {index} 📌 " + "подробности " * 20, False, None)
+        for index in range(300)
+    ]
+    text, markup = deliver(db, FakeNotion(records), monkeypatch)[0]
+    assert message_length(text) <= TELEGRAM_MESSAGE_LIMIT
+    assert text.startswith("📬 Неразобранный инбокс (300 задачи)")
+    assert text.endswith("💡 Используйте /list для просмотра всех заметок")
+    assert markup is not None
+
+    # Небольшой список выводится целиком, как и раньше
+    short = NotificationManager._render_digest(["купить хлеб", "позвонить"])
+    assert short == (
+        "📬 Неразобранный инбокс (2 задачи):\n\n☐ купить хлеб\n☐ позвонить\n"
+        "\n💡 Используйте /list для просмотра всех заметок"
+    )
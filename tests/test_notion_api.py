@@ -4,6 +4,8 @@
 
 import os
 import json
+from types import SimpleNamespace
+
 import pytest
 from dotenv import load_dotenv
 
@@ -51,3 +53,295 @@ def test_notion_get_user_data():
     # Проверяем что имя пользователя равно "inbox writer"
     user_name = user_data.get("name")
     assert user_name == "inbox writer", f"Ожидалось имя 'inbox writer', получено: '{user_name}'"
+
+
+class Recorder:
+    """Заглушка метода SDK: запоминает вызовы и отвечает заданной функцией."""
+
+    def __init__(self, respond=None):
+        self.calls = []
+        self.respond = respond or (lambda *args, **kwargs: {})
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        return self.respond(*args, **kwargs)
+
+
+class StubSDK:
+    """Заглушка notion_client.Client с нужными эндпоинтами."""
+
+    def __init__(self):
+        self.created = 0
+        self.blocks = SimpleNamespace(
+            retrieve=Recorder(), update=Recorder(), delete=Recorder(),
+            children=SimpleNamespace(list=Recorder(), append=Recorder(self._append)),
+        )
+        self.pages = SimpleNamespace(retrieve=Recorder(), create=Recorder(self._create), update=Recorder())
+        self.databases = SimpleNamespace(retrieve=Recorder(), update=Recorder())
+        self.data_sources = SimpleNamespace(retrieve=Recorder(), update=Recorder(), query=Recorder())
+
+    def _new_id(self):
+        self.created += 1
+        return f"new-{self.created}"
+
+    def _append(self, block_id, children):
+        return {'results': [{'id': self._new_id()} for _ in children]}
+
+    def _create(self, **kwargs):
+        return {'id': self._new_id()}
+
+
+def stub_client():
+    from src.notion_api import NotionClient
+
+    client = NotionClient()
+    client.token = 'stub-token'
+    client.client = StubSDK()
+    return client
+
+
+def _block(block_id, block_type, text, has_children=False, **payload):
+    return {
+        'object': 'block', 'id': block_id, 'type': block_type, 'has_children': has_children,
+        'created_time': '2026-01-01T00:00:00.000Z',
+        block_type: {'rich_text': [{
+            'type': 'text', 'text': {'content': text, 'link': None}, 'plain_text': text, 'href': None,
+            'annotations': {'bold': True, 'italic': False, 'strikethrough': False, 'underline': False,
+                            'code': False, 'color': 'default'},
+        }], **payload},
+    }
+
+
+def test_archive_copies_nested_children_with_formatting():
+    """Заметка со вложенным блоком копируется в архив целиком, с оформлением."""
+    from src.notion_api import InboxTarget, TARGET_PAGE, count_tree_writes
+
+    client = stub_client()
+    sdk = client.client
+    sdk.blocks.retrieve.respond = lambda block_id: _block('todo', 'to_do', "Задача", True, checked=True)
+    children = {
+        'todo': [_block('child', 'bulleted_list_item', "Подпункт", True)],
+        'child': [_block('grandchild', 'paragraph', "Деталь")],
+    }
+    sdk.blocks.children.list.respond = lambda block_id, **params: {
+        'results': children[block_id], 'has_more': False, 'next_cursor': None
+    }
+
+    tree = client.get_block_tree('todo')
+    assert count_tree_writes(tree) == 3
+    client.archive_block_tree(InboxTarget(TARGET_PAGE, 'archive'), tree)
+
+    appends = [(args[0], kwargs['children']) for args, kwargs in sdk.blocks.children.append.calls]
+    assert [parent for parent, _ in appends] == ['archive', 'new-1', 'new-2']
+    top = appends[0][1][0]
+    assert top['to_do']['checked'] is True
+    assert top['to_do']['rich_text'][0]['annotations']['bold'] is True
+    assert 'plain_text' not in top['to_do']['rich_text'][0]
+    assert 'id' not in top
+    assert appends[1][1][0]['type'] == 'bulleted_list_item'
+    assert appends[2][1][0]['paragraph']['rich_text'][0]['text']['content'] == "Деталь"
+
+
+def test_block_tree_with_child_page_is_not_copyable():
+    client = stub_client()
+    sdk = client.client
+    sdk.blocks.retrieve.respond = lambda block_id: _block('todo', 'to_do', "Задача", True, checked=True)
+    sdk.blocks.children.list.respond = lambda block_id, **params: {
+        'results': [{'id': 'sub', 'type': 'child_page', 'has_children': False, 'child_page': {'title': "x"}}],
+        'has_more': False,
+    }
+    assert client.get_block_tree('todo') is None
+
+
+def test_append_rolls_back_earlier_batches_when_later_batch_is_rejected():
+    """Отклонённая вторая пачка длинной заметки не оставляет первую без привязки."""
+    from src.notion_errors import NotionRequestError
+
+    client = stub_client()
+    sdk = client.client
+    append = sdk.blocks.children.append.respond
+
+    def reject_second(block_id, children):
+        if sdk.blocks.children.append.calls[1:]:
+            raise NotionRequestError("validation", status=400)
+        return append(block_id, children)
+
+    sdk.blocks.children.append.respond = reject_second
+    text = "\n".join(f"строка {i}" for i in range(150))
+    with pytest.raises(NotionRequestError):
+        client.append_to_page('inbox', text, per_line=True)
+    deleted = [args[0] for args, _ in sdk.blocks.delete.calls]
+    assert deleted == [f"new-{i}" for i in range(1, 101)]
+
+
+def test_list_page_starts_from_newest_blocks():
+    """Первая страница /list для страницы-инбокса показывает последние блоки."""
+    from src.blocks import BlockRecord
+    from src.notion_api import InboxTarget, TARGET_PAGE
+
+    client = stub_client()
+    blocks = [BlockRecord(f"b{i}", "to_do", f"заметка {i}", False, None) for i in range(250)]
+    requests = []
+
+    def list_block_records(block_id, start_cursor=None, page_size=100):
+        requests.append(start_cursor)
+        start = int(start_cursor) if start_cursor else 0
+        end = min(start + page_size, len(blocks))
+        return blocks[start:end], (str(end) if end < len(blocks) else None)
+
+    client.list_block_records = list_block_records
+    target = InboxTarget(TARGET_PAGE, 'inbox')
+
+    records, cursor = client.list_target_page(target, None, 20)
+    assert [record.text for record in records[:2]] == ["заметка 249", "заметка 248"]
+    assert len(records) == 20 and requests == [None, '100', '200']
+
+    requests.clear()
+    seen = [record.id for record in records]
+    while cursor is not None:
+        records, cursor = client.list_target_page(target, cursor, 20)
+        seen.extend(record.id for record in records)
+    assert seen == [f"b{i}" for i in reversed(range(250))]
+    # Каждая следующая страница — один-два запроса за нужными порциями
+    assert len(requests) <= 2 * 12
+
+
+def _database_stub(properties):
+    """Клиент, для которого ID указывает на базу данных, а не на страницу."""
+    from src.notion_errors import NotionNotFoundError
+
+    client = stub_client()
+    sdk = client.client
+
+    def not_a_page(page_id):
+        raise NotionNotFoundError("not a page", status=404)
+
+    sdk.pages.retrieve.respond = not_a_page
+    sdk.databases.retrieve.respond = lambda database_id: {
+        'title': [{'plain_text': "Входящие"}], 'data_sources': [{'id': 'source'}],
+    }
+    sdk.data_sources.retrieve.respond = lambda source_id: {'properties': properties}
+    return client
+
+
+def test_resolve_target_falls_back_to_database_and_adds_checkbox():
+    from src.notion_api import DEFAULT_CHECKBOX_PROPERTY, TARGET_DATABASE
+
+    client = _database_stub({'Name': {'type': 'title'}, 'Теги': {'type': 'multi_select'}})
+    target, title = client.resolve_target('db')
+
+    assert title == "Входящие"
+    assert (target.type, target.id, target.data_source_id) == (TARGET_DATABASE, 'db', 'source')
+    assert (target.title_property, target.checkbox_property) == ('Name', DEFAULT_CHECKBOX_PROPERTY)
+    assert client.client.data_sources.update.calls == [
+        (('source',), {'properties': {DEFAULT_CHECKBOX_PROPERTY: {'checkbox': {}}}})
+    ]
+
+
+def test_resolve_target_keeps_existing_checkbox():
+    client = _database_stub({'Name': {'type': 'title'}, 'Сделано': {'type': 'checkbox'}})
+    target, _ = client.resolve_target('db')
+
+    assert target.checkbox_property == 'Сделано'
+    assert client.client.data_sources.update.calls == []
+
+
+def test_add_note_to_database_creates_page_with_title_and_checkbox():
+    from src.notion_api import InboxTarget, TARGET_DATABASE
+
+    client = stub_client()
+    target = InboxTarget(TARGET_DATABASE, 'db', 'source', 'Name', 'Сделано')
+    assert client.add_note(target, "Купить хлеб") == ['new-1']
+
+    (_, kwargs), = client.client.pages.create.calls
+    assert kwargs['parent'] == {'type': 'data_source_id', 'data_source_id': 'source'}
+    assert [item['text']['content'] for item in kwargs['properties']['Name']['title']] == ["Купить хлеб"]
+    assert kwargs['properties']['Сделано'] == {'checkbox': False}
+
+
+def test_database_queries_filter_unchecked_on_server():
+    from src.notion_api import InboxTarget, TARGET_DATABASE
+
+    client = stub_client()
+    pages = iter([
+        {'results': [{'id': 'p1', 'properties': {
+            'Name': {'title': [{'type': 'text', 'text': {'content': "первая"}}]}, 'Сделано': {'checkbox': False},
+        }}], 'has_more': True, 'next_cursor': 'c1'},
+        {'results': [], 'has_more': False, 'next_cursor': None},
+    ])
+    client.client.data_sources.query.respond = lambda source_id, **params: next(pages)
+    target = InboxTarget(TARGET_DATABASE, 'db', 'source', 'Name', 'Сделано')
+
+    records = client.list_unchecked(target)
+
+    assert [(record.id, record.text, record.checked) for record in records] == [('p1', "первая", False)]
+    first, second = client.client.data_sources.query.calls
+    assert first == (('source',), {
+        'sorts': [{'timestamp': 'created_time', 'direction': 'ascending'}],
+        'page_size': 100,
+        'filter': {'property': 'Сделано', 'checkbox': {'equals': False}},
+    })
+    assert second[1]['start_cursor'] == 'c1'
+
+    client.client.data_sources.query.respond = lambda source_id, **params: {'results': [], 'has_more': False}
+    client.list_target_page(target, None, 20)
+    _, latest = client.client.data_sources.query.calls[-1]
+    assert latest == {'sorts': [{'timestamp': 'created_time', 'direction': 'descending'}], 'page_size': 20}
+
+
+def httpx_response(status, payload):
+    import httpx
+
+    return httpx.Response(status, content=json.dumps(payload).encode('utf-8'),
+                          headers={'Content-Type': 'application/json'})
+
+
+def _mock_notion(handler, token):
+    """Клиент поверх установленного notion_client с подменённым HTTP-транспортом."""
+    import httpx
+
+    from src.notion_api import NotionClient, PolicyClient
+
+    client = NotionClient()
+    client.token = token
+    client.client = PolicyClient(NotionClient.policy, auth=token, client=httpx.Client(
+        transport=httpx.MockTransport(handler)
+    ))
+    return client
+
+
+def test_block_list_adapter_matches_notion_client():
+    """Сырое чтение блоков работает с закреплённой версией notion_client."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx_response(200, {
+            'object': 'list', 'has_more': True, 'next_cursor': 'next',
+            'results': [_block('todo', 'to_do', "купить хлеб", checked=False)],
+        })
+
+    client = _mock_notion(handler, 'adapter-token')
+    records, cursor = client.list_block_records('page', start_cursor='start', page_size=50)
+
+    assert [(record.id, record.text, record.checked) for record in records] == [('todo', "купить хлеб", False)]
+    assert cursor == 'next'
+    request, = requests
+    assert request.url.path == '/v1/blocks/page/children'
+    assert dict(request.url.params) == {'page_size': '50', 'start_cursor': 'start'}
+    assert request.headers['Authorization'] == 'Bearer adapter-token'
+    assert 'Notion-Version' in request.headers
+
+
+def test_block_list_adapter_translates_errors():
+    from src.notion_errors import NotionNotFoundError
+
+    def handler(request):
+        return httpx_response(404, {
+            'object': 'error', 'status': 404, 'code': 'object_not_found', 'message': "Could not find block",
+        })
+
+    client = _mock_notion(handler, 'adapter-missing')
+    with pytest.raises(NotionNotFoundError):
+        client.list_block_records('missing')
+
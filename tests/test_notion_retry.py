@@ -0,0 +1,180 @@
+"""
+Тесты типизированных ошибок Notion, повторов и хеджирования.
+"""
+
+import threading
+import time
+
+import httpx
+import pytest
+from notion_client.errors import APIResponseError, HTTPResponseError, RequestTimeoutError
+
+from src.notion_api import PolicyClient
+from src.notion_errors import (
+    NotionAuthError,
+    NotionNotFoundError,
+    NotionRateLimitError,
+    NotionServerError,
+    NotionTimeoutError,
+    translate_error,
+)
+from src.notion_retry import RequestPolicy, endpoint_name, is_idempotent
+
+
+def _response(status: int, headers: dict = None) -> httpx.Response:
+    return httpx.Response(status, headers=headers, request=httpx.Request('GET', 'https://api.notion.com'))
+
+
+def _api_error(status: int, code: str, headers: dict = None) -> APIResponseError:
+    return APIResponseError(_response(status, headers), 'error', code, request_id='req-1')
+
+
+def make_policy(**kwargs):
+    delays = []
+    policy = RequestPolicy(base_delay=0.1, max_delay=5, sleep=delays.append, **kwargs)
+    return policy, delays
+
+
+def failing(*errors, result="ok"):
+    """Функция, выбрасывающая ошибки по очереди, затем возвращающая result."""
+    errors = list(errors)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_translate_error():
+    limited = translate_error(_api_error(429, 'rate_limited', {'Retry-After': '2'}))
+    assert isinstance(limited, NotionRateLimitError)
+    assert (limited.status, limited.code, limited.retry_after, limited.request_id) == (429, 'rate_limited', 2.0, 'req-1')
+    assert limited.transient and not limited.outcome_unknown
+
+    assert isinstance(translate_error(_api_error(401, 'unauthorized')), NotionAuthError)
+    assert isinstance(translate_error(_api_error(404, 'object_not_found')), NotionNotFoundError)
+    server = translate_error(HTTPResponseError(_response(502)))
+    assert isinstance(server, NotionServerError) and server.outcome_unknown
+    assert isinstance(translate_error(RequestTimeoutError()), NotionTimeoutError)
+    assert isinstance(translate_error(httpx.ConnectError("reset")), NotionTimeoutError)
+    error = ValueError("не Notion")
+    assert translate_error(error) is error
+
+
+def test_endpoint_classification():
+    assert endpoint_name('get', 'blocks/1f2e3d4c-0000-1111-2222-333344445555/children') == 'GET blocks/*/children'
+    assert is_idempotent('GET', 'pages/x')
+    assert is_idempotent('POST', 'data_sources/x/query')
+    assert not is_idempotent('PATCH', 'blocks/x/children')
+
+
+def test_read_retries_transient_errors_with_backoff():
+    policy, delays = make_policy()
+    fn, calls = failing(_api_error(503, 'service_unavailable'), RequestTimeoutError())
+    assert policy.call(fn, 'GET pages/*', idempotent=True) == "ok"
+    assert len(calls) == 3
+    assert len(delays) == 2 and all(0 <= delay <= 0.4 for delay in delays)
+
+
+def test_retry_after_is_respected():
+    policy, delays = make_policy()
+    fn, _ = failing(_api_error(429, 'rate_limited', {'Retry-After': '1.5'}))
+    assert policy.call(fn, 'PATCH blocks/*/children', idempotent=False) == "ok"
+    assert delays == [1.5]
+
+    fn, calls = failing(_api_error(429, 'rate_limited', {'Retry-After': '30'}))
+    with pytest.raises(NotionRateLimitError):
+        policy.call(fn, 'PATCH blocks/*/children', idempotent=False)
+    assert len(calls) == 1 and policy.gave_up == 1
+
+
+def test_writes_are_not_retried_after_unknown_outcome():
+    policy, _ = make_policy()
+    fn, calls = failing(HTTPResponseError(_response(500)))
+    with pytest.raises(NotionServerError):
+        policy.call(fn, 'PATCH blocks/*/children', idempotent=False)
+    assert len(calls) == 1
+
+    fn, calls = failing(_api_error(404, 'object_not_found'))
+    with pytest.raises(NotionNotFoundError):
+        policy.call(fn, 'GET pages/*', idempotent=True)
+    assert len(calls) == 1
+
+
+def test_hedged_read_takes_faster_duplicate():
+    """Если основной запрос дольше p95, дубль отвечает раньше."""
+    policy = RequestPolicy(hedge=True, hedge_min_delay=0.01)
+    for _ in range(30):
+        policy.latencies.record('GET pages/*', 0.01)
+
+    release = threading.Event()
+    calls = []
+
+    def read():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "медленный"
+        return "быстрый"
+
+    started = time.monotonic()
+    assert policy.call(read, 'GET pages/*', idempotent=True) == "быстрый"
+    assert time.monotonic() - started < 1
+    assert (policy.hedged, policy.hedge_wins) == (1, 1)
+    release.set()
+    policy.shutdown()
+
+
+def test_hedging_is_skipped_when_hedge_pool_is_busy():
+    """Без свободного места на дубль чтение выполняется сразу, а не ждёт в очереди пула."""
+    policy = RequestPolicy(hedge=True, hedge_min_delay=0.01, hedge_workers=2)
+    for _ in range(30):
+        policy.latencies.record('GET pages/*', 0.01)
+
+    release = threading.Event()
+    slow = threading.Thread(
+        target=policy.call, args=(lambda: release.wait(5), 'GET pages/*'), kwargs={'idempotent': True}
+    )
+    slow.start()
+    time.sleep(0.1)
+    # Оба места заняты основным запросом и его дублем
+    assert policy.hedged == 1
+    assert policy.call(lambda: "сразу", 'GET pages/*', idempotent=True) == "сразу"
+    assert policy.hedge_skipped == 1
+    release.set()
+    slow.join(5)
+    time.sleep(0.05)
+    assert policy._hedge_inflight == 0
+    policy.shutdown()
+
+
+def test_retry_counters_are_exact_across_threads():
+    policy, _ = make_policy()
+    threads = []
+    for _ in range(16):
+        fn, _calls = failing(*[_api_error(503, 'service_unavailable')] * 2)
+        threads.append(threading.Thread(target=policy.call, args=(fn, 'GET pages/*', True)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert policy.retries == 32
+
+
+def test_policy_client_retries_rate_limited_request():
+    """Клиент notion_client через политику повторяет 429 и возвращает ответ."""
+    responses = [
+        httpx.Response(429, headers={'Retry-After': '0'}, json={
+            'object': 'error', 'status': 429, 'code': 'rate_limited', 'message': 'slow down'
+        }),
+        httpx.Response(200, json={'object': 'user', 'name': 'inbox writer'}),
+    ]
+    transport = httpx.MockTransport(lambda request: responses.pop(0))
+    policy, delays = make_policy()
+    client = PolicyClient(policy, auth='secret', client=httpx.Client(transport=transport))
+
+    assert client.users.me()['name'] == 'inbox writer'
+    assert policy.retries == 1 and delays[0] >= 0
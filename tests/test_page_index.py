@@ -0,0 +1,111 @@
+"""
+Тесты индекса названий страниц.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from src import app_globals, handlers
+from src.notion_api import NotionClient
+from src.page_index import PageIndex, has_close_match, rank_titles
+
+
+PAGES = [
+    ("id-1", "Inbox"),
+    ("id-2", "Inbox Archive"),
+    ("id-3", "Рабочий Inbox"),
+    ("id-4", "Inbx"),
+    ("id-5", "Проекты"),
+]
+
+
+def test_rank_titles_order():
+    """Точное совпадение первым, затем префикс, подстрока и нечёткое."""
+    ranked = rank_titles("inbox", PAGES, limit=10)
+    assert [page_id for page_id, _ in ranked] == ["id-1", "id-2", "id-3", "id-4"]
+
+
+def test_rank_titles_fuzzy_and_limit():
+    """Опечатка находит страницу, лимит ограничивает выдачу."""
+    assert rank_titles("Праекты", PAGES)[0] == ("id-5", "Проекты")
+    assert len(rank_titles("inbox", PAGES, limit=2)) == 2
+    assert rank_titles("   ", PAGES) == []
+
+
+def test_page_index_build_and_caps():
+    """Индекс ограничен по числу страниц и токенов."""
+    index = PageIndex(ttl=60, max_pages=3, max_tokens=1)
+
+    def loader(limit):
+        return iter(PAGES[:limit])
+
+    assert index.needs_build("token-a")
+    index.build("token-a", loader)
+    assert index.is_ready("token-a")
+    assert not index.needs_build("token-a")
+    assert index.search("token-a", "проекты") == []
+    assert index.get_title("token-a", "id-2") == "Inbox Archive"
+
+    index.build("token-b", loader)
+    assert not index.is_ready("token-a")
+    assert index.is_ready("token-b")
+
+
+def test_page_index_ttl():
+    """Устаревший индекс продолжает отвечать, но требует перестроения."""
+    index = PageIndex(ttl=-1)
+    index.build("token", lambda limit: iter(PAGES))
+    assert index.needs_build("token")
+    assert index.search("token", "Inbox")[0] == ("id-1", "Inbox")
+
+
+class FakeSearch:
+    def __init__(self, pages):
+        self.pages = pages
+        self.queries = []
+
+    def search_pages(self, query, limit=5):
+        self.queries.append(query)
+        return rank_titles(query, self.pages, limit)
+
+
+def find_candidates(monkeypatch, index, live_pages, query):
+    live = FakeSearch(live_pages)
+    monkeypatch.setattr(app_globals, 'page_index', index)
+    monkeypatch.setattr(NotionClient, 'for_token', classmethod(lambda cls, token: live))
+    return asyncio.run(handlers._find_page_candidates(SimpleNamespace(), "token", query)), live.queries
+
+
+def test_close_match_requires_exact_or_prefix():
+    assert has_close_match("inbox", [("id-3", "Рабочий Inbox"), ("id-2", "Inbox Archive")])
+    assert not has_close_match("inbox", [("id-3", "Рабочий Inbox"), ("id-4", "Inbx")])
+    assert not has_close_match("", PAGES)
+
+
+def test_index_answers_when_it_has_a_close_match(monkeypatch):
+    index = PageIndex(ttl=60)
+    index.build("token", lambda limit: iter(PAGES))
+
+    candidates, queries = find_candidates(monkeypatch, index, [], "Inbox")
+    assert candidates[0] == ("id-1", "Inbox")
+    assert queries == []
+
+
+def test_page_missing_from_index_falls_back_to_live_search(monkeypatch):
+    """Страница, созданная после построения индекса, находится живым поиском."""
+    index = PageIndex(ttl=60)
+    index.build("token", lambda limit: iter(PAGES))
+
+    candidates, queries = find_candidates(monkeypatch, index, [("id-9", "Заметки 2026")], "Заметки")
+    assert candidates == [("id-9", "Заметки 2026")]
+    assert queries == ["Заметки"]
+
+
+def test_truncated_index_is_completed_by_live_search(monkeypatch):
+    index = PageIndex(ttl=60, max_pages=2)
+    index.build("token", lambda limit: iter(PAGES[:limit]))
+    assert index.is_truncated("token")
+
+    candidates, queries = find_candidates(monkeypatch, index, [("id-5", "Проекты")], "Inbox")
+    assert queries == ["Inbox"]
+    assert candidates[0] == ("id-1", "Inbox")
@@ -0,0 +1,67 @@
+"""
+Тесты хранения диалогов и user_data в SQLite.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from src.database import Database
+from src.persistence import SQLitePersistence
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    database.init_database()
+    yield database
+    database.close()
+
+
+def test_user_data_survives_restart_and_writes_only_changed_keys(db):
+    async def first_run():
+        persistence = SQLitePersistence(db)
+        await persistence.get_user_data()
+        await persistence.update_user_data(1, {'timezone_offset': 10800, 'selected_days': ['1', '2']})
+        await persistence.update_user_data(1, {'timezone_offset': 10800, 'selected_days': ['1', '2', '3']})
+        await persistence.update_user_data(1, {'selected_days': ['1', '2', '3']})
+        await persistence.flush()
+        return persistence
+
+    persistence = asyncio.run(first_run())
+    # 2 ключа, затем 1 изменённый, затем 1 удалённый
+    assert persistence.rows_written == 4
+
+    restored = asyncio.run(SQLitePersistence(db).get_user_data())
+    assert restored == {1: {'selected_days': ['1', '2', '3']}}
+
+
+def test_concurrent_updates_share_one_transaction(db):
+    async def scenario():
+        persistence = SQLitePersistence(db)
+        await asyncio.gather(
+            persistence.update_user_data(1, {'a': 1}),
+            persistence.update_user_data(2, {'b': 2}),
+            persistence.update_conversation('setup', (1, 1), 1),
+        )
+        return persistence
+
+    persistence = asyncio.run(scenario())
+    assert persistence.batches == 1
+    assert persistence.rows_written == 3
+
+
+def test_conversations_restore_end_and_expire(db):
+    async def scenario():
+        persistence = SQLitePersistence(db)
+        await persistence.update_conversation('setup', (1, 1), 1)
+        await persistence.update_conversation('setup', (2, 2), 0)
+        await persistence.update_conversation('setup', (2, 2), None)
+        return await SQLitePersistence(db).get_conversations('setup')
+
+    assert asyncio.run(scenario()) == {(1, 1): 1}
+
+    db.purge_expired_conversations(time.time() + 1)
+    assert asyncio.run(SQLitePersistence(db).get_conversations('setup')) == {}
+    assert asyncio.run(SQLitePersistence(db, conversation_ttl=-1).get_conversations('notifications')) == {}
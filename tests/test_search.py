@@ -0,0 +1,113 @@
+"""
+Тесты локального поиска заметок (/find).
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from src import search
+from src.blocks import BlockRecord
+from src.capture import capture_note, update_note
+from src.database import Database
+from src.notion_api import InboxTarget, TARGET_PAGE
+from src.search import NoteSearch, parse_find_args
+from tests.test_capture import FakeNotion
+
+TARGET = InboxTarget(TARGET_PAGE, "page")
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"))
+    database.init_database()
+    yield database
+    database.close()
+
+
+def found(db, query, checked=None, page_id="page"):
+    return [row['text'] for row in db.search_notes(page_id, search.search_terms(query), checked, 10)]
+
+
+def test_prefix_ranking_and_filters(db):
+    """Поиск по началу слов без учёта регистра, с фильтром по отметке и по странице."""
+    assert db.fts_enabled
+    now = time.time()
+    db.index_notes("page", [
+        ("b1", "Купить молоко", False),
+        ("b2", "Молоко, молоко и ещё раз молоко", True),
+        ("b3", "Позвонить маме", None),
+    ], now)
+    db.index_notes("other", [("b4", "Молоко для соседа", False)], now)
+
+    assert found(db, "МОЛОК") == ["Молоко, молоко и ещё раз молоко", "Купить молоко"]
+    assert found(db, "куп мол") == ["Купить молоко"]
+    assert found(db, "молоко", checked=False) == ["Купить молоко"]
+    assert found(db, "молоко", checked=True) == ["Молоко, молоко и ещё раз молоко"]
+    assert found(db, "мам") == ["Позвонить маме"]
+    assert found(db, "хлеб") == []
+
+
+def test_like_fallback_without_fts(db):
+    """Без FTS5 поиск идёт по подстроке."""
+    db.index_notes("page", [("b1", "Купить молоко", False), ("b2", "Купить хлеб", False)], time.time())
+    db.fts_enabled = False
+    assert found(db, "купить хлеб") == ["Купить хлеб"]
+
+
+def test_full_sync_replaces_page_index(db):
+    """Полная синхронизация удаляет пропавшие заметки, но не записанные во время чтения."""
+    db.index_notes("page", [("old", "Удалена в Notion", False)], 100.0)
+    db.index_notes("page", [("new", "Записана во время чтения", False)], 300.0)
+    db.sync_page_index("page", [("kept", "Осталась в Notion", True)], 200.0)
+
+    assert found(db, "удалена") == []
+    assert found(db, "записана") == ["Записана во время чтения"]
+    assert found(db, "осталась", checked=True) == ["Осталась в Notion"]
+    assert db.get_index_synced_at("page") == 200.0
+
+
+def test_capture_and_edit_update_index(db):
+    """Записанные ботом заметки сразу находятся, правка обновляет текст и сохраняет отметку."""
+    notion = FakeNotion()
+    asyncio.run(capture_note(db, notion, 1, 10, TARGET, "- хлеб\n- молоко", per_line=True))
+    assert found(db, "хлеб") == ["хлеб"]
+    assert found(db, "молоко") == ["молоко"]
+
+    block_id = asyncio.run(capture_note(db, notion, 1, 11, TARGET, "Опечтка"))
+    db.set_notes_checked([block_id], True)
+    asyncio.run(update_note(db, notion, 1, 11, TARGET, "Опечатка исправлена"))
+    assert found(db, "опечтка") == []
+    assert found(db, "исправлена", checked=True) == ["Опечатка исправлена"]
+
+
+def test_parse_find_args():
+    assert parse_find_args(["open", "Купить", "молоко!"]) == (False, ["купить", "молоко"])
+    assert parse_find_args(["выполненные", "отчёт"]) == (True, ["отчёт"])
+    assert parse_find_args(["done"]) == (True, [])
+    assert parse_find_args([]) == (None, [])
+
+
+def test_stale_index_is_synced_in_background(db, monkeypatch):
+    """/find запускает одну фоновую синхронизацию для страницы без индекса."""
+    calls = []
+
+    class FakeClient:
+        def list_all_notes(self, target):
+            calls.append(target.id)
+            return [BlockRecord("b1", "to_do", "Заметка из Notion", False, None)]
+
+    monkeypatch.setattr(search.NotionClient, 'for_token', classmethod(lambda cls, token: FakeClient()))
+
+    async def scenario():
+        note_search = NoteSearch(db)
+        assert await note_search.ensure_fresh("token", TARGET)
+        assert await note_search.ensure_fresh("token", TARGET)
+        await asyncio.gather(*note_search._syncing.values())
+        assert not await note_search.ensure_fresh("token", TARGET)
+        return await note_search.find(TARGET.id, ["notion"])
+
+    results = asyncio.run(scenario())
+    assert calls == ["page"]
+    assert [row['text'] for row in results] == ["Заметка из Notion"]
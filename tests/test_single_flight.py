@@ -0,0 +1,115 @@
+"""
+Тесты объединения одинаковых одновременных чтений из Notion.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.notion_api import NotionClient
+from src.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    """Одновременные вызовы с одним ключом выполняются один раз и получают общий результат."""
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_read():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["block"]
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        leader = pool.submit(flight.do, ("token", "list", ("page",)), slow_read)
+        started.wait(5)
+        followers = [pool.submit(flight.do, ("token", "list", ("page",)), slow_read) for _ in range(4)]
+        while flight.shared < 4:
+            time.sleep(0.001)
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert (flight.calls, flight.shared) == (1, 4)
+
+
+def test_errors_are_shared_and_not_remembered():
+    """Ошибка ведущего вызова достаётся ожидающим, следующий вызов идёт заново."""
+    flight = SingleFlight(window=60)
+
+    def failing():
+        raise RuntimeError("Notion недоступен")
+
+    with pytest.raises(RuntimeError):
+        flight.do(("token", "list", ()), failing)
+    assert flight.do(("token", "list", ()), lambda: "ok") == "ok"
+    assert flight.calls == 2
+
+
+def test_window_reuses_results_until_write():
+    """В окне результат переиспользуется; запись через токен его сбрасывает."""
+    flight = SingleFlight(window=60)
+    counter = iter(range(100))
+    key = ("token", "list", ("page",))
+
+    assert flight.do(key, lambda: next(counter)) == 0
+    assert flight.do(key, lambda: next(counter)) == 0
+    assert flight.do(("other", "list", ("page",)), lambda: next(counter)) == 1
+    flight.forget("token")
+    assert flight.do(key, lambda: next(counter)) == 2
+    assert flight.reused == 1
+
+
+def test_write_during_read_is_not_hidden_by_shared_read():
+    """Чтение, начатое до записи, не достаётся пришедшим после неё и не попадает в окно."""
+    flight = SingleFlight(window=60)
+    key = ("token", "list", ("page",))
+    started = threading.Event()
+    release = threading.Event()
+
+    def stale_read():
+        started.set()
+        release.wait(5)
+        return "до записи"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        before = pool.submit(flight.do, key, stale_read)
+        started.wait(5)
+        flight.forget("token")
+        after = pool.submit(flight.do, key, lambda: "после записи")
+        assert after.result(5) == "после записи"
+        release.set()
+        assert before.result(5) == "до записи"
+
+    assert flight.shared == 0
+    assert flight.do(key, lambda: "новое чтение") == "после записи"
+
+
+def test_notion_reads_are_keyed_by_token_and_params(monkeypatch):
+    """Чтения блоков объединяются по токену и параметрам запроса."""
+    monkeypatch.setattr(NotionClient, 'reads', SingleFlight(window=60))
+    fetched = []
+    monkeypatch.setattr(
+        NotionClient, '_fetch_block_records',
+        lambda self, block_id, cursor, size: fetched.append((self.token, block_id, cursor)) or ([], None)
+    )
+
+    first, second = NotionClient("token-a"), NotionClient("token-b")
+    first.list_block_records("page")
+    first.list_block_records("page")
+    first.list_block_records("page", start_cursor="next")
+    second.list_block_records("page")
+    monkeypatch.setattr(first.client.blocks, 'delete', lambda block_id: None)
+    first.delete_block("block")
+    first.list_block_records("page")
+
+    assert fetched == [
+        ("token-a", "page", None), ("token-a", "page", "next"),
+        ("token-b", "page", None), ("token-a", "page", None),
+    ]
@@ -0,0 +1,138 @@
+"""
+Контрактные тесты хранилищ пользователей.
+
+Один набор тестов прогоняется для всех реализаций UserStore. PostgreSQL
+проверяется, если задан TEST_POSTGRES_DSN
+(например: TEST_POSTGRES_DSN=postgresql://postgres@localhost/bot_test);
+так тесты запускаются в CI (.github/workflows/tests.yml). Если DSN задан,
+а asyncpg не установлен, тест падает, а не пропускается.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from src.database import Database
+from src.storage import MemoryUserStore, PostgresUserStore, SQLiteUserStore
+
+TEST_POSTGRES_DSN = os.getenv('TEST_POSTGRES_DSN')
+
+
+async def _make_store(backend: str, tmp_path):
+    if backend == 'sqlite':
+        db = Database(str(tmp_path / "test.db"))
+        db.init_database()
+        return SQLiteUserStore(db)
+    if backend == 'memory':
+        return MemoryUserStore()
+    store = PostgresUserStore(TEST_POSTGRES_DSN, min_size=1, max_size=4)
+    await store.init()
+    await store.pool.execute('TRUNCATE users')
+    return store
+
+
+@pytest.fixture(params=[
+    'sqlite',
+    'memory',
+    pytest.param('postgres', marks=pytest.mark.skipif(not TEST_POSTGRES_DSN, reason="TEST_POSTGRES_DSN не задан")),
+])
+def run(request, tmp_path):
+    """Выполнить сценарий с новым хранилищем выбранного типа."""
+    def runner(scenario):
+        async def wrapped():
+            store = await _make_store(request.param, tmp_path)
+            try:
+                return await scenario(store)
+            finally:
+                await store.close()
+        return asyncio.run(wrapped())
+    return runner
+
+
+def test_unknown_user_defaults(run):
+    async def scenario(store):
+        assert await store.get_user_config(1) == {}
+        assert await store.get_notification_settings(1) == {}
+        assert await store.get_user_version(1) == '0.0.0'
+        # Изменения несуществующего пользователя ничего не создают
+        await store.set_user_version(1, '2.0.0')
+        await store.save_page_config(1, 'page', 'Inbox')
+        assert await store.get_user_config(1) == {}
+    run(scenario)
+
+
+def test_token_and_page_config(run):
+    async def scenario(store):
+        await store.save_notion_token(1, 'token')
+        await store.save_page_config(1, 'db', 'Tasks', 'database', 'ds', 'Name', 'Done')
+        assert await store.get_user_config(1) == {
+            'notion_token': 'token',
+            'page_id': 'db',
+            'page_name': 'Tasks',
+            'target_type': 'database',
+            'data_source_id': 'ds',
+            'title_property': 'Name',
+            'checkbox_property': 'Done',
+            'suspended_reason': None,
+        }
+        await store.save_notion_token(1, 'new-token')
+        assert (await store.get_user_config(1))['page_id'] == 'db'
+    run(scenario)
+
+
+def test_notification_settings_and_versions(run):
+    async def scenario(store):
+        await store.save_notion_token(1, 'token')
+        assert await store.get_notification_settings(1) == {
+            'notification_enabled': False,
+            'notification_time': None,
+            'notification_days': '1,2,3,4,5',
+            'last_seen_version': '0.0.0',
+            'timezone_offset': None,
+        }
+        await store.save_notification_settings(1, True, '09:00', '1,3', 10800)
+        await store.set_user_version(1, '1.2.0')
+        settings = await store.get_notification_settings(1)
+        assert settings['notification_enabled'] is True
+        assert settings['notification_time'] == '09:00'
+        assert settings['timezone_offset'] == 10800
+        assert await store.get_user_version(1) == '1.2.0'
+        assert await store.get_users_with_notifications() == [{
+            'user_id': 1, 'notification_time': '09:00', 'notification_days': '1,3', 'timezone_offset': 10800,
+        }]
+    run(scenario)
+
+
+def test_suspension_and_reset(run):
+    async def scenario(store):
+        for user_id in (1, 2, 3):
+            await store.save_notion_token(user_id, 'shared' if user_id < 3 else 'own')
+            await store.save_notification_settings(user_id, True, '09:00', '1')
+
+        assert sorted(await store.suspend_users("Токен недействителен", notion_token='shared')) == [1, 2]
+        assert await store.suspend_users("again", notion_token='shared') == []
+        assert await store.suspend_users("Страница недоступна", notion_token='own', page_id='other') == []
+        assert (await store.get_user_config(1))['suspended_reason'] == "Токен недействителен"
+        assert [user['user_id'] for user in await store.get_users_with_notifications()] == [3]
+
+        await store.save_notion_token(1, 'fresh')
+        assert (await store.get_user_config(1))['suspended_reason'] is None
+
+        await store.reset_user_config(2)
+        assert await store.get_user_config(2) == {}
+    run(scenario)
+
+
+def test_users_by_notion_ids(run):
+    async def scenario(store):
+        await store.save_notion_token(1, 'token')
+        await store.save_page_config(1, '11111111-2222-3333-4444-555555555555', 'Inbox')
+        await store.save_notion_token(2, 'token')
+        await store.save_page_config(2, 'db', 'Tasks', 'database', 'AAAA-bbbb', 'Name', 'Done')
+        await store.save_notion_token(3, 'token')
+
+        assert await store.get_users_by_notion_ids(['11111111222233334444555555555555']) == [1]
+        assert await store.get_users_by_notion_ids(['aaaabbbb', 'unknown']) == [2]
+        assert await store.get_users_by_notion_ids([]) == []
+    run(scenario)
@@ -0,0 +1,132 @@
+"""
+Тесты приёма вебхуков Notion и отметки изменившихся инбоксов.
+"""
+
+import asyncio
+import logging
+import os
+import stat
+import time
+
+from src.inbox_cache import ChangeTracker, InboxCache
+from src.notifications import NotificationManager
+from src.storage import MemoryUserStore
+from src.webhooks import WebhookReceiver, affected_ids, build_event, send_event, sign_body, verify_signature
+
+SECRET = "secret_test"
+PAGE_ID = "11111111-2222-3333-4444-555555555555"
+DATABASE_ID = "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+async def make_store():
+    store = MemoryUserStore()
+    await store.save_notion_token(1, "token")
+    await store.save_page_config(1, PAGE_ID, "Inbox")
+    await store.save_notion_token(2, "token")
+    await store.save_page_config(2, DATABASE_ID, "Tasks", 'database', "ds-1", "Name", "Done")
+    return store
+
+
+def test_signature_and_affected_ids():
+    body = b'{"type": "page.content_updated"}'
+    assert verify_signature(body, sign_body(body, SECRET), SECRET)
+    assert not verify_signature(body, sign_body(body, "other"), SECRET)
+    assert not verify_signature(body, None, SECRET)
+
+    record_created = build_event('page.created', "record", parent_id=DATABASE_ID, parent_type='database')
+    assert affected_ids(record_created) == ["record", DATABASE_ID]
+    assert affected_ids(build_event('comment.created', PAGE_ID)) == []
+
+
+def test_signed_events_mark_affected_inboxes(tmp_path, caplog):
+    token_file = str(tmp_path / "token" / "notion_webhook_token")
+
+    async def scenario():
+        changes = ChangeTracker()
+        receiver = WebhookReceiver(
+            await make_store(), changes, SECRET, host='127.0.0.1', port=0, token_file=token_file
+        )
+        await receiver.start()
+        url = f"http://127.0.0.1:{receiver.port}{receiver.path}"
+        read_at = time.time()
+        try:
+            statuses = [
+                # ID без дефисов тоже сопоставляется
+                await send_event(url, build_event('page.content_updated', PAGE_ID.replace('-', '')), SECRET),
+                await send_event(url, build_event('page.content_updated', DATABASE_ID), "wrong"),
+                await send_event(url, {"verification_token": "secret_new"}, None),
+                await send_event(url.replace('/notion', '/other'), build_event('page.created', PAGE_ID), SECRET),
+            ]
+            unchanged = (changes.is_unchanged(1, read_at), changes.is_unchanged(2, read_at))
+        finally:
+            await receiver.stop()
+        return changes, receiver, statuses, unchanged
+
+    with caplog.at_level(logging.INFO, logger='src.webhooks'):
+        changes, receiver, statuses, unchanged = asyncio.run(scenario())
+    assert statuses == [200, 401, 200, 404]
+    # У пользователя 2 событий не было: подписки его интеграции может не быть
+    assert unchanged == (False, False)
+    # Токен проверки сохраняется в файл владельца и не попадает в лог
+    assert "secret_new" not in caplog.text
+    with open(token_file) as file:
+        assert file.read().strip() == "secret_new"
+    assert stat.S_IMODE(os.stat(token_file).st_mode) == 0o600
+    assert receiver.rejected == 1
+    assert receiver.invalidated == 1
+    assert not changes.active
+
+
+def test_database_record_event_marks_database_owner():
+    async def scenario():
+        changes = ChangeTracker()
+        changes.activate()
+        receiver = WebhookReceiver(await make_store(), changes, SECRET)
+        return await receiver.apply_event(
+            build_event('page.properties_updated', "record", parent_id="ds-1", parent_type='data_source')
+        )
+
+    assert asyncio.run(scenario()) == [2]
+
+
+def test_change_tracker_trusts_only_reads_after_activation():
+    changes = ChangeTracker(max_trust=60)
+    read_at = time.time()
+    assert not changes.is_unchanged(1, read_at)
+
+    changes.activate()
+    changes.record_events([1, 2])
+    assert not changes.is_unchanged(1, read_at - 1)
+    read_at = time.time()
+    assert changes.is_unchanged(1, read_at)
+    time.sleep(0.01)
+    changes.touch(1)
+    assert not changes.is_unchanged(1, read_at)
+    assert changes.is_unchanged(2, read_at)
+    assert not changes.is_unchanged(2, time.time() - 120)
+    # Без единого события от интеграции пользователя молчание не доказывает отсутствие правок
+    assert not changes.is_unchanged(3, time.time())
+    changes.deactivate()
+    changes.activate()
+    assert not changes.is_unchanged(2, time.time())
+
+
+def test_list_cache_and_digest_skip_notion_without_events():
+    changes = ChangeTracker()
+    changes.activate()
+    changes.record_events([1])
+    time.sleep(0.01)
+    fetched_at = time.time()
+    cache = InboxCache()
+    cache.put(1, PAGE_ID, [("a", False)], ["record"], "cursor", fetched_at)
+    records, next_cursor, cached_at = cache.get_page(1, PAGE_ID)
+    assert (records, next_cursor, cached_at) == (["record"], "cursor", fetched_at)
+    assert changes.is_unchanged(1, cached_at)
+
+    manager = NotificationManager(db=None, bot=None, storage=MemoryUserStore(), changes=changes)
+    state = {'page_id': PAGE_ID, 'checked_at': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(time.time() + 1))}
+    assert manager._webhooks_report_unchanged(1, state, PAGE_ID)
+    assert not manager._webhooks_report_unchanged(1, state, "other-page")
+    changes.touch(1)
+    state['checked_at'] = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(time.time() - 1))
+    assert not manager._webhooks_report_unchanged(1, state, PAGE_ID)